@@ -103,27 +103,14 @@ install_contatester
 echo -e '\033[31m- Testing scripts\033[0m'
 contatester -h
 
-echo -e '\033[34m\t- Testing calculAllelicBalance\033[0m'
-calculAllelicBalance.sh -f ./data_examples/test_1.vcf.gz \
-                        -o ./data_examples/calculAllelicBalance_output.hist \
-                        -d ./data_examples/calculAllelicBalance_output.meandepth
-                        
-echo -e '\033[34m\t- Testing contaReport\033[0m'
-module_load r
-contaReport.R --input ./data_examples/distrib_allele_balance.hist \
-              --output ./data_examples/distrib_allele_balance.conta \
-              --report \
-              --depth 30 \
-              --experiment WG \
-              --reportName \
-              ./data_examples/distrib_allele_balance.pdf
-
-echo -e '\033[34m\t- Testing recupConta\033[0m'
-recupConta.sh -f ./data_examples/test_1.vcf.gz \
-              -c ./data_examples/test_1_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz
-
-echo -e '\033[34m\t- Testing checkContaminant\033[0m'
-checkContaminant.sh -f ./data_examples/test_2.vcf.gz \
-                    -c ./data_examples/test_1_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz \
-                    -s ./data_examples/test_1_comparisonSummary.txt
-
+echo -e '\033[34m\t- Testing abcalc\033[0m'
+contatester abcalc -f ./data_examples/test_1.vcf.gz \
+                   -o ./data_examples/abcalc_output.hist \
+                   -d ./data_examples/abcalc_output.meandepth \
+                   -c ./data_examples/abcalc_output_candidates.vcf.gz
+
+echo -e '\033[34m\t- Testing estimate\033[0m'
+contatester estimate --input ./data_examples/distrib_allele_balance.hist \
+                     --output ./data_examples/estimate_output.conta \
+                     --depth 30 \
+                     --experiment WG
@@ -94,8 +94,7 @@ if __name__ == '__main__':
         include_package_data=True,
 
         data_files=[('share/{}/'.format(conf['metadata']['name']), get_files('data'))],
-        scripts=get_files('scripts'),
-        install_requires=['wheel >= 0.31.0'],
+        install_requires=['wheel >= 0.31.0', 'numpy >= 1.13.0'],
         setup_requires=['pytest-runner', 'setuptools >= 40.0.0 '],
         tests_require=['pytest  >= 3.4.0',
                        'pytest-dependency >= 0.3.0',
@@ -106,5 +105,5 @@ if __name__ == '__main__':
                 'contatester = fr.cea.cnrgh.lbi.contatester.__main__:main'
             ]
         },
-        extras_require={}
+        extras_require={'report': ['matplotlib >= 2.2.0']}
     )
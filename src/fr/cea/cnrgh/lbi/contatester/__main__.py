@@ -3,17 +3,54 @@
 from pathlib import Path
 from os import access, R_OK, getcwd, makedirs, remove
 from os.path import isfile, abspath, isdir, join, exists, basename
-from typing import Sequence, Tuple, List, BinaryIO, Dict, Union
+from typing import Sequence, Tuple, List, BinaryIO, Dict, Optional, Union
 import argparse
 import io
+import shutil
 import subprocess
 import sys
 import glob
 from datetime import datetime
 from math import ceil
 
+from fr.cea.cnrgh.lbi.contatester import allelic_balance, benchmark, \
+    comparison, estimation, executor, joint, panels, preflight, regions, \
+    report, results, serve, sketch, slurm, synthetic, timeline, triage
+from fr.cea.cnrgh.lbi.contatester.comparison import read_vcf_list
+from fr.cea.cnrgh.lbi.contatester.data import DEFAULT_REFERENCE, gnomad_bed
+from fr.cea.cnrgh.lbi.contatester.outputs import candidates_file, \
+    is_processed, sample_name
+from fr.cea.cnrgh.lbi.contatester.report import MISSING_MATPLOTLIB, \
+    has_matplotlib
+from fr.cea.cnrgh.lbi.contatester.runtime import BatchPlan, MAX_DURATION, \
+    count_batches, history_file, load_models, partition, plan_batch, \
+    sample_durations
+
 script_name = "contatester"
 
+# Stages run by the DAG tasks as: contatester <stage> [options]
+stages = {"abcalc": allelic_balance.main,
+          "benchmark": benchmark.main,
+          "collect": results.main,
+          "compare": comparison.main,
+          "estimate": estimation.main,
+          "joint": joint.main,
+          "panels": panels.main,
+          "preflight": preflight.main,
+          "profile": timeline.main,
+          "regions": regions.main,
+          "report": report.main,
+          "run": executor.main,
+          "serve": serve.main,
+          "simulate": synthetic.main,
+          "sketch": sketch.main,
+          "triage": triage.main}
+# Stages writing a manifest next to their outputs, their tasks are skipped
+# while the outputs are valid
+stage_modules = {"abcalc": allelic_balance,
+                 "compare": comparison,
+                 "estimate": estimation}
+
 
 def readable_file(prospective_file: str) -> str:
     if not isfile(prospective_file):
@@ -39,7 +76,8 @@ def valid_output_dir(prospective_path: str) -> str:
 
 
 def get_cli_args(parameters: Sequence[str] = sys.argv[1:]) \
-        -> Tuple[List[str], str, str, bool, str, str, str, str, int, str]:
+        -> Tuple[List[str], str, str, bool, str, str, str, str, int, str,
+                 str, bool, bool, Optional[int], int, str, bool, str]:
     """Parse command line parameters
     Parse program parameters using argparse module
     Args:
@@ -73,6 +111,18 @@ def get_cli_args(parameters: Sequence[str] = sys.argv[1:]) \
     parser.add_argument("-e", "--experiment", default="WG", type=str,
                         help="Experiment type, could be WG for Whole Genome or EX for Exome [default WG] ")
 
+    parser.add_argument("--targets", default=None, type=readable_file,
+                        help=("BED file of the capture targets of an exome, "
+                              "with -e EX only the records of the targets "
+                              "are read (optional) [default: whole VCF]"))
+
+    parser.add_argument("--triage",
+                        help=("estimate each sample from random regions of "
+                              "its indexed VCF, only samples whose "
+                              "estimation is close to the threshold are "
+                              "scanned in full"),
+                        action="store_true")
+
     parser.add_argument("-r", "--report",
                         help=("create a pdf report for contamination "
                               "estimation [default: no report]"),
@@ -83,6 +133,13 @@ def get_cli_args(parameters: Sequence[str] = sys.argv[1:]) \
                               "provided if a VCF is marked as contaminated"),
                         action="store_true")
 
+    parser.add_argument("--sketch-index", default="", type=str,
+                        help=("with -c, sketch index of the samples "
+                              "sequenced so far: the cohort is added to it "
+                              "and a contaminated sample is only compared "
+                              "with its most likely sources (optional) "
+                              "[default: compare with the cohort]"))
+
     parser.add_argument("-m", "--mail", default="", type=str,
                         help="send an email at the end of the job")
 
@@ -93,7 +150,7 @@ def get_cli_args(parameters: Sequence[str] = sys.argv[1:]) \
                         type=str,
                         help="DAG file name for pegasus")
 
-    parser.add_argument("-t", "--thread", default=4, type=int,
+    parser.add_argument("-t", "--thread", default=None, type=int,
                         help=("number of threads used by job"
                               "(optional) [default if check enable|disable: 4|1]"))
 
@@ -101,6 +158,36 @@ def get_cli_args(parameters: Sequence[str] = sys.argv[1:]) \
                         help=("Threshold for contaminated status"
                               "(optional) [default: 4 ]"))
 
+    parser.add_argument("--cache-dir", default="", type=str,
+                        help=("directory of sample fingerprints shared by "
+                              "runs, VCF already processed with the same "
+                              "parameters are not read again (optional) "
+                              "[default: no cache]"))
+
+    parser.add_argument("-u", "--update",
+                        help=("update the results of an existing output "
+                              "directory: only VCF not yet processed are "
+                              "analysed and only missing comparisons are "
+                              "added to existing summaries"),
+                        action="store_true")
+
+    parser.add_argument("--dry-run",
+                        help=("write the DAG and the batch file, print the "
+                              "predicted core-hours but do not submit"),
+                        action="store_true")
+
+    parser.add_argument("--batches", default=None, type=int,
+                        help=("split the VCF into this number of batches "
+                              "submitted independently, packed by VCF size "
+                              "(optional) [default: fewest batches within "
+                              "--batch-walltime]"))
+
+    parser.add_argument("--batch-walltime", default=MAX_DURATION, type=int,
+                        help=("target walltime of a batch in second, the "
+                              "cohort is split when a single batch would "
+                              "last longer (optional) [default: {}]"
+                              .format(MAX_DURATION)))
+
     # keep arguments
     args = parser.parse_args(parameters)
 
@@ -114,29 +201,35 @@ def get_cli_args(parameters: Sequence[str] = sys.argv[1:]) \
     thread = args.thread
     conta_threshold = args.threshold
     experiment = args.experiment
+    cache_dir = abspath(args.cache_dir) if args.cache_dir else ""
+    update = args.update
+    dry_run = args.dry_run
+    batches = args.batches
+    batch_walltime = args.batch_walltime
+    targets = args.targets or ""
+    sketch_index = abspath(args.sketch_index) if args.sketch_index else ""
+
+    if targets and experiment != "EX":
+        parser.error("--targets requires -e EX")
+
+    if args.triage and (check or targets):
+        parser.error("--triage is not compatible with -c and --targets")
+
+    if sketch_index and not check:
+        parser.error("--sketch-index requires -c")
+
+    # fail now rather than in the last task of the DAG
+    if args.report and not has_matplotlib():
+        parser.error(MISSING_MATPLOTLIB)
 
     if vcf_list is not None:
         try:
-            with open(vcf_list, 'r') as filin:
-                vcfs = filin.read().splitlines()
-                pass
+            vcfs = read_vcf_list(vcf_list)
         except IOError:
-            print("Error while opening list file {} : "
-                  "file does not exist".format(" ".join(vcf_list)),
-                  file=sys.stderr)
+            parser.error("cannot read list file {}".format(vcf_list))
     else:
         vcfs = vcf_file
 
-    #
-    for vcf in vcfs:
-        try:
-            with open(vcf, 'r'):
-                pass
-        except IOError:
-            print("Error while opening VCF file {} : "
-                  "file does not exist".format(" ".join(vcf)),
-                  file=sys.stderr)
-
     if not exists(out_dir):
         makedirs(out_dir)
 
@@ -145,13 +238,17 @@ def get_cli_args(parameters: Sequence[str] = sys.argv[1:]) \
     else:
         report = ""
 
+    if thread is None:
+        # default value depends of contaminant check
+        thread = 4 if check else 1
+
     if not thread > 0:
-        print("Error : --thread must be greather than 0 ", file=sys.stderr)
-        
-    if not check :
-        thread = 1
+        parser.error("--thread must be greater than 0")
+
+    if batches is not None and not batches > 0:
+        parser.error("--batches must be greater than 0")
 
-    return vcfs, out_dir, report, check, mail, accounting, dagname, thread, conta_threshold, experiment
+    return vcfs, out_dir, report, check, mail, accounting, dagname, thread, conta_threshold, experiment, cache_dir, update, dry_run, batches, batch_walltime, targets, args.triage, sketch_index
 
 
 def default_dagfile_name() -> str:
@@ -190,56 +287,164 @@ def task_cmd_if(conta_file: str, cmd: str) -> str:
     return task_cmd
 
 
-def create_report(basename_vcf: str, conta_file: str, dag_f: BinaryIO,
-                  out_dir: str, task_fmt: str, task_id2: str, current_vcf: str,
-                  vcfs: List[str], thread: int) -> None:
+def cache_option(cache_dir: str) -> List[str]:
+    """Fingerprint cache option of stage commands"""
+    if cache_dir:
+        return ["--cache-dir", cache_dir]
+    return []
+
+
+def is_up_to_date(stage: str, parameters: List[str]) -> bool:
+    """Test if the outputs of a stage task are still valid
+
+    The stage parses the parameters of the task and checks the manifest
+    written next to its outputs by a previous run, as the task does when it
+    starts.
+    """
+    module = stage_modules[stage]
+    return module.task_manifest(module.get_cli_args(parameters)).is_valid()
+
+
+def write_stage_task(dag_f: BinaryIO, task_fmt: str, task_id: str,
+                     core: int, stage: str, parameters: List[str]) -> None:
+    task_conf = task_fmt.format(id=task_id, core=core)
+    task_cmd = " ".join([script_name, stage] + parameters)
+    write_binary(dag_f, task_conf + "\"" + task_cmd + "\"\n")
+
+
+def write_vcf_list(dag_file: str, vcfs: List[str]) -> str:
+    """Write the list of vcf read by the cohort tasks next to the DAG"""
+    vcf_list = dag_file + ".vcfs"
+    with open(vcf_list, "w") as vcf_list_f:
+        vcf_list_f.write("".join(vcf + "\n" for vcf in vcfs))
+    return vcf_list
+
+
+def create_report(dag_f: BinaryIO, vcf_list: str, out_dir: str,
+                  task_fmt: str, report_tasks: List[str], thread: int,
+                  cache_dir: str = "", update: bool = False,
+                  cohort_list: str = "",
+                  sketch_index: str = "") -> Optional[str]:
     """Report generator
 
-    This function append some extra tasks to the DAG in order to generate a
-    report on each provided vcf file
+    This function append a task to the DAG in order to compare the
+    potentially contaminant variants of each contaminated sample with each
+    other provided vcf file. These variants are selected by the ABCalc_
+    tasks, the comparison of the whole cohort is done in one process which
+    reads each vcf file once.
 
     Args:
-        :param basename_vcf: The base name of vcf file
-        :param conta_file: The generated contaminant file to be processed
-        :param dag_f: the dag file to append the extra tasks
+        :param dag_f: the dag file to append the extra task
+        :param vcf_list: file of the vcf of the cohort
         :param out_dir: Directory to put results
         :param task_fmt: A format string to write a task into the DAG
-        :param task_id2: The task id which generate generate the contaminant file
-        :param current_vcf: Path to current vcf analysed
-        :param vcfs: A list of vcf file path
-        :param thread:
+        :param report_tasks: The task ids which generate the contaminant files
+        :param thread: number of processes reading vcf files
+        :param cache_dir: directory of sample fingerprints, empty to disable
+        :param update: only add missing comparisons to existing summaries
+        :param cohort_list: file of the vcf of the whole cohort when the
+                            DAG is a batch of it, the samples of vcf_list
+                            are compared with the whole cohort
+        :param sketch_index: sketch index searched for the sources of the
+                             contaminated samples, empty to compare them
+                             with the cohort
+
+    Returns:
+        The id of the comparison task, None when the summaries are up to
+        date and no sample is estimated again
     """
-    file_extension = "AB_0.00_to_0.11"
-    basename_conta = join(out_dir, basename_vcf + "_" + file_extension)
-    vcf_conta = join(out_dir, basename_conta + "_noLCRnoDUP.vcf.gz")
-    # select potentialy contaminant variants
-    task_id3 = "RecupConta_" + basename_vcf
-    task_conf = task_fmt.format(id=task_id3, core=thread)
-    cmd = ("recupConta.sh -f " + current_vcf + " -c " + vcf_conta)
-    task_cmd = task_cmd_if(conta_file, cmd)
-    write_intermediate_task(dag_f, task_conf, task_cmd, task_id2, task_id3)
-    # summary file for comparisons
-    summary_file = join(out_dir, basename_vcf + "_comparisonSummary.txt")
-    # comparisons with other vcf
-    for vcf_compare in vcfs:
-        if vcf_compare != current_vcf:
-            vcf_name = basename(vcf_compare)
-            vcf_compare_basename = str(vcf_name.split(".vcf")[0])
-            task_id4 = ("Compare_" + basename_vcf + "_" +
-                        vcf_compare_basename)
-            task_conf = task_fmt.format(id=task_id4, core=thread)
-            cmd = ("checkContaminant.sh -f " + vcf_compare +
-                   " -c " + vcf_conta + " -s " + summary_file)
-            task_cmd = task_cmd_if(conta_file, cmd)
-            write_intermediate_task(dag_f, task_conf, task_cmd, task_id3,
-                                    task_id4)
+    task_id = "Compare_all"
+    parameters = ["-l", vcf_list]
+    if cohort_list:
+        parameters = ["-l", cohort_list, "--samples", vcf_list]
+    parameters += (["-o", out_dir, "-t", str(thread)] +
+                   cache_option(cache_dir))
+    if update:
+        parameters.append("--update")
+    if sketch_index:
+        parameters += ["--sketch-index", sketch_index]
+    if not report_tasks and is_up_to_date("compare", parameters):
+        return None
+    write_stage_task(dag_f, task_fmt, task_id, thread, "compare", parameters)
+    for report_task in report_tasks:
+        write_edge_task(dag_f, report_task, task_id)
+    return task_id
+
+
+def create_cohort_report(dag_f: BinaryIO, vcf_list: str, out_dir: str,
+                         task_fmt: str, parent_tasks: List[str],
+                         conta_threshold: int, experiment: str,
+                         output: str = "") -> None:
+    """Append the task drawing the pdf report of the whole cohort
+
+    The report is drawn once every sample is estimated, and compared when
+    contaminant check is enabled, by a single process which loads each
+    dataset once.
+
+    Args:
+        :param dag_f: the dag file to append the extra task
+        :param vcf_list: file of the vcf of the cohort
+        :param out_dir: Directory to put results
+        :param task_fmt: A format string to write a task into the DAG
+        :param parent_tasks: The task ids the report depends on
+        :param conta_threshold: threshold for contaminated status
+        :param experiment: WG or EX
+        :param output: pdf file of the report [default: the cohort report
+                       of out_dir]
+    """
+    task_id = "Report_cohort"
+    task_conf = task_fmt.format(id=task_id, core=1)
+    task_cmd = (script_name + " report -l " + vcf_list + " -o " + out_dir +
+                " -s " + str(conta_threshold) + " --experiment " +
+                experiment)
+    if output:
+        task_cmd += " --output " + output
+    write_binary(dag_f, task_conf + "\"" + task_cmd + "\"\n")
+    for parent_task in parent_tasks:
+        write_edge_task(dag_f, parent_task, task_id)
+
+
+def create_collect_task(dag_f: BinaryIO, vcf_list: str, out_dir: str,
+                        task_fmt: str, parent_tasks: List[str],
+                        database: str = "") -> None:
+    """Append the task merging the results into the project database
+
+    Nothing is appended when no task runs and the database exists.
+
+    Args:
+        :param dag_f: the dag file to append the extra task
+        :param vcf_list: file of the vcf of the cohort
+        :param out_dir: Directory to put results
+        :param task_fmt: A format string to write a task into the DAG
+        :param parent_tasks: The task ids writing the collected outputs
+        :param database: results database, empty for the database of the
+                         project
+    """
+    if not parent_tasks and isfile(database or
+                                   results.results_file(out_dir)):
+        return
+    task_id = "Collect_results"
+    parameters = ["-l", vcf_list, "-o", out_dir]
+    if database:
+        parameters += ["--database", database]
+    write_stage_task(dag_f, task_fmt, task_id, 1, "collect", parameters)
+    for parent_task in parent_tasks:
+        write_edge_task(dag_f, parent_task, task_id)
 
 
 def write_dag_file(check: bool, dag_file: str, out_dir: str, report: str,
                    task_fmt: str, vcfs: List[str], thread: int,
-                   conta_threshold: int, experiment: str) -> None:
+                   conta_threshold: int, experiment: str,
+                   cache_dir: str = "", update: bool = False,
+                   cohort_list: str = "", targets: str = "",
+                   triage: bool = False, sketch_index: str = "") -> None:
     """Write a DAG of tasks into a file
 
+    Once the samples are estimated, and compared, their results are merged
+    into the project database by a Collect_results task.
+    The DAG of a batch of a larger cohort compares its samples with the
+    whole cohort and draws the report of its own samples.
+
     Args:
         :param check: A flag to enable contaminant check
         :param dag_file: the dag file path
@@ -247,53 +452,105 @@ def write_dag_file(check: bool, dag_file: str, out_dir: str, report: str,
         :param report: A flag to generate or not the report
         :param task_fmt: A format string to write a task into the DAG
         :param vcfs: A list of vcf file path
-        :param thread:
+        :param thread: number of cores of ABCalc_ and Compare_all tasks
         :param conta_threshold:
-        :param experiment: used for contaReport.R could be WG or Ex but EX not yet supoorted
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param cache_dir: directory of sample fingerprints, empty to disable
+        :param update: skip the tasks of VCF already processed in out_dir
+        :param cohort_list: file of the vcf of the whole cohort when vcfs
+                            are a batch of it, empty otherwise
+        :param targets: BED file of the capture targets read by the ABCalc_
+                        tasks, empty to read whole VCF
+        :param triage: estimate the samples from random regions, a Triage_
+                       task by sample replaces ABCalc_ and Report_ tasks
+        :param sketch_index: sketch index searched for the sources of the
+                             contaminated samples, empty to compare them
+                             with the cohort
     """
     page_size = io.DEFAULT_BUFFER_SIZE
+    report_tasks = []
     with open(dag_file, "wb", buffering=10 * page_size) as dag_f:
         for current_vcf in vcfs:
             # path_obj = Path(current_vcf)
             # basename_vcf = path_obj.stem
             vcf_name = str(basename(current_vcf))
             basename_vcf = str(vcf_name.split(".vcf")[0])
+            if update and is_processed(out_dir, basename_vcf, check):
+                continue
             vcf_hist = join(out_dir, basename_vcf + ".hist")
             depth_estim = join(out_dir, basename_vcf + ".meandepth")
             conta_file = join(out_dir, basename_vcf + ".conta")
-            report_name = join(out_dir, basename_vcf + ".pdf")
 
-            # calcul allelic balance
-            task_id1 = "ABCalc_" + basename_vcf
-            task_conf = task_fmt.format(id=task_id1, core=1)
-            task_cmd = "calculAllelicBalance.sh -f " + current_vcf + \
-                       " -o " + vcf_hist + " -d " + depth_estim
-            write_binary(dag_f, task_conf + "\"" + task_cmd + "\"\n")
+            if triage:
+                task_id = "Triage_" + basename_vcf
+                write_stage_task(dag_f, task_fmt, task_id, thread, "triage",
+                                 ["-f", current_vcf, "-o", out_dir, "-s",
+                                  str(conta_threshold), "-e", experiment,
+                                  "-t", str(thread)])
+                report_tasks.append(task_id)
+                continue
 
-            # test and report contamination
-            task_id2 = "Report_" + basename_vcf
-            task_conf = task_fmt.format(id=task_id2, core=1)
-            task_cmd = ("contaReport.R --input " + vcf_hist + " --output "
-                        + conta_file + " " + report + " --reportName "
-                        + report_name + " -t " + str(conta_threshold) +
-                        " --experiment " + experiment +
-                        " -d $(< " + depth_estim + " )")
-            write_binary(dag_f, task_conf + "\"" + task_cmd + "\"\n")
-            write_edge_task(dag_f, task_id1, task_id2)
-
-            # proceed to comparison
+            # calcul allelic balance, regions are processed in parallel
+            task_id1 = "ABCalc_" + basename_vcf
+            parameters = (["-f", current_vcf, "-o", vcf_hist, "-d",
+                           depth_estim, "-t", str(thread)] +
+                          cache_option(cache_dir))
+            if targets:
+                parameters += ["--targets", targets]
             if check is True:
-                create_report(basename_vcf, conta_file, dag_f, out_dir,
-                              task_fmt, task_id2, current_vcf, vcfs, thread)
+                # select potentially contaminant variants in the same pass
+                parameters += ["-c", candidates_file(out_dir, basename_vcf)]
+            # tasks whose outputs are still valid are skipped
+            abcalc_done = is_up_to_date("abcalc", parameters)
+            if not abcalc_done:
+                write_stage_task(dag_f, task_fmt, task_id1, thread, "abcalc",
+                                 parameters)
+
+            # test contamination, the pdf is drawn for the whole cohort
+            task_id2 = "Report_" + basename_vcf
+            parameters = ["--input", vcf_hist, "--output", conta_file, "-t",
+                          str(conta_threshold), "--experiment", experiment,
+                          "--depth-file", depth_estim]
+            if abcalc_done and is_up_to_date("estimate", parameters):
+                continue
+            write_stage_task(dag_f, task_fmt, task_id2, 1, "estimate",
+                             parameters)
+            if not abcalc_done:
+                write_edge_task(dag_f, task_id1, task_id2)
+            report_tasks.append(task_id2)
+
+        vcf_list = write_vcf_list(dag_file, vcfs)
+        # proceed to comparison once every sample is tested
+        if check is True:
+            compare_task = create_report(dag_f, vcf_list, out_dir, task_fmt,
+                                         report_tasks, thread, cache_dir,
+                                         update, cohort_list, sketch_index)
+            report_tasks = [compare_task] if compare_task else []
+        # batches run at the same time, each one writes its own database
+        # and the cohort is collected once every batch is done
+        database = dag_file + ".sqlite" if cohort_list else ""
+        create_collect_task(dag_f, vcf_list, out_dir, task_fmt, report_tasks,
+                            database)
+        if report:
+            output = ""
+            if cohort_list:
+                output = join(out_dir, basename(dag_file) + ".pdf")
+            create_cohort_report(dag_f, vcf_list, out_dir, task_fmt,
+                                 report_tasks, conta_threshold, experiment,
+                                 output)
 
 
 def write_batch_file(dag_file: str, msub_file: str, nb_vcf: int, thread: int,  
                      out_dir: str,
                      mail: Union[str, None] = None,
                      accounting: Union[str, None] = None,
-                     check: bool = False) -> None:
+                     check: bool = False,
+                     plan: Optional[BatchPlan] = None) -> None:
     """Write a Batch file to be processed by SLURM
 
+    On a SLURM cluster, the batch file submits the tasks of the DAG as job
+    arrays, see slurm.write_slurm_jobs.
+
     Args:
         :param dag_file: The dag file path
         :param mail: User mail to be notified
@@ -302,11 +559,22 @@ def write_batch_file(dag_file: str, msub_file: str, nb_vcf: int, thread: int,
         :param out_dir: Directory to output slurm error and output files
         :param accounting: msub option for calculation time imputation
         :param check: option for contaminant identification
+        :param plan: resources predicted from previous runs, None to size
+                     the job from the number of VCF
     """
-    with open(msub_file, "wb", ) as msub_f:
-        nb_vcf_by_task = nb_vcf_by_tasks(nb_vcf)
-        clust_param = machine_param(out_dir, nb_vcf, thread, check)
+    nb_vcf_by_task = nb_vcf_by_tasks(nb_vcf)
+    if plan is not None:
+        nb_vcf_by_task = plan.nb_task
+    clust_param = machine_param(out_dir, nb_vcf, thread, check, plan)
+    if clust_param.get("slurm"):
+        # a job array by stage, as many samples at once as MSUB tasks
+        walltime = plan.duration if plan is not None else \
+            job_duration(nb_vcf, check)
+        slurm.write_slurm_jobs(dag_file, msub_file, out_dir, nb_vcf_by_task,
+                               walltime, accounting or "", mail or "")
+        return
 
+    with open(msub_file, "wb", ) as msub_f:
         if clust_param.get("cea_clust"):
             # Clusters parameters
             write_binary(msub_f, clust_param.get("msub_info"))
@@ -327,6 +595,7 @@ def write_batch_file(dag_file: str, msub_file: str, nb_vcf: int, thread: int,
 
             # MODULES LOAD
             write_binary(msub_f, clust_param.get("msub_module_load"))
+            write_timeline_env(msub_f, dag_file)
 
             # PEGASUS Command
             mpi_exe = clust_param.get("mpi_exe")
@@ -339,20 +608,25 @@ def write_batch_file(dag_file: str, msub_file: str, nb_vcf: int, thread: int,
 
         else:
             write_binary(msub_f, clust_param.get("msub_info"))
-            # PEGASUS Command
-            mpi_exe = clust_param.get("mpi_exe")
-            mpi_opt = clust_param.get("mpi_opt")
-            write_binary(msub_f, mpi_exe + " " + mpi_opt + " -n " +
-                         str(2) + " pegasus-mpi-cluster --keep-affinity " +
-                         dag_file + "\n")
+            write_timeline_env(msub_f, dag_file)
+            # tasks are run by the local executor, neither MPI nor pegasus
+            # are needed
+            write_binary(msub_f, script_name + " run " + dag_file + "\n")
             if mail is not None:
                 if len(mail) > 0:
                     write_binary(msub_f, 'mail -s "[Contatester] is terminate" '
                                  + mail + ' < /dev/null\n')
 
 
+def write_timeline_env(msub_f: BinaryIO, dag_file: str) -> None:
+    """Make the tasks record their resources, see contatester profile"""
+    write_binary(msub_f, "export " + timeline.TIMELINE_ENV + "=" +
+                 timeline.timeline_file(dag_file) + "\n")
+
+
 def machine_param(out_dir: str, nb_vcf: int, thread: int,
-                  check: bool = False) -> Dict[str, Union[bool, str]]:
+                  check: bool = False, plan: Optional[BatchPlan] = None) \
+        -> Dict[str, Union[bool, str]]:
     """ Test machine and apply a configuration
     Usage :
     clust_param = machine_param(out_dir, nb_task))
@@ -365,14 +639,19 @@ def machine_param(out_dir: str, nb_vcf: int, thread: int,
     :param out_dir:
     :param nb_vcf:
     :param check
+    :param plan: resources predicted from previous runs
     :return: dictionary
     """
-    nb_vcf_by_task = nb_vcf_by_tasks(nb_vcf)
-    pipeline_duration = job_duration(nb_vcf, check)
+    if plan is not None:
+        nb_vcf_by_task = plan.nb_task
+        pipeline_duration = plan.duration
+        thread = plan.nb_core
+    else:
+        nb_vcf_by_task = nb_vcf_by_tasks(nb_vcf)
+        pipeline_duration = job_duration(nb_vcf, check)
 
-    common_load = ("module load pegasus\n" +
-                   "module load bcftools/1.9\n" +
-                   "module load r\n")
+    common_load = "module load pegasus\n"
+    slurm_clust = False
 
     if isdir("/ccc"):
         # si machine cobalt
@@ -413,13 +692,25 @@ def machine_param(out_dir: str, nb_vcf: int, thread: int,
                      "#MSUB -q normal\n" +
                      "#MSUB -T " + str(pipeline_duration) + "\n")
         msub_module_load = common_load
+    elif shutil.which("sbatch"):
+        # SLURM cluster, stages are submitted as job arrays, see slurm
+        cea_clust = False
+        slurm_clust = True
+        batch_exe = "bash"
+        run_exe = "srun"
+        mpi_exe = ""
+        mpi_opt = ""
+        nb_core = thread
+        msub_info = ""
+        msub_module_load = ""
     else:
         # Default machine
         cea_clust = False
         batch_exe = "bash"
         run_exe = ""
-        mpi_exe = "mpirun"
-        mpi_opt = "-oversubscribe"
+        # DAG run by contatester run
+        mpi_exe = ""
+        mpi_opt = ""
         nb_core = thread
         # host_cpus = ""
         msub_info = ("#!/bin/bash\n" +
@@ -430,6 +721,7 @@ def machine_param(out_dir: str, nb_vcf: int, thread: int,
 
     clust_param = {}
     clust_param["cea_clust"] = cea_clust
+    clust_param["slurm"] = slurm_clust
     clust_param["batch_exe"] = batch_exe
     clust_param["run_exe"] = run_exe
     clust_param["mpi_exe"] = mpi_exe
@@ -466,7 +758,8 @@ def nb_runs(nb_vcf: int, nb_vcf_by_task: int) -> int:
 
 def job_duration(nb_vcf: int, check: bool = False) -> int:
     """
-    Used to set an optimised maximum time duration for the job
+    Used to set an optimised maximum time duration for the job when no run
+    is recorded into the runtime history, see runtime.plan_batch
     :param nb_vcf:
     :param check:
     :return: pipeline_duration
@@ -501,38 +794,151 @@ def job_duration(nb_vcf: int, check: bool = False) -> int:
     return pipeline_duration
 
 
+def dry_run_summary(dag_file: str, msub_file: str, nb_vcf: int, thread: int,
+                    check: bool, plan: Optional[BatchPlan]) -> str:
+    """Resources the batch file would request, printed by --dry-run"""
+    lines = ["DAG file: " + dag_file, "Batch file: " + msub_file]
+    if plan is None:
+        nb_task = nb_vcf_by_tasks(nb_vcf)
+        duration = job_duration(nb_vcf, check)
+        lines += ["No run recorded into {}, job sized from the number of VCF"
+                  .format(history_file()),
+                  "{} task(s) of {} core(s), requested walltime {} s"
+                  .format(nb_task, thread, duration),
+                  "Requested core-hours: {:.2f}"
+                  .format(nb_task * thread * duration / 3600)]
+        return "\n".join(lines) + "\n"
+    return "\n".join(lines) + "\n" + plan.summary()
+
+
+def split_cohort(vcfs: List[str], durations: List[float],
+                 nb_batch: Optional[int] = None,
+                 walltime: int = MAX_DURATION) -> List[List[str]]:
+    """Split the VCF into batches submitted independently
+
+    Batches are packed by predicted duration, hence by VCF size, so that
+    each one runs within the walltime.
+
+    Args:
+        :param vcfs: VCF of the cohort
+        :param durations: predicted duration of each VCF, 0 when processed
+        :param nb_batch: number of batches, None to fit the walltime
+        :param walltime: target walltime of a batch in second
+
+    Returns:
+        The VCF of each batch, in the order of the cohort
+    """
+    if nb_batch is None:
+        nb_batch = count_batches(durations, walltime)
+    if nb_batch <= 1:
+        return [vcfs]
+    return [[vcfs[index] for index in batch]
+            for batch in partition(durations, nb_batch)]
+
+
+def batch_dagname(dagname: str, batch: int) -> str:
+    return "{}.batch{:03d}".format(dagname, batch + 1)
+
+
 # Main
 def main():
-    vcfs, out_dir, report, check, mail, accounting, dagname, thread, conta_threshold, experiment = get_cli_args()
+    if len(sys.argv) > 1 and sys.argv[1] in stages:
+        sys.exit(timeline.run_stage(sys.argv[1], stages[sys.argv[1]],
+                                    sys.argv[2:]))
+
+    vcfs, out_dir, report, check, mail, accounting, dagname, thread, conta_threshold, experiment, cache_dir, update, dry_run, nb_batch, batch_walltime, targets, triage_mode, sketch_index = get_cli_args()
+
+    # inputs are checked before anything is submitted, indexes are built
+    # when the tasks read regions; ABCalc_ tasks exclude the regions of the
+    # default reference
+    regions = [gnomad_bed(DEFAULT_REFERENCE)] if check else []
+    if targets:
+        regions.append(targets)
+    unindexed = []  # type: List[str]
+    errors = preflight.preflight(vcfs, thread > 1 or bool(targets) or
+                                 triage_mode, triage_mode,
+                                 DEFAULT_REFERENCE if check else None,
+                                 executor.available_cores(), regions,
+                                 dry_run, unindexed)
+    for vcf in unindexed:
+        print("{} would be indexed".format(vcf))
+    if errors:
+        for error in errors:
+            print("Error {}".format(error), file=sys.stderr)
+        print("{} problem(s) found into the inputs, nothing submitted"
+              .format(len(errors)), file=sys.stderr)
+        sys.exit(1)
+
+    models = load_models()
+    processed = set()
+    if update:
+        # size the job for the VCF not yet processed
+        processed = set(vcf for vcf in vcfs
+                        if is_processed(out_dir, sample_name(vcf), check))
+    durations = [0.0 if vcf in processed else duration for vcf, duration in
+                 zip(vcfs, sample_durations(vcfs, thread, models))]
+    batches = split_cohort(vcfs, durations, nb_batch, batch_walltime)
+    cohort_list = ""
+    if len(batches) > 1:
+        # each batch compares its samples with the whole cohort
+        cohort_list = write_vcf_list(join(out_dir, dagname), vcfs)
+        print("{} VCF split into {} batches".format(len(vcfs), len(batches)))
 
-    dag_file = join(out_dir, dagname)
-    msub_file = join(out_dir, dagname + ".msub")
-    if isfile(dag_file):
-        remove(dag_file)
     task_fmt = "TASK {id} -c {core} bash -c "
-    write_dag_file(check, dag_file, out_dir, report, task_fmt, vcfs, int(thread),
-                   conta_threshold, experiment)
-
-    nb_vcf = len(vcfs)
-    write_batch_file(dag_file, msub_file, nb_vcf, thread, out_dir, mail, 
-                     accounting, check)
-
-    # remove rescue file and ressource file
-    res_files = glob.glob(dag_file + ".res*")
-    for res in res_files:
-        if isfile(res):
-            remove(res)
-
-    # Start Script
-    clust_param = machine_param(out_dir, nb_vcf, thread, check)
-    batch_exe = clust_param.get("batch_exe")
-    cmd = [batch_exe, msub_file]
-
-    p = subprocess.call(cmd)
-    if p != 0:
-        print("Error while running contatester: {} ".format(" ".join(cmd)),
-              file=sys.stderr)
-    sys.exit(p)
+    status = 0
+    for batch, batch_vcfs in enumerate(batches):
+        if cohort_list:
+            dag_file = join(out_dir, batch_dagname(dagname, batch))
+        else:
+            dag_file = join(out_dir, dagname)
+        msub_file = dag_file + ".msub"
+        if isfile(dag_file):
+            remove(dag_file)
+        write_dag_file(check, dag_file, out_dir, report, task_fmt, batch_vcfs,
+                       int(thread), conta_threshold, experiment, cache_dir,
+                       update, cohort_list, targets, triage_mode,
+                       sketch_index)
+
+        todo_vcfs = [vcf for vcf in batch_vcfs if vcf not in processed]
+        nb_vcf = max(1, len(todo_vcfs))
+        # size the job from the runtime of previous runs when there are some
+        plan = plan_batch(todo_vcfs, thread, check, bool(report), models)
+        write_batch_file(dag_file, msub_file, nb_vcf, thread, out_dir, mail,
+                         accounting, check, plan)
+
+        if dry_run:
+            print(dry_run_summary(dag_file, msub_file, nb_vcf, thread, check,
+                                  plan), end="")
+            continue
+
+        # remove rescue file, ressource file and timeline of a previous run
+        res_files = glob.glob(dag_file + ".res*") + \
+            [timeline.timeline_file(dag_file)]
+        for res in res_files:
+            if isfile(res):
+                remove(res)
+
+        # Start Script, batches do not depend on each other
+        clust_param = machine_param(out_dir, nb_vcf, thread, check, plan)
+        batch_exe = clust_param.get("batch_exe")
+        cmd = [batch_exe, msub_file]
+
+        p = subprocess.call(cmd)
+        if p != 0:
+            print("Error while running contatester: {} ".format(" ".join(cmd)),
+                  file=sys.stderr)
+            status = p
+
+    if cohort_list:
+        print("Once every batch is done, collect the results of the cohort "
+              "with: {} collect -l {} -o {}"
+              .format(script_name, cohort_list, out_dir))
+    if cohort_list and report:
+        print("Once every batch is done, draw the report of the cohort with: "
+              "{} report -l {} -o {} -s {} --experiment {}"
+              .format(script_name, cohort_list, out_dir, conta_threshold,
+                      experiment))
+    sys.exit(status)
 
 
 if __name__ == '__main__':
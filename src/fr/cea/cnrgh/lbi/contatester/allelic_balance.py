@@ -0,0 +1,595 @@
+# Import necessary libraries:
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, \
+    Sequence, Tuple
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.bgzf import BgzfReader, BgzfWriter
+from fr.cea.cnrgh.lbi.contatester.data import DEFAULT_REFERENCE, \
+    REFERENCES, gnomad_bed
+from fr.cea.cnrgh.lbi.contatester.fingerprint import FingerprintCache, \
+    CACHE_SIZE, Arrays, open_cache, sites_to_arrays
+from fr.cea.cnrgh.lbi.contatester.manifest import Manifest, manifest_file
+from fr.cea.cnrgh.lbi.contatester.regions import Regions, load_bed
+from fr.cea.cnrgh.lbi.contatester.runtime import files_size, \
+    record_runtime
+from fr.cea.cnrgh.lbi.contatester.tabix import TabixIndex, MAX_POSITION, \
+    has_index, index_path, read_index
+from fr.cea.cnrgh.lbi.contatester.vcf import open_vcf, iter_records, \
+    iter_region, iter_targets, is_snp, read_header, sample_ad_values, \
+    padded_ad
+
+# Allele balance histogram from 0.00 to 1.00 with a 0.01 step
+NB_BINS = 101
+# Allele balance range of potentially contaminant variants
+AB_START = 0.00
+AB_END = 0.11
+# Length of the regions processed in parallel
+SHARD_SIZE = 10000000
+
+
+@lru_cache(maxsize=65536)
+def ab_bin(alt_depth: int, total_depth: int) -> int:
+    """Histogram bin of an allele balance
+
+    The bin is the one printed by awk with "%.2f", both use the exact
+    decimal rounding of the double value.
+
+    Args:
+        :param alt_depth: depth of the first alternate allele
+        :param total_depth: depth of reference and two first alternate alleles
+
+    Returns:
+        An integer between 0 and 100
+    """
+    return int(round(round(alt_depth / total_depth, 2) * 100))
+
+
+class AlleleBalance:
+    """Allele balance histogram and depth accumulator of a sample
+
+    With keep_sites, the positions of all SNP are kept by sequence too, for
+    the fingerprint used by the comparison stage. cores is the number of
+    processes which read the VCF, cached is set when the counts were read
+    from the fingerprint cache instead.
+    """
+
+    def __init__(self, keep_sites: bool = False) -> None:
+        self.histogram = [0] * NB_BINS  # type: List[int]
+        self.depth_sum = 0
+        self.nb_snp = 0
+        self.cores = 1
+        self.cached = False
+        self.sites = None  # type: Optional[Dict[bytes, array]]
+        if keep_sites:
+            self.sites = {}
+
+    def add_site(self, chrom: bytes, pos: int) -> None:
+        positions = self.sites.get(chrom)
+        if positions is None:
+            positions = self.sites[chrom] = array("I")
+        positions.append(pos)
+
+    def add(self, ad: List[int]) -> None:
+        """Account a SNP from its allelic depths
+
+        Args:
+            :param ad: the 4 first allelic depths of the SNP
+        """
+        self.depth_sum += ad[0] + ad[1] + ad[2] + ad[3]
+        self.nb_snp += 1
+        total_depth = ad[0] + ad[1] + ad[2]
+        if total_depth != 0:
+            self.histogram[ab_bin(ad[1], total_depth)] += 1
+
+    def merge(self, other: "AlleleBalance") -> None:
+        """Add the counts of a partial result"""
+        for i, count in enumerate(other.histogram):
+            self.histogram[i] += count
+        self.depth_sum += other.depth_sum
+        self.nb_snp += other.nb_snp
+        if self.sites is not None and other.sites is not None:
+            for chrom, positions in other.sites.items():
+                self.sites.setdefault(chrom, array("I")).extend(positions)
+
+    def mean_depth(self) -> float:
+        if self.nb_snp == 0:
+            raise ValueError("No SNP found, mean depth is undefined")
+        return self.depth_sum / self.nb_snp
+
+    def to_arrays(self) -> Arrays:
+        """Content of a fingerprint, without the sites"""
+        return {"histogram": np.array(self.histogram, dtype=np.int64),
+                "depth_sum": np.array(self.depth_sum, dtype=np.int64),
+                "nb_snp": np.array(self.nb_snp, dtype=np.int64)}
+
+    @staticmethod
+    def from_arrays(arrays: Arrays) -> "AlleleBalance":
+        result = AlleleBalance()
+        result.histogram = arrays["histogram"].tolist()
+        result.depth_sum = int(arrays["depth_sum"])
+        result.nb_snp = int(arrays["nb_snp"])
+        result.cached = True
+        return result
+
+
+class CandidateSelector:
+    """Select SNP in an allele balance range outside excluded regions
+
+    The selection is the one of recupConta.sh: the allele balance is
+    computed with and without the second alternate allele and bounds are
+    excluded.
+    """
+
+    def __init__(self, ab_start: float = AB_START, ab_end: float = AB_END,
+                 excluded: Optional[Regions] = None) -> None:
+        self.ab_start = ab_start
+        self.ab_end = ab_end
+        self.excluded = excluded
+
+    def _in_range(self, alt_depth: int, total_depth: int) -> bool:
+        return (total_depth > 0 and
+                self.ab_start < alt_depth / total_depth < self.ab_end)
+
+    def accept(self, fields: List[bytes],
+               ad_values: List[Optional[int]]) -> bool:
+        """Test if a SNP record is a potentially contaminant variant
+
+        Args:
+            :param fields: record split by iter_records
+            :param ad_values: allelic depths of the record
+        """
+        if len(ad_values) < 2 or ad_values[0] is None or ad_values[1] is None:
+            return False
+        selected = self._in_range(ad_values[1], ad_values[0] + ad_values[1])
+        if not selected and len(ad_values) > 2 and ad_values[2] is not None:
+            selected = self._in_range(ad_values[1], ad_values[0] +
+                                      ad_values[1] + ad_values[2])
+        if selected and self.excluded is not None:
+            selected = not self.excluded.contains(fields[0], int(fields[1]))
+        return selected
+
+
+def scan_records(records: Iterable[List[bytes]], result: AlleleBalance,
+                 hist_excluded: Optional[Regions] = None,
+                 selector: Optional[CandidateSelector] = None,
+                 emit: Optional[Callable[[bytes], None]] = None) -> None:
+    """Accumulate SNP records into a result and emit selected ones
+
+    Args:
+        :param records: records split by iter_records or iter_region
+        :param result: the accumulator to fill
+        :param hist_excluded: regions excluded from histogram and depth
+        :param selector: selection of potentially contaminant variants
+        :param emit: called with each selected record line
+    """
+    format_cache = {}  # type: Dict[bytes, int]
+    for fields in records:
+        if not is_snp(fields[3], fields[4]):
+            continue
+        if result.sites is not None:
+            result.add_site(fields[0], int(fields[1]))
+        ad_values = sample_ad_values(fields, format_cache)
+        if hist_excluded is None or \
+                not hist_excluded.contains(fields[0], int(fields[1])):
+            result.add(padded_ad(ad_values))
+        if selector is not None and selector.accept(fields, ad_values):
+            emit(b"\t".join(fields) + b"\n")
+
+
+_regions_cache = {}  # type: Dict[str, Regions]
+_index_cache = {}  # type: Dict[str, TabixIndex]
+
+
+def cached_regions(bed_file: Optional[str]) -> Optional[Regions]:
+    """Load a BED file once by process"""
+    if bed_file is None:
+        return None
+    if bed_file not in _regions_cache:
+        _regions_cache[bed_file] = load_bed(bed_file)
+    return _regions_cache[bed_file]
+
+
+def cached_index(vcf_file: str) -> TabixIndex:
+    """Read the tabix index of a VCF once by process"""
+    if vcf_file not in _index_cache:
+        _index_cache[vcf_file] = read_index(index_path(vcf_file))
+    return _index_cache[vcf_file]
+
+
+def on_targets(records: Iterable[List[bytes]],
+               targets: Regions) -> Iterator[List[bytes]]:
+    """Records starting in target regions, for a VCF read as a stream"""
+    for fields in records:
+        if targets.contains(fields[0], int(fields[1])):
+            yield fields
+
+
+def plan_shards(index: TabixIndex, shard_size: int = SHARD_SIZE,
+                targets: Optional[Regions] = None) \
+        -> List[Tuple[bytes, int, int, int]]:
+    """Split the indexed sequences into regions processed independently
+
+    Args:
+        :param index: tabix index of the VCF
+        :param shard_size: length of a region, 0 for a region by sequence
+        :param targets: capture targets, regions without target are dropped
+
+    Returns:
+        A list of (sequence, 0-based start, 0-based end, virtual offset) in
+        file order
+    """
+    shards = []
+    for name, sequence in zip(index.names, index.sequences):
+        if shard_size <= 0:
+            starts = [0]
+        else:
+            starts = list(range(0, max(sequence.length(), 1), shard_size))
+        for i, beg in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else MAX_POSITION
+            if targets is not None and not targets.intervals(name, beg, end):
+                continue
+            shards.append((name, beg, end, sequence.offset_at(beg)))
+    return shards
+
+
+def shard_allele_balance(vcf_file: str, shard: Tuple[bytes, int, int, int],
+                         bed_file: Optional[str], exclude_hist: bool,
+                         ab_range: Optional[Tuple[float, float]],
+                         keep_sites: bool = False,
+                         targets_file: Optional[str] = None) \
+        -> Tuple[AlleleBalance, List[bytes]]:
+    """Partial result of a region, run by the workers of the process pool
+
+    With targets, only the blocks of the region holding target records are
+    read.
+
+    Args:
+        :param vcf_file: path to a bgzipped and tabix indexed VCF
+        :param shard: region as returned by plan_shards
+        :param bed_file: BED file of regions to exclude
+        :param exclude_hist: exclude regions from histogram and depth too
+        :param ab_range: allele balance range of selected variants, None to
+                         disable the selection
+        :param keep_sites: keep the positions of SNP
+        :param targets_file: BED file of capture targets
+
+    Returns:
+        The partial AlleleBalance and the selected record lines
+    """
+    chrom, beg, end, offset = shard
+    excluded = cached_regions(bed_file)
+    selector = None
+    if ab_range is not None:
+        selector = CandidateSelector(ab_range[0], ab_range[1], excluded)
+    result = AlleleBalance(keep_sites)
+    selected = []  # type: List[bytes]
+    with BgzfReader(vcf_file) as reader:
+        if targets_file is None:
+            records = iter_region(reader, offset, chrom, beg, end)
+        else:
+            records = iter_targets(reader,
+                                   cached_index(vcf_file).sequence(chrom),
+                                   chrom, cached_regions(targets_file)
+                                   .intervals(chrom, beg, end))
+        scan_records(records, result, excluded if exclude_hist else None,
+                     selector, selected.append)
+    return result, selected
+
+
+def merge_shard(result: AlleleBalance,
+                partial: Tuple[AlleleBalance, List[bytes]],
+                emit: Optional[Callable[[bytes], None]]) -> None:
+    """Merge the result of a region and emit its selected records"""
+    result.merge(partial[0])
+    for line in partial[1]:
+        emit(line)
+
+
+def scan_allele_balance(vcf_file: str, bed_file: Optional[str],
+                        exclude_hist: bool,
+                        ab_range: Optional[Tuple[float, float]],
+                        emit: Optional[Callable[[bytes], None]],
+                        thread: int = 1, shard_size: int = SHARD_SIZE,
+                        keep_sites: bool = False,
+                        targets_file: Optional[str] = None) -> AlleleBalance:
+    """Read a VCF once, with a pool of processes when it is indexed
+
+    With targets, only the records starting in a target are read, the
+    regions of an indexed VCF without target are skipped even by a single
+    process.
+
+    Args:
+        :param vcf_file: path to a VCF file, compressed or not
+        :param bed_file: BED file of regions to exclude
+        :param exclude_hist: exclude regions from histogram and depth too
+        :param ab_range: allele balance range of selected variants, None to
+                         disable the selection
+        :param emit: called with each selected record line, in file order
+        :param thread: number of processes
+        :param shard_size: length of the regions processed in parallel
+        :param keep_sites: keep the positions of SNP
+        :param targets_file: BED file of capture targets
+
+    Returns:
+        The filled AlleleBalance
+    """
+    result = AlleleBalance(keep_sites)
+    if (thread > 1 or targets_file is not None) and has_index(vcf_file):
+        shards = plan_shards(cached_index(vcf_file), shard_size,
+                             cached_regions(targets_file))
+        if thread > 1:
+            result.cores = min(thread, max(1, len(shards)))
+            with ProcessPoolExecutor(max_workers=thread) as executor:
+                futures = [executor.submit(shard_allele_balance, vcf_file,
+                                           shard, bed_file, exclude_hist,
+                                           ab_range, keep_sites,
+                                           targets_file)
+                           for shard in shards]
+                for future in futures:
+                    merge_shard(result, future.result(), emit)
+        else:
+            for shard in shards:
+                merge_shard(result,
+                            shard_allele_balance(vcf_file, shard, bed_file,
+                                                 exclude_hist, ab_range,
+                                                 keep_sites, targets_file),
+                            emit)
+    else:
+        excluded = cached_regions(bed_file)
+        selector = None
+        if ab_range is not None:
+            selector = CandidateSelector(ab_range[0], ab_range[1], excluded)
+        with open_vcf(vcf_file) as handler:
+            records = iter_records(handler)
+            if targets_file is not None:
+                records = on_targets(records, cached_regions(targets_file))
+            scan_records(records, result, excluded if exclude_hist else None,
+                         selector, emit)
+    return result
+
+
+def compute_allele_balance(vcf_file: str, bed_file: Optional[str] = None,
+                           exclude_hist: bool = False,
+                           ab_range: Optional[Tuple[float, float]] = None,
+                           candidates_file: Optional[str] = None,
+                           thread: int = 1, shard_size: int = SHARD_SIZE,
+                           cache: Optional[FingerprintCache] = None,
+                           targets_file: Optional[str] = None) \
+        -> AlleleBalance:
+    """Compute the allele balance histogram and depth of a VCF
+
+    Only SNP records are used, memory usage does not depend on file size.
+    When a candidates file is given, potentially contaminant variants are
+    written in the same pass into a bgzipped VCF.
+    With more than one thread and a tabix indexed VCF, regions are processed
+    by a pool of processes and the partial results are merged in file
+    order, the results are identical to a single thread run.
+    With a cache, results are read from the fingerprint of the VCF when it
+    was computed with the same parameters, otherwise the fingerprint and the
+    SNP sites used by the comparison stage are stored after the pass.
+    With capture targets, as for an exome, only the records starting in a
+    target are used and, when the VCF is indexed, only the blocks holding
+    them are read. The SNP sites of the comparison are not kept then, they
+    must be those of the whole VCF.
+
+    Args:
+        :param vcf_file: path to a VCF file, compressed or not
+        :param bed_file: BED file of regions to exclude
+        :param exclude_hist: exclude regions from histogram and depth too
+        :param ab_range: allele balance range of selected variants
+        :param candidates_file: path of the bgzipped VCF of selected variants
+        :param thread: number of processes
+        :param shard_size: length of the regions processed in parallel
+        :param cache: fingerprint cache
+        :param targets_file: BED file of capture targets
+
+    Returns:
+        The filled AlleleBalance
+    """
+    if candidates_file is not None and ab_range is None:
+        ab_range = (AB_START, AB_END)
+    if candidates_file is None:
+        ab_range = None
+    key = None
+    sites_key = None
+    if cache is not None:
+        vcf_checksum = cache.checksum(vcf_file)
+        bed_checksum = cache.checksum(bed_file) if bed_file else ""
+        parts = [vcf_checksum, bed_checksum, exclude_hist, ab_range]
+        if targets_file is not None:
+            parts.append(cache.checksum(targets_file))
+        key = cache.key("abcalc", *parts)
+        sites_key = cache.key("sites", vcf_checksum)
+        arrays = cache.load(key)
+        if arrays is not None:
+            if candidates_file is not None:
+                with BgzfWriter(candidates_file) as writer:
+                    writer.write(b"".join(read_header(vcf_file)))
+                    writer.write(arrays["candidates"].tobytes())
+            return AlleleBalance.from_arrays(arrays)
+    writer = None
+    if candidates_file is not None:
+        writer = BgzfWriter(candidates_file)
+        writer.write(b"".join(read_header(vcf_file)))
+    selected = []  # type: List[bytes]
+
+    def write_and_keep(line: bytes) -> None:
+        writer.write(line)
+        selected.append(line)
+
+    emit = None
+    if writer is not None:
+        emit = writer.write if cache is None else write_and_keep
+    keep_sites = cache is not None and targets_file is None and \
+        not cache.contains(sites_key)
+    try:
+        result = scan_allele_balance(vcf_file, bed_file, exclude_hist,
+                                     ab_range, emit, thread, shard_size,
+                                     keep_sites, targets_file)
+    finally:
+        if writer is not None:
+            writer.close()
+    if cache is not None:
+        arrays = result.to_arrays()
+        arrays["candidates"] = np.frombuffer(b"".join(selected),
+                                             dtype=np.uint8)
+        cache.store(key, arrays)
+        if keep_sites:
+            cache.store(sites_key, sites_to_arrays(result.sites))
+    return result
+
+
+def write_hist(hist_file: str, histogram: List[int]) -> None:
+    """Write a histogram with the layout of "sort | uniq -c"
+
+    Args:
+        :param hist_file: output file path
+        :param histogram: count of each allele balance bin
+    """
+    with open(hist_file, "w") as hist_f:
+        for i, count in enumerate(histogram):
+            if count > 0:
+                hist_f.write("{:7d} {:.2f}\n".format(count, i / 100))
+
+
+def write_mean_depth(depth_file: str, mean_depth: float) -> None:
+    """Write the mean depth as awk print does (OFMT %.6g)
+
+    Args:
+        :param depth_file: output file path
+        :param mean_depth: value to write
+    """
+    with open(depth_file, "w") as depth_f:
+        depth_f.write("{:.6g}\n".format(mean_depth))
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester abcalc",
+                                     description=("Compute the allele "
+                                                  "balance histogram and the "
+                                                  "mean depth of a VCF"))
+    parser.add_argument("-f", "--file", required=True, type=str,
+                        help="VCF file version 4.2 to process (Mandatory)")
+    parser.add_argument("-o", "--histoutputfile", default=None, type=str,
+                        help=("allelic balance histogram result file "
+                              "(optional) [default: <vcf_file>.hist]"))
+    parser.add_argument("-d", "--depthoutputfile", default=None, type=str,
+                        help=("depth estimation result file (optional) "
+                              "[default: <vcf_file>.meandepth]"))
+    parser.add_argument("-c", "--vcfconta", default=None, type=str,
+                        help=("output bgzipped VCF file of potentially "
+                              "contaminant variants, selected in the same "
+                              "pass (optional) [default: no selection]"))
+    parser.add_argument("-e", "--exclude_gnomad", action="store_true",
+                        help=("exclude gnomad regions from histogram and "
+                              "depth too"))
+    parser.add_argument("-g", "--gnomad", default=None, type=str,
+                        help=("BED file used to exclude regions with Low "
+                              "Complexity Repeats (LCR) and Segmental "
+                              "Duplications (seg_dup) (optional) "
+                              "[default: lcr_seg_dup_gnomad_2.0.2_"
+                              "<reference>.bed.gz]"))
+    parser.add_argument("-r", "--reference", default=DEFAULT_REFERENCE,
+                        type=str, choices=REFERENCES,
+                        help=("genome version for gnomad regions exclusions "
+                              "(optional) [default: {}]"
+                              .format(DEFAULT_REFERENCE)))
+    parser.add_argument("--targets", default=None, type=str,
+                        help=("BED file of the capture targets of an exome, "
+                              "only the records starting in a target are "
+                              "read (optional) [default: whole VCF]"))
+    parser.add_argument("--ABstart", default=AB_START, type=float,
+                        help=("Allele balance starting value for variant "
+                              "selection (optional) [default: 0.00]"))
+    parser.add_argument("--ABend", default=AB_END, type=float,
+                        help=("Allele balance ending value for variant "
+                              "selection (optional) [default: 0.11]"))
+    parser.add_argument("-t", "--thread", default=1, type=int,
+                        help=("number of processes, regions of a tabix "
+                              "indexed VCF are processed in parallel "
+                              "(optional) [default: 1]"))
+    parser.add_argument("--shard-size", default=SHARD_SIZE, type=int,
+                        help=("length in bp of the regions processed in "
+                              "parallel, 0 for a region by chromosome "
+                              "(optional) [default: {}]".format(SHARD_SIZE)))
+    parser.add_argument("--cache-dir", default="", type=str,
+                        help=("directory of sample fingerprints, results "
+                              "are read from it when the VCF was already "
+                              "processed with the same parameters "
+                              "(optional) [default: no cache]"))
+    parser.add_argument("--cache-size", default=CACHE_SIZE / 1024 ** 3,
+                        type=float,
+                        help=("size cap of the cache directory in GiB, least "
+                              "recently used fingerprints are removed "
+                              "(optional) [default: 10]"))
+    args = parser.parse_args(parameters)
+    if args.histoutputfile is None:
+        args.histoutputfile = args.file + ".hist"
+    if args.depthoutputfile is None:
+        args.depthoutputfile = args.file + ".meandepth"
+    if args.histoutputfile == args.depthoutputfile:
+        parser.error("-o|--histoutputfile and -d|--depthoutputfile must "
+                     "have different names")
+    if args.gnomad is None:
+        args.gnomad = gnomad_bed(args.reference)
+    return args
+
+
+def exclusion_bed(args: argparse.Namespace) -> Optional[str]:
+    """BED file read by a run, None when no region is excluded"""
+    if args.exclude_gnomad or args.vcfconta is not None:
+        return args.gnomad
+    return None
+
+
+def task_manifest(args: argparse.Namespace) -> Manifest:
+    """Manifest of a run, written next to the histogram"""
+    bed_file = exclusion_bed(args)
+    outputs = [args.histoutputfile, args.depthoutputfile]
+    if args.vcfconta is not None:
+        outputs.append(args.vcfconta)
+    inputs = [args.file] + ([bed_file] if bed_file else [])
+    parameters = {"exclude_gnomad": args.exclude_gnomad,
+                  "gnomad": bed_file,
+                  "ab_range": [args.ABstart, args.ABend]}
+    if args.targets is not None:
+        inputs.append(args.targets)
+        parameters["targets"] = args.targets
+    return Manifest(manifest_file(args.histoutputfile), "abcalc", parameters,
+                    inputs, outputs)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    start = time.monotonic()
+    args = get_cli_args(parameters)
+    manifest = task_manifest(args)
+    if manifest.is_valid():
+        print("Outputs of {} are up to date".format(args.file))
+        return 0
+    bed_file = exclusion_bed(args)
+    # the checksum of the VCF computed for the cache is recorded too
+    manifest.cache = open_cache(args.cache_dir, args.cache_size)
+    result = compute_allele_balance(args.file, bed_file, args.exclude_gnomad,
+                                    (args.ABstart, args.ABend), args.vcfconta,
+                                    args.thread, args.shard_size,
+                                    manifest.cache, args.targets)
+    if result.nb_snp == 0:
+        print("Error no SNP found in VCF file {}".format(args.file),
+              file=sys.stderr)
+        return 1
+    write_hist(args.histoutputfile, result.histogram)
+    write_mean_depth(args.depthoutputfile, result.mean_depth())
+    manifest.write()
+    # a run whose counts come from the cache says nothing of the runtime
+    if not result.cached:
+        record_runtime("abcalc", files_size([args.file]), result.cores,
+                       start)
+    return 0
@@ -0,0 +1,36 @@
+# Import necessary libraries:
+
+from os import getpid, makedirs, rename
+from os.path import isdir, join
+from typing import Dict
+import shutil
+
+import numpy as np
+
+
+def save_arrays(directory: str, arrays: Dict[str, np.ndarray]) -> None:
+    """Write arrays as a directory of .npy files, one by name
+
+    The arrays are written into a directory aside, the previous directory
+    is then moved aside, the new one renamed in its place and the previous
+    one removed. Readers never see a partially written directory and the
+    directory is missing only between the two renames, not while the
+    arrays are written nor while the previous ones are removed.
+
+    Args:
+        :param directory: directory of the arrays, replaced when it exists
+        :param arrays: array of each file name, without the .npy extension
+    """
+    tmp_dir = "{}.{}.tmp".format(directory, getpid())
+    old_dir = "{}.{}.old".format(directory, getpid())
+    for leftover in (tmp_dir, old_dir):
+        if isdir(leftover):
+            shutil.rmtree(leftover)
+    makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(join(tmp_dir, name + ".npy"), np.ascontiguousarray(array))
+    if isdir(directory):
+        rename(directory, old_dir)
+    rename(tmp_dir, directory)
+    if isdir(old_dir):
+        shutil.rmtree(old_dir)
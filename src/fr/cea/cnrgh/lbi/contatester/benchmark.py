@@ -0,0 +1,272 @@
+# Import necessary libraries:
+
+from datetime import datetime
+from os import environ, makedirs
+from os.path import isfile, join
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import platform
+import sys
+import time
+
+from fr.cea.cnrgh.lbi.contatester import allelic_balance, estimation
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import AB_END, AB_START, \
+    compute_allele_balance
+from fr.cea.cnrgh.lbi.contatester.comparison import comparison_matrix
+from fr.cea.cnrgh.lbi.contatester.estimation import estimate_files, \
+    read_depth
+from fr.cea.cnrgh.lbi.contatester.manifest import tool_version
+from fr.cea.cnrgh.lbi.contatester.outputs import candidates_file, \
+    conta_file, depth_file, hist_file, sample_name
+from fr.cea.cnrgh.lbi.contatester.runtime import HISTORY_ENV
+from fr.cea.cnrgh.lbi.contatester.synthetic import sample_vcf, \
+    simulate_cohort
+
+# Cohorts benchmarked: number of samples, variants by sample, depth and
+# experiment
+SCALES = {"tiny": (4, 20000, 30, "WG"),
+          "small": (8, 200000, 30, "WG"),
+          "exome": (100, 40000, 90, "EX"),
+          "wgs90": (2, 4000000, 90, "WG"),
+          "cohort": (1000, 40000, 60, "EX")}
+# Number of VCF of the benchmarked DAG
+DAG_VCFS = 1000
+# Contamination injected into the second sample of a cohort
+CONTAMINATION = 0.2
+# A benchmark lasting this ratio more than its baseline is a regression
+TOLERANCE = 0.25
+# Slow downs shorter than this duration in second are noise
+MIN_DELTA = 0.05
+RESULTS_FILE = "benchmark_results.jsonl"
+BASELINE_FILE = "baseline.json"
+# Runtime history of the stages run on the simulated cohorts, kept out of
+# the history sizing the jobs of real cohorts
+HISTORY_FILE = "runtimes.jsonl"
+
+Results = Dict[str, float]
+
+
+class Cohort:
+    """Simulated cohort and the outputs of its samples
+
+    Args:
+        :param work_dir: directory of the cohorts
+        :param nb_sample: number of samples
+        :param nb_sites: mean number of variants of a sample
+        :param depth: mean depth
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param seed: seed of the cohort
+    """
+
+    def __init__(self, work_dir: str, nb_sample: int, nb_sites: int,
+                 depth: float, experiment: str, seed: int = 0) -> None:
+        self.nb_sample = nb_sample
+        self.nb_sites = nb_sites
+        self.depth = depth
+        self.experiment = experiment
+        self.seed = seed
+        self.directory = join(work_dir, "cohort_{}x{}_{:g}x_{}_{}"
+                              .format(nb_sample, nb_sites, depth, experiment,
+                                      seed))
+        self.vcfs = [sample_vcf(self.directory, sample)
+                     for sample in range(nb_sample)]
+        self.bed = join(self.directory, "excluded.bed")
+        self.out_dir = join(self.directory, "results")
+
+    def generate(self) -> None:
+        """Write the VCF once, they are kept for the next benchmarks"""
+        if all(isfile(vcf) for vcf in self.vcfs):
+            return
+        contaminations = []
+        if self.nb_sample > 1:
+            contaminations.append((1, 0, CONTAMINATION))
+        simulate_cohort(self.directory, self.nb_sample, self.nb_sites,
+                        self.depth, self.experiment, contaminations,
+                        self.seed)
+
+    def prepare(self) -> None:
+        """Outputs of the samples read by the estimation and the comparison
+
+        Stages skip the samples whose outputs are up to date.
+        """
+        makedirs(self.out_dir, exist_ok=True)
+        for vcf in self.vcfs:
+            name = sample_name(vcf)
+            allelic_balance.main(["-f", vcf,
+                                  "-o", hist_file(self.out_dir, name),
+                                  "-d", depth_file(self.out_dir, name),
+                                  "-c", candidates_file(self.out_dir, name),
+                                  "-g", self.bed])
+            estimation.main(["--input", hist_file(self.out_dir, name),
+                             "--output", conta_file(self.out_dir, name),
+                             "--depth-file", depth_file(self.out_dir, name),
+                             "--experiment", self.experiment])
+
+
+def bench_abcalc(cohort: Cohort) -> None:
+    compute_allele_balance(cohort.vcfs[0])
+
+
+def bench_candidates(cohort: Cohort) -> None:
+    compute_allele_balance(cohort.vcfs[0], cohort.bed, False,
+                           (AB_START, AB_END),
+                           join(cohort.directory, "candidates.vcf.gz"))
+
+
+def bench_estimate(cohort: Cohort) -> None:
+    names = [sample_name(vcf) for vcf in cohort.vcfs]
+    estimate_files([hist_file(cohort.out_dir, name) for name in names],
+                   [read_depth(depth_file(cohort.out_dir, name))
+                    for name in names],
+                   [conta_file(cohort.out_dir, name) for name in names],
+                   cohort.experiment)
+
+
+def bench_compare(cohort: Cohort) -> None:
+    # the injected sample is compared whatever its estimation
+    comparison_matrix(cohort.vcfs[1:2], cohort.vcfs, cohort.out_dir)
+
+
+def bench_dag(cohort: Cohort) -> None:
+    # imported here, __main__ imports the stages
+    from fr.cea.cnrgh.lbi.contatester.__main__ import write_batch_file, \
+        write_dag_file
+    dag_dir = join(cohort.directory, "dag")
+    makedirs(dag_dir, exist_ok=True)
+    vcfs = [join(dag_dir, "sample{:05d}.vcf.gz".format(i))
+            for i in range(DAG_VCFS)]
+    dag_file = join(dag_dir, "benchmark.dagfile")
+    write_dag_file(True, dag_file, dag_dir, "--report",
+                   "TASK {id} -c {core} bash -c ", vcfs, 4, 4,
+                   cohort.experiment)
+    write_batch_file(dag_file, dag_file + ".msub", DAG_VCFS, 4, dag_dir, "",
+                     "", True)
+
+
+# Benchmarks of each stage, in the order they run
+BENCHMARKS = (("abcalc", bench_abcalc),
+              ("candidates", bench_candidates),
+              ("estimate", bench_estimate),
+              ("compare", bench_compare),
+              ("dag", bench_dag))  # type: Tuple[Tuple[str, Callable[[Cohort], None]], ...]
+
+
+def best_time(function: Callable[[Cohort], None], cohort: Cohort,
+              repeat: int) -> float:
+    """Shortest duration of several runs, the least disturbed one"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(cohort)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def run_benchmarks(cohort: Cohort, repeat: int = 3,
+                   only: Optional[Sequence[str]] = None) -> Results:
+    cohort.generate()
+    cohort.prepare()
+    results = {}
+    for name, function in BENCHMARKS:
+        if only and name not in only:
+            continue
+        results[name] = round(best_time(function, cohort, repeat), 6)
+        print("{:<12}{:>10.3f} s".format(name, results[name]))
+    return results
+
+
+def regressions(results: Results, baseline: Results,
+                tolerance: float = TOLERANCE) -> List[Tuple[str, float]]:
+    """Benchmarks slower than their baseline beyond the tolerance
+
+    Returns:
+        The name and the duration ratio to the baseline of each regression
+    """
+    slower = []
+    for name, duration in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference and duration > reference * (1 + tolerance) and \
+                duration - reference > MIN_DELTA:
+            slower.append((name, duration / reference))
+    return slower
+
+
+def scale_label(cohort: Cohort) -> str:
+    return "{}x{}_{:g}x_{}".format(cohort.nb_sample, cohort.nb_sites,
+                                   cohort.depth, cohort.experiment)
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester benchmark",
+                                     description=("Time each stage on a "
+                                                  "simulated cohort and "
+                                                  "compare with a baseline"))
+    parser.add_argument("-o", "--outdir", default="contatester_benchmark",
+                        type=str,
+                        help=("directory of the cohorts and of the results "
+                              "[default: contatester_benchmark]"))
+    parser.add_argument("--scale", default="small", choices=sorted(SCALES),
+                        help="simulated cohort [default: small]")
+    parser.add_argument("--samples", default=None, type=int,
+                        help="number of samples, overrides the scale")
+    parser.add_argument("--sites", default=None, type=int,
+                        help="variants by sample, overrides the scale")
+    parser.add_argument("--depth", default=None, type=float,
+                        help="mean depth, overrides the scale")
+    parser.add_argument("-r", "--repeat", default=3, type=int,
+                        help="runs of each benchmark, the best one is kept "
+                             "[default: 3]")
+    parser.add_argument("--only", default=[], action="append",
+                        choices=[name for name, _ in BENCHMARKS],
+                        help="run this benchmark only, may be repeated")
+    parser.add_argument("--baseline", default=None, type=str,
+                        help=("baseline results [default: <outdir>/" +
+                              BASELINE_FILE + "]"))
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--tolerance", default=TOLERANCE, type=float,
+                        help=("slow down flagged as a regression "
+                              "[default: {}]".format(TOLERANCE)))
+    return parser.parse_args(parameters)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    nb_sample, nb_sites, depth, experiment = SCALES[args.scale]
+    cohort = Cohort(args.outdir, args.samples or nb_sample,
+                    args.sites or nb_sites, args.depth or depth, experiment)
+    previous = environ.get(HISTORY_ENV)
+    environ[HISTORY_ENV] = join(args.outdir, HISTORY_FILE)
+    try:
+        results = run_benchmarks(cohort, args.repeat, args.only)
+    finally:
+        if previous is None:
+            del environ[HISTORY_ENV]
+        else:
+            environ[HISTORY_ENV] = previous
+    label = scale_label(cohort)
+    record = {"date": datetime.now().isoformat(timespec="seconds"),
+              "version": tool_version(), "python": platform.python_version(),
+              "host": platform.node(), "scale": label, "results": results}
+    with open(join(args.outdir, RESULTS_FILE), "a") as results_f:
+        results_f.write(json.dumps(record, sort_keys=True) + "\n")
+    baseline_file = args.baseline or join(args.outdir, BASELINE_FILE)
+    baselines = {}  # type: Dict[str, Results]
+    if isfile(baseline_file):
+        with open(baseline_file, "r") as baseline_f:
+            baselines = json.load(baseline_f)
+    status = 0
+    if label in baselines:
+        slower = regressions(results, baselines[label], args.tolerance)
+        for name, ratio in slower:
+            print("Regression: {} is {:.2f} times slower than the baseline"
+                  .format(name, ratio), file=sys.stderr)
+        status = 1 if slower else 0
+    else:
+        print("No baseline for {} in {}".format(label, baseline_file))
+    if args.save_baseline:
+        baselines[label] = dict(baselines.get(label, {}), **results)
+        with open(baseline_file, "w") as baseline_f:
+            json.dump(baselines, baseline_f, indent=1, sort_keys=True)
+    return status
@@ -0,0 +1,160 @@
+# Import necessary libraries:
+
+from typing import BinaryIO, Iterator, Tuple
+import struct
+import zlib
+
+# Maximum uncompressed size of a block, the value used by htslib
+BLOCK_SIZE = 0xff00
+# gzip header with the BC extra subfield, BSIZE is appended
+BLOCK_HEADER = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+EOF_BLOCK = (b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+             b"\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+
+
+def compress_block(data: bytes, level: int = 6) -> bytes:
+    """Compress up to BLOCK_SIZE bytes into a BGZF block
+
+    Args:
+        :param data: uncompressed content
+        :param level: zlib compression level
+
+    Returns:
+        The BGZF block as bytes
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = len(BLOCK_HEADER) + 2 + len(deflated) + 8
+    return (BLOCK_HEADER + struct.pack("<H", block_size - 1) + deflated +
+            struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data)))
+
+
+class BgzfWriter:
+    """Write a BGZF file readable by gzip, bcftools and tabix"""
+
+    def __init__(self, file_path: str, level: int = 6) -> None:
+        self._handler = open(file_path, "wb")  # type: BinaryIO
+        self._level = level
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) >= BLOCK_SIZE:
+            self._flush_block(bytes(self._buffer[:BLOCK_SIZE]))
+            del self._buffer[:BLOCK_SIZE]
+
+    def _flush_block(self, data: bytes) -> None:
+        self._handler.write(compress_block(data, self._level))
+
+    def flush(self) -> None:
+        """Compress buffered data into a block, even if it is not full"""
+        if self._buffer:
+            self._flush_block(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def close(self) -> None:
+        self.flush()
+        self._handler.write(EOF_BLOCK)
+        self._handler.close()
+
+    def __enter__(self) -> "BgzfWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class BgzfReader:
+    """Read a BGZF file line by line and seek to virtual offsets
+
+    A virtual offset is the address of a block in the compressed file
+    shifted by 16 bits plus the offset into the uncompressed block, as used
+    by tabix indexes.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self._handler = open(file_path, "rb")  # type: BinaryIO
+        self._block_address = 0
+        self._next_address = 0
+        self._data = b""
+        self._pos = 0
+
+    def _load_block(self, address: int) -> bool:
+        """Load the block at a compressed file address
+
+        Returns:
+            False at end of file
+        """
+        self._handler.seek(address)
+        header = self._handler.read(len(BLOCK_HEADER) + 2)
+        if len(header) < len(BLOCK_HEADER) + 2:
+            self._block_address = address
+            self._data = b""
+            self._pos = 0
+            return False
+        if header[:4] != BLOCK_HEADER[:4]:
+            raise ValueError("Not a BGZF file: " + self._handler.name)
+        block_size = struct.unpack("<H", header[-2:])[0] + 1
+        payload = self._handler.read(block_size - len(header))
+        self._block_address = address
+        self._next_address = address + block_size
+        self._data = zlib.decompress(payload[:-8], -15)
+        self._pos = 0
+        return True
+
+    def _next_block(self) -> bool:
+        """Load the next non empty block, False at end of file"""
+        while self._load_block(self._next_address):
+            if self._data:
+                return True
+        return False
+
+    def seek(self, virtual_offset: int) -> None:
+        self._next_address = virtual_offset >> 16
+        if self._load_block(virtual_offset >> 16):
+            self._pos = virtual_offset & 0xffff
+
+    def tell(self) -> int:
+        if self._pos >= len(self._data):
+            return self._next_address << 16
+        return (self._block_address << 16) | self._pos
+
+    def readline(self) -> bytes:
+        """Read a line, an empty bytes at end of file"""
+        chunks = []
+        while True:
+            if self._pos >= len(self._data) and not self._next_block():
+                break
+            end = self._data.find(b"\n", self._pos)
+            if end >= 0:
+                chunks.append(self._data[self._pos:end + 1])
+                self._pos = end + 1
+                break
+            chunks.append(self._data[self._pos:])
+            self._pos = len(self._data)
+        return b"".join(chunks)
+
+    def iter_lines(self) -> Iterator[Tuple[int, bytes, int]]:
+        """Iterate over lines with their start and end virtual offsets"""
+        while True:
+            start = self.tell()
+            line = self.readline()
+            if not line:
+                break
+            yield start, line, self.tell()
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    def close(self) -> None:
+        self._handler.close()
+
+    def __enter__(self) -> "BgzfReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
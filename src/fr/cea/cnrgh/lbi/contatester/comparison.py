@@ -0,0 +1,457 @@
+# Import necessary libraries:
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os.path import basename, isfile, join
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, \
+    Sequence, Set, Tuple, TypeVar
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.fingerprint import FingerprintCache, \
+    CACHE_SIZE, arrays_to_sites, open_cache, sites_to_arrays
+from fr.cea.cnrgh.lbi.contatester.manifest import Manifest, MANIFEST_SUFFIX
+from fr.cea.cnrgh.lbi.contatester.outputs import sample_name, \
+    candidates_file, conta_file, summary_file, is_contaminated
+from fr.cea.cnrgh.lbi.contatester.runtime import files_size, \
+    record_runtime
+from fr.cea.cnrgh.lbi.contatester.vcf import open_vcf, iter_records, is_snp
+
+SUMMARY_HEADER = "vcfContaName,vcfComparName,nbSNPConta,nbMatch,ratio\n"
+
+Sites = Dict[bytes, np.ndarray]
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def load_snp_sites(vcf_file: str) -> Sites:
+    """Positions of the SNP records of a VCF by sequence
+
+    Records at the same position are all kept, as bcftools view counts
+    them.
+
+    Args:
+        :param vcf_file: path to a VCF file, compressed or not
+
+    Returns:
+        A dictionary of sequence name to an array of positions
+    """
+    positions = {}  # type: Dict[bytes, array]
+    with open_vcf(vcf_file) as handler:
+        for fields in iter_records(handler):
+            if is_snp(fields[3], fields[4]):
+                chrom_positions = positions.get(fields[0])
+                if chrom_positions is None:
+                    chrom_positions = positions[fields[0]] = array("I")
+                chrom_positions.append(int(fields[1]))
+    return {chrom: np.frombuffer(chrom_positions, dtype=np.uint32)
+            for chrom, chrom_positions in positions.items()}
+
+
+def fetch_snp_sites(vcf_file: str, cache: Optional[FingerprintCache]) \
+        -> Tuple[Sites, bool]:
+    """SNP sites of a VCF, read from its fingerprint when it is cached
+
+    Args:
+        :param vcf_file: path to a VCF file, compressed or not
+        :param cache: fingerprint cache, None to always read the VCF
+
+    Returns:
+        The sites and whether the VCF was read
+    """
+    if cache is None:
+        return load_snp_sites(vcf_file), True
+    key = cache.key("sites", cache.checksum(vcf_file))
+    arrays = cache.load(key)
+    if arrays is not None:
+        return arrays_to_sites(arrays), False
+    sites = load_snp_sites(vcf_file)
+    cache.store(key, sites_to_arrays(sites))
+    return sites, True
+
+
+def cached_snp_sites(vcf_file: str, cache: Optional[FingerprintCache]) \
+        -> Sites:
+    """SNP sites of a VCF, read from its fingerprint when it is cached"""
+    return fetch_snp_sites(vcf_file, cache)[0]
+
+
+class SiteCodec:
+    """Pack (sequence, position) sites into sortable 64 bits integers
+
+    The sequence identifier takes the 32 high bits and the position the 32
+    low bits, identifiers are shared by all samples encoded by a codec.
+    """
+
+    def __init__(self) -> None:
+        self.ids = {}  # type: Dict[bytes, int]
+
+    def encode(self, sites: Sites) -> np.ndarray:
+        """Sorted keys of the sites of a sample"""
+        parts = []
+        for chrom, positions in sites.items():
+            chrom_id = self.ids.setdefault(chrom, len(self.ids))
+            parts.append((np.uint64(chrom_id) << np.uint64(32)) |
+                         positions.astype(np.uint64))
+        if not parts:
+            return np.empty(0, dtype=np.uint64)
+        keys = np.concatenate(parts)
+        keys.sort()
+        return keys
+
+
+class CandidateSets:
+    """Potentially contaminant sites of several samples in one sorted array
+
+    Each key is stored with the index of the sample it belongs to, so the
+    sites of another sample are matched against all sets at once.
+    """
+
+    def __init__(self, keys_by_sample: Sequence[np.ndarray]) -> None:
+        self.nb_samples = len(keys_by_sample)
+        unique_keys = [np.unique(keys) for keys in keys_by_sample]
+        owners = [np.full(len(keys), i, dtype=np.int32)
+                  for i, keys in enumerate(unique_keys)]
+        keys = np.concatenate(unique_keys) if unique_keys else \
+            np.empty(0, dtype=np.uint64)
+        owners = np.concatenate(owners) if owners else \
+            np.empty(0, dtype=np.int32)
+        order = np.argsort(keys, kind="mergesort")
+        self.keys = keys[order]
+        self.owners = owners[order]
+
+    def count_matches(self, sites: np.ndarray) -> np.ndarray:
+        """Number of sites found in each set
+
+        Args:
+            :param sites: sorted keys of a sample
+
+        Returns:
+            An array with a count by set
+        """
+        lows = np.searchsorted(self.keys, sites, side="left")
+        highs = np.searchsorted(self.keys, sites, side="right")
+        lengths = highs - lows
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(self.nb_samples, dtype=np.int64)
+        # expand each [low, high) range of matching keys
+        range_starts = np.repeat(lows, lengths)
+        range_offsets = np.arange(total) - np.repeat(np.cumsum(lengths) -
+                                                     lengths, lengths)
+        return np.bincount(self.owners[range_starts + range_offsets],
+                           minlength=self.nb_samples)
+
+
+def bc_ratio(nb_match: int, nb_var: int) -> str:
+    """Ratio formatted as echo "scale=3; nb_match/nb_var" | bc does"""
+    if nb_var == 0:
+        return "NaN"
+    units, decimals = divmod(nb_match * 1000 // nb_var, 1000)
+    if units == 0 and decimals == 0:
+        return "0"
+    return (str(units) if units > 0 else "") + ".{:03d}".format(decimals)
+
+
+def bounded_map(executor: ProcessPoolExecutor, function: Callable[[T], R],
+                items: Iterable[T], window: int) -> Iterator[R]:
+    """Ordered map which keeps at most window results pending"""
+    pending = []
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def iter_snp_sites(vcf_files: Sequence[str], thread: int = 1,
+                   cache: Optional[FingerprintCache] = None,
+                   read: Optional[List[str]] = None) -> Iterator[Sites]:
+    """SNP sites of several VCF, read by a pool of processes
+
+    The VCF whose sites are not cached are appended to read.
+    """
+    load = partial(fetch_snp_sites, cache=cache)
+    if thread > 1:
+        with ProcessPoolExecutor(max_workers=thread) as executor:
+            results = bounded_map(executor, load, vcf_files, 2 * thread)
+            for vcf_file, (sites, was_read) in zip(vcf_files, results):
+                if was_read and read is not None:
+                    read.append(vcf_file)
+                yield sites
+    else:
+        for vcf_file in vcf_files:
+            sites, was_read = load(vcf_file)
+            if was_read and read is not None:
+                read.append(vcf_file)
+            yield sites
+
+
+def comparison_matrix(contaminated: Sequence[str], vcfs: Sequence[str],
+                      out_dir: str, thread: int = 1,
+                      cache: Optional[FingerprintCache] = None,
+                      read: Optional[List[str]] = None) \
+        -> Tuple[List[int], np.ndarray]:
+    """Compare the potentially contaminant variants of samples with all VCF
+
+    Each VCF is read once, whatever the number of contaminated samples, or
+    not at all when its sites are in the fingerprint cache.
+
+    Args:
+        :param contaminated: VCF of samples marked as contaminated
+        :param vcfs: all VCF of the cohort
+        :param out_dir: directory of the selected variants
+        :param thread: number of processes reading VCF
+        :param cache: fingerprint cache of the cohort VCF
+        :param read: filled with the VCF read, whose sites are not cached
+
+    Returns:
+        The number of selected variants of each contaminated sample and the
+        matrix of matches, a row by contaminated sample and a column by VCF
+    """
+    codec = SiteCodec()
+    nb_snp_conta = []
+    candidate_keys = []
+    for sites in iter_snp_sites([candidates_file(out_dir, sample_name(vcf))
+                                 for vcf in contaminated], thread):
+        nb_snp_conta.append(sum(len(positions)
+                                for positions in sites.values()))
+        candidate_keys.append(codec.encode(sites))
+    candidate_sets = CandidateSets(candidate_keys)
+    matrix = np.zeros((len(contaminated), len(vcfs)), dtype=np.int64)
+    for j, sites in enumerate(iter_snp_sites(vcfs, thread, cache, read)):
+        matrix[:, j] = candidate_sets.count_matches(codec.encode(sites))
+    return nb_snp_conta, matrix
+
+
+def compared_vcf_names(summary: str) -> Set[str]:
+    """Names of the VCF already compared in a comparisonSummary file"""
+    if not isfile(summary):
+        return set()
+    with open(summary, "r") as summary_f:
+        lines = summary_f.read().splitlines()[1:]
+    return {line.split(",")[1] for line in lines if line}
+
+
+def write_summaries(contaminated: Sequence[str], vcfs: Sequence[str],
+                    out_dir: str, nb_snp_conta: List[int],
+                    matrix: np.ndarray,
+                    pending: Optional[Dict[str, List[str]]] = None,
+                    append: bool = True) -> None:
+    """Write the comparisonSummary file of each contaminated sample
+
+    Args:
+        :param contaminated: VCF of samples marked as contaminated
+        :param vcfs: all VCF of the cohort
+        :param out_dir: directory to put results
+        :param nb_snp_conta: number of selected variants of each sample
+        :param matrix: matches as returned by comparison_matrix
+        :param pending: VCF to compare with each contaminated sample, rows
+        are then appended to existing summaries [default: all other VCF]
+        :param append: append the rows of pending VCF to existing summaries
+    """
+    for i, current_vcf in enumerate(contaminated):
+        basename_vcf = sample_name(current_vcf)
+        vcf_conta_name = basename(candidates_file(out_dir, basename_vcf))
+        summary = summary_file(out_dir, basename_vcf)
+        appended = append and pending is not None and isfile(summary)
+        with open(summary, "a" if appended else "w") as summary_f:
+            if not appended:
+                summary_f.write(SUMMARY_HEADER)
+            for j, vcf_compare in enumerate(vcfs):
+                if vcf_compare == current_vcf or \
+                        (pending is not None and
+                         vcf_compare not in pending[current_vcf]):
+                    continue
+                nb_match = int(matrix[i, j])
+                summary_f.write(",".join((vcf_conta_name,
+                                          basename(vcf_compare),
+                                          str(nb_snp_conta[i]), str(nb_match),
+                                          bc_ratio(nb_match,
+                                                   nb_snp_conta[i]))) + "\n")
+
+
+def compare_cohort(vcfs: Sequence[str], out_dir: str, thread: int = 1,
+                   cache: Optional[FingerprintCache] = None,
+                   update: bool = False,
+                   samples: Optional[Sequence[str]] = None,
+                   sources: Optional[Callable[[str], Optional[List[str]]]]
+                   = None, read: Optional[List[str]] = None) -> List[str]:
+    """Search the contaminant source of each contaminated sample
+
+    A batch of a cohort split into several submissions compares its own
+    samples with all VCF of the cohort, which are its inputs, so batches do
+    not wait for each other.
+    In update mode, comparisons already in the summary files are kept: only
+    the VCF missing from the summary of a sample are compared with it, and
+    only the VCF missing from at least one summary are read.
+    With a search of sources, a contaminated sample is only compared with
+    the VCF it returns, which may be out of the cohort.
+
+    Args:
+        :param vcfs: all VCF of the cohort
+        :param out_dir: directory of the sample results
+        :param thread: number of processes reading VCF
+        :param cache: fingerprint cache of the cohort VCF
+        :param update: complete existing summary files
+        :param samples: VCF whose contamination is checked [default: vcfs]
+        :param sources: VCF to compare with a contaminated sample, None when
+                        they cannot be searched [default: all vcfs]
+        :param read: filled with the VCF actually read, whose sites are not
+                     cached
+
+    Returns:
+        The VCF of samples marked as contaminated
+    """
+    contaminated = [vcf for vcf in (vcfs if samples is None else samples)
+                    if is_contaminated(conta_file(out_dir, sample_name(vcf)))]
+    if not update and sources is None:
+        if contaminated:
+            nb_snp_conta, matrix = comparison_matrix(contaminated, vcfs,
+                                                     out_dir, thread, cache,
+                                                     read)
+            write_summaries(contaminated, vcfs, out_dir, nb_snp_conta,
+                            matrix)
+        return contaminated
+    pending = {}  # type: Dict[str, List[str]]
+    for current_vcf in contaminated:
+        compared = set()  # type: Set[str]
+        if update:
+            compared = compared_vcf_names(summary_file(
+                out_dir, sample_name(current_vcf)))
+        searched = sources(current_vcf) if sources is not None else None
+        pending[current_vcf] = [vcf for vcf in
+                                (vcfs if searched is None else searched)
+                                if vcf != current_vcf and
+                                basename(vcf) not in compared]
+    rows = [vcf for vcf in contaminated if pending[vcf] or not update]
+    wanted = set(vcf for row in rows for vcf in pending[row])
+    # VCF of the cohort first, in its order, then the sources out of it
+    columns = [vcf for vcf in vcfs if vcf in wanted]
+    columns += sorted(wanted.difference(vcfs))
+    if rows:
+        nb_snp_conta, matrix = comparison_matrix(rows, columns, out_dir,
+                                                 thread, cache, read)
+        write_summaries(rows, columns, out_dir, nb_snp_conta, matrix,
+                        pending, update)
+    return contaminated
+
+
+def read_vcf_list(vcf_list: str) -> List[str]:
+    with open(vcf_list, "r") as filin:
+        return [line for line in filin.read().splitlines() if line]
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester compare",
+                                     description=("Compare potentially "
+                                                  "contaminant variants of "
+                                                  "contaminated samples with "
+                                                  "all the cohort"))
+    parser.add_argument("-l", "--list", required=True, type=str,
+                        help="input text file, one vcf by lane (Mandatory)")
+    parser.add_argument("-o", "--outdir", required=True, type=str,
+                        help=("folder of .conta and selected variants files, "
+                              "comparisonSummary files are written there "
+                              "(Mandatory)"))
+    parser.add_argument("-t", "--thread", default=1, type=int,
+                        help=("number of processes reading VCF (optional) "
+                              "[default: 1]"))
+    parser.add_argument("--cache-dir", default="", type=str,
+                        help=("directory of sample fingerprints, SNP sites "
+                              "are read from it when a VCF was already "
+                              "processed (optional) [default: no cache]"))
+    parser.add_argument("--cache-size", default=CACHE_SIZE / 1024 ** 3,
+                        type=float,
+                        help=("size cap of the cache directory in GiB, least "
+                              "recently used fingerprints are removed "
+                              "(optional) [default: 10]"))
+    parser.add_argument("-u", "--update", action="store_true",
+                        help=("keep existing comparisonSummary files and only "
+                              "add the comparisons they miss"))
+    parser.add_argument("-s", "--samples", default=None, type=str,
+                        help=("text file of the VCF whose contamination is "
+                              "checked, as the samples of a batch, they are "
+                              "compared with all VCF of --list (optional) "
+                              "[default: all VCF of --list]"))
+    parser.add_argument("--sketch-index", default="", type=str,
+                        help=("sketch index of the samples sequenced so far, "
+                              "the VCF of --list are added to it and a "
+                              "contaminated sample is only compared with its "
+                              "--top most likely sources (optional) "
+                              "[default: compare with all VCF of --list]"))
+    parser.add_argument("--top", default=10, type=int,
+                        help=("number of sources compared with --sketch-index "
+                              "(optional) [default: 10]"))
+    return parser.parse_args(parameters)
+
+
+def task_manifest(args: argparse.Namespace) -> Manifest:
+    """Manifest of the comparison of a cohort, written into outdir
+
+    Inputs are the VCF, the .conta files and the selected variants of the
+    cohort which exist, outputs are the summary files written. The
+    comparison of a batch has its own manifest, next to its list of samples.
+    """
+    vcfs = read_vcf_list(args.list)
+    path = join(args.outdir, "comparison" + MANIFEST_SUFFIX)
+    parameters = {"vcfs": vcfs}
+    samples = vcfs
+    if args.samples is not None:
+        samples = read_vcf_list(args.samples)
+        path = args.samples + MANIFEST_SUFFIX
+        parameters["samples"] = samples
+    if args.sketch_index:
+        parameters["sketch_index"] = args.sketch_index
+        parameters["top"] = args.top
+    inputs = [vcf for vcf in vcfs if isfile(vcf)]
+    for vcf in samples:
+        inputs.extend(input_file for input_file in
+                      (conta_file(args.outdir, sample_name(vcf)),
+                       candidates_file(args.outdir, sample_name(vcf)))
+                      if isfile(input_file))
+    return Manifest(path, "compare", parameters, inputs, [])
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    start = time.monotonic()
+    args = get_cli_args(parameters)
+    vcfs = read_vcf_list(args.list)
+    samples = None
+    if args.samples is not None:
+        samples = read_vcf_list(args.samples)
+    manifest = task_manifest(args)
+    if manifest.is_valid():
+        print("Comparison of the cohort is up to date")
+        return 0
+    cache = open_cache(args.cache_dir, args.cache_size)
+    manifest.cache = cache
+    sources = None
+    if args.sketch_index:
+        # the sketch module reads sites with the functions of this one
+        from fr.cea.cnrgh.lbi.contatester import sketch
+        sketch.add_samples(args.sketch_index, vcfs, args.outdir, args.thread,
+                           cache)
+        sources = partial(sketch.source_vcfs,
+                          sketch.SketchIndex.load(args.sketch_index),
+                          args.outdir, args.top)
+    read = []  # type: List[str]
+    contaminated = compare_cohort(vcfs, args.outdir, args.thread, cache,
+                                  args.update, samples, sources, read)
+    manifest.outputs = [summary_file(args.outdir, sample_name(vcf))
+                        for vcf in contaminated]
+    manifest.write()
+    # only the VCF read count, sites of the others come from the cache
+    if read:
+        record_runtime("compare", files_size(read),
+                       min(args.thread, len(read)), start)
+    print("{} contaminated sample(s) among {} VCF"
+          .format(len(contaminated), len(samples or vcfs)))
+    for vcf in contaminated:
+        print(vcf)
+    return 0
@@ -0,0 +1,32 @@
+# Import necessary libraries:
+
+from os.path import abspath, dirname, isdir, join
+import sys
+
+script_name = "contatester"
+# Genome versions of the gnomad BED shipped with contatester
+REFERENCES = ("GRCh37", "GRCh38")
+# Genome version of the exclusion regions when none is given, checked by
+# the preflight of the DAG and used by its ABCalc_ tasks
+DEFAULT_REFERENCE = "GRCh37"
+
+
+def data_dir() -> str:
+    """Directory of the data shipped with contatester
+
+    Installed data lie into <prefix>/share/contatester, the data directory of
+    the sources is used when running from a source tree.
+    """
+    installed = join(sys.prefix, "share", script_name)
+    if isdir(installed):
+        return installed
+    return abspath(join(dirname(__file__), *([".."] * 6), "data"))
+
+
+def gnomad_bed(reference: str = DEFAULT_REFERENCE) -> str:
+    """Default BED of LCR and segmental duplications regions to exclude
+
+    Args:
+        :param reference: genome version GRCh37 or GRCh38
+    """
+    return join(data_dir(), "lcr_seg_dup_gnomad_2.0.2_" + reference + ".bed.gz")
@@ -0,0 +1,386 @@
+# Import necessary libraries:
+
+from os.path import basename
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import re
+import sys
+import time
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.manifest import Manifest, manifest_file
+from fr.cea.cnrgh.lbi.contatester.outputs import sample_name, hist_file, \
+    depth_file, conta_file, record_file
+from fr.cea.cnrgh.lbi.contatester.panels import NB_BINS, COR_PARAM, \
+    MAX_CONTA_LINEAR, Panel, Rows, load_panel, ratio_hetero, standardize
+from fr.cea.cnrgh.lbi.contatester.runtime import record_runtime
+
+
+def r_format(value: float) -> str:
+    """Number as R prints it with paste or write.table (15 digits)"""
+    return "{:.15g}".format(value)
+
+
+def dataset_depth(depth: int, experiment: str) -> int:
+    """Depth of the dataset used to estimate a sample contamination
+
+    Args:
+        :param depth: estimated depth of the sample
+        :param experiment: WG for Whole Genome or EX for Exome
+    """
+    if experiment == "WG" and depth <= 45:
+        depthtest = 30
+    elif depth <= 75:
+        depthtest = 60
+    else:
+        depthtest = 90
+    return depthtest
+
+
+def read_depth(depth_estim: str) -> int:
+    """Depth from a .meandepth file, truncated as R as.integer does"""
+    with open(depth_estim, "r") as depth_f:
+        return int(float(depth_f.read().split()[0]))
+
+
+def read_hist(hist: str) -> np.ndarray:
+    """Allele balance histogram written by the abcalc stage
+
+    Args:
+        :param hist: path of a .hist file, "count allele_balance" lines
+
+    Returns:
+        An array of NB_BINS counts, missing allele balances count 0
+    """
+    histogram = np.zeros(NB_BINS, dtype=np.float64)
+    with open(hist, "r") as hist_f:
+        for line in hist_f:
+            fields = line.split()
+            if len(fields) == 2:
+                histogram[int(round(float(fields[1]) * 100))] += \
+                    float(fields[0])
+    return histogram
+
+
+def rows_label(rows: Rows) -> str:
+    i1min, i1med, i2med, i2max = rows
+    return ("AB [" + r_format((i1min - 1) / 100) + "-" +
+            r_format((i1med - 1) / 100) + " ; " +
+            r_format((i2med - 1) / 100) + "-" +
+            r_format((i2max - 1) / 100) + "]")
+
+
+def quadratic_root(coef_c: np.ndarray, coef_b: float, coef_a: float) \
+        -> np.ndarray:
+    """Real part of the first root returned by R polyroot
+
+    polyroot finds the root of smallest modulus first, complex roots of a
+    real polynomial have the same modulus and real part.
+
+    Args:
+        :param coef_c: constant coefficients, one by polynomial
+        :param coef_b: first degree coefficient
+        :param coef_a: second degree coefficient
+
+    Returns:
+        A root by constant coefficient
+    """
+    coef_c = np.asarray(coef_c, dtype=np.float64)
+    if coef_a == 0:
+        return -coef_c / coef_b
+    discriminant = coef_b * coef_b - 4 * coef_a * coef_c
+    real_roots = discriminant >= 0
+    sqrt_disc = np.sqrt(np.where(real_roots, discriminant, 0))
+    # numerically stable roots
+    q = -0.5 * (coef_b + np.copysign(sqrt_disc, coef_b))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root1 = q / coef_a
+        root2 = np.where(q != 0, coef_c / q, 0.0)
+    smallest = np.where(np.abs(root1) <= np.abs(root2), root1, root2)
+    return np.where(real_roots, smallest, -coef_b / (2 * coef_a))
+
+
+class Estimation:
+    """Contamination estimation of a sample, the content of a .conta file
+
+    The polynomial estimation is rounded to 2 digits as in contaReport.R.
+    The correlations of the sample with each simulated sample of the dataset
+    are kept for the report.
+    """
+
+    def __init__(self, max_ref: float, hit_cor: float, name_hit: float,
+                 lin_predict: float, res_poly: float,
+                 correlations: Optional[np.ndarray] = None) -> None:
+        self.max_ref = max_ref
+        self.hit_cor = hit_cor
+        self.name_hit = name_hit
+        self.lin_predict = lin_predict
+        self.res_poly = res_poly
+        self.correlations = correlations
+
+    def is_contaminated(self, conta_threshold: int) -> bool:
+        """Status written in the .conta file, res_poly is rounded"""
+        return self.res_poly >= conta_threshold
+
+
+def last_argmax(values: np.ndarray) -> int:
+    """Index of the maximum, the last one on ties as R sort gives it"""
+    valid = np.where(np.isnan(values), -np.inf, values)
+    return len(valid) - 1 - int(np.argmax(valid[::-1]))
+
+
+def estimate(panel: Panel, histograms: np.ndarray) -> List[Estimation]:
+    """Estimate the contamination of samples of a same dataset depth
+
+    All samples are processed at once with matrix operations.
+
+    Args:
+        :param panel: dataset matching the depth of the samples
+        :param histograms: a histogram by column
+
+    Returns:
+        An Estimation by sample
+    """
+    # the dataset is standardized once, when the panel is compiled
+    cor = panel.cor_dataset.T.dot(standardize(histograms, COR_PARAM))
+    intercept, slope = panel.lin_coefs
+    lin_predict = intercept + slope * ratio_hetero(histograms,
+                                                   panel.lin_rows)
+    coef_c, coef_b, coef_a = panel.poly_coefs
+    res_poly = quadratic_root(coef_c - ratio_hetero(histograms,
+                                                    panel.poly_rows),
+                              coef_b, coef_a)
+    estimations = []
+    for i in range(histograms.shape[1]):
+        hit = last_argmax(cor[:, i])
+        estimations.append(Estimation(float(np.nanmax(cor[panel.references,
+                                                          i])),
+                                      float(cor[hit, i]),
+                                      float(panel.xconta[hit]),
+                                      float(lin_predict[i]),
+                                      round(float(res_poly[i]), 2),
+                                      cor[:, i]))
+    return estimations
+
+
+def lin_predict_modif(lin_predict: float) -> str:
+    if lin_predict <= MAX_CONTA_LINEAR:
+        return r_format(round(lin_predict, 2)) + "%"
+    return (r_format(MAX_CONTA_LINEAR) + "% < x < 50% (" +
+            r_format(round(lin_predict, 2)) + "%)")
+
+
+def conta_result(res_poly: float, conta_threshold: int) -> str:
+    return ("Possible contamination greater than " +
+            r_format(conta_threshold) + "% : " +
+            ("TRUE" if res_poly >= conta_threshold else "FALSE"))
+
+
+def write_conta(conta: str, estimation: Estimation, panel: Panel,
+                conta_threshold: int) -> None:
+    """Write a .conta file with the layout of contaReport.R
+
+    Args:
+        :param conta: output file path
+        :param estimation: estimation of the sample
+        :param panel: dataset used for the estimation
+        :param conta_threshold: threshold for contaminated status
+    """
+    lines = ['"Max. Cor. with Ref.","Max. Cor. with dataset",'
+             '"Percent Conta. hit"',
+             '"' + rows_label(COR_PARAM) + '",' +
+             r_format(round(estimation.max_ref, 3)) + "," +
+             r_format(round(estimation.hit_cor, 3)) + "," +
+             r_format(estimation.name_hit),
+             '"Percent Conta Linear Regression (Max. precision ' +
+             r_format(MAX_CONTA_LINEAR) + '%) ",'
+             '"Percent Conta Polynomial Regression"',
+             '"' + rows_label(panel.lin_rows) + '","' +
+             lin_predict_modif(estimation.lin_predict) + '","' +
+             r_format(estimation.res_poly) + '%"',
+             conta_result(estimation.res_poly, conta_threshold) + " "]
+    with open(conta, "w") as conta_f:
+        conta_f.write("\n".join(lines) + "\n")
+
+
+def write_record(record: str, name: str, estimation: Estimation, depth: int,
+                 experiment: str, conta_threshold: int) -> None:
+    """Write the estimation of a sample as a JSON object
+
+    Unlike the .conta file, it is read without parsing, see contatester
+    collect.
+
+    Args:
+        :param record: output file path
+        :param name: sample name
+        :param estimation: estimation of the sample
+        :param depth: estimated depth of the sample
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param conta_threshold: threshold for contaminated status
+    """
+    with open(record, "w") as record_f:
+        json.dump({"sample": name,
+                   "depth": depth,
+                   "dataset_depth": dataset_depth(depth, experiment),
+                   "experiment": experiment,
+                   "max_ref": estimation.max_ref,
+                   "hit_cor": estimation.hit_cor,
+                   "name_hit": estimation.name_hit,
+                   "lin_predict": estimation.lin_predict,
+                   "res_poly": estimation.res_poly,
+                   "threshold": conta_threshold,
+                   "contaminated": estimation.is_contaminated(
+                       conta_threshold)},
+                  record_f, sort_keys=True)
+        record_f.write("\n")
+
+
+def estimate_histograms(histograms: Sequence[np.ndarray],
+                        depths: Sequence[int], experiment: str = "WG",
+                        panel_dir: Optional[str] = None) \
+        -> List[Tuple[Estimation, Panel]]:
+    """Estimate the contamination of several samples in one process
+
+    Samples are grouped by dataset depth, each dataset is loaded once.
+
+    Args:
+        :param histograms: allele balance histogram of each sample
+        :param depths: estimated depth of each sample
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param panel_dir: directory of compiled panels [default: data dir]
+
+    Returns:
+        An Estimation by sample with the dataset it was estimated with, in
+        the order of histograms
+    """
+    results = [None] * len(histograms)  # type: List[Any]
+    groups = {}  # type: Dict[int, List[int]]
+    for i, depth in enumerate(depths):
+        groups.setdefault(dataset_depth(depth, experiment), []).append(i)
+    for depthtest, indexes in sorted(groups.items()):
+        panel = load_panel(experiment, depthtest, panel_dir)
+        group = np.column_stack([histograms[i] for i in indexes])
+        for i, estimation in zip(indexes, estimate(panel, group)):
+            results[i] = (estimation, panel)
+    return results
+
+
+def estimate_files(hists: Sequence[str], depths: Sequence[int],
+                   contas: Sequence[str], experiment: str = "WG",
+                   conta_threshold: int = 4,
+                   panel_dir: Optional[str] = None) -> List[Estimation]:
+    """Estimate the contamination of several samples and write .conta files
+
+    The estimation of each sample is written as a JSON record too.
+
+    Args:
+        :param hists: allele balance histogram files
+        :param depths: estimated depth of each sample
+        :param contas: output .conta files
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param conta_threshold: threshold for contaminated status
+        :param panel_dir: directory of compiled panels [default: data dir]
+
+    Returns:
+        An Estimation by sample, in the order of hists
+    """
+    estimations = []
+    results = estimate_histograms([read_hist(hist) for hist in hists],
+                                  depths, experiment, panel_dir)
+    for conta, depth, (estimation, panel) in zip(contas, depths, results):
+        write_conta(conta, estimation, panel, conta_threshold)
+        write_record(record_file(conta), re.sub("\\.conta$", "",
+                                                basename(conta)),
+                     estimation, depth, experiment, conta_threshold)
+        estimations.append(estimation)
+    return estimations
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester estimate",
+                                     description=("Estimate the "
+                                                  "contamination degree of "
+                                                  "samples, output a csv "
+                                                  "file by sample"))
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-i", "--input", type=str,
+                       help=("allele balance histogram of a sample, as "
+                             "written by contatester abcalc"))
+    group.add_argument("-l", "--list", type=str,
+                       help=("batch mode: text file, one vcf by lane, the "
+                             ".hist and .meandepth files of each vcf are "
+                             "read from --outdir"))
+    parser.add_argument("-o", "--output", default=None, type=str,
+                        help="output file [default: <input>.conta]")
+    parser.add_argument("--outdir", default=".", type=str,
+                        help=("batch mode: folder of the sample results "
+                              "[default: current directory]"))
+    parser.add_argument("-d", "--depth", default=30, type=float,
+                        help="Estimated depth [default: 30]")
+    parser.add_argument("--depth-file", default=None, type=str,
+                        help=("file of the estimated depth as written by "
+                              "contatester abcalc, replaces -d"))
+    parser.add_argument("-t", "--threshold", default=4, type=int,
+                        help=("Threshold for contamination status "
+                              "[default: 4]"))
+    parser.add_argument("-e", "--experiment", default="WG", type=str,
+                        choices=("WG", "EX"),
+                        help=("Experiment type, could be WG for Whole "
+                              "Genome or EX for Exome [default: WG]"))
+    parser.add_argument("--panels", default=None, type=str,
+                        help=("folder of panels compiled by contatester "
+                              "panels, .rda datasets are read when a panel "
+                              "is missing [default: contatester data "
+                              "directory]"))
+    args = parser.parse_args(parameters)
+    if args.input is not None and args.output is None:
+        args.output = re.sub("\\.hist$", "", basename(args.input)) + ".conta"
+    return args
+
+
+def task_manifest(args: argparse.Namespace) -> Manifest:
+    """Manifest of the estimation of a sample, written next to the output"""
+    inputs = [args.input]
+    parameters = {"threshold": args.threshold,
+                  "experiment": args.experiment,
+                  "panels": args.panels}
+    if args.depth_file is not None:
+        inputs.append(args.depth_file)
+    else:
+        parameters["depth"] = int(args.depth)
+    return Manifest(manifest_file(args.output), "estimate", parameters,
+                    inputs, [args.output, record_file(args.output)])
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    start = time.monotonic()
+    args = get_cli_args(parameters)
+    manifest = None
+    if args.input is not None:
+        manifest = task_manifest(args)
+        if manifest.is_valid():
+            print("Estimation of {} is up to date".format(args.input))
+            return 0
+        hists = [args.input]
+        if args.depth_file is not None:
+            depths = [read_depth(args.depth_file)]
+        else:
+            depths = [int(args.depth)]
+        contas = [args.output]
+    else:
+        with open(args.list, "r") as filin:
+            names = [sample_name(vcf) for vcf in filin.read().splitlines()
+                     if vcf]
+        hists = [hist_file(args.outdir, name) for name in names]
+        depths = [read_depth(depth_file(args.outdir, name))
+                  for name in names]
+        contas = [conta_file(args.outdir, name) for name in names]
+    estimate_files(hists, depths, contas, args.experiment, args.threshold,
+                   args.panels)
+    if manifest is not None:
+        manifest.write()
+    # the size of an estimation is its number of samples
+    record_runtime("estimate", len(hists), 1, start)
+    return 0
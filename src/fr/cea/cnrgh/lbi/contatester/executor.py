@@ -0,0 +1,300 @@
+# Import necessary libraries:
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from os import stat
+from os.path import isfile
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import argparse
+import heapq
+import os
+import subprocess
+import sys
+
+# Suffix of the file listing the tasks done, as pegasus-mpi-cluster does
+RESCUE_SUFFIX = ".rescue"
+# Options of a TASK line followed by a value
+TASK_OPTIONS = ("-c", "-m", "-t", "-p", "-r", "-f")
+
+
+class Task:
+    """A task of a DAG file written for pegasus-mpi-cluster
+
+    Args:
+        :param task_id: unique name of the task
+        :param args: executable and its arguments
+        :param cores: number of cores requested with -c
+    """
+
+    def __init__(self, task_id: str, args: List[str], cores: int = 1) -> None:
+        self.task_id = task_id
+        self.args = args
+        self.cores = cores
+        self.parents = []  # type: List[str]
+        self.children = []  # type: List[str]
+        self.priority = 0
+
+    def cost(self) -> int:
+        """Size of the input files of the task, tasks of large VCF first
+
+        Words of the command line which are existing files are counted,
+        outputs of other tasks do not exist yet.
+        """
+        size = 0
+        for word in set(" ".join(self.args[1:]).split()):
+            if isfile(word):
+                size += stat(word).st_size
+        return size
+
+
+def split_task_line(line: str) -> List[str]:
+    """Split a line as pegasus-mpi-cluster does
+
+    Double quotes group words and a backslash escapes any character.
+    """
+    tokens = []
+    token = []  # type: List[str]
+    in_token = False
+    quoted = False
+    escaped = False
+    for char in line:
+        if escaped:
+            token.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = in_token = True
+        elif char == '"':
+            quoted = not quoted
+            in_token = True
+        elif char.isspace() and not quoted:
+            if in_token:
+                tokens.append("".join(token))
+                token = []
+                in_token = False
+        else:
+            token.append(char)
+            in_token = True
+    if quoted or escaped:
+        raise ValueError("Unterminated quote or escape: " + line)
+    if in_token:
+        tokens.append("".join(token))
+    return tokens
+
+
+def read_dag(dag_file: str) -> Dict[str, Task]:
+    """Tasks and dependencies of the TASK and EDGE lines of a DAG file
+
+    Args:
+        :param dag_file: the dag file path
+
+    Returns:
+        A dictionary of task id to Task, in the order of the file
+    """
+    tasks = {}  # type: Dict[str, Task]
+    edges = []  # type: List[Tuple[str, str]]
+    with open(dag_file, "r") as dag_f:
+        for line_number, line in enumerate(dag_f, start=1):
+            tokens = split_task_line(line)
+            if not tokens or tokens[0].startswith("#"):
+                continue
+            if tokens[0] == "TASK" and len(tokens) > 2:
+                task_id = tokens[1]
+                cores = 1
+                i = 2
+                while i < len(tokens) and tokens[i] in TASK_OPTIONS:
+                    if tokens[i] == "-c":
+                        cores = int(tokens[i + 1])
+                    i += 2
+                if i >= len(tokens) or task_id in tasks:
+                    raise ValueError("Invalid task at line {} of {}"
+                                     .format(line_number, dag_file))
+                tasks[task_id] = Task(task_id, tokens[i:], cores)
+            elif tokens[0] == "EDGE" and len(tokens) == 3:
+                edges.append((tokens[1], tokens[2]))
+            else:
+                raise ValueError("Invalid line {} of {}: {}"
+                                 .format(line_number, dag_file, line.strip()))
+    for parent, child in edges:
+        if parent not in tasks or child not in tasks:
+            raise ValueError("Unknown task in EDGE {} {}"
+                             .format(parent, child))
+        tasks[parent].children.append(child)
+        tasks[child].parents.append(parent)
+    return tasks
+
+
+def topological_order(tasks: Dict[str, Task]) -> List[str]:
+    remaining = {task_id: len(task.parents) for task_id, task in tasks.items()}
+    order = [task_id for task_id, count in remaining.items() if count == 0]
+    for task_id in order:
+        for child in tasks[task_id].children:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                order.append(child)
+    if len(order) != len(tasks):
+        raise ValueError("The DAG has a cycle")
+    return order
+
+
+def set_priorities(tasks: Dict[str, Task]) -> None:
+    """Priority of a task: cost of the longest path starting from it
+
+    Tasks on the critical path, those of the largest VCF, start first.
+    """
+    for task_id in reversed(topological_order(tasks)):
+        task = tasks[task_id]
+        task.priority = 1 + task.cost() + \
+            max([tasks[child].priority for child in task.children] or [0])
+
+
+def read_rescue(rescue_file: str) -> Set[str]:
+    """Tasks done by a previous run, DONE lines of a rescue file"""
+    done = set()
+    if isfile(rescue_file):
+        with open(rescue_file, "r") as rescue_f:
+            for line in rescue_f:
+                fields = line.split()
+                if len(fields) == 2 and fields[0] == "DONE":
+                    done.add(fields[1])
+    return done
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def run_task(task: Task) -> Tuple[int, bytes, bytes]:
+    # task variables set by pegasus-mpi-cluster, read by the timeline
+    env = dict(os.environ, PMC_TASK=task.task_id, PMC_CPUS=str(task.cores))
+    process = subprocess.Popen(task.args, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, env=env)
+    stdout, stderr = process.communicate()
+    return process.returncode, stdout, stderr
+
+
+def run_dag(dag_file: str, cores: Optional[int] = None,
+            rescue: bool = True) -> List[Tuple[str, int]]:
+    """Run the tasks of a DAG file on the local machine
+
+    A task starts once its parents succeeded and its cores are free, ready
+    tasks are started by decreasing priority. As with pegasus-mpi-cluster,
+    each task done is appended to <dag_file>.rescue and tasks listed there
+    are not run again, so a failed run resumes where it stopped.
+
+    Args:
+        :param dag_file: the dag file path
+        :param cores: number of cores to use [default: cores of the machine]
+        :param rescue: read and write the rescue file
+
+    Returns:
+        The failed tasks with their exit code
+    """
+    tasks = read_dag(dag_file)
+    set_priorities(tasks)
+    cores = cores or available_cores()
+    rescue_file = dag_file + RESCUE_SUFFIX
+    done = read_rescue(rescue_file) if rescue else set()
+    remaining = {task_id: sum(parent not in done for parent in task.parents)
+                 for task_id, task in tasks.items()}
+    # ties are broken by the order of the DAG file
+    order = {task_id: i for i, task_id in enumerate(tasks)}
+    ready = [(-task.priority, order[task_id], task_id)
+             for task_id, task in tasks.items()
+             if task_id not in done and remaining[task_id] == 0]
+    heapq.heapify(ready)
+    failed = []  # type: List[Tuple[str, int]]
+    free_cores = cores
+    running = {}
+    rescue_f = open(rescue_file, "a") if rescue else None
+    try:
+        with ThreadPoolExecutor(max_workers=cores) as executor:
+            while ready or running:
+                # start every ready task which fits, by priority
+                waiting = []
+                while ready:
+                    item = heapq.heappop(ready)
+                    task = tasks[item[2]]
+                    # a task larger than the machine runs alone
+                    task_cores = min(task.cores, cores)
+                    if task_cores <= free_cores:
+                        free_cores -= task_cores
+                        running[executor.submit(run_task, task)] = task
+                    else:
+                        waiting.append(item)
+                for item in waiting:
+                    heapq.heappush(ready, item)
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    free_cores += min(task.cores, cores)
+                    returncode, stdout, stderr = future.result()
+                    sys.stdout.buffer.write(stdout)
+                    sys.stdout.flush()
+                    sys.stderr.buffer.write(stderr)
+                    sys.stderr.flush()
+                    if returncode != 0:
+                        failed.append((task.task_id, returncode))
+                        continue
+                    if rescue_f is not None:
+                        rescue_f.write("DONE " + task.task_id + "\n")
+                        rescue_f.flush()
+                    for child in task.children:
+                        remaining[child] -= 1
+                        if remaining[child] == 0:
+                            heapq.heappush(ready, (-tasks[child].priority,
+                                                   order[child], child))
+    finally:
+        if rescue_f is not None:
+            rescue_f.close()
+    return failed
+
+
+def descendants(tasks: Dict[str, Task], task_ids: Sequence[str]) -> Set[str]:
+    found = set()  # type: Set[str]
+    stack = list(task_ids)
+    while stack:
+        for child in tasks[stack.pop()].children:
+            if child not in found:
+                found.add(child)
+                stack.append(child)
+    return found
+
+
+def failure_report(dag_file: str, failed: List[Tuple[str, int]]) -> str:
+    """Failed tasks and tasks not run because of them"""
+    not_run = descendants(read_dag(dag_file),
+                          [task_id for task_id, _ in failed])
+    lines = ["Task {} failed with exit code {}".format(task_id, returncode)
+             for task_id, returncode in failed]
+    lines.append("{} task(s) not run: {}"
+                 .format(len(not_run), " ".join(sorted(not_run))))
+    lines.append("Tasks done are listed in " + dag_file + RESCUE_SUFFIX +
+                 ", run the same command again to resume")
+    return "\n".join(lines) + "\n"
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester run",
+                                     description=("Run the tasks of a DAG "
+                                                  "file on the local "
+                                                  "machine"))
+    parser.add_argument("dag_file", type=str,
+                        help="DAG file written by contatester")
+    parser.add_argument("-n", "--cores", default=None, type=int,
+                        help=("number of cores to use "
+                              "[default: cores of the machine]"))
+    parser.add_argument("--no-rescue", dest="rescue", action="store_false",
+                        help=("run all tasks, neither read nor write the "
+                              "rescue file"))
+    return parser.parse_args(parameters)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    failed = run_dag(args.dag_file, args.cores, args.rescue)
+    if failed:
+        print(failure_report(args.dag_file, failed), end="",
+              file=sys.stderr)
+        return 1
+    return 0
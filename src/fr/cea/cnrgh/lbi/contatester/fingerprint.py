@@ -0,0 +1,213 @@
+# Import necessary libraries:
+
+from os import makedirs, remove, replace, stat, utime, walk, getpid
+from os.path import abspath, getsize, isfile, join
+from typing import Dict, List, Optional, Sequence
+import hashlib
+import zipfile
+
+import numpy as np
+
+# Change it when the content of fingerprints changes
+FINGERPRINT_VERSION = "1"
+# Default size cap of a cache directory, in bytes
+CACHE_SIZE = 10 * 1024 ** 3
+ENTRY_SUFFIX = ".npz"
+# Estimated size of the entries of a cache directory, updated by each store
+SIZE_FILE = "size"
+READ_SIZE = 1024 * 1024
+
+Arrays = Dict[str, np.ndarray]
+
+
+def file_checksum(file_path: str) -> str:
+    """SHA-256 of the content of a file"""
+    checksum = hashlib.sha256()
+    with open(file_path, "rb") as file_f:
+        for chunk in iter(lambda: file_f.read(READ_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def sites_to_arrays(sites: Dict[bytes, Sequence[int]]) -> Arrays:
+    """Pack SNP positions by sequence into arrays storable in a cache"""
+    chroms = list(sites)
+    return {"chroms": np.array(chroms, dtype=bytes),
+            "counts": np.array([len(sites[chrom]) for chrom in chroms],
+                               dtype=np.int64),
+            "positions": np.concatenate(
+                [np.asarray(sites[chrom], dtype=np.uint32)
+                 for chrom in chroms]) if chroms else
+            np.empty(0, dtype=np.uint32)}
+
+
+def arrays_to_sites(arrays: Arrays) -> Dict[bytes, np.ndarray]:
+    """Reverse of sites_to_arrays"""
+    sites = {}
+    offset = 0
+    for chrom, count in zip(arrays["chroms"].tolist(),
+                            arrays["counts"].tolist()):
+        sites[chrom] = arrays["positions"][offset:offset + count]
+        offset += count
+    return sites
+
+
+class FingerprintCache:
+    """Directory of sample fingerprints with a size cap
+
+    Entries are numpy archives named after a key computed from the checksum
+    of the input files and the parameters they were computed with, so a
+    modified VCF or a new parameter never hits an outdated entry. The
+    modification time of an entry is updated each time it is read and the
+    least recently used entries are removed when the directory exceeds its
+    size cap. The size of the directory is estimated from a file updated by
+    each store, the entries are only listed when the estimate crosses the
+    cap.
+    Checksums of input files are kept into the directory too, they are
+    computed again only when the size or the modification time of a file
+    changes.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = CACHE_SIZE) -> None:
+        self.cache_dir = abspath(cache_dir)
+        self.max_size = max_size
+        makedirs(join(self.cache_dir, "checksums"), exist_ok=True)
+
+    def checksum(self, file_path: str) -> str:
+        """Checksum of a file, computed once while the file is unchanged"""
+        file_stat = stat(file_path)
+        signature = "{} {}".format(file_stat.st_size, file_stat.st_mtime_ns)
+        record = join(self.cache_dir, "checksums",
+                      hashlib.sha1(abspath(file_path).encode()).hexdigest())
+        if isfile(record):
+            with open(record, "r") as record_f:
+                fields = record_f.read().split()
+            if len(fields) == 3 and " ".join(fields[:2]) == signature:
+                return fields[2]
+        checksum = file_checksum(file_path)
+        self._atomic_write(record, (signature + " " + checksum).encode())
+        return checksum
+
+    def key(self, kind: str, *parts: object) -> str:
+        """Key of an entry from its kind and what its content depends on
+
+        Args:
+            :param kind: type of content, as "sites" or "abcalc"
+            :param parts: checksums of inputs and parameters
+        """
+        content = "\x00".join([kind, FINGERPRINT_VERSION] +
+                              [str(part) for part in parts])
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return join(self.cache_dir, key[:2], key + ENTRY_SUFFIX)
+
+    def contains(self, key: str) -> bool:
+        return isfile(self.entry_path(key))
+
+    def load(self, key: str) -> Optional[Arrays]:
+        """Content of an entry, None when missing or unreadable"""
+        entry = self.entry_path(key)
+        if not isfile(entry):
+            return None
+        try:
+            with np.load(entry, allow_pickle=False) as archive:
+                arrays = {name: archive[name] for name in archive.files}
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # truncated by a killed job, another task may remove it too
+            try:
+                remove(entry)
+            except OSError:
+                pass
+            return None
+        try:
+            utime(entry)
+        except OSError:
+            pass
+        return arrays
+
+    def store(self, key: str, arrays: Arrays) -> None:
+        """Write an entry then evict least recently used ones when the
+        estimated size of the directory exceeds the size cap"""
+        entry = self.entry_path(key)
+        makedirs(join(self.cache_dir, key[:2]), exist_ok=True)
+        tmp_entry = "{}.{}.tmp".format(entry, getpid())
+        with open(tmp_entry, "wb") as entry_f:
+            np.savez_compressed(entry_f, **arrays)
+        entry_size = getsize(tmp_entry)
+        # concurrent tasks may store the same entry
+        replace(tmp_entry, entry)
+        size = self.estimated_size()
+        if size is None or size + entry_size > self.max_size:
+            self.evict()
+        else:
+            self._write_size(size + entry_size)
+
+    def estimated_size(self) -> Optional[int]:
+        """Size of the entries as written by the last store, None when
+        unknown
+
+        Concurrent stores may lose an update of each other, evict corrects
+        the estimate.
+        """
+        try:
+            with open(join(self.cache_dir, SIZE_FILE), "r") as size_f:
+                return int(size_f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_size(self, size: int) -> None:
+        try:
+            self._atomic_write(join(self.cache_dir, SIZE_FILE),
+                               str(size).encode())
+        except OSError:
+            pass
+
+    def entries(self) -> List[str]:
+        paths = []
+        for root, _, files in walk(self.cache_dir):
+            paths.extend(join(root, name) for name in files
+                         if name.endswith(ENTRY_SUFFIX))
+        return paths
+
+    def evict(self) -> None:
+        """Remove least recently used entries above the size cap"""
+        entries = []
+        total_size = 0
+        for entry in self.entries():
+            try:
+                entry_stat = stat(entry)
+            except OSError:
+                continue
+            entries.append((entry_stat.st_mtime_ns, entry_stat.st_size,
+                            entry))
+            total_size += entry_stat.st_size
+        entries.sort()
+        for _, size, entry in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                remove(entry)
+            except OSError:
+                pass
+            total_size -= size
+        self._write_size(total_size)
+
+    def _atomic_write(self, file_path: str, content: bytes) -> None:
+        tmp_path = "{}.{}.tmp".format(file_path, getpid())
+        with open(tmp_path, "wb") as file_f:
+            file_f.write(content)
+        replace(tmp_path, file_path)
+
+
+def open_cache(cache_dir: Optional[str], cache_size: float) \
+        -> Optional[FingerprintCache]:
+    """Cache of a stage command line, None when no directory is given
+
+    Args:
+        :param cache_dir: cache directory, empty or None to disable
+        :param cache_size: size cap in GiB
+    """
+    if not cache_dir:
+        return None
+    return FingerprintCache(cache_dir, int(cache_size * 1024 ** 3))
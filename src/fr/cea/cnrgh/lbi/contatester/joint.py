@@ -0,0 +1,349 @@
+# Import necessary libraries:
+
+from concurrent.futures import ProcessPoolExecutor
+from os import makedirs
+from os.path import basename, join
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import AB_END, AB_START, \
+    SHARD_SIZE, AlleleBalance, CandidateSelector, cached_regions, \
+    plan_shards, write_hist, write_mean_depth
+from fr.cea.cnrgh.lbi.contatester.bgzf import BgzfReader
+from fr.cea.cnrgh.lbi.contatester.comparison import SUMMARY_HEADER, bc_ratio
+from fr.cea.cnrgh.lbi.contatester.data import DEFAULT_REFERENCE, \
+    REFERENCES, gnomad_bed
+from fr.cea.cnrgh.lbi.contatester.estimation import estimate_histograms, \
+    write_conta, write_record
+from fr.cea.cnrgh.lbi.contatester.manifest import Manifest, manifest_file
+from fr.cea.cnrgh.lbi.contatester.outputs import candidates_file, \
+    conta_file, depth_file, hist_file, record_file, sample_name, summary_file
+from fr.cea.cnrgh.lbi.contatester.regions import Regions
+from fr.cea.cnrgh.lbi.contatester.runtime import files_size, \
+    record_runtime
+from fr.cea.cnrgh.lbi.contatester.tabix import has_index, index_path, \
+    read_index
+from fr.cea.cnrgh.lbi.contatester.vcf import ad_values, field_index, \
+    has_alt_allele, header_samples, is_snp, iter_records, iter_region, \
+    open_vcf, padded_ad, read_header
+
+SAMPLES_SUFFIX = ".samples"
+
+
+class JointBalance:
+    """Allele balance of each sample of a joint VCF and their comparisons
+
+    A sample accounts for the records where it carries an alternate allele,
+    the records a single sample VCF split from the joint VCF would keep.
+    matches[i, j] counts the potentially contaminant variants of sample i
+    carried by sample j, the nbMatch of the comparison stage.
+
+    Args:
+        :param nb_sample: number of samples of the VCF
+    """
+
+    def __init__(self, nb_sample: int) -> None:
+        self.samples = [AlleleBalance() for _ in range(nb_sample)]
+        self.nb_candidates = [0] * nb_sample
+        self.matches = np.zeros((nb_sample, nb_sample), dtype=np.int64)
+
+    def merge(self, other: "JointBalance") -> None:
+        """Add the counts of a partial result"""
+        for result, partial in zip(self.samples, other.samples):
+            result.merge(partial)
+        for i, count in enumerate(other.nb_candidates):
+            self.nb_candidates[i] += count
+        self.matches += other.matches
+
+
+def scan_joint_records(records: Iterable[List[bytes]], result: JointBalance,
+                       hist_excluded: Optional[Regions] = None,
+                       selector: Optional[CandidateSelector] = None) -> None:
+    """Accumulate the SNP records of a joint VCF into a result
+
+    Args:
+        :param records: records split by iter_records or iter_region
+        :param result: the accumulator to fill
+        :param hist_excluded: regions excluded from histogram and depth
+        :param selector: selection of potentially contaminant variants
+    """
+    ad_cache = {}  # type: Dict[bytes, int]
+    gt_cache = {}  # type: Dict[bytes, int]
+    samples = result.samples
+    for fields in records:
+        if len(fields) <= 9 or not is_snp(fields[3], fields[4]):
+            continue
+        ad_index = field_index(fields[8], ad_cache)
+        gt_index = field_index(fields[8], gt_cache, b"GT")
+        in_hist = hist_excluded is None or \
+            not hist_excluded.contains(fields[0], int(fields[1]))
+        carriers = []
+        candidates = []
+        # iter_records leaves the samples after the first one unsplit
+        columns = fields[9:]
+        if len(columns) > 1:
+            columns = columns[:1] + columns[1].split(b"\t")
+        for i, sample in enumerate(columns):
+            keys = sample.split(b":")
+            values = ad_values(keys, ad_index)
+            if not has_alt_allele(keys, gt_index, values):
+                continue
+            carriers.append(i)
+            if in_hist:
+                samples[i].add(padded_ad(values))
+            if selector is not None and selector.accept(fields, values):
+                candidates.append(i)
+        if candidates:
+            for i in candidates:
+                result.nb_candidates[i] += 1
+            result.matches[np.ix_(candidates, carriers)] += 1
+
+
+def shard_joint_balance(vcf_file: str, nb_sample: int,
+                        shard: Tuple[bytes, int, int, int],
+                        bed_file: Optional[str], exclude_hist: bool,
+                        ab_range: Tuple[float, float]) -> JointBalance:
+    """Partial result of a region, run by the workers of the process pool"""
+    chrom, beg, end, offset = shard
+    excluded = cached_regions(bed_file)
+    result = JointBalance(nb_sample)
+    with BgzfReader(vcf_file) as reader:
+        scan_joint_records(iter_region(reader, offset, chrom, beg, end),
+                           result, excluded if exclude_hist else None,
+                           CandidateSelector(ab_range[0], ab_range[1],
+                                             excluded))
+    return result
+
+
+def compute_joint_balance(vcf_file: str, nb_sample: int,
+                          bed_file: Optional[str] = None,
+                          exclude_hist: bool = False,
+                          ab_range: Tuple[float, float] = (AB_START, AB_END),
+                          thread: int = 1,
+                          shard_size: int = SHARD_SIZE) -> JointBalance:
+    """Read a joint VCF once for all its samples
+
+    With more than one thread and a tabix indexed VCF, regions are processed
+    by a pool of processes as contatester abcalc does.
+
+    Args:
+        :param vcf_file: path to a multi-sample VCF file, compressed or not
+        :param nb_sample: number of samples of the VCF
+        :param bed_file: BED file of regions to exclude
+        :param exclude_hist: exclude regions from histogram and depth too
+        :param ab_range: allele balance range of selected variants
+        :param thread: number of processes
+        :param shard_size: length of the regions processed in parallel
+
+    Returns:
+        The filled JointBalance
+    """
+    result = JointBalance(nb_sample)
+    if thread > 1 and has_index(vcf_file):
+        shards = plan_shards(read_index(index_path(vcf_file)), shard_size)
+        with ProcessPoolExecutor(max_workers=thread) as executor:
+            futures = [executor.submit(shard_joint_balance, vcf_file,
+                                       nb_sample, shard, bed_file,
+                                       exclude_hist, ab_range)
+                       for shard in shards]
+            for future in futures:
+                result.merge(future.result())
+    else:
+        excluded = cached_regions(bed_file)
+        with open_vcf(vcf_file) as handler:
+            scan_joint_records(iter_records(handler), result,
+                               excluded if exclude_hist else None,
+                               CandidateSelector(ab_range[0], ab_range[1],
+                                                 excluded))
+    return result
+
+
+def sample_vcf_names(samples: Sequence[str]) -> List[str]:
+    """VCF names standing for the samples of a joint VCF
+
+    The outputs of a sample are named from them as from a single sample
+    VCF, so report and collect read the list of these names.
+    """
+    return [sample + ".vcf" for sample in samples]
+
+
+def samples_file(out_dir: str, vcf_file: str) -> str:
+    return join(out_dir, sample_name(vcf_file) + SAMPLES_SUFFIX)
+
+
+def write_joint_summaries(vcfs: Sequence[str], contaminated: Sequence[int],
+                          out_dir: str, result: JointBalance) -> None:
+    """Write the comparisonSummary file of each contaminated sample
+
+    Args:
+        :param vcfs: VCF names of the samples, see sample_vcf_names
+        :param contaminated: indexes of the samples marked as contaminated
+        :param out_dir: directory to put results
+        :param result: counts of the joint VCF
+    """
+    for i in contaminated:
+        name = sample_name(vcfs[i])
+        nb_snp_conta = result.nb_candidates[i]
+        with open(summary_file(out_dir, name), "w") as summary_f:
+            summary_f.write(SUMMARY_HEADER)
+            for j, vcf_compare in enumerate(vcfs):
+                if j == i:
+                    continue
+                nb_match = int(result.matches[i, j])
+                summary_f.write(",".join((
+                    basename(candidates_file(out_dir, name)), vcf_compare,
+                    str(nb_snp_conta), str(nb_match),
+                    bc_ratio(nb_match, nb_snp_conta))) + "\n")
+
+
+def write_joint_results(vcfs: Sequence[str], out_dir: str,
+                        result: JointBalance, experiment: str = "WG",
+                        conta_threshold: int = 4,
+                        panel_dir: Optional[str] = None) -> List[str]:
+    """Write the outputs of each sample of a joint VCF
+
+    The histograms are estimated in memory, the comparisons come from the
+    matches counted during the pass, no VCF is read again.
+
+    Args:
+        :param vcfs: VCF names of the samples, see sample_vcf_names
+        :param out_dir: directory to put results
+        :param result: counts of the joint VCF
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param conta_threshold: threshold for contaminated status
+        :param panel_dir: directory of compiled panels [default: data dir]
+
+    Returns:
+        The VCF names of the samples marked as contaminated
+    """
+    names = [sample_name(vcf) for vcf in vcfs]
+    estimated = [i for i, balance in enumerate(result.samples)
+                 if balance.nb_snp > 0]
+    depths = []
+    for i in estimated:
+        balance = result.samples[i]
+        write_hist(hist_file(out_dir, names[i]), balance.histogram)
+        write_mean_depth(depth_file(out_dir, names[i]), balance.mean_depth())
+        # the depth read back from the .meandepth file by estimate
+        depths.append(int(float("{:.6g}".format(balance.mean_depth()))))
+    estimations = estimate_histograms(
+        [np.array(result.samples[i].histogram, dtype=np.float64)
+         for i in estimated], depths, experiment, panel_dir)
+    contaminated = []
+    for i, depth, (estimation, panel) in zip(estimated, depths, estimations):
+        conta = conta_file(out_dir, names[i])
+        write_conta(conta, estimation, panel, conta_threshold)
+        write_record(record_file(conta), names[i], estimation, depth,
+                     experiment, conta_threshold)
+        if estimation.is_contaminated(conta_threshold):
+            contaminated.append(i)
+    write_joint_summaries(vcfs, contaminated, out_dir, result)
+    return [vcfs[i] for i in contaminated]
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester joint",
+                                     description=("Check the contamination "
+                                                  "of all samples of a "
+                                                  "multi-sample VCF in one "
+                                                  "pass"))
+    parser.add_argument("-f", "--file", required=True, type=str,
+                        help="joint VCF file version 4.2 to process "
+                             "(Mandatory)")
+    parser.add_argument("-o", "--outdir", default=".", type=str,
+                        help=("folder of the sample results "
+                              "[default: current directory]"))
+    parser.add_argument("-e", "--exclude_gnomad", action="store_true",
+                        help=("exclude gnomad regions from histogram and "
+                              "depth too"))
+    parser.add_argument("-g", "--gnomad", default=None, type=str,
+                        help=("BED file of Low Complexity Repeats (LCR) and "
+                              "Segmental Duplications (seg_dup) excluded "
+                              "from the potentially contaminant variants "
+                              "(optional) [default: lcr_seg_dup_gnomad_"
+                              "2.0.2_<reference>.bed.gz]"))
+    parser.add_argument("-r", "--reference", default=DEFAULT_REFERENCE,
+                        type=str, choices=REFERENCES,
+                        help=("genome version for gnomad regions exclusions "
+                              "(optional) [default: {}]"
+                              .format(DEFAULT_REFERENCE)))
+    parser.add_argument("--ABstart", default=AB_START, type=float,
+                        help=("Allele balance starting value for variant "
+                              "selection (optional) [default: 0.00]"))
+    parser.add_argument("--ABend", default=AB_END, type=float,
+                        help=("Allele balance ending value for variant "
+                              "selection (optional) [default: 0.11]"))
+    parser.add_argument("-t", "--thread", default=1, type=int,
+                        help=("number of processes, regions of a tabix "
+                              "indexed VCF are processed in parallel "
+                              "(optional) [default: 1]"))
+    parser.add_argument("--shard-size", default=SHARD_SIZE, type=int,
+                        help=("length in bp of the regions processed in "
+                              "parallel, 0 for a region by chromosome "
+                              "(optional) [default: {}]".format(SHARD_SIZE)))
+    parser.add_argument("--threshold", default=4, type=int,
+                        help=("Threshold for contamination status "
+                              "[default: 4]"))
+    parser.add_argument("--experiment", default="WG", type=str,
+                        choices=("WG", "EX"),
+                        help=("Experiment type, could be WG for Whole "
+                              "Genome or EX for Exome [default: WG]"))
+    parser.add_argument("--panels", default=None, type=str,
+                        help=("folder of panels compiled by contatester "
+                              "panels [default: contatester data "
+                              "directory]"))
+    args = parser.parse_args(parameters)
+    if args.gnomad is None:
+        args.gnomad = gnomad_bed(args.reference)
+    return args
+
+
+def task_manifest(args: argparse.Namespace) -> Manifest:
+    """Manifest of a run, written next to the list of samples"""
+    return Manifest(manifest_file(samples_file(args.outdir, args.file)),
+                    "joint",
+                    {"exclude_gnomad": args.exclude_gnomad,
+                     "ab_range": [args.ABstart, args.ABend],
+                     "threshold": args.threshold,
+                     "experiment": args.experiment,
+                     "panels": args.panels},
+                    [args.file, args.gnomad],
+                    [samples_file(args.outdir, args.file)])
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    start = time.monotonic()
+    args = get_cli_args(parameters)
+    manifest = task_manifest(args)
+    if manifest.is_valid():
+        print("Outputs of {} are up to date".format(args.file))
+        return 0
+    samples = header_samples(read_header(args.file))
+    if not samples:
+        print("Error no sample found in VCF file {}".format(args.file),
+              file=sys.stderr)
+        return 1
+    result = compute_joint_balance(args.file, len(samples), args.gnomad,
+                                   args.exclude_gnomad,
+                                   (args.ABstart, args.ABend), args.thread,
+                                   args.shard_size)
+    vcfs = sample_vcf_names(samples)
+    for vcf, balance in zip(vcfs, result.samples):
+        if balance.nb_snp == 0:
+            print("Error no SNP found for sample {}".format(sample_name(vcf)),
+                  file=sys.stderr)
+    makedirs(args.outdir, exist_ok=True)
+    contaminated = write_joint_results(vcfs, args.outdir, result,
+                                       args.experiment, args.threshold,
+                                       args.panels)
+    with open(samples_file(args.outdir, args.file), "w") as samples_f:
+        samples_f.write("".join(vcf + "\n" for vcf in vcfs))
+    print("{} sample(s) of {}, {} contaminated".format(len(vcfs), args.file,
+                                                       len(contaminated)))
+    manifest.write()
+    record_runtime("joint", files_size([args.file]), args.thread, start)
+    return 0
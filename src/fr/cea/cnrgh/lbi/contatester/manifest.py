@@ -0,0 +1,151 @@
+# Import necessary libraries:
+
+from os import replace, stat, getpid
+from os.path import isfile
+from typing import Any, Dict, Optional, Sequence
+import json
+
+from pkg_resources import DistributionNotFound, get_distribution
+
+from fr.cea.cnrgh.lbi.contatester.data import script_name
+from fr.cea.cnrgh.lbi.contatester.fingerprint import FingerprintCache, \
+    file_checksum
+
+MANIFEST_SUFFIX = ".manifest"
+# Change it when the content of manifests changes
+MANIFEST_VERSION = 1
+
+FileRecord = Dict[str, Any]
+
+
+def tool_version() -> str:
+    try:
+        return get_distribution(script_name).version
+    except DistributionNotFound:
+        # run from a source tree
+        return "dev"
+
+
+def file_record(file_path: str, cache: Optional[FingerprintCache] = None,
+                previous: Optional[FileRecord] = None) -> FileRecord:
+    """Size and modification time of a file, with its checksum when it is
+    known without reading the file again
+
+    The checksum is the one of the previous record of the unchanged file, or
+    the one of the fingerprint cache, computed once while the file is
+    unchanged. Files are never read only to be recorded.
+
+    Args:
+        :param file_path: path of the file
+        :param cache: fingerprint cache of the task, None if it has none
+        :param previous: record of the file in the previous manifest
+    """
+    file_stat = stat(file_path)
+    record = {"size": file_stat.st_size,
+              "mtime_ns": file_stat.st_mtime_ns}  # type: FileRecord
+    if previous is not None and "sha256" in previous and \
+            previous.get("size") == record["size"] and \
+            previous.get("mtime_ns") == record["mtime_ns"]:
+        record["sha256"] = previous["sha256"]
+    elif cache is not None:
+        record["sha256"] = cache.checksum(file_path)
+    return record
+
+
+def is_unchanged(file_path: str, record: FileRecord) -> bool:
+    """Test if a file still has the content it was recorded with
+
+    The checksum is computed only when the modification time of the file
+    changed, a file touched but not modified is unchanged when its checksum
+    was recorded.
+    """
+    if not isfile(file_path):
+        return False
+    file_stat = stat(file_path)
+    if file_stat.st_size != record["size"]:
+        return False
+    if file_stat.st_mtime_ns == record["mtime_ns"]:
+        return True
+    return "sha256" in record and \
+        file_checksum(file_path) == record["sha256"]
+
+
+class Manifest:
+    """What a task computed its outputs from, written next to its outputs
+
+    A manifest holds the checksums of the inputs and of the outputs of a
+    task, its parameters and the version of contatester. The task does not
+    need to run again while the manifest is valid: same parameters and
+    version, inputs and outputs unchanged.
+
+    Args:
+        :param path: manifest file
+        :param stage: stage of the task, as abcalc
+        :param parameters: parameters the outputs depend on
+        :param inputs: input files
+        :param outputs: output files, more may be added before writing
+        :param cache: fingerprint cache of the task, checksums of the files
+                      are recorded from it [default: no checksum]
+    """
+
+    def __init__(self, path: str, stage: str, parameters: Dict[str, Any],
+                 inputs: Sequence[str], outputs: Sequence[str],
+                 cache: Optional[FingerprintCache] = None) -> None:
+        self.path = path
+        self.stage = stage
+        # as it is read back from the file
+        self.parameters = json.loads(json.dumps(parameters))
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cache = cache
+
+    def header(self) -> Dict[str, Any]:
+        return {"manifest_version": MANIFEST_VERSION,
+                "version": tool_version(),
+                "stage": self.stage,
+                "parameters": self.parameters}
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        if not isfile(self.path):
+            return None
+        try:
+            with open(self.path, "r") as manifest_f:
+                return json.load(manifest_f)
+        except ValueError:
+            return None
+
+    def is_valid(self) -> bool:
+        """Test if the outputs of the task are still valid"""
+        content = self.read()
+        if content is None or \
+                any(content.get(key) != value
+                    for key, value in self.header().items()):
+            return False
+        inputs = content.get("inputs", {})  # type: Dict[str, FileRecord]
+        outputs = content.get("outputs", {})  # type: Dict[str, FileRecord]
+        if sorted(inputs) != sorted(set(self.inputs)) or \
+                any(output not in outputs for output in self.outputs):
+            return False
+        return all(is_unchanged(file_path, record)
+                   for records in (inputs, outputs)
+                   for file_path, record in records.items())
+
+    def write(self) -> None:
+        """Record the inputs and the outputs once the task succeeded"""
+        previous = self.read() or {}
+        content = self.header()
+        for key, files in (("inputs", self.inputs),
+                           ("outputs", self.outputs)):
+            records = previous.get(key, {})  # type: Dict[str, FileRecord]
+            content[key] = {file_path: file_record(file_path, self.cache,
+                                                   records.get(file_path))
+                            for file_path in files}
+        tmp_path = "{}.{}.tmp".format(self.path, getpid())
+        with open(tmp_path, "w") as manifest_f:
+            json.dump(content, manifest_f, indent=1, sort_keys=True)
+        replace(tmp_path, self.path)
+
+
+def manifest_file(output: str) -> str:
+    """Manifest of the task writing an output file"""
+    return output + MANIFEST_SUFFIX
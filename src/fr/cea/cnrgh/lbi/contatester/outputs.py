@@ -0,0 +1,70 @@
+# Import necessary libraries:
+
+from os.path import basename, isfile, join
+
+
+def sample_name(vcf_file: str) -> str:
+    """Base name of a VCF used to name all outputs of a sample"""
+    return str(basename(vcf_file).split(".vcf")[0])
+
+
+def candidates_file(out_dir: str, basename_vcf: str) -> str:
+    """Path of the potentially contaminant variants of a sample"""
+    file_extension = "AB_0.00_to_0.11"
+    return join(out_dir, basename_vcf + "_" + file_extension +
+                "_noLCRnoDUP.vcf.gz")
+
+
+def hist_file(out_dir: str, basename_vcf: str) -> str:
+    return join(out_dir, basename_vcf + ".hist")
+
+
+def depth_file(out_dir: str, basename_vcf: str) -> str:
+    return join(out_dir, basename_vcf + ".meandepth")
+
+
+def conta_file(out_dir: str, basename_vcf: str) -> str:
+    return join(out_dir, basename_vcf + ".conta")
+
+
+def record_file(conta: str) -> str:
+    """Estimation of a sample as a JSON object, next to its .conta file"""
+    return conta + ".json"
+
+
+def triage_file(conta: str) -> str:
+    """Sampling of a sample estimated by contatester triage"""
+    return conta + ".triage.json"
+
+
+def summary_file(out_dir: str, basename_vcf: str) -> str:
+    return join(out_dir, basename_vcf + "_comparisonSummary.txt")
+
+
+def is_contaminated(conta: str) -> bool:
+    """Contamination status of a sample, the last field of its .conta file
+
+    Args:
+        :param conta: path of the .conta file written by contaReport.R
+    """
+    if not isfile(conta):
+        return False
+    with open(conta, "r") as conta_f:
+        fields = conta_f.read().split()
+    return len(fields) > 0 and fields[-1] == "TRUE"
+
+
+def is_processed(out_dir: str, basename_vcf: str, check: bool) -> bool:
+    """Test if the per sample tasks of a previous run produced all outputs
+
+    Args:
+        :param out_dir: output directory of the previous run
+        :param basename_vcf: The base name of vcf file
+        :param check: the potentially contaminant variants are needed too
+    """
+    outputs = [hist_file(out_dir, basename_vcf),
+               depth_file(out_dir, basename_vcf),
+               conta_file(out_dir, basename_vcf)]
+    if check:
+        outputs.append(candidates_file(out_dir, basename_vcf))
+    return all(isfile(output) for output in outputs)
@@ -0,0 +1,264 @@
+# Import necessary libraries:
+
+from functools import lru_cache
+from os import makedirs, stat
+from os.path import abspath, isdir, isfile, join
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import re
+import sys
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.arrays import save_arrays
+from fr.cea.cnrgh.lbi.contatester.data import data_dir
+from fr.cea.cnrgh.lbi.contatester.rdata import load_rdata, \
+    data_frame_matrix, column_names
+
+# Allele balance histogram from 0.00 to 1.00 with a 0.01 step
+NB_BINS = 101
+# Histogram rows, 1-based and inclusive as in contaReport.R:
+# (first left, last left, first right, last right)
+Rows = Tuple[int, int, int, int]
+COR_PARAM = (2, 50, 52, 100)  # type: Rows
+# Largest contamination percent of the linear regression
+MAX_CONTA_LINEAR = 15
+# Simulated contamination datasets with the rows used by the linear and the
+# polynomial regressions
+PANELS = {("WG", 30): ("contaIntraProjetWG30x", (14, 50, 52, 88),
+                       (19, 50, 52, 83)),
+          ("WG", 60): ("contaIntraProjetWG60x", (10, 50, 52, 92),
+                       (13, 50, 52, 89)),
+          ("WG", 90): ("contaIntraProjetWG90x", (28, 50, 52, 74),
+                       (12, 50, 52, 90)),
+          ("EX", 60): ("contaIntraProjetEX60x", (10, 50, 52, 92),
+                       (12, 50, 52, 90)),
+          ("EX", 90): ("contaIntraProjetEX90x", (10, 50, 52, 92),
+                       (9, 50, 52, 93))
+          }  # type: Dict[Tuple[str, int], Tuple[str, Rows, Rows]]
+XCONTA_PATTERN = re.compile(".*[.](.*)pctReal.*")
+REFERENCE_PATTERN = re.compile("[.]0000pctReal")
+# Compiled panels: a directory of .npy files
+PANEL_SUFFIX = ".panel"
+# Change it when the content of compiled panels changes
+PANEL_VERSION = 2
+PANEL_ARRAYS = ("dataset", "xconta", "references", "lin_ratio", "poly_ratio",
+                "lin_coefs", "poly_coefs", "cor_dataset", "parameters",
+                "source")
+
+
+def ratio_hetero(histograms: np.ndarray, rows: Rows) -> np.ndarray:
+    """Ratio of left heterozygous counts to right heterozygous counts
+
+    Args:
+        :param histograms: a histogram by column
+        :param rows: rows of the left and right parts, 1-based inclusive
+
+    Returns:
+        A ratio by column
+    """
+    i1min, i1med, i2med, i2max = rows
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (histograms[i1min - 1:i1med].sum(axis=0) /
+                histograms[i2med - 1:i2max].sum(axis=0))
+
+
+def standardize(histograms: np.ndarray, rows: Rows) -> np.ndarray:
+    """Center and scale columns over some rows, for Pearson correlations
+
+    The correlation of two columns is the dot product of their
+    standardized values.
+    """
+    i1min, i1med, i2med, i2max = rows
+    selected = histograms[np.r_[i1min - 1:i1med, i2med - 1:i2max]]
+    centered = selected - selected.mean(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return centered / np.sqrt((centered ** 2).sum(axis=0))
+
+
+def panel_parameters(lin_rows: Rows, poly_rows: Rows,
+                     rda_file: str) -> np.ndarray:
+    """Everything a compiled panel depends on and the signature of the .rda
+    file it is compiled from"""
+    rda_stat = stat(rda_file)
+    return np.array((PANEL_VERSION, MAX_CONTA_LINEAR) + COR_PARAM +
+                    lin_rows + poly_rows +
+                    (rda_stat.st_size, rda_stat.st_mtime_ns), dtype=np.int64)
+
+
+class Panel:
+    """Simulated contamination dataset of a depth and its regressions
+
+    Everything which does not depend on the tested sample is computed once:
+    contamination percents, panel ratios of both regression windows,
+    regression coefficients and the dataset standardized for correlations.
+
+    Args:
+        :param arrays: the arrays of PANEL_ARRAYS
+        :param depthtest: depth of the simulated samples
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], depthtest: int) -> None:
+        self.dataset = arrays["dataset"]
+        self.xconta = arrays["xconta"]
+        self.references = arrays["references"]
+        self.lin_ratio = arrays["lin_ratio"]
+        self.poly_ratio = arrays["poly_ratio"]
+        self.lin_coefs = arrays["lin_coefs"]
+        self.poly_coefs = arrays["poly_coefs"]
+        self.cor_dataset = arrays["cor_dataset"]
+        self.parameters = arrays["parameters"]
+        # path of the .rda file the panel is compiled from
+        self.source = arrays["source"]
+        parameters = self.parameters.tolist()
+        self.lin_rows = tuple(parameters[6:10])  # type: Rows
+        self.poly_rows = tuple(parameters[10:14])  # type: Rows
+        self.depthtest = depthtest
+
+    @staticmethod
+    def from_data_frame(dataset: np.ndarray, names: List[str],
+                        lin_rows: Rows, poly_rows: Rows,
+                        depthtest: int, rda_file: str) -> "Panel":
+        """Compile a dataset as loaded from a .rda file
+
+        Args:
+            :param dataset: a histogram of a simulated sample by column
+            :param names: column names of the dataset
+            :param lin_rows: rows of the ratio of the linear regression
+            :param poly_rows: rows of the ratio of the polynomial regression
+            :param depthtest: depth of the simulated samples
+            :param rda_file: the .rda file of the dataset
+        """
+        dataset = np.nan_to_num(dataset)
+        xconta = np.array([float(XCONTA_PATTERN.sub("\\1", name)) / 100
+                           for name in names])
+        lin_ratio = ratio_hetero(dataset, lin_rows)
+        poly_ratio = ratio_hetero(dataset, poly_rows)
+        # xconta ~ ratio_hetero on samples below MAX_CONTA_LINEAR
+        linear = xconta <= MAX_CONTA_LINEAR
+        design = np.column_stack((np.ones(linear.sum()), lin_ratio[linear]))
+        lin_coefs = np.linalg.lstsq(design, xconta[linear], rcond=None)[0]
+        # ratio_hetero ~ xconta + xconta^2 on all samples
+        design = np.column_stack((np.ones(len(xconta)), xconta, xconta ** 2))
+        poly_coefs = np.linalg.lstsq(design, poly_ratio, rcond=None)[0]
+        arrays = {"dataset": dataset,
+                  "xconta": xconta,
+                  "references": np.array([REFERENCE_PATTERN.search(name)
+                                          is not None for name in names]),
+                  "lin_ratio": lin_ratio,
+                  "poly_ratio": poly_ratio,
+                  "lin_coefs": lin_coefs,
+                  "poly_coefs": poly_coefs,
+                  "cor_dataset": standardize(dataset, COR_PARAM),
+                  "parameters": panel_parameters(lin_rows, poly_rows,
+                                                 rda_file),
+                  "source": np.array([abspath(rda_file)])}
+        return Panel(arrays, depthtest)
+
+    def save(self, panel_dir: str) -> None:
+        """Write the panel as a directory of .npy files, see save_arrays"""
+        save_arrays(panel_dir, {name: getattr(self, name)
+                                for name in PANEL_ARRAYS})
+
+    @staticmethod
+    def load(panel_dir: str, depthtest: int) -> "Panel":
+        """Memory map a compiled panel, its pages are shared by processes"""
+        return Panel({name: np.load(join(panel_dir, name + ".npy"),
+                                    mmap_mode="r")
+                      for name in PANEL_ARRAYS}, depthtest)
+
+
+def is_compiled(panel_dir: str, lin_rows: Rows, poly_rows: Rows) -> bool:
+    """Test if a compiled panel exists and matches current parameters and
+    the .rda file it is compiled from"""
+    if not isdir(panel_dir) or \
+            any(not isfile(join(panel_dir, name + ".npy"))
+                for name in PANEL_ARRAYS):
+        return False
+    rda_file = str(np.load(join(panel_dir, "source.npy"))[0])
+    if not isfile(rda_file):
+        return False
+    parameters = np.load(join(panel_dir, "parameters.npy"))
+    return np.array_equal(parameters,
+                          panel_parameters(lin_rows, poly_rows, rda_file))
+
+
+def read_panel(rda_file: str, name: str, lin_rows: Rows, poly_rows: Rows,
+               depthtest: int) -> Panel:
+    """Compile a panel from a .rda file"""
+    data_frame = load_rdata(rda_file)[name]
+    return Panel.from_data_frame(data_frame_matrix(data_frame),
+                                 column_names(data_frame), lin_rows,
+                                 poly_rows, depthtest, rda_file)
+
+
+@lru_cache(maxsize=None)
+def load_panel(experiment: str, depthtest: int,
+               panel_dir: Optional[str] = None) -> Panel:
+    """Load a dataset shipped with contatester, once by process
+
+    The compiled panel is memory mapped when it exists, the .rda file is
+    read and compiled in memory otherwise.
+
+    Args:
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param depthtest: depth of the dataset
+        :param panel_dir: directory of compiled panels [default: data dir]
+    """
+    if (experiment, depthtest) not in PANELS:
+        raise ValueError("No dataset for experiment {} at {}x"
+                         .format(experiment, depthtest))
+    name, lin_rows, poly_rows = PANELS[(experiment, depthtest)]
+    compiled = join(panel_dir or data_dir(), name + PANEL_SUFFIX)
+    if is_compiled(compiled, lin_rows, poly_rows):
+        return Panel.load(compiled, depthtest)
+    return read_panel(join(data_dir(), name + ".rda"), name, lin_rows,
+                      poly_rows, depthtest)
+
+
+def compile_panels(out_dir: str, rda_dir: str) -> List[str]:
+    """Compile every dataset of PANELS
+
+    Args:
+        :param out_dir: output directory of compiled panels
+        :param rda_dir: directory of the .rda files
+
+    Returns:
+        The paths of the compiled panels
+    """
+    makedirs(out_dir, exist_ok=True)
+    compiled = []
+    for (_, depthtest), (name, lin_rows, poly_rows) in sorted(PANELS.items()):
+        panel = read_panel(join(rda_dir, name + ".rda"), name, lin_rows,
+                           poly_rows, depthtest)
+        panel_dir = join(out_dir, name + PANEL_SUFFIX)
+        panel.save(panel_dir)
+        compiled.append(panel_dir)
+    return compiled
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester panels",
+                                     description=("Compile the simulated "
+                                                  "contamination datasets "
+                                                  "into memory mapped "
+                                                  "panels"))
+    parser.add_argument("-i", "--input", default=None, type=str,
+                        help=("folder of the .rda datasets (optional) "
+                              "[default: contatester data directory]"))
+    parser.add_argument("-o", "--outdir", default=None, type=str,
+                        help=("folder of compiled panels (optional) "
+                              "[default: contatester data directory]"))
+    args = parser.parse_args(parameters)
+    if args.input is None:
+        args.input = data_dir()
+    if args.outdir is None:
+        args.outdir = data_dir()
+    return args
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    for panel_dir in compile_panels(args.outdir, args.input):
+        print(panel_dir)
+    return 0
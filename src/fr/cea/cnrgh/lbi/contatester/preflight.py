@@ -0,0 +1,273 @@
+# Import necessary libraries:
+
+from concurrent.futures import ProcessPoolExecutor
+from os import R_OK, access, stat
+from os.path import isfile
+from typing import Dict, List, Optional, Sequence
+import argparse
+import re
+import sys
+import zlib
+
+from fr.cea.cnrgh.lbi.contatester.bgzf import BLOCK_HEADER, BgzfReader
+from fr.cea.cnrgh.lbi.contatester.comparison import read_vcf_list
+from fr.cea.cnrgh.lbi.contatester.executor import available_cores
+from fr.cea.cnrgh.lbi.contatester.outputs import sample_name
+from fr.cea.cnrgh.lbi.contatester.tabix import build_index, has_index, \
+    index_path, write_index
+from fr.cea.cnrgh.lbi.contatester.vcf import header_samples, open_vcf
+
+# Records read after the header
+NB_RECORDS = 100
+# Length of the first sequence by genome version, as written in the header
+CHR1_LENGTHS = {249250621: "GRCh37", 248956422: "GRCh38"}
+REFERENCE_NAMES = (("GRCh37", ("grch37", "hg19", "b37", "hs37d5")),
+                   ("GRCh38", ("grch38", "hg38")))
+CONTIG_LINE = re.compile(b"^##contig=<ID=(?:chr)?1,.*length=([0-9]+)")
+
+
+class InputCheck:
+    """Problems of a VCF found from its header and first records
+
+    Args:
+        :param vcf: path of the VCF
+    """
+
+    def __init__(self, vcf: str) -> None:
+        self.vcf = vcf
+        self.errors = []  # type: List[str]
+        self.reference = None  # type: Optional[str]
+        self.chr_prefix = None  # type: Optional[bool]
+        self.indexed = False
+        # the index is missing or stale and was not built by a dry run
+        self.unindexed = False
+
+    def error(self, message: str) -> None:
+        self.errors.append(message)
+
+
+def is_bgzf(vcf_file: str) -> bool:
+    """Test if the first block of a file is a BGZF block"""
+    with open(vcf_file, "rb") as vcf_f:
+        header = vcf_f.read(len(BLOCK_HEADER))
+    return header[:4] == BLOCK_HEADER[:4] and header[12:14] == b"BC"
+
+
+def read_start(vcf_file: str, bgzf: bool, nb_records: int = NB_RECORDS) \
+        -> List[bytes]:
+    """Header lines and first records of a VCF, only the first blocks of a
+    bgzipped VCF are decompressed"""
+    lines = []
+    reader = BgzfReader(vcf_file) if bgzf else open_vcf(vcf_file)
+    with reader:
+        for line in reader:
+            lines.append(line)
+            if line[:1] != b"#":
+                nb_records -= 1
+                if nb_records <= 0:
+                    break
+    return lines
+
+
+def header_reference(header: Sequence[bytes]) -> Optional[str]:
+    """Genome version named by the header, None when unknown"""
+    for line in header:
+        match = CONTIG_LINE.match(line)
+        if match and int(match.group(1)) in CHR1_LENGTHS:
+            return CHR1_LENGTHS[int(match.group(1))]
+    for line in header:
+        if line.startswith(b"##reference="):
+            value = line.decode(errors="replace").lower()
+            for reference, names in REFERENCE_NAMES:
+                if any(name in value for name in names):
+                    return reference
+    return None
+
+
+def is_stale(vcf_file: str) -> bool:
+    """Test if the tabix index of a VCF is missing or older than it"""
+    return not has_index(vcf_file) or \
+        stat(index_path(vcf_file)).st_mtime < stat(vcf_file).st_mtime
+
+
+def check_vcf(vcf_file: str, index: bool = False,
+              require_index: bool = False,
+              nb_records: int = NB_RECORDS,
+              dry_run: bool = False) -> InputCheck:
+    """Check that a VCF can be processed by the stages
+
+    Only the header and the first records are read. The VCF must hold a
+    single sample and its records the AD field.
+
+    Args:
+        :param vcf_file: path to a VCF file, compressed or not
+        :param index: build the tabix index of a bgzipped VCF when it is
+                      missing or older than the VCF
+        :param require_index: the VCF must be bgzipped and indexed
+        :param nb_records: number of records read
+        :param dry_run: only tell whether the index would be built, nothing
+                        is written
+
+    Returns:
+        The problems found
+    """
+    check = InputCheck(vcf_file)
+    if not isfile(vcf_file) or not access(vcf_file, R_OK):
+        check.error("is not a readable file")
+        return check
+    try:
+        bgzf = is_bgzf(vcf_file)
+        lines = read_start(vcf_file, bgzf, nb_records)
+    except (EOFError, OSError, ValueError, zlib.error) as err:
+        check.error("cannot be read: {}".format(err))
+        return check
+    header = [line for line in lines if line[:1] == b"#"]
+    records = [line.rstrip(b"\n").split(b"\t", 10) for line in lines
+               if line[:1] != b"#"]
+    if not header or not header[0].startswith(b"##fileformat=VCF"):
+        check.error("has no VCF header")
+        return check
+    samples = header_samples(header)
+    if len(samples) != 1:
+        check.error("has {} samples, a single sample is expected "
+                    "(see contatester joint)".format(len(samples)))
+    if not records:
+        check.error("has no record")
+    elif not any(len(fields) > 8 and b"AD" in fields[8].split(b":")
+                 for fields in records):
+        check.error("has no AD field in FORMAT of its first records")
+    check.reference = header_reference(header)
+    if records:
+        check.chr_prefix = records[0][0].startswith(b"chr")
+    if not bgzf:
+        if require_index:
+            check.error("is not bgzipped, it cannot be indexed")
+        return check
+    if (index or require_index) and not check.errors and is_stale(vcf_file):
+        if dry_run:
+            check.unindexed = True
+            return check
+        try:
+            write_index(build_index(vcf_file), index_path(vcf_file))
+            check.indexed = True
+        except (OSError, ValueError) as err:
+            if require_index:
+                check.error("cannot be indexed: {}".format(err))
+    return check
+
+
+def cohort_errors(checks: Sequence[InputCheck],
+                  reference: Optional[str] = None) -> List[str]:
+    """Problems of a cohort: samples with the same name, whose outputs
+    would overwrite each other, and mixed genome versions
+
+    Args:
+        :param checks: checks of the VCF of the cohort
+        :param reference: genome version of the exclusion regions, None
+                          when no region is read
+    """
+    errors = []
+    names = {}  # type: Dict[str, str]
+    for check in checks:
+        name = sample_name(check.vcf)
+        if name in names:
+            errors.append("{}: same sample name {} as {}"
+                          .format(check.vcf, name, names[name]))
+        names.setdefault(name, check.vcf)
+    references = sorted(set(check.reference for check in checks
+                            if check.reference is not None))
+    if reference is not None:
+        errors += ["{}: reference {} while exclusion regions are {}"
+                   .format(check.vcf, check.reference, reference)
+                   for check in checks
+                   if check.reference not in (None, reference)]
+    elif len(references) > 1:
+        errors.append("VCF of references {} are mixed"
+                      .format(", ".join(references)))
+    if len(set(check.chr_prefix for check in checks
+               if check.chr_prefix is not None)) > 1:
+        errors.append("chromosomes are named with and without chr prefix")
+    return errors
+
+
+def preflight(vcfs: Sequence[str], index: bool = False,
+              require_index: bool = False, reference: Optional[str] = None,
+              workers: int = 1, regions: Sequence[str] = (),
+              dry_run: bool = False,
+              unindexed: Optional[List[str]] = None) -> List[str]:
+    """Check all VCF of a cohort before any task is submitted
+
+    The VCF are checked, and missing indexes built, by a pool of processes.
+
+    Args:
+        :param vcfs: VCF of the cohort
+        :param index: build missing tabix indexes of bgzipped VCF
+        :param require_index: every VCF must be bgzipped and indexed
+        :param reference: genome version of the exclusion regions, None
+                          when no region is read
+        :param workers: number of processes
+        :param regions: BED files read by the tasks
+        :param dry_run: build no index, nothing is written
+        :param unindexed: extended with the VCF whose index a dry run did
+                          not build
+
+    Returns:
+        The problems found, as <vcf>: <problem>
+    """
+    nb_vcf = len(vcfs)
+    if workers > 1 and nb_vcf > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, nb_vcf)) as pool:
+            checks = list(pool.map(check_vcf, vcfs, [index] * nb_vcf,
+                                   [require_index] * nb_vcf,
+                                   [NB_RECORDS] * nb_vcf,
+                                   [dry_run] * nb_vcf))
+    else:
+        checks = [check_vcf(vcf, index, require_index, dry_run=dry_run)
+                  for vcf in vcfs]
+    if unindexed is not None:
+        unindexed.extend(check.vcf for check in checks if check.unindexed)
+    errors = ["{}: is not a readable file".format(bed_file)
+              for bed_file in regions
+              if not isfile(bed_file) or not access(bed_file, R_OK)]
+    errors += ["{}: {}".format(check.vcf, error) for check in checks
+               for error in check.errors]
+    return errors + cohort_errors(checks, reference)
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester preflight",
+                                     description=("Check the VCF of a "
+                                                  "cohort from their header "
+                                                  "and first records"))
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-f", "--file", type=str,
+                       help="VCF file to check")
+    group.add_argument("-l", "--list", type=str,
+                       help="input text file, one vcf by lane")
+    parser.add_argument("--index", action="store_true",
+                        help=("build the missing tabix indexes of bgzipped "
+                              "VCF"))
+    parser.add_argument("--require-index", action="store_true",
+                        help="every VCF must be bgzipped and indexed")
+    parser.add_argument("-r", "--reference", default=None, type=str,
+                        help=("genome version of the exclusion regions, VCF "
+                              "of another version are rejected "
+                              "[default: VCF must only agree]"))
+    parser.add_argument("-t", "--thread", default=available_cores(),
+                        type=int,
+                        help=("number of processes "
+                              "[default: available cores]"))
+    return parser.parse_args(parameters)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    vcfs = [args.file] if args.file else read_vcf_list(args.list)
+    errors = preflight(vcfs, args.index, args.require_index, args.reference,
+                       args.thread)
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors:
+        return 1
+    print("{} VCF ready".format(len(vcfs)))
+    return 0
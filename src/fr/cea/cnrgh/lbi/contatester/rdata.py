@@ -0,0 +1,179 @@
+# Import necessary libraries:
+
+from typing import Any, BinaryIO, Dict, List, Optional
+import gzip
+import struct
+
+import numpy as np
+
+# SEXP types used by data frames saved with save()
+NILSXP = 0
+SYMSXP = 1
+LISTSXP = 2
+CHARSXP = 9
+LGLSXP = 10
+INTSXP = 13
+REALSXP = 14
+STRSXP = 16
+VECSXP = 19
+# Special values of the serialization format
+REFSXP = 255
+NILVALUE_SXP = 254
+GLOBALENV_SXP = 253
+EMPTYENV_SXP = 242
+BASEENV_SXP = 241
+NA_INTEGER = -2 ** 31
+
+
+class RObject:
+    """An R value with its attributes"""
+
+    def __init__(self, value: Any,
+                 attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.value = value
+        self.attributes = attributes if attributes is not None else {}
+
+
+class RSymbol:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class XdrUnserializer:
+    """Read objects of the XDR format of R serialize(), version 2
+
+    Only the types of atomic vectors, lists, pairlists and symbols are
+    supported, which is what data frames are made of.
+    """
+
+    def __init__(self, handler: BinaryIO) -> None:
+        self._handler = handler
+        self._references = []  # type: List[Any]
+
+    def _read(self, size: int) -> bytes:
+        data = self._handler.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated R data")
+        return data
+
+    def _int(self) -> int:
+        return struct.unpack(">i", self._read(4))[0]
+
+    def read_header(self) -> None:
+        if self._read(2) != b"X\n":
+            raise ValueError("Only the XDR format of R data is supported")
+        version = self._int()
+        self._int()  # version of R which wrote the data
+        self._int()  # minimal version of R to read the data
+        if version != 2:
+            raise ValueError("Unsupported R serialization version: {}"
+                             .format(version))
+
+    def _attributes(self, has_attributes: bool) -> Dict[str, Any]:
+        if not has_attributes:
+            return {}
+        attributes = {}
+        pairlist = self.read_item()
+        for tag, value in pairlist.value:
+            attributes[tag] = value
+        return attributes
+
+    def read_item(self) -> Any:
+        flags = self._int()
+        sexp_type = flags & 0xff
+        has_attributes = bool(flags & (1 << 9))
+        has_tag = bool(flags & (1 << 10))
+        if sexp_type == NILVALUE_SXP:
+            return None
+        if sexp_type in (GLOBALENV_SXP, EMPTYENV_SXP, BASEENV_SXP):
+            return None
+        if sexp_type == REFSXP:
+            index = flags >> 8
+            if index == 0:
+                index = self._int()
+            return self._references[index - 1]
+        if sexp_type == SYMSXP:
+            symbol = RSymbol(self.read_item())
+            self._references.append(symbol)
+            return symbol
+        if sexp_type == LISTSXP:
+            # pairlists are read as a list of (tag, value)
+            items = []
+            attributes = {}  # type: Dict[str, Any]
+            while True:
+                if has_attributes:
+                    attributes = self._attributes(True)
+                tag = self.read_item().name if has_tag else None
+                items.append((tag, self.read_item()))
+                flags = self._int()
+                if flags & 0xff == NILVALUE_SXP:
+                    break
+                if flags & 0xff != LISTSXP:
+                    raise ValueError("Unsupported pairlist in R data")
+                has_attributes = bool(flags & (1 << 9))
+                has_tag = bool(flags & (1 << 10))
+            return RObject(items, attributes)
+        if sexp_type == CHARSXP:
+            length = self._int()
+            if length == -1:
+                return None
+            return self._read(length).decode("utf-8", "replace")
+        if sexp_type in (LGLSXP, INTSXP):
+            length = self._int()
+            value = np.frombuffer(self._read(4 * length), dtype=">i4")
+            return RObject(value.astype(np.int64),
+                           self._attributes(has_attributes))
+        if sexp_type == REALSXP:
+            length = self._int()
+            value = np.frombuffer(self._read(8 * length), dtype=">f8")
+            return RObject(value.astype(np.float64),
+                           self._attributes(has_attributes))
+        if sexp_type == STRSXP:
+            length = self._int()
+            value = [self.read_item() for _ in range(length)]
+            return RObject(value, self._attributes(has_attributes))
+        if sexp_type == VECSXP:
+            length = self._int()
+            value = [self.read_item() for _ in range(length)]
+            return RObject(value, self._attributes(has_attributes))
+        raise ValueError("Unsupported type in R data: {}".format(sexp_type))
+
+
+def load_rdata(rda_file: str) -> Dict[str, Any]:
+    """Objects of a file written by save(), as load() does
+
+    Args:
+        :param rda_file: path to a .rda file, gzip compressed or not
+
+    Returns:
+        A dictionary of object name to RObject
+    """
+    with open(rda_file, "rb") as rda_f:
+        compressed = rda_f.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    with opener(rda_file, "rb") as rda_f:
+        if rda_f.read(5) != b"RDX2\n":
+            raise ValueError("Not a R data file: " + rda_file)
+        unserializer = XdrUnserializer(rda_f)
+        unserializer.read_header()
+        pairlist = unserializer.read_item()
+    return {tag: value for tag, value in pairlist.value}
+
+
+def data_frame_matrix(data_frame: RObject) -> np.ndarray:
+    """Numeric columns of a data frame as a matrix, a column by column
+
+    NA values, integer or double, are returned as NaN.
+    """
+    columns = []
+    for column in data_frame.value:
+        values = column.value.astype(np.float64)
+        if column.value.dtype == np.int64:
+            values[column.value == NA_INTEGER] = np.nan
+        columns.append(values)
+    return np.column_stack(columns)
+
+
+def column_names(data_frame: RObject) -> List[str]:
+    return list(data_frame.attributes["names"].value)
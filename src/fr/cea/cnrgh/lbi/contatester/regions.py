@@ -0,0 +1,232 @@
+# Import necessary libraries:
+
+from os import makedirs, stat
+from os.path import basename, isdir, isfile, join
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import sys
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.arrays import save_arrays
+from fr.cea.cnrgh.lbi.contatester.data import REFERENCES, data_dir, \
+    gnomad_bed
+from fr.cea.cnrgh.lbi.contatester.vcf import open_vcf
+
+INDEX_SUFFIX = ".regions"
+# Change it when the content of compiled indexes changes
+INDEX_VERSION = 1
+INDEX_ARRAYS = ("chroms", "offsets", "starts", "ends", "parameters")
+# Position after the last region of a sequence
+NO_REGION = int(np.iinfo(np.int64).max)
+EMPTY_VIEW = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+
+class Regions:
+    """Genomic regions from a BED file, merged and sorted by chromosome
+
+    Regions of all chromosomes are held by two arrays of 0-based starts and
+    ends, the regions of a chromosome lie between its offsets. Lookups of
+    increasing positions, as the records of a VCF, reuse the region found
+    by the previous lookup and only search the arrays when a position
+    passes the next region.
+    """
+
+    def __init__(self, intervals: Dict[bytes, List[Tuple[int, int]]]) -> None:
+        chroms = []  # type: List[bytes]
+        offsets = [0]
+        starts = []  # type: List[int]
+        ends = []  # type: List[int]
+        for chrom, chrom_intervals in sorted(intervals.items()):
+            chroms.append(chrom)
+            first = len(starts)
+            for start, end in sorted(chrom_intervals):
+                if len(starts) > first and start <= ends[-1]:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            offsets.append(len(starts))
+        self.set_arrays({"chroms": np.array(chroms, dtype=bytes),
+                         "offsets": np.array(offsets, dtype=np.int64),
+                         "starts": np.array(starts, dtype=np.int64),
+                         "ends": np.array(ends, dtype=np.int64)})
+
+    def set_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.chroms = arrays["chroms"]
+        self.offsets = arrays["offsets"]
+        self.starts = arrays["starts"]
+        self.ends = arrays["ends"]
+        self.views = {}  # type: Dict[bytes, Tuple[np.ndarray, np.ndarray]]
+        for i, chrom in enumerate(self.chroms.tolist()):
+            first, last = int(self.offsets[i]), int(self.offsets[i + 1])
+            self.views[chrom] = (self.starts[first:last],
+                                 self.ends[first:last])
+        # region of the last lookup: the positions from low to high share it
+        self.chrom = None  # type: Optional[bytes]
+        self.index = -1
+        self.low = self.high = 0
+        self.end = -1
+
+    def seek(self, chrom: bytes, pos: int) -> None:
+        """Find the last region starting at or before a 0-based position
+
+        The next region is tried first, then the regions are searched.
+        """
+        starts, ends = self.views.get(chrom, EMPTY_VIEW)
+        i = self.index + 1
+        if chrom != self.chrom or pos < self.high or \
+                (i + 1 < len(starts) and starts[i + 1] <= pos):
+            i = int(np.searchsorted(starts, pos, side="right")) - 1
+        self.chrom = chrom
+        self.index = i
+        self.low, self.end = -1, -1
+        if i >= 0:
+            self.low, self.end = int(starts[i]), int(ends[i])
+        self.high = int(starts[i + 1]) if i + 1 < len(starts) else NO_REGION
+
+    def contains(self, chrom: bytes, pos: int) -> bool:
+        """Test if a VCF position is inside a region
+
+        Args:
+            :param chrom: chromosome name
+            :param pos: 1-based position as written in a VCF
+        """
+        pos -= 1
+        if chrom != self.chrom or not self.low <= pos < self.high:
+            self.seek(chrom, pos)
+        return pos < self.end
+
+    def intervals(self, chrom: bytes, beg: int, end: int) \
+            -> List[Tuple[int, int]]:
+        """Regions of a chromosome overlapping [beg, end), clipped to it
+
+        Args:
+            :param chrom: chromosome name
+            :param beg: 0-based start
+            :param end: 0-based end (excluded)
+        """
+        starts, ends = self.views.get(chrom, EMPTY_VIEW)
+        first = int(np.searchsorted(ends, beg, side="right"))
+        last = int(np.searchsorted(starts, end, side="left"))
+        return [(max(beg, start), min(end, stop)) for start, stop in
+                zip(starts[first:last].tolist(), ends[first:last].tolist())]
+
+    def save(self, index_dir: str, parameters: np.ndarray) -> None:
+        """Write the regions as a directory of .npy files, see save_arrays"""
+        save_arrays(index_dir, {"chroms": self.chroms,
+                                "offsets": self.offsets,
+                                "starts": self.starts, "ends": self.ends,
+                                "parameters": parameters})
+
+    @staticmethod
+    def load(index_dir: str) -> "Regions":
+        """Memory map a compiled index, its pages are shared by processes"""
+        regions = Regions({})
+        # plain arrays on the mapped pages, indexed faster than np.memmap
+        regions.set_arrays({name: np.load(join(index_dir, name + ".npy"),
+                                          mmap_mode="r").view(np.ndarray)
+                            for name in INDEX_ARRAYS})
+        return regions
+
+
+def read_bed(bed_file: str) -> Regions:
+    """Read a BED file, plain or (b)gzipped
+
+    Args:
+        :param bed_file: path to the BED file
+
+    Returns:
+        The regions of the BED file
+    """
+    intervals = {}  # type: Dict[bytes, List[Tuple[int, int]]]
+    with open_vcf(bed_file) as bed_f:
+        for line in bed_f:
+            if line[:1] == b"#" or line.startswith((b"track", b"browser")):
+                continue
+            fields = line.split(b"\t", 3)
+            if len(fields) < 3:
+                continue
+            intervals.setdefault(fields[0], []).append((int(fields[1]),
+                                                        int(fields[2])))
+    return Regions(intervals)
+
+
+def index_parameters(bed_file: str) -> np.ndarray:
+    """Version of the index and signature of the BED it is compiled from"""
+    bed_stat = stat(bed_file)
+    return np.array((INDEX_VERSION, bed_stat.st_size, bed_stat.st_mtime_ns),
+                    dtype=np.int64)
+
+
+def index_dir(bed_file: str, out_dir: Optional[str] = None) -> str:
+    """Compiled index of a BED file, next to it by default"""
+    if out_dir is None:
+        return bed_file + INDEX_SUFFIX
+    return join(out_dir, basename(bed_file) + INDEX_SUFFIX)
+
+
+def is_compiled(regions_dir: str, bed_file: str) -> bool:
+    """Test if a compiled index exists and matches its BED file"""
+    if not isdir(regions_dir) or \
+            any(not isfile(join(regions_dir, name + ".npy"))
+                for name in INDEX_ARRAYS):
+        return False
+    parameters = np.load(join(regions_dir, "parameters.npy"))
+    return np.array_equal(parameters, index_parameters(bed_file))
+
+
+def compile_bed(bed_file: str, out_dir: Optional[str] = None) -> str:
+    """Compile a BED file into an index memory mapped by load_bed
+
+    Returns:
+        The path of the compiled index
+    """
+    regions_dir = index_dir(bed_file, out_dir)
+    if out_dir is not None:
+        makedirs(out_dir, exist_ok=True)
+    read_bed(bed_file).save(regions_dir, index_parameters(bed_file))
+    return regions_dir
+
+
+def load_bed(bed_file: str, regions_dir: Optional[str] = None) -> Regions:
+    """Regions of a BED file
+
+    The compiled index is memory mapped when it exists and matches the BED
+    file, the BED file is read otherwise.
+
+    Args:
+        :param bed_file: path to the BED file
+        :param regions_dir: compiled index [default: <bed_file>.regions]
+    """
+    regions_dir = regions_dir or index_dir(bed_file)
+    if is_compiled(regions_dir, bed_file):
+        return Regions.load(regions_dir)
+    return read_bed(bed_file)
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester regions",
+                                     description=("Compile BED files of "
+                                                  "excluded regions into "
+                                                  "memory mapped indexes"))
+    parser.add_argument("bed", nargs="*",
+                        help=("BED files to compile [default: the gnomad "
+                              "BED of each genome version]"))
+    parser.add_argument("-o", "--outdir", default=None, type=str,
+                        help=("folder of compiled indexes (optional) "
+                              "[default: next to each BED file]"))
+    args = parser.parse_args(parameters)
+    if not args.bed:
+        args.bed = [gnomad_bed(reference) for reference in REFERENCES
+                    if isfile(gnomad_bed(reference))]
+        if not args.bed:
+            parser.error("no gnomad BED into " + data_dir())
+    return args
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    for bed_file in args.bed:
+        print(compile_bed(bed_file, args.outdir))
+    return 0
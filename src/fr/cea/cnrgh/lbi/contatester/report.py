@@ -0,0 +1,450 @@
+# Import necessary libraries:
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from os.path import basename, isfile, join
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.comparison import read_vcf_list
+from fr.cea.cnrgh.lbi.contatester.estimation import Estimation, \
+    conta_result, estimate_histograms, lin_predict_modif, r_format, \
+    read_depth, read_hist, rows_label
+from fr.cea.cnrgh.lbi.contatester.outputs import sample_name, hist_file, \
+    depth_file, summary_file
+from fr.cea.cnrgh.lbi.contatester.panels import NB_BINS, COR_PARAM, \
+    MAX_CONTA_LINEAR, Panel, load_panel
+from fr.cea.cnrgh.lbi.contatester.runtime import record_runtime
+
+try:
+    # optional dependency: pip install contatester[report]
+    from matplotlib.backends.backend_pdf import PdfPages
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+except ImportError:
+    Figure = None
+
+COHORT_REPORT = "cohort_report.pdf"
+MISSING_MATPLOTLIB = ("contatester report needs matplotlib: "
+                      "pip install contatester[report]")
+# A4 portrait, in inches, as the pdf of contaReport.R
+PAGE_SIZE = (8.3, 11.7)
+AB_VALUES = np.arange(NB_BINS) / 100
+AB_GRID = np.arange(1, 10) / 10
+CONTA_GRID = (0, 1, 2.5, 5, 7.5, 10, 15, 20, 25, 30, 35, 40, 45)
+CONTA_TICKS = (0, 2.5, 5, 7.5, 10, 15, 20, 25, 30, 35, 40, 45, 50)
+COR_GRID = (0, 0.9, 0.95, 1)
+COR_TICKS = (-1, -0.5, 0, 0.5, 0.9, 1)
+ESTIMATES_HEADER = ("Sample", "Depth", "Dataset", "Max. Cor.\nwith Ref.",
+                    "Max. Cor.\nwith dataset", "Percent\nConta. hit",
+                    "Linear\nRegression", "Polynomial\nRegression",
+                    "Contaminated")
+# Samples by page of the cohort estimates table
+TABLE_ROWS = 40
+# Names are drawn on the axes of the source matrix up to this size
+MAX_LABELS = 60
+
+
+class SampleReport:
+    """What is drawn for a sample: its histogram and its estimation
+
+    Args:
+        :param vcf: VCF of the sample
+        :param hist: allele balance histogram file
+        :param depth: estimated depth of the sample
+        :param histogram: allele balance histogram
+        :param estimation: estimation, with correlations to the dataset
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param depthtest: depth of the dataset used for the estimation
+    """
+
+    def __init__(self, vcf: str, hist: str, depth: int,
+                 histogram: np.ndarray, estimation: Estimation,
+                 experiment: str, depthtest: int) -> None:
+        self.vcf = vcf
+        self.hist = hist
+        self.depth = depth
+        self.histogram = histogram
+        self.estimation = estimation
+        self.experiment = experiment
+        self.depthtest = depthtest
+
+    @property
+    def name(self) -> str:
+        return sample_name(self.vcf)
+
+
+class ReferenceCurves:
+    """Uncontaminated references of a dataset, computed once for all pages
+
+    Args:
+        :param panel: dataset of the references
+    """
+
+    def __init__(self, panel: Panel) -> None:
+        references = np.asarray(panel.dataset[:, panel.references]).T
+        self.segments = np.stack((np.broadcast_to(AB_VALUES,
+                                                  references.shape),
+                                  references), axis=-1)
+        # the peak at allele balance 1 is left out of the y range
+        self.ylim_max = (round(float(np.max(panel.dataset[:NB_BINS - 1])) /
+                               1000) * 1000 * 1.1)
+        self.label = "References\n{}x (2x150pb reads)".format(
+            panel.depthtest)
+
+    def draw(self, axes) -> None:
+        axes.add_collection(LineCollection(self.segments, colors="darkgreen",
+                                           label=self.label))
+
+
+@lru_cache(maxsize=None)
+def reference_curves(experiment: str, depthtest: int,
+                     panel_dir: Optional[str] = None) -> ReferenceCurves:
+    """Reference curves of a dataset, once by process"""
+    return ReferenceCurves(load_panel(experiment, depthtest, panel_dir))
+
+
+def load_samples(vcfs: Sequence[str], out_dir: str, experiment: str = "WG",
+                 panel_dir: Optional[str] = None) -> List[SampleReport]:
+    """Read the results of a cohort and estimate every sample in one pass
+
+    Args:
+        :param vcfs: all VCF of the cohort
+        :param out_dir: directory of the sample results
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param panel_dir: directory of compiled panels [default: data dir]
+    """
+    hists = [hist_file(out_dir, sample_name(vcf)) for vcf in vcfs]
+    depths = [read_depth(depth_file(out_dir, sample_name(vcf)))
+              for vcf in vcfs]
+    histograms = [read_hist(hist) for hist in hists]
+    results = estimate_histograms(histograms, depths, experiment, panel_dir)
+    return [SampleReport(vcf, hist, depth, histogram, estimation, experiment,
+                         panel.depthtest)
+            for vcf, hist, depth, histogram, (estimation, panel)
+            in zip(vcfs, hists, depths, histograms, results)]
+
+
+def draw_table(axes, row: Sequence[str], col_labels: Sequence[str],
+               bbox: Sequence[float]) -> None:
+    """Draw a result table of a sample, its row label is its first cell"""
+    table = axes.table(cellText=[row], colLabels=col_labels,
+                       cellLoc="center", bbox=bbox)
+    table.auto_set_font_size(False)
+    table.set_fontsize(8)
+
+
+def draw_sample_page(figure: "Figure", sample: SampleReport,
+                     conta_threshold: int,
+                     panel_dir: Optional[str] = None) -> None:
+    """Draw the page of contaReport.R: distribution, correlations, tables"""
+    panel = load_panel(sample.experiment, sample.depthtest, panel_dir)
+    curves = reference_curves(sample.experiment, sample.depthtest,
+                              panel_dir)
+    estimation = sample.estimation
+    ab_axes, cor_axes, table_axes = figure.subplots(3, 1)
+    figure.subplots_adjust(hspace=0.35)
+    figure.suptitle(basename(sample.hist) + "; Estimated depth : " +
+                    str(sample.depth) + "x", fontsize="x-large")
+
+    ab_axes.plot(AB_VALUES, sample.histogram, color="blue", label="Sample")
+    curves.draw(ab_axes)
+    ab_axes.vlines(AB_GRID, 0, 1, transform=ab_axes.get_xaxis_transform(),
+                   colors="red", linestyles="dotted")
+    ab_axes.set_xlim(0, 1)
+    ab_axes.set_ylim(0, curves.ylim_max)
+    ab_axes.set_title("Allele Balance Distribution")
+    ab_axes.set_xlabel("Allele Balance")
+    ab_axes.set_ylabel("Observation Number")
+    ab_axes.legend(loc="upper left", frameon=False)
+
+    cor_axes.scatter(panel.xconta, estimation.correlations, marker="x",
+                     color="blue", label=rows_label(COR_PARAM))
+    cor_axes.vlines(CONTA_GRID, 0, 1,
+                    transform=cor_axes.get_xaxis_transform(), colors="gray",
+                    linestyles="dotted")
+    cor_axes.hlines(COR_GRID, 0, 1,
+                    transform=cor_axes.get_yaxis_transform(), colors="red",
+                    linestyles="dotted")
+    cor_axes.set_xlim(0, 50)
+    cor_axes.set_ylim(-1, 1)
+    cor_axes.set_xticks(CONTA_TICKS)
+    cor_axes.set_yticks(COR_TICKS)
+    cor_axes.tick_params(labelsize="small")
+    cor_axes.set_title("Sample Correlation to Simulated CrossHuman "
+                       "Contamination Dataset")
+    cor_axes.set_xlabel("Percent contamination")
+    cor_axes.set_ylabel("Correlation")
+    cor_axes.legend(loc="lower left", frameon=False)
+
+    table_axes.axis("off")
+    draw_table(table_axes, [rows_label(COR_PARAM),
+                            r_format(round(estimation.max_ref, 3)),
+                            r_format(round(estimation.hit_cor, 3)),
+                            r_format(estimation.name_hit)],
+               ["", "Max. Correlation\nwith Reference",
+                "Max. Correlation\nwith dataset",
+                "Percent Contamination\nhit"], [0, 0.6, 1, 0.3])
+    draw_table(table_axes, [rows_label(panel.lin_rows),
+                            lin_predict_modif(estimation.lin_predict),
+                            r_format(estimation.res_poly) + "%"],
+               ["", "Percent Conta\nLinear Regression\n(Max. precision " +
+                r_format(MAX_CONTA_LINEAR) + "%) ",
+                "Percent Conta\nPolynomial Regression"],
+               [0, 0.15, 1, 0.35])
+    table_axes.text(0.5, 0.0, conta_result(estimation.res_poly,
+                                           conta_threshold),
+                    ha="center", transform=table_axes.transAxes)
+
+
+def estimates_rows(samples: Sequence[SampleReport],
+                   conta_threshold: int) -> List[List[str]]:
+    """Rows of the cohort estimates table, as written in .conta files"""
+    rows = []
+    for sample in samples:
+        estimation = sample.estimation
+        rows.append([sample.name, str(sample.depth),
+                     "{}{}x".format(sample.experiment, sample.depthtest),
+                     r_format(round(estimation.max_ref, 3)),
+                     r_format(round(estimation.hit_cor, 3)),
+                     r_format(estimation.name_hit),
+                     lin_predict_modif(estimation.lin_predict),
+                     r_format(estimation.res_poly) + "%",
+                     "TRUE" if estimation.is_contaminated(conta_threshold)
+                     else "FALSE"])
+    return rows
+
+
+def draw_estimates_table(figure: "Figure", rows: Sequence[Sequence[str]],
+                         title: str) -> None:
+    axes = figure.subplots()
+    axes.axis("off")
+    axes.set_title(title)
+    table = axes.table(cellText=rows,
+                       colLabels=ESTIMATES_HEADER,
+                       loc="upper center", cellLoc="center")
+    table.auto_set_font_size(False)
+    table.set_fontsize(6)
+    table.auto_set_column_width(range(len(ESTIMATES_HEADER)))
+    for j in range(len(ESTIMATES_HEADER)):
+        # headers are on 2 lines
+        table[0, j].set_height(table[0, j].get_height() * 2)
+    for i, row in enumerate(rows):
+        if row[-1] == "TRUE":
+            for j in range(len(row)):
+                table[i + 1, j].set_facecolor("mistyrose")
+
+
+def draw_histogram_overlay(figure: "Figure", samples: Sequence[SampleReport],
+                           conta_threshold: int) -> None:
+    """Allele balance distribution of every sample, in frequency"""
+    axes = figure.subplots()
+    for contaminated, color, width in ((False, "gray", 0.5),
+                                       (True, "red", 1.0)):
+        segments = []
+        for sample in samples:
+            if sample.estimation.is_contaminated(conta_threshold) != \
+                    contaminated:
+                continue
+            # the peak at allele balance 1 is left out
+            counts = sample.histogram[:NB_BINS - 1]
+            total = counts.sum()
+            frequencies = counts / total if total > 0 else counts
+            segments.append(np.column_stack((AB_VALUES[:NB_BINS - 1],
+                                             frequencies)))
+        if segments:
+            axes.add_collection(LineCollection(
+                segments, colors=color, linewidths=width,
+                label="Contaminated" if contaminated else "Not contaminated"))
+    axes.autoscale()
+    axes.set_xlim(0, 1)
+    axes.set_title("Allele Balance Distribution of the cohort")
+    axes.set_xlabel("Allele Balance")
+    axes.set_ylabel("Frequency")
+    axes.legend(loc="upper left", frameon=False)
+
+
+def read_summary(summary: str) -> Dict[str, float]:
+    """Ratio of matching variants by compared VCF name"""
+    ratios = {}
+    with open(summary, "r") as summary_f:
+        for line in summary_f.read().splitlines()[1:]:
+            fields = line.split(",")
+            if len(fields) == 5:
+                ratios[fields[1]] = float(fields[4])
+    return ratios
+
+
+def source_matrix(samples: Sequence[SampleReport], out_dir: str) \
+        -> Tuple[List[str], np.ndarray]:
+    """Ratios of the comparisonSummary files of a cohort
+
+    Returns:
+        The names of the compared samples and a matrix with a row by
+        compared sample and a column by sample of the cohort, NaN when
+        there is no comparison
+    """
+    names = []
+    rows = []
+    for sample in samples:
+        summary = summary_file(out_dir, sample.name)
+        if not isfile(summary):
+            continue
+        ratios = read_summary(summary)
+        names.append(sample.name)
+        rows.append([ratios.get(basename(other.vcf), np.nan)
+                     for other in samples])
+    return names, np.array(rows, dtype=np.float64).reshape(len(rows),
+                                                           len(samples))
+
+
+def draw_source_matrix(figure: "Figure", samples: Sequence[SampleReport],
+                       names: Sequence[str], matrix: np.ndarray) -> None:
+    axes = figure.subplots()
+    image = axes.imshow(np.ma.masked_invalid(matrix), cmap="Reds", vmin=0,
+                        vmax=1, aspect="auto", interpolation="nearest")
+    figure.colorbar(image, ax=axes, orientation="horizontal",
+                    label="Ratio of potentially contaminant variants found")
+    axes.set_title("Contaminant source search")
+    axes.set_ylabel("Contaminated sample")
+    axes.set_xlabel("Compared sample")
+    if len(samples) <= MAX_LABELS:
+        axes.set_xticks(range(len(samples)))
+        axes.set_xticklabels([sample.name for sample in samples],
+                             rotation=90, fontsize="xx-small")
+    if len(names) <= MAX_LABELS:
+        axes.set_yticks(range(len(names)))
+        axes.set_yticklabels(names, fontsize="xx-small")
+
+
+def write_cohort_report(pdf_file: str, samples: Sequence[SampleReport],
+                        out_dir: str, conta_threshold: int = 4,
+                        panel_dir: Optional[str] = None) -> int:
+    """Write the cohort overview followed by the page of each sample
+
+    Args:
+        :param pdf_file: output pdf file
+        :param samples: samples of the cohort
+        :param out_dir: directory of the comparisonSummary files
+        :param conta_threshold: threshold for contaminated status
+        :param panel_dir: directory of compiled panels [default: data dir]
+
+    Returns:
+        The number of pages
+    """
+    nb_pages = 0
+    with PdfPages(pdf_file) as pdf:
+        rows = estimates_rows(samples, conta_threshold)
+        for start in range(0, max(len(rows), 1), TABLE_ROWS):
+            figure = Figure(figsize=PAGE_SIZE)
+            draw_estimates_table(figure, rows[start:start + TABLE_ROWS],
+                                 "Contamination estimates ({} samples, "
+                                 "threshold {}%)".format(len(samples),
+                                                         conta_threshold))
+            pdf.savefig(figure)
+            nb_pages += 1
+        figure = Figure(figsize=PAGE_SIZE)
+        draw_histogram_overlay(figure, samples, conta_threshold)
+        pdf.savefig(figure)
+        nb_pages += 1
+        names, matrix = source_matrix(samples, out_dir)
+        if names:
+            figure = Figure(figsize=PAGE_SIZE)
+            draw_source_matrix(figure, samples, names, matrix)
+            pdf.savefig(figure)
+            nb_pages += 1
+        for sample in samples:
+            figure = Figure(figsize=PAGE_SIZE)
+            draw_sample_page(figure, sample, conta_threshold, panel_dir)
+            pdf.savefig(figure)
+            nb_pages += 1
+    return nb_pages
+
+
+def write_sample_report(out_dir: str, conta_threshold: int,
+                        panel_dir: Optional[str],
+                        sample: SampleReport) -> str:
+    """Write the pdf of a sample, as contaReport.R --report did"""
+    pdf_file = join(out_dir, sample.name + ".pdf")
+    figure = Figure(figsize=PAGE_SIZE)
+    draw_sample_page(figure, sample, conta_threshold, panel_dir)
+    figure.savefig(pdf_file, format="pdf")
+    return pdf_file
+
+
+def write_sample_reports(samples: Sequence[SampleReport], out_dir: str,
+                         conta_threshold: int = 4,
+                         panel_dir: Optional[str] = None,
+                         thread: int = 1) -> List[str]:
+    """Write a pdf by sample, pages are drawn by a pool of processes
+
+    Each process loads a dataset and its reference curves once.
+    """
+    writer = partial(write_sample_report, out_dir, conta_threshold,
+                     panel_dir)
+    if thread <= 1:
+        return [writer(sample) for sample in samples]
+    with ProcessPoolExecutor(max_workers=thread) as executor:
+        return list(executor.map(writer, samples))
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester report",
+                                     description=("Draw the contamination "
+                                                  "report of a cohort in a "
+                                                  "single pdf"))
+    parser.add_argument("-l", "--list", required=True, type=str,
+                        help="text file, one vcf by lane")
+    parser.add_argument("-o", "--outdir", default=".", type=str,
+                        help=("folder of the sample results "
+                              "[default: current directory]"))
+    parser.add_argument("--output", default=None, type=str,
+                        help=("pdf file of the cohort [default: <outdir>/" +
+                              COHORT_REPORT + "]"))
+    parser.add_argument("-s", "--threshold", default=4, type=int,
+                        help=("Threshold for contamination status "
+                              "[default: 4]"))
+    parser.add_argument("-e", "--experiment", default="WG", type=str,
+                        choices=("WG", "EX"),
+                        help=("Experiment type, could be WG for Whole "
+                              "Genome or EX for Exome [default: WG]"))
+    parser.add_argument("--panels", default=None, type=str,
+                        help=("folder of panels compiled by contatester "
+                              "panels [default: contatester data "
+                              "directory]"))
+    parser.add_argument("--sample-pdf", action="store_true",
+                        help=("also write the pdf of each sample into "
+                              "outdir"))
+    parser.add_argument("-t", "--thread", default=1, type=int,
+                        help=("number of processes drawing the pdf of "
+                              "samples [default: 1]"))
+    args = parser.parse_args(parameters)
+    if args.output is None:
+        args.output = join(args.outdir, COHORT_REPORT)
+    return args
+
+
+def has_matplotlib() -> bool:
+    """The optional dependency drawing the pdf is installed"""
+    return Figure is not None
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    start = time.monotonic()
+    args = get_cli_args(parameters)
+    if not has_matplotlib():
+        raise SystemExit(MISSING_MATPLOTLIB)
+    samples = load_samples(read_vcf_list(args.list), args.outdir,
+                           args.experiment, args.panels)
+    write_cohort_report(args.output, samples, args.outdir, args.threshold,
+                        args.panels)
+    if args.sample_pdf:
+        write_sample_reports(samples, args.outdir, args.threshold,
+                             args.panels, args.thread)
+    # the size of a report is its number of samples
+    record_runtime("report", len(samples), 1, start)
+    return 0
@@ -0,0 +1,220 @@
+# Import necessary libraries:
+
+from os.path import isfile, join
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+
+from fr.cea.cnrgh.lbi.contatester.comparison import read_vcf_list
+from fr.cea.cnrgh.lbi.contatester.estimation import read_hist
+from fr.cea.cnrgh.lbi.contatester.outputs import conta_file, depth_file, \
+    hist_file, record_file, sample_name, summary_file
+
+RESULTS_DB = "contatester.sqlite"
+# A collect run waits for another one writing the same database
+LOCK_TIMEOUT = 600  # in second
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    sample TEXT PRIMARY KEY,
+    vcf TEXT NOT NULL,
+    mean_depth REAL,
+    depth INTEGER,
+    dataset_depth INTEGER,
+    experiment TEXT,
+    max_ref REAL,
+    hit_cor REAL,
+    name_hit REAL,
+    lin_predict REAL,
+    res_poly REAL,
+    threshold INTEGER,
+    contaminated INTEGER
+);
+CREATE INDEX IF NOT EXISTS samples_contaminated
+    ON samples (contaminated, res_poly);
+CREATE TABLE IF NOT EXISTS histograms (
+    sample TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count REAL NOT NULL,
+    PRIMARY KEY (sample, bin)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS comparisons (
+    sample TEXT NOT NULL,
+    source TEXT NOT NULL,
+    source_vcf TEXT NOT NULL,
+    nb_snp INTEGER NOT NULL,
+    nb_match INTEGER NOT NULL,
+    ratio REAL,
+    PRIMARY KEY (sample, source)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS comparisons_ratio
+    ON comparisons (sample, ratio);
+"""
+
+SAMPLE_COLUMNS = ("sample", "vcf", "mean_depth", "depth", "dataset_depth",
+                  "experiment", "max_ref", "hit_cor", "name_hit",
+                  "lin_predict", "res_poly", "threshold", "contaminated")
+
+Row = Tuple[Any, ...]
+
+
+def results_file(out_dir: str) -> str:
+    return join(out_dir, RESULTS_DB)
+
+
+def open_results(database: str) -> sqlite3.Connection:
+    """Open the results database of a project, created when missing"""
+    connection = sqlite3.connect(database, timeout=LOCK_TIMEOUT)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def read_record(record: str) -> Dict[str, Any]:
+    """Estimation of a sample written by contatester estimate, empty when
+    the sample was not estimated"""
+    if not isfile(record):
+        return {}
+    with open(record, "r") as record_f:
+        return json.load(record_f)
+
+
+def sample_row(vcf: str, out_dir: str) -> Row:
+    """Row of the samples table, unknown values are NULL"""
+    name = sample_name(vcf)
+    values = read_record(record_file(conta_file(out_dir, name)))
+    values.update(sample=name, vcf=vcf, mean_depth=None)
+    depth = depth_file(out_dir, name)
+    if isfile(depth):
+        with open(depth, "r") as depth_f:
+            values["mean_depth"] = float(depth_f.read().split()[0])
+    return tuple(values.get(column) for column in SAMPLE_COLUMNS)
+
+
+def histogram_rows(vcf: str, out_dir: str) -> List[Row]:
+    """Non empty bins of the allele balance histogram of a sample"""
+    name = sample_name(vcf)
+    hist = hist_file(out_dir, name)
+    if not isfile(hist):
+        return []
+    return [(name, int(allele_balance), float(count))
+            for allele_balance, count in enumerate(read_hist(hist))
+            if count > 0]
+
+
+def comparison_rows(vcf: str, out_dir: str) -> List[Row]:
+    """Rows of the comparisonSummary file of a sample, ratio NULL when the
+    sample has no potentially contaminant variant"""
+    name = sample_name(vcf)
+    summary = summary_file(out_dir, name)
+    if not isfile(summary):
+        return []
+    rows = []
+    with open(summary, "r", newline="") as summary_f:
+        for fields in csv.DictReader(summary_f):
+            ratio = fields["ratio"]
+            rows.append((name, sample_name(fields["vcfComparName"]),
+                         fields["vcfComparName"], int(fields["nbSNPConta"]),
+                         int(fields["nbMatch"]),
+                         None if ratio == "NaN" else float(ratio)))
+    return rows
+
+
+def collect_results(vcfs: Sequence[str], out_dir: str,
+                    database: Optional[str] = None) -> Tuple[int, int]:
+    """Merge the outputs of the samples into the results database
+
+    The rows of the samples are replaced in a single transaction, readers
+    never see a partially collected cohort and a batch of a cohort does not
+    remove the samples of another one.
+
+    Args:
+        :param vcfs: VCF of the samples to collect
+        :param out_dir: folder of the sample results
+        :param database: results database
+                         [default: <outdir>/contatester.sqlite]
+
+    Returns:
+        The number of samples and of comparisons collected
+    """
+    samples = [sample_row(vcf, out_dir) for vcf in vcfs]
+    names = [(row[0],) for row in samples]
+    histograms = [row for vcf in vcfs
+                  for row in histogram_rows(vcf, out_dir)]
+    comparisons = [row for vcf in vcfs
+                   for row in comparison_rows(vcf, out_dir)]
+    connection = open_results(database or results_file(out_dir))
+    try:
+        with connection:
+            connection.executemany("DELETE FROM histograms WHERE sample = ?",
+                                   names)
+            connection.executemany("DELETE FROM comparisons WHERE sample = ?",
+                                   names)
+            connection.executemany(
+                "INSERT OR REPLACE INTO samples ({}) VALUES ({})"
+                .format(", ".join(SAMPLE_COLUMNS),
+                        ", ".join("?" * len(SAMPLE_COLUMNS))), samples)
+            connection.executemany("INSERT INTO histograms VALUES (?, ?, ?)",
+                                   histograms)
+            connection.executemany("INSERT INTO comparisons "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", comparisons)
+    finally:
+        connection.close()
+    return len(samples), len(comparisons)
+
+
+def top_sources(connection: sqlite3.Connection,
+                limit: int = 1) -> List[Row]:
+    """Most likely contaminant sources of each contaminated sample
+
+    Returns:
+        Rows of sample, estimated contamination, source, nbSNPConta, nbMatch
+        and ratio, by sample then decreasing ratio
+    """
+    return connection.execute(
+        "SELECT s.sample, s.res_poly, c.source, c.nb_snp, c.nb_match, "
+        "c.ratio FROM samples AS s JOIN comparisons AS c "
+        "ON c.sample = s.sample "
+        "WHERE s.contaminated = 1 AND c.ratio IS NOT NULL AND "
+        "(SELECT COUNT(*) FROM comparisons AS o "
+        "WHERE o.sample = c.sample AND o.ratio > c.ratio) < ? "
+        "ORDER BY s.sample, c.ratio DESC", (limit,)).fetchall()
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester collect",
+                                     description=("Merge the results of "
+                                                  "samples into the SQLite "
+                                                  "database of the project"))
+    parser.add_argument("-l", "--list", required=True, type=str,
+                        help="input text file, one vcf by lane")
+    parser.add_argument("-o", "--outdir", default=".", type=str,
+                        help=("folder of the sample results "
+                              "[default: current directory]"))
+    parser.add_argument("--database", default=None, type=str,
+                        help=("results database [default: <outdir>/" +
+                              RESULTS_DB + "]"))
+    parser.add_argument("--top", default=0, type=int,
+                        help=("print this number of most likely contaminant "
+                              "sources of each contaminated sample "
+                              "[default: 0]"))
+    return parser.parse_args(parameters)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    database = args.database or results_file(args.outdir)
+    nb_sample, nb_comparison = collect_results(read_vcf_list(args.list),
+                                               args.outdir, database)
+    print("{} sample(s) and {} comparison(s) collected into {}"
+          .format(nb_sample, nb_comparison, database))
+    if args.top > 0:
+        connection = open_results(database)
+        try:
+            for row in top_sources(connection, args.top):
+                print("{}\t{:g}%\t{}\t{}\t{}\t{:.3f}".format(*row))
+        finally:
+            connection.close()
+    return 0
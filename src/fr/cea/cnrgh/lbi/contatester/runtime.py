@@ -0,0 +1,300 @@
+# Import necessary libraries:
+
+from math import ceil
+from os import environ, makedirs
+from os.path import dirname, expanduser, getsize, isfile, join
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import heapq
+import json
+import sys
+import time
+
+from fr.cea.cnrgh.lbi.contatester.data import script_name
+
+# Environment variable overriding the history file
+HISTORY_ENV = "CONTATESTER_HISTORY"
+# Only the last runs of a stage are fitted, older ones may be another version
+MAX_RUNS = 500
+# Requested walltime: predicted duration times the margin plus the overhead
+MARGIN = 1.5
+OVERHEAD = 300  # in second
+# Maximum job duration 24h
+MAX_DURATION = 86400  # in second
+# Maximum number of tasks run in parallel
+MAX_TASKS = 48
+# Number of tasks is lowered while the duration grows less than this ratio
+TASKS_TOLERANCE = 1.1
+# Duration of a sample of median size when abcalc never ran, as job_duration
+DEFAULT_SAMPLE_DURATION = 180.0  # in second
+
+Record = Dict[str, float]
+
+
+def history_file() -> str:
+    """File where stages append their runtime
+
+    Returns:
+        The file of the CONTATESTER_HISTORY variable, else
+        ~/.contatester/runtimes.jsonl
+    """
+    return environ.get(HISTORY_ENV) or \
+        join(expanduser("~"), "." + script_name, "runtimes.jsonl")
+
+
+def record_runtime(stage: str, size: int, cores: int, start: float) -> None:
+    """Append the duration of a stage run to the history file
+
+    A run never fails because of the history, a single write of a line is
+    safe with concurrent tasks.
+
+    Args:
+        :param stage: stage name, as abcalc
+        :param size: input size, unit depends on the stage
+        :param cores: number of cores of the run
+        :param start: time.monotonic() at the start of the run
+    """
+    record = {"stage": stage, "size": size, "cores": cores,
+              "seconds": round(time.monotonic() - start, 3)}
+    path = history_file()
+    try:
+        if dirname(path):
+            makedirs(dirname(path), exist_ok=True)
+        with open(path, "a") as history_f:
+            history_f.write(json.dumps(record, sort_keys=True) + "\n")
+    except OSError as err:
+        print("Runtime not recorded into {}: {}".format(path, err),
+              file=sys.stderr)
+
+
+def files_size(files: Iterable[str]) -> int:
+    return sum(getsize(file_path) for file_path in files if isfile(file_path))
+
+
+def read_history(path: str) -> Dict[str, List[Record]]:
+    """Runs of the history file by stage, malformed lines are ignored"""
+    runs = {}  # type: Dict[str, List[Record]]
+    if not isfile(path):
+        return runs
+    with open(path, "r") as history_f:
+        for line in history_f:
+            try:
+                record = json.loads(line)
+                runs.setdefault(record["stage"], []).append(
+                    {"size": float(record["size"]),
+                     "core_seconds": float(record["seconds"]) *
+                     max(1, int(record["cores"]))})
+            except (ValueError, KeyError, TypeError):
+                continue
+    return runs
+
+
+class RuntimeModel:
+    """Linear model of the core-seconds of a stage run by input size
+
+    Args:
+        :param intercept: core-seconds of a run whatever its input
+        :param slope: core-seconds by unit of input size
+        :param nb_run: number of runs the model is fitted on
+    """
+
+    def __init__(self, intercept: float, slope: float,
+                 nb_run: int = 0) -> None:
+        self.intercept = intercept
+        self.slope = slope
+        self.nb_run = nb_run
+
+    def predict(self, size: float, cores: int = 1) -> float:
+        """Predicted duration in second of a run on some cores"""
+        return (self.intercept + self.slope * size) / max(1, cores)
+
+    @staticmethod
+    def fit(runs: Sequence[Record]) -> "RuntimeModel":
+        """Least squares fit of the core-seconds by input size
+
+        Durations do not decrease with the input, a negative slope is
+        replaced by the mean duration.
+        """
+        runs = runs[-MAX_RUNS:]
+        sizes = [run["size"] for run in runs]
+        durations = [run["core_seconds"] for run in runs]
+        mean_size = sum(sizes) / len(runs)
+        mean_duration = sum(durations) / len(runs)
+        variance = sum((size - mean_size) ** 2 for size in sizes)
+        slope = 0.0
+        if variance > 0:
+            slope = sum((size - mean_size) * (duration - mean_duration)
+                        for size, duration in zip(sizes, durations)) / variance
+        if slope <= 0:
+            return RuntimeModel(mean_duration, 0.0, len(runs))
+        intercept = max(0.0, mean_duration - slope * mean_size)
+        return RuntimeModel(intercept, slope, len(runs))
+
+
+def load_models(path: Optional[str] = None) -> Dict[str, RuntimeModel]:
+    """Models of the stages run at least once"""
+    return {stage: RuntimeModel.fit(runs)
+            for stage, runs in read_history(path or history_file()).items()}
+
+
+def makespan(durations: Sequence[float], nb_task: int) -> float:
+    """Duration of independent tasks run longest first on nb_task slots"""
+    slots = [0.0] * nb_task
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(slots, slots[0] + duration)
+    return max(slots)
+
+
+class BatchPlan:
+    """Resources requested by the batch file
+
+    Args:
+        :param nb_task: number of tasks run in parallel, #MSUB -n
+        :param nb_core: number of cores by task, #MSUB -c
+        :param predicted: predicted duration in second
+        :param duration: requested walltime in second, #MSUB -T
+    """
+
+    def __init__(self, nb_task: int, nb_core: int, predicted: float,
+                 duration: int) -> None:
+        self.nb_task = nb_task
+        self.nb_core = nb_core
+        self.predicted = predicted
+        self.duration = duration
+
+    def core_hours(self) -> float:
+        return self.nb_task * self.nb_core * self.predicted / 3600
+
+    def summary(self) -> str:
+        lines = ["{} task(s) of {} core(s), predicted duration {:.0f} s, "
+                 "requested walltime {} s"
+                 .format(self.nb_task, self.nb_core, self.predicted,
+                         self.duration),
+                 "Predicted core-hours: {:.2f}".format(self.core_hours())]
+        if self.predicted * MARGIN + OVERHEAD > MAX_DURATION:
+            lines.append("Warning: the predicted duration exceeds the {} s "
+                         "walltime limit".format(MAX_DURATION))
+        return "\n".join(lines) + "\n"
+
+
+def sample_durations(vcfs: Sequence[str], thread: int,
+                     models: Dict[str, RuntimeModel]) -> List[float]:
+    """Predicted duration in second of the ABCalc_ and Report_ tasks of
+    each sample
+
+    When abcalc never ran, durations are proportional to the VCF size, a
+    sample of median size lasting DEFAULT_SAMPLE_DURATION.
+    """
+    sizes = [files_size([vcf]) for vcf in vcfs]
+    abcalc = models.get("abcalc")
+    if abcalc is None:
+        middle = sorted(sizes)[len(sizes) // 2] if sizes else 0
+        if middle <= 0:
+            return [DEFAULT_SAMPLE_DURATION] * len(sizes)
+        return [DEFAULT_SAMPLE_DURATION * size / middle for size in sizes]
+    estimate = models.get("estimate", RuntimeModel(0.0, 0.0))
+    return [abcalc.predict(size, thread) + estimate.predict(1)
+            for size in sizes]
+
+
+def partition(durations: Sequence[float], nb_batch: int) -> List[List[int]]:
+    """Share samples between batches of close durations
+
+    Samples are given longest first to the batch which lasts the least.
+
+    Args:
+        :param durations: predicted duration of each sample
+        :param nb_batch: number of batches
+
+    Returns:
+        The indices of the samples of each batch, empty batches are dropped
+    """
+    loads = [(0.0, batch) for batch in range(max(1, nb_batch))]
+    batches = [[] for _ in loads]  # type: List[List[int]]
+    for index in sorted(range(len(durations)),
+                        key=lambda index: -durations[index]):
+        load, batch = heapq.heappop(loads)
+        batches[batch].append(index)
+        heapq.heappush(loads, (load + durations[index], batch))
+    return [sorted(batch) for batch in batches if batch]
+
+
+def count_batches(durations: Sequence[float], walltime: int = MAX_DURATION,
+                  max_tasks: int = MAX_TASKS) -> int:
+    """Lowest number of batches whose samples run within the walltime
+
+    A batch runs its samples on up to max_tasks tasks, its requested
+    walltime is its duration times the margin plus the overhead. A sample
+    lasting longer than the walltime gets a batch of its own.
+
+    Args:
+        :param durations: predicted duration of each sample
+        :param walltime: target walltime of a batch in second
+        :param max_tasks: maximum number of tasks run in parallel by a batch
+
+    Returns:
+        The number of batches
+    """
+    if not durations:
+        return 1
+    # no batch is shorter than its longest sample
+    budget = max((walltime - OVERHEAD) / MARGIN, max(durations))
+    nb_batch = 1
+    if budget > 0:
+        nb_batch = max(1, int(ceil(sum(durations) / (budget * max_tasks))))
+    while nb_batch < len(durations):
+        batches = partition(durations, nb_batch)
+        if all(makespan([durations[index] for index in batch],
+                        min(len(batch), max_tasks)) <= budget
+               for batch in batches):
+            break
+        nb_batch += 1
+    return min(nb_batch, len(durations))
+
+
+def plan_batch(vcfs: Sequence[str], thread: int, check: bool, report: bool,
+               models: Dict[str, RuntimeModel],
+               max_tasks: int = MAX_TASKS) -> Optional[BatchPlan]:
+    """Size a batch from the runtime of previous runs
+
+    Each sample is an ABCalc_ task on thread cores followed by its
+    estimation, then the comparison and the report run once. The number of
+    tasks is the lowest one whose duration is close to the duration with
+    one task by sample, up to max_tasks.
+
+    Args:
+        :param vcfs: VCF to process
+        :param thread: number of cores of the ABCalc_ tasks
+        :param check: contaminant check is enabled
+        :param report: the cohort report is drawn
+        :param models: runtime model of each stage
+        :param max_tasks: maximum number of tasks run in parallel
+
+    Returns:
+        The plan, None when abcalc never ran and there is nothing to predict
+        the duration from
+    """
+    abcalc = models.get("abcalc")
+    if abcalc is None or not vcfs:
+        return None
+    estimate = models.get("estimate", RuntimeModel(0.0, 0.0))
+    sizes = [files_size([vcf]) for vcf in vcfs]
+    durations = sample_durations(vcfs, thread, models)
+    width = min(len(vcfs), max_tasks)
+    shortest = makespan(durations, width)
+    nb_task = next(nb for nb in range(1, width + 1)
+                   if makespan(durations, nb) <= shortest * TASKS_TOLERANCE)
+    predicted = makespan(durations, nb_task)
+    if check:
+        # the comparison reads every VCF once, as abcalc does
+        compare = models.get("compare", abcalc)
+        predicted += compare.predict(sum(sizes), thread)
+    if report:
+        predicted += models.get("report", estimate).predict(len(vcfs))
+    duration = min(MAX_DURATION, int(ceil(predicted * MARGIN)) + OVERHEAD)
+    return BatchPlan(nb_task, thread, predicted, duration)
+
+
+def describe_models(models: Dict[str, RuntimeModel]) -> List[Tuple[str, str]]:
+    return [(stage, "{} run(s), {:.1f} + {:.3g} x size core-seconds"
+             .format(model.nb_run, model.intercept, model.slope))
+            for stage, model in sorted(models.items())]
@@ -0,0 +1,436 @@
+# Import necessary libraries:
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os import R_OK, access, makedirs, remove
+from os.path import abspath, exists, isfile
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+from fr.cea.cnrgh.lbi.contatester import allelic_balance, estimation
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import cached_regions
+from fr.cea.cnrgh.lbi.contatester.data import DEFAULT_REFERENCE, \
+    REFERENCES, gnomad_bed
+from fr.cea.cnrgh.lbi.contatester.executor import available_cores
+from fr.cea.cnrgh.lbi.contatester.outputs import candidates_file, \
+    conta_file, depth_file, hist_file, record_file, sample_name
+from fr.cea.cnrgh.lbi.contatester.panels import PANELS, load_panel
+from fr.cea.cnrgh.lbi.contatester.results import read_record
+
+# Stages run by a job, in order
+JOB_STAGES = {"abcalc": allelic_balance.main,
+              "estimate": estimation.main}
+# States of a job
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Finished jobs kept for their clients, older ones are forgotten
+MAX_FINISHED = 1000
+
+StageCall = Tuple[str, List[str]]
+
+
+def run_stages(calls: Sequence[StageCall]) -> int:
+    """Run the stages of a job into a worker, stop at the first failure
+
+    Returns:
+        The exit status of the last stage run
+    """
+    for stage, parameters in calls:
+        try:
+            status = JOB_STAGES[stage](parameters)
+        except SystemExit as err:
+            status = err.code if isinstance(err.code, int) else 1
+        if status != 0:
+            return status
+    return 0
+
+
+def warm_up(experiments: Sequence[str], bed_file: Optional[str],
+            panel_dir: Optional[str] = None) -> int:
+    """Load the panels and the exclusion regions into the process
+
+    Workers forked afterwards inherit them, as the stages they run load
+    them once by process.
+
+    Returns:
+        The number of panels loaded
+    """
+    nb_panel = 0
+    for experiment, depthtest in sorted(PANELS):
+        if experiment in experiments:
+            load_panel(experiment, depthtest, panel_dir)
+            nb_panel += 1
+    if bed_file is not None and isfile(bed_file):
+        cached_regions(bed_file)
+    return nb_panel
+
+
+class Job:
+    """Analysis of a sample requested to the service
+
+    Args:
+        :param job_id: identifier returned to the client
+        :param vcf: path of the VCF of the sample
+        :param out_dir: folder of the sample results
+        :param calls: stages run by the job
+    """
+
+    def __init__(self, job_id: str, vcf: str, out_dir: str,
+                 calls: List[StageCall]) -> None:
+        self.job_id = job_id
+        self.vcf = vcf
+        self.out_dir = out_dir
+        self.calls = calls
+        self.conta = conta_file(out_dir, sample_name(vcf))
+        self.submitted = time.time()
+        self.future = None  # type: Optional[Future]
+        self.error = ""
+
+    def state(self) -> str:
+        if self.future is None or not self.future.done():
+            if self.future is not None and self.future.running():
+                return RUNNING
+            return QUEUED
+        if self.future.exception() is not None:
+            return FAILED
+        return DONE if self.future.result() == 0 else FAILED
+
+    def describe(self) -> Dict[str, Any]:
+        """Status of the job, with the estimation once done"""
+        state = self.state()
+        description = {"id": self.job_id, "vcf": self.vcf,
+                       "outdir": self.out_dir, "conta": self.conta,
+                       "status": state,
+                       "submitted": self.submitted}  # type: Dict[str, Any]
+        if state == FAILED:
+            error = self.future.exception()
+            description["error"] = str(error) if error is not None else \
+                "stage exited with status {}".format(self.future.result())
+        elif state == DONE:
+            description["estimation"] = read_record(record_file(self.conta))
+        return description
+
+
+class Service:
+    """Queue of analyses run by a pool of warm worker processes
+
+    Args:
+        :param out_dir: default folder of the sample results
+        :param experiment: default experiment, WG or EX
+        :param conta_threshold: default threshold for contaminated status
+        :param reference: genome version of the exclusion regions
+        :param workers: number of worker processes
+        :param cache_dir: directory of sample fingerprints, empty to disable
+        :param panel_dir: directory of compiled panels [default: data dir]
+        :param max_finished: number of finished jobs kept, the oldest ones
+                             are forgotten
+    """
+
+    def __init__(self, out_dir: str = ".", experiment: str = "WG",
+                 conta_threshold: int = 4, reference: str = DEFAULT_REFERENCE,
+                 workers: int = 1, cache_dir: str = "",
+                 panel_dir: Optional[str] = None,
+                 max_finished: int = MAX_FINISHED) -> None:
+        self.out_dir = abspath(out_dir)
+        self.experiment = experiment
+        self.conta_threshold = conta_threshold
+        self.gnomad = gnomad_bed(reference)
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.panel_dir = panel_dir
+        self.max_finished = max_finished
+        self.jobs = {}  # type: Dict[str, Job]
+        self.nb_submitted = 0
+        self.lock = threading.Lock()
+        self.nb_panel = warm_up(("WG", "EX"), self.gnomad, panel_dir)
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+
+    def stage_calls(self, vcf: str, out_dir: str, experiment: str,
+                    conta_threshold: int, check: bool,
+                    targets: Optional[str]) -> List[StageCall]:
+        """Stages of a sample, with the parameters of the DAG tasks"""
+        name = sample_name(vcf)
+        abcalc = ["-f", vcf, "-o", hist_file(out_dir, name), "-d",
+                  depth_file(out_dir, name), "-g", self.gnomad]
+        if self.cache_dir:
+            abcalc += ["--cache-dir", self.cache_dir]
+        if targets:
+            abcalc += ["--targets", targets]
+        if check:
+            abcalc += ["-c", candidates_file(out_dir, name)]
+        estimate = ["--input", hist_file(out_dir, name), "--output",
+                    conta_file(out_dir, name), "-t", str(conta_threshold),
+                    "--experiment", experiment, "--depth-file",
+                    depth_file(out_dir, name)]
+        if self.panel_dir:
+            estimate += ["--panels", self.panel_dir]
+        return [("abcalc", abcalc), ("estimate", estimate)]
+
+    def submit(self, request: Dict[str, Any]) -> Job:
+        """Queue the analysis of a sample
+
+        A sample whose analysis is still queued or running into the same
+        folder is not queued twice, its job is returned.
+
+        Args:
+            :param request: vcf, and optionally outdir, experiment,
+                            threshold, check and targets
+
+        Returns:
+            The job of the sample, ValueError is raised when the request is
+            not valid and BrokenProcessPool when a worker died, the workers
+            are started again then
+        """
+        vcf = request.get("vcf")
+        if not isinstance(vcf, str) or not isfile(vcf) or \
+                not access(vcf, R_OK):
+            raise ValueError("vcf {} is not a readable file".format(vcf))
+        experiment = request.get("experiment", self.experiment)
+        if experiment not in ("WG", "EX"):
+            raise ValueError("experiment must be WG or EX")
+        targets = request.get("targets")
+        if targets is not None and experiment != "EX":
+            raise ValueError("targets are read for an exome only")
+        if targets is not None and \
+                (not isinstance(targets, str) or not isfile(targets)):
+            raise ValueError("targets {} is not a file".format(targets))
+        out_dir = request.get("outdir", self.out_dir)
+        if not isinstance(out_dir, str) or not out_dir:
+            raise ValueError("outdir must be a path")
+        threshold = request.get("threshold", self.conta_threshold)
+        # bool is an int for isinstance
+        if not isinstance(threshold, int) or isinstance(threshold, bool):
+            raise ValueError("threshold must be an integer")
+        check = request.get("check", False)
+        if not isinstance(check, bool):
+            raise ValueError("check must be true or false")
+        out_dir = abspath(out_dir)
+        try:
+            makedirs(out_dir, exist_ok=True)
+        except OSError as err:
+            raise ValueError("outdir {} cannot be created: {}"
+                             .format(out_dir, err))
+        vcf = abspath(vcf)
+        calls = self.stage_calls(vcf, out_dir, experiment, threshold, check,
+                                 targets and abspath(targets))
+        with self.lock:
+            for job in self.jobs.values():
+                if job.conta == conta_file(out_dir, sample_name(vcf)) and \
+                        job.state() in (QUEUED, RUNNING):
+                    return job
+            try:
+                future = self.pool.submit(run_stages, calls)
+            except BrokenProcessPool:
+                # a worker was killed, as by the OOM killer: jobs of the
+                # pool failed, later ones run on a new pool
+                self.pool.shutdown(wait=False)
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                raise
+            self.forget_finished()
+            self.nb_submitted += 1
+            job = Job(str(self.nb_submitted), vcf, out_dir, calls)
+            job.future = future
+            self.jobs[job.job_id] = job
+        return job
+
+    def forget_finished(self) -> None:
+        """Forget the oldest finished jobs beyond max_finished, called with
+        the lock held"""
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job.state() in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def job(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def status(self) -> Dict[str, Any]:
+        """Number of jobs by state and resources of the service"""
+        with self.lock:
+            jobs = list(self.jobs.values())
+        counts = {state: 0 for state in (QUEUED, RUNNING, DONE, FAILED)}
+        for job in jobs:
+            counts[job.state()] += 1
+        return {"workers": self.workers, "panels": self.nb_panel,
+                "jobs": counts}
+
+    def shutdown(self) -> None:
+        """Wait for the jobs submitted"""
+        self.pool.shutdown(wait=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """HTTP interface of the service
+
+    POST /samples queues a sample, GET /samples lists the jobs,
+    GET /samples/<id> returns the status of a job with its estimation once
+    done, GET /samples/<id>/conta the .conta file and GET /status the
+    number of jobs by state.
+    """
+
+    service = None  # type: Service
+
+    def send_json(self, code: int, content: Any) -> None:
+        self.send_body(code, json.dumps(content, sort_keys=True) + "\n",
+                       "application/json")
+
+    def send_body(self, code: int, body: str, content_type: str) -> None:
+        data = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if parts == ["status"]:
+            self.send_json(200, self.service.status())
+        elif parts == ["samples"]:
+            with self.service.lock:
+                jobs = list(self.service.jobs.values())
+            self.send_json(200, [job.describe() for job in jobs])
+        elif len(parts) in (2, 3) and parts[0] == "samples":
+            job = self.service.job(parts[1])
+            if job is None:
+                self.send_json(404, {"error": "no job " + parts[1]})
+            elif len(parts) == 2:
+                self.send_json(200, job.describe())
+            elif parts[2] != "conta":
+                self.send_json(404, {"error": "unknown path " + self.path})
+            elif job.state() != DONE:
+                self.send_json(409, {"error": "job {} is {}"
+                                     .format(job.job_id, job.state())})
+            else:
+                with open(job.conta, "r") as conta_f:
+                    self.send_body(200, conta_f.read(), "text/csv")
+        else:
+            self.send_json(404, {"error": "unknown path " + self.path})
+
+    def do_POST(self) -> None:
+        # the body is read first, a connection closed with unread data is
+        # reset before the client reads the response
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path.rstrip("/") != "/samples":
+            self.send_json(404, {"error": "unknown path " + self.path})
+            return
+        try:
+            request = json.loads(body.decode() or "{}")
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            job = self.service.submit(request)
+        except ValueError as err:
+            self.send_json(400, {"error": str(err)})
+            return
+        except BrokenProcessPool:
+            self.send_json(500, {"error": "a worker died, the workers were "
+                                          "started again: submit again"})
+            return
+        self.send_json(202, job.describe())
+
+    def address_string(self) -> str:
+        # clients of a UNIX socket have no address
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "local"
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn,
+                          socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: Service, socket_path: Optional[str] = None,
+                host: str = "127.0.0.1", port: int = 0) \
+        -> socketserver.BaseServer:
+    """Server of the HTTP interface, on a UNIX socket when one is given"""
+    handler = type("ServiceHandler", (RequestHandler,), {"service": service})
+    if socket_path is not None:
+        if exists(socket_path):
+            remove(socket_path)
+        return ThreadingUnixServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def stop(signum: int, frame: Any) -> None:
+    raise KeyboardInterrupt
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester serve",
+                                     description=("Analyse samples submitted "
+                                                  "over HTTP with panels "
+                                                  "and exclusion regions "
+                                                  "kept in memory"))
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--socket", default=None, type=str,
+                       help=("UNIX socket to listen on "
+                             "[default: TCP on --host and --port]"))
+    group.add_argument("--port", default=8080, type=int,
+                       help="TCP port to listen on [default: 8080]")
+    parser.add_argument("--host", default="127.0.0.1", type=str,
+                        help="address to listen on [default: 127.0.0.1]")
+    parser.add_argument("-o", "--outdir", default=".", type=str,
+                        help=("folder of the sample results, when a request "
+                              "gives none [default: current directory]"))
+    parser.add_argument("-e", "--experiment", default="WG", type=str,
+                        choices=("WG", "EX"),
+                        help=("Experiment type, when a request gives none, "
+                              "could be WG for Whole Genome or EX for Exome "
+                              "[default: WG]"))
+    parser.add_argument("-s", "--threshold", default=4, type=int,
+                        help=("Threshold for contamination status, when a "
+                              "request gives none [default: 4]"))
+    parser.add_argument("-r", "--reference", default=DEFAULT_REFERENCE,
+                        type=str, choices=REFERENCES,
+                        help=("genome version for gnomad regions exclusions "
+                              "[default: {}]".format(DEFAULT_REFERENCE)))
+    parser.add_argument("-w", "--workers", default=available_cores(),
+                        type=int,
+                        help=("number of worker processes, a sample by "
+                              "worker [default: available cores]"))
+    parser.add_argument("--cache-dir", default="", type=str,
+                        help=("directory of sample fingerprints "
+                              "[default: no cache]"))
+    parser.add_argument("--panels", default=None, type=str,
+                        help=("folder of panels compiled by contatester "
+                              "panels [default: contatester data "
+                              "directory]"))
+    return parser.parse_args(parameters)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    service = Service(args.outdir, args.experiment, args.threshold,
+                      args.reference, args.workers, args.cache_dir,
+                      args.panels)
+    server = make_server(service, args.socket, args.host, args.port)
+    signal.signal(signal.SIGTERM, stop)
+    print("Serving on {} with {} worker(s), {} panel(s) loaded"
+          .format(args.socket or "http://{}:{}".format(*server.server_address),
+                  args.workers, service.nb_panel), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and exists(args.socket):
+            remove(args.socket)
+        service.shutdown()
+    return 0
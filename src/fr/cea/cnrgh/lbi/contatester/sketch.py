@@ -0,0 +1,389 @@
+# Import necessary libraries:
+
+from os import makedirs, stat
+from os.path import dirname, isdir, isfile, join
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import fcntl
+import sys
+import zlib
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.arrays import save_arrays
+from fr.cea.cnrgh.lbi.contatester.comparison import Sites, bc_ratio, \
+    iter_snp_sites, load_snp_sites, read_vcf_list
+from fr.cea.cnrgh.lbi.contatester.fingerprint import CACHE_SIZE, \
+    FingerprintCache, open_cache
+from fr.cea.cnrgh.lbi.contatester.outputs import candidates_file, \
+    sample_name
+
+# Change it when the content of sketch indexes changes
+SKETCH_VERSION = 1
+# A site is kept into sketches when its hash is below 2^64 / SCALE
+SCALE = 1000
+# Contaminant sources verified by an exact comparison
+TOP = 10
+SKETCH_ARRAYS = ("parameters", "vcfs", "mtimes", "candidate_mtimes",
+                 "sizes", "candidate_sizes", "hashes", "owners",
+                 "candidate_hashes", "candidate_owners")
+# Modification time of a missing candidates file
+NO_FILE = -1
+# Concurrent writers of an index wait for each other
+LOCK_SUFFIX = ".lock"
+
+Sketch = Tuple[str, int, int, np.ndarray, np.ndarray]
+
+
+def site_hashes(sites: Sites, seed: int = 0) -> np.ndarray:
+    """Hash of each site of a sample, the same for all samples and runs
+
+    A site is packed as the CRC32 of its sequence name and its position,
+    then mixed by the splitmix64 finalizer.
+    """
+    parts = []
+    for chrom, positions in sites.items():
+        chrom_key = np.uint64((zlib.crc32(chrom) ^ seed) & 0xffffffff)
+        parts.append((chrom_key << np.uint64(32)) |
+                     positions.astype(np.uint64))
+    if not parts:
+        return np.empty(0, dtype=np.uint64)
+    keys = np.concatenate(parts) + np.uint64(0x9e3779b97f4a7c15)
+    keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return keys ^ (keys >> np.uint64(31))
+
+
+def sketch_sites(sites: Sites, scale: int = SCALE,
+                 seed: int = 0) -> np.ndarray:
+    """Sorted hashes of the sites kept into the sketch of a site set
+
+    Sites whose hash is below 2^64 / scale are kept, a site is kept by the
+    sketches of all samples or by none of them, so the part of a set found
+    into another is estimated from their sketches.
+    """
+    hashes = site_hashes(sites, seed)
+    return np.unique(hashes[hashes <= np.uint64((2 ** 64 - 1) // scale)])
+
+
+def file_mtime(file_path: str) -> int:
+    return stat(file_path).st_mtime_ns if isfile(file_path) else NO_FILE
+
+
+def grouped(hashes_by_sample: Sequence[np.ndarray],
+            first: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashes of several samples with the index of their sample"""
+    if not hashes_by_sample:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int32)
+    return (np.concatenate(hashes_by_sample).astype(np.uint64),
+            np.concatenate([np.full(len(hashes), first + i, dtype=np.int32)
+                            for i, hashes in enumerate(hashes_by_sample)]))
+
+
+class SketchIndex:
+    """Sketches of the genotype and candidate site sets of samples
+
+    The hashes of all samples are held by one sorted array, with the index
+    of the sample each hash belongs to, so a query searches the hashes of a
+    sketch instead of reading the samples.
+
+    Args:
+        :param scale: a site out of scale is kept into the sketches
+        :param seed: seed of the hash of sites
+    """
+
+    def __init__(self, scale: int = SCALE, seed: int = 0) -> None:
+        self.set_arrays({
+            "parameters": np.array((SKETCH_VERSION, scale, seed),
+                                   dtype=np.int64),
+            "vcfs": np.empty(0, dtype=str),
+            "mtimes": np.empty(0, dtype=np.int64),
+            "candidate_mtimes": np.empty(0, dtype=np.int64),
+            "sizes": np.empty(0, dtype=np.int64),
+            "candidate_sizes": np.empty(0, dtype=np.int64),
+            "hashes": np.empty(0, dtype=np.uint64),
+            "owners": np.empty(0, dtype=np.int32),
+            "candidate_hashes": np.empty(0, dtype=np.uint64),
+            "candidate_owners": np.empty(0, dtype=np.int32)})
+
+    def set_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.arrays = arrays
+        _, self.scale, self.seed = arrays["parameters"].tolist()
+        self.vcfs = arrays["vcfs"].tolist()  # type: List[str]
+        self.positions = {vcf: i for i, vcf in enumerate(self.vcfs)}
+
+    def is_current(self, vcf: str, candidates: str) -> bool:
+        """Test if a sample is indexed with its current files"""
+        i = self.positions.get(vcf)
+        return i is not None and \
+            int(self.arrays["mtimes"][i]) == file_mtime(vcf) and \
+            int(self.arrays["candidate_mtimes"][i]) == file_mtime(candidates)
+
+    def has_current_vcf(self, vcf: str) -> bool:
+        """Test if the VCF of an indexed sample still exists unchanged, the
+        samples of other projects may have been moved or removed since"""
+        i = self.positions.get(vcf)
+        mtime = file_mtime(vcf)
+        return i is not None and mtime != NO_FILE and \
+            int(self.arrays["mtimes"][i]) == mtime
+
+    def update(self, sketches: Sequence[Sketch]) -> None:
+        """Add samples, the sketches of samples already indexed are replaced
+
+        Args:
+            :param sketches: vcf, modification times of the VCF and of its
+                             candidates, genotype and candidate hashes
+        """
+        replaced = {vcf for vcf, _, _, _, _ in sketches}
+        kept = [i for i, vcf in enumerate(self.vcfs) if vcf not in replaced]
+        remap = np.full(len(self.vcfs), -1, dtype=np.int32)
+        remap[kept] = np.arange(len(kept), dtype=np.int32)
+        arrays = dict(self.arrays)
+        for name in ("vcfs", "mtimes", "candidate_mtimes", "sizes",
+                     "candidate_sizes"):
+            arrays[name] = self.arrays[name][kept]
+        arrays["vcfs"] = np.array(arrays["vcfs"].tolist() +
+                                  [vcf for vcf, _, _, _, _ in sketches],
+                                  dtype=str)
+        for name, values in (("mtimes", [sketch[1] for sketch in sketches]),
+                             ("candidate_mtimes",
+                              [sketch[2] for sketch in sketches]),
+                             ("sizes", [len(sketch[3])
+                                        for sketch in sketches]),
+                             ("candidate_sizes", [len(sketch[4])
+                                                  for sketch in sketches])):
+            arrays[name] = np.concatenate([arrays[name],
+                                           np.array(values, dtype=np.int64)])
+        for prefix, column in (("", 3), ("candidate_", 4)):
+            hashes = self.arrays[prefix + "hashes"]
+            owners = remap[self.arrays[prefix + "owners"]]
+            new_hashes, new_owners = grouped([sketch[column]
+                                              for sketch in sketches],
+                                             len(kept))
+            hashes = np.concatenate([hashes[owners >= 0], new_hashes])
+            owners = np.concatenate([owners[owners >= 0], new_owners])
+            order = np.argsort(hashes, kind="mergesort")
+            arrays[prefix + "hashes"] = hashes[order]
+            arrays[prefix + "owners"] = owners[order]
+        self.set_arrays(arrays)
+
+    def candidate_sketch(self, vcf: str) -> Optional[np.ndarray]:
+        """Sketch of the candidates of an indexed sample, None when the
+        sample has no candidates file"""
+        i = self.positions.get(vcf)
+        if i is None or int(self.arrays["candidate_mtimes"][i]) == NO_FILE:
+            return None
+        return np.sort(self.arrays["candidate_hashes"][
+            self.arrays["candidate_owners"] == i])
+
+    def query(self, sketch: np.ndarray, top: int = TOP,
+              exclude: Optional[str] = None,
+              current: bool = False) -> List[Tuple[str, int, float]]:
+        """Most likely contaminant sources of a sample
+
+        The hashes of the candidate sketch are searched into the genotype
+        hashes of all samples, the match ratio of a sample is estimated by
+        the part of the candidate sketch found into its sketch.
+
+        Args:
+            :param sketch: sketch of the candidates of a sample
+            :param top: number of sources returned
+            :param exclude: sample name not returned, the queried sample
+            :param current: only return samples whose VCF can be read as it
+                            was sketched
+
+        Returns:
+            VCF, shared hashes and estimated ratio of the sources, by
+            decreasing ratio
+        """
+        if len(sketch) == 0 or not self.vcfs:
+            return []
+        hashes = self.arrays["hashes"]
+        lows = np.searchsorted(hashes, sketch, side="left")
+        highs = np.searchsorted(hashes, sketch, side="right")
+        lengths = highs - lows
+        total = int(lengths.sum())
+        # expand each [low, high) range of matching hashes
+        starts = np.repeat(lows, lengths)
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths,
+                                               lengths)
+        shared = np.bincount(np.asarray(self.arrays["owners"])[
+            starts + offsets], minlength=len(self.vcfs))
+        order = np.lexsort((np.arange(len(shared)), -shared))
+        sources = []
+        for i in order.tolist():
+            if len(sources) >= top or shared[i] == 0:
+                break
+            if exclude is not None and sample_name(self.vcfs[i]) == exclude:
+                continue
+            if current and not self.has_current_vcf(self.vcfs[i]):
+                continue
+            sources.append((self.vcfs[i], int(shared[i]),
+                            int(shared[i]) / len(sketch)))
+        return sources
+
+    def save(self, index_dir: str) -> None:
+        """Write the index as a directory of .npy files, see save_arrays"""
+        save_arrays(index_dir, {name: self.arrays[name]
+                                for name in SKETCH_ARRAYS})
+
+    @staticmethod
+    def load(index_dir: str) -> "SketchIndex":
+        """Memory map an index, its pages are shared by processes"""
+        index = SketchIndex()
+        index.set_arrays({name: np.load(join(index_dir, name + ".npy"),
+                                        mmap_mode="r").view(np.ndarray)
+                          for name in SKETCH_ARRAYS})
+        if int(index.arrays["parameters"][0]) != SKETCH_VERSION:
+            raise ValueError("Sketch index {} was written by another version, "
+                             "build it again".format(index_dir))
+        return index
+
+
+def open_index(index_dir: str, scale: int = SCALE) -> SketchIndex:
+    """Sketch index of a directory, empty when it does not exist yet"""
+    if isdir(index_dir):
+        return SketchIndex.load(index_dir)
+    return SketchIndex(scale)
+
+
+def add_samples(index_dir: str, vcfs: Sequence[str], out_dir: str,
+                thread: int = 1, cache: Optional[FingerprintCache] = None,
+                scale: int = SCALE) -> int:
+    """Sketch the samples missing from an index, or whose files changed
+
+    The candidates of a sample are read from out_dir when they exist.
+    Writers of the same index wait for each other.
+
+    Args:
+        :param index_dir: sketch index directory
+        :param vcfs: VCF of the samples
+        :param out_dir: folder of the sample results
+        :param thread: number of processes reading VCF
+        :param cache: fingerprint cache of the VCF sites
+        :param scale: scale of a new index, an existing one keeps its own
+
+    Returns:
+        The number of samples sketched
+    """
+    parent = dirname(index_dir.rstrip("/"))
+    if parent:
+        makedirs(parent, exist_ok=True)
+    with open(index_dir.rstrip("/") + LOCK_SUFFIX, "w") as lock_f:
+        fcntl.flock(lock_f, fcntl.LOCK_EX)
+        index = open_index(index_dir, scale)
+        todo = [vcf for vcf in vcfs
+                if not index.is_current(vcf, candidates_file(
+                    out_dir, sample_name(vcf)))]
+        if not todo:
+            return 0
+        sketches = []
+        for vcf, sites in zip(todo, iter_snp_sites(todo, thread, cache)):
+            candidates = candidates_file(out_dir, sample_name(vcf))
+            candidate_hashes = np.empty(0, dtype=np.uint64)
+            if isfile(candidates):
+                candidate_hashes = sketch_sites(load_snp_sites(candidates),
+                                                index.scale, index.seed)
+            sketches.append((vcf, file_mtime(vcf), file_mtime(candidates),
+                             sketch_sites(sites, index.scale, index.seed),
+                             candidate_hashes))
+        index.update(sketches)
+        index.save(index_dir)
+    return len(todo)
+
+
+def search_sources(index: SketchIndex, vcf: str, out_dir: str,
+                   top: int = TOP, current: bool = False) \
+        -> Optional[List[Tuple[str, int, float]]]:
+    """Most likely contaminant sources of a sample from its candidates file,
+    only those whose VCF is unchanged with current
+
+    Returns:
+        The sources as SketchIndex.query returns them, None when the
+        sketch of the candidates is empty and gives no estimation
+    """
+    sketch = sketch_sites(load_snp_sites(candidates_file(out_dir,
+                                                         sample_name(vcf))),
+                          index.scale, index.seed)
+    if len(sketch) == 0:
+        return None
+    return index.query(sketch, top, sample_name(vcf), current)
+
+
+def source_vcfs(index: SketchIndex, out_dir: str, top: int,
+                vcf: str) -> Optional[List[str]]:
+    """VCF of the most likely contaminant sources of a sample which can be
+    read, None when they cannot be estimated or none can be read"""
+    sources = search_sources(index, vcf, out_dir, top, current=True)
+    if not sources:
+        return None
+    return [source for source, _, _ in sources]
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester sketch",
+                                     description=("Sketch the SNP sites of "
+                                                  "samples into an index and "
+                                                  "search the most likely "
+                                                  "contaminant sources"))
+    parser.add_argument("-i", "--index", required=True, type=str,
+                        help="sketch index directory (Mandatory)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-l", "--list", type=str,
+                       help=("text file, one vcf by lane, of the samples to "
+                             "add to the index"))
+    group.add_argument("-q", "--query", type=str,
+                       help=("VCF of a sample whose most likely contaminant "
+                             "sources are printed"))
+    parser.add_argument("-o", "--outdir", default=".", type=str,
+                        help=("folder of the selected variants of the "
+                              "samples [default: current directory]"))
+    parser.add_argument("--top", default=TOP, type=int,
+                        help=("number of sources printed [default: {}]"
+                              .format(TOP)))
+    parser.add_argument("--scale", default=SCALE, type=int,
+                        help=("a site out of scale is kept into the "
+                              "sketches of a new index [default: {}]"
+                              .format(SCALE)))
+    parser.add_argument("-t", "--thread", default=1, type=int,
+                        help=("number of processes reading VCF "
+                              "[default: 1]"))
+    parser.add_argument("--cache-dir", default="", type=str,
+                        help=("directory of sample fingerprints, SNP sites "
+                              "are read from it when a VCF was already "
+                              "processed [default: no cache]"))
+    parser.add_argument("--cache-size", default=CACHE_SIZE / 1024 ** 3,
+                        type=float,
+                        help=("size cap of the cache directory in GiB "
+                              "[default: 10]"))
+    return parser.parse_args(parameters)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    if args.list is not None:
+        vcfs = read_vcf_list(args.list)
+        nb_added = add_samples(args.index, vcfs, args.outdir, args.thread,
+                               open_cache(args.cache_dir, args.cache_size),
+                               args.scale)
+        print("{} sample(s) sketched into {}, {} up to date"
+              .format(nb_added, args.index, len(vcfs) - nb_added))
+        return 0
+    if not isdir(args.index):
+        print("Error no sketch index {}".format(args.index), file=sys.stderr)
+        return 1
+    index = SketchIndex.load(args.index)
+    sketch = index.candidate_sketch(args.query)
+    if sketch is None:
+        if not isfile(candidates_file(args.outdir, sample_name(args.query))):
+            print("Error no selected variants of {}".format(args.query),
+                  file=sys.stderr)
+            return 1
+        sketch = sketch_sites(load_snp_sites(candidates_file(
+            args.outdir, sample_name(args.query))), index.scale, index.seed)
+    print("vcfComparName,nbSketchConta,nbSketchMatch,estimatedRatio")
+    for vcf, shared, _ in index.query(sketch, args.top,
+                                      sample_name(args.query)):
+        print(",".join((vcf, str(len(sketch)), str(shared),
+                        bc_ratio(shared, len(sketch)))))
+    return 0
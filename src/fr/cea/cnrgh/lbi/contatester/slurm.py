@@ -0,0 +1,299 @@
+# Import necessary libraries:
+
+from math import ceil
+from os import makedirs
+from os.path import basename, isfile, join
+from typing import Dict, List, Optional, Set, Tuple
+import shlex
+
+from fr.cea.cnrgh.lbi.contatester import timeline
+from fr.cea.cnrgh.lbi.contatester.data import script_name
+from fr.cea.cnrgh.lbi.contatester.executor import Task, read_dag, \
+    topological_order
+from fr.cea.cnrgh.lbi.contatester.outputs import sample_name
+from fr.cea.cnrgh.lbi.contatester.runtime import MARGIN, MAX_DURATION, \
+    OVERHEAD, RuntimeModel, files_size, load_models
+
+# Highest number of tasks of an array, MaxArraySize of slurm is 1001
+ARRAY_LIMIT = 1000
+SCRIPTS_SUFFIX = ".slurm"
+# Stages whose size is the number of samples, not the size of the inputs
+COUNTED_STAGES = ("estimate", "report")
+# Stages reading every VCF of the cohort
+COHORT_STAGES = ("compare",)
+
+
+class SlurmJob:
+    """A job submitted with sbatch: a task of the DAG, or a job array of
+    the tasks of a stage run by sample
+
+    Args:
+        :param name: job name
+        :param tasks: task run by each index of the array, None when the
+                      sample has no task of the stage, a single task for a
+                      job which is not an array
+        :param first: index of the first task, arrays of more than
+                      ARRAY_LIMIT samples are split
+        :param array: the job is an array
+    """
+
+    def __init__(self, name: str, tasks: List[Optional[Task]],
+                 first: int = 0, array: bool = True) -> None:
+        self.name = name
+        self.tasks = tasks
+        self.first = first
+        self.array = array
+        # (job, corresponding) the job waits for
+        self.dependencies = []  # type: List[Tuple[SlurmJob, bool]]
+        self.script = ""
+
+    def cores(self) -> int:
+        return max(task.cores for task in self.tasks if task is not None)
+
+    def dependency_option(self, variables: Dict[str, str]) -> str:
+        """--dependency option of sbatch, empty when the job waits for none
+
+        The tasks of an array run by sample wait for the task of the same
+        sample only, other jobs wait for the whole arrays.
+        """
+        corr = ":".join("$" + variables[job.name] for job, corresponding in
+                        self.dependencies if corresponding)
+        after = ":".join("$" + variables[job.name] for job, corresponding
+                         in self.dependencies if not corresponding)
+        conditions = []
+        if corr:
+            conditions.append("aftercorr:" + corr)
+        if after:
+            conditions.append("afterok:" + after)
+        if not conditions:
+            return ""
+        return " --dependency=" + ",".join(conditions)
+
+
+def task_stage(task: Task) -> str:
+    """Stage run by a task written as bash -c "contatester <stage> ..."""
+    words = task.args[-1].split()
+    if len(words) > 1 and words[0] == script_name:
+        return words[1]
+    return ""
+
+
+def task_walltime(task: Task, models: Dict[str, RuntimeModel],
+                  default: int, cohort_size: int = 0) -> int:
+    """Requested walltime of a task in second, from the runtime of previous
+    runs of its stage, default when the stage never ran"""
+    stage = task_stage(task)
+    if stage not in models:
+        return default
+    if stage in COUNTED_STAGES:
+        size = 1
+    elif stage in COHORT_STAGES:
+        size = cohort_size
+    else:
+        size = task.cost()
+    predicted = models[stage].predict(size, task.cores)
+    return min(MAX_DURATION, int(ceil(predicted * MARGIN)) + OVERHEAD)
+
+
+def sample_tasks(tasks: Dict[str, Task], samples: List[str]) \
+        -> Tuple[Dict[str, List[Optional[Task]]], List[str]]:
+    """Tasks run by sample, grouped by stage
+
+    A task is run by sample when its id is <stage>_<sample name>.
+
+    Returns:
+        The task of each sample by stage, in the order of samples, and the
+        other tasks
+    """
+    groups = {}  # type: Dict[str, List[Optional[Task]]]
+    others = []
+    positions = {name: i for i, name in enumerate(samples)}
+    for task_id in topological_order(tasks):
+        prefix, _, name = task_id.partition("_")
+        if name not in positions:
+            others.append(task_id)
+            continue
+        if prefix not in groups:
+            groups[prefix] = [None] * len(samples)
+        groups[prefix][positions[name]] = tasks[task_id]
+    return groups, others
+
+
+def dag_jobs(dag_file: str, samples: List[str]) -> List[SlurmJob]:
+    """Jobs running the tasks of a DAG, in submission order
+
+    Each stage run by sample is a job array, split every ARRAY_LIMIT
+    samples, whose task i is the task of sample i. An array waits with
+    aftercorr for the array of the stage before, so the estimation of a
+    sample starts as soon as its histogram is computed.
+
+    Args:
+        :param dag_file: DAG written by write_dag_file
+        :param samples: names of the samples of the DAG
+
+    Returns:
+        The jobs, each one after the jobs it depends on
+    """
+    tasks = read_dag(dag_file)
+    groups, others = sample_tasks(tasks, samples)
+    # samples without any task are left out of the arrays
+    kept = [i for i in range(len(samples))
+            if any(group[i] is not None for group in groups.values())]
+    jobs = []  # type: List[SlurmJob]
+    job_of = {}  # type: Dict[str, List[Tuple[SlurmJob, int]]]
+    for prefix, group in groups.items():
+        for first in range(0, len(kept), ARRAY_LIMIT):
+            chunk = kept[first:first + ARRAY_LIMIT]
+            name = prefix if len(kept) <= ARRAY_LIMIT else \
+                "{}_{}".format(prefix, first // ARRAY_LIMIT)
+            job = SlurmJob(name, [group[i] for i in chunk], first)
+            jobs.append(job)
+            for i in chunk:
+                if group[i] is not None:
+                    job_of[group[i].task_id] = [(job, first // ARRAY_LIMIT)]
+    for task_id in others:
+        job = SlurmJob(task_id, [tasks[task_id]], array=False)
+        jobs.append(job)
+        job_of[task_id] = [(job, -1)]
+    for job in jobs:
+        seen = set()  # type: Set[Tuple[str, bool]]
+        for task in job.tasks:
+            if task is None:
+                continue
+            for parent in task.parents:
+                for parent_job, chunk in job_of[parent]:
+                    # the parent is the task of the same sample
+                    corresponding = job.array and parent_job.array and \
+                        chunk == job.first // ARRAY_LIMIT and \
+                        parent.partition("_")[2] == \
+                        task.task_id.partition("_")[2]
+                    if (parent_job.name, corresponding) not in seen:
+                        seen.add((parent_job.name, corresponding))
+                        job.dependencies.append((parent_job, corresponding))
+    # an array waits for all of a parent array when one of its tasks does
+    for job in jobs:
+        whole = {parent.name for parent, corresponding in job.dependencies
+                 if not corresponding}
+        job.dependencies = [(parent, corresponding) for parent, corresponding
+                            in job.dependencies
+                            if not corresponding or parent.name not in whole]
+    # sbatch needs the id of every job a job depends on
+    ordered = []  # type: List[SlurmJob]
+    submitted = set()  # type: Set[str]
+    while len(ordered) < len(jobs):
+        for job in jobs:
+            if job.name not in submitted and \
+                    all(parent.name in submitted
+                        for parent, _ in job.dependencies):
+                ordered.append(job)
+                submitted.add(job.name)
+    return ordered
+
+
+def task_command(task: Task) -> str:
+    """Command of a task, named as pegasus-mpi-cluster names it"""
+    return "PMC_TASK={} PMC_CPUS={} {}".format(
+        shlex.quote(task.task_id), task.cores,
+        " ".join(shlex.quote(arg) for arg in task.args))
+
+
+def job_script(job: SlurmJob, out_dir: str, throttle: int, walltime: int,
+               account: str = "", mail: str = "") -> str:
+    """Batch script of a job, an array task runs the task of its index"""
+    lines = ["#!/bin/bash",
+             "#SBATCH --job-name={}_{}".format(script_name, job.name),
+             "#SBATCH --cpus-per-task={}".format(job.cores()),
+             "#SBATCH --time={}".format(int(ceil(walltime / 60)))]
+    log = join(out_dir, "{}_{}_%A_%a".format(script_name, job.name)) \
+        if job.array else join(out_dir, "{}_{}_%j".format(script_name,
+                                                         job.name))
+    lines += ["#SBATCH --output={}.out".format(log),
+              "#SBATCH --error={}.err".format(log)]
+    if job.array:
+        lines.insert(2, "#SBATCH --array=0-{}%{}"
+                     .format(len(job.tasks) - 1,
+                             max(1, min(throttle, len(job.tasks)))))
+    if account:
+        lines.append("#SBATCH --account={}".format(account))
+    if mail:
+        lines += ["#SBATCH --mail-type=END",
+                  "#SBATCH --mail-user={}".format(mail)]
+    lines.append("set -eo pipefail")
+    if not job.array:
+        lines.append(task_command(job.tasks[0]))
+        return "\n".join(lines) + "\n"
+    # indexes of samples without task of this stage run nothing, the
+    # arrays of all stages keep the same indexes for aftercorr
+    lines.append('case "$SLURM_ARRAY_TASK_ID" in')
+    for index, task in enumerate(job.tasks):
+        if task is not None:
+            lines.append("    {}) {} ;;".format(index, task_command(task)))
+    lines.append("esac")
+    return "\n".join(lines) + "\n"
+
+
+def write_slurm_jobs(dag_file: str, submit_file: str, out_dir: str,
+                     throttle: int, walltime: int, account: str = "",
+                     mail: str = "",
+                     models: Optional[Dict[str, RuntimeModel]] = None) \
+        -> List[SlurmJob]:
+    """Write the batch scripts of a DAG and the script submitting them
+
+    The samples are those of the vcf list written next to the DAG. Scripts
+    are written into <dag_file>.slurm, the submit script runs sbatch for
+    each of them with the dependencies of the DAG.
+
+    Args:
+        :param dag_file: DAG written by write_dag_file
+        :param submit_file: path of the submit script, run by bash
+        :param out_dir: directory of the slurm outputs
+        :param throttle: maximum number of tasks of an array run at once
+        :param walltime: requested walltime of a task in second when its
+                         stage never ran
+        :param account: account charged for the jobs, empty for the default
+        :param mail: user mail notified at the end of the last job
+        :param models: runtime model of each stage [default: history]
+
+    Returns:
+        The jobs written
+    """
+    if models is None:
+        models = load_models()
+    vcf_list = dag_file + ".vcfs"
+    vcfs = []  # type: List[str]
+    if isfile(vcf_list):
+        with open(vcf_list, "r") as vcf_list_f:
+            vcfs = [vcf for vcf in vcf_list_f.read().splitlines() if vcf]
+    cohort_size = files_size(vcfs)
+    jobs = dag_jobs(dag_file, [sample_name(vcf) for vcf in vcfs])
+    scripts_dir = dag_file + SCRIPTS_SUFFIX
+    makedirs(scripts_dir, exist_ok=True)
+    variables = {job.name: "job{}".format(i) for i, job in enumerate(jobs)}
+    lines = ["#!/bin/bash", "set -eo pipefail",
+             "export {}={}".format(timeline.TIMELINE_ENV,
+                                   timeline.timeline_file(dag_file))]
+    for i, job in enumerate(jobs):
+        job.script = join(scripts_dir, job.name + ".sbatch")
+        task_time = max(task_walltime(task, models, walltime,
+                                      cohort_size)
+                        for task in job.tasks if task is not None)
+        with open(job.script, "w") as script_f:
+            script_f.write(job_script(job, out_dir, throttle, task_time,
+                                      account,
+                                      mail if i == len(jobs) - 1 else ""))
+        # sbatch --parsable prints <job id>[;<cluster>]
+        lines.append('{}=$(sbatch --parsable{} {})'
+                     .format(variables[job.name],
+                             job.dependency_option(variables),
+                             shlex.quote(job.script)))
+        lines.append('{0}="${{{0}%%;*}}"'.format(variables[job.name]))
+    if jobs:
+        lines.append('echo "Submitted {} job(s) of {}, last job ${}"'
+                     .format(len(jobs), basename(dag_file),
+                             variables[jobs[-1].name]))
+    else:
+        lines.append('echo "Nothing to submit for {}"'
+                     .format(basename(dag_file)))
+    with open(submit_file, "w") as submit_f:
+        submit_f.write("\n".join(lines) + "\n")
+    return jobs
@@ -0,0 +1,315 @@
+# Import necessary libraries:
+
+from os import makedirs
+from os.path import join
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import sys
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.bgzf import BgzfWriter
+from fr.cea.cnrgh.lbi.contatester.tabix import build_index, index_path, \
+    write_index
+
+# GRCh37 autosomes and X, sites are drawn proportionally to their length
+CONTIGS = ((b"chr1", 249250621), (b"chr2", 243199373), (b"chr3", 198022430),
+           (b"chr4", 191154276), (b"chr5", 180915260), (b"chr6", 171115067),
+           (b"chr7", 159138663), (b"chr8", 146364022), (b"chr9", 141213431),
+           (b"chr10", 135534747), (b"chr11", 135006516),
+           (b"chr12", 133851895), (b"chr13", 115169878),
+           (b"chr14", 107349540), (b"chr15", 102531392),
+           (b"chr16", 90354753), (b"chr17", 81195210), (b"chr18", 78077248),
+           (b"chr19", 59128983), (b"chr20", 63025520), (b"chr21", 48129895),
+           (b"chr22", 51304566), (b"chrX", 155270560))
+BASES = np.array([b"A", b"C", b"G", b"T"])
+# Length of the exome targets
+TARGET_LENGTH = 170
+# Dispersion of the depth: shape of the gamma mixed with the Poisson draw
+DEPTH_SHAPE = {"WG": 20.0, "EX": 3.0}
+# Sequencing error rate and number of alternate reads to call a variant
+ERROR_RATE = 0.002
+MIN_ALT_READS = 2
+# Part of the sites which are deletions, ignored by the allele balance
+INDEL_RATE = 0.05
+# Part of the genome in the exclusion BED, drawn as 10 kb regions
+EXCLUDED_RATE = 0.02
+EXCLUDED_LENGTH = 10000
+
+VCF_HEADER = (b"##fileformat=VCFv4.2\n"
+              b"##source=contatester simulate\n"
+              b'##INFO=<ID=AF,Number=A,Type=Float,Description="Allele '
+              b'frequency of the simulated population">\n'
+              b'##INFO=<ID=DP,Number=1,Type=Integer,Description="Read '
+              b'depth">\n'
+              b'##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+              b'##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic '
+              b'depths for the ref and alt alleles">\n'
+              b'##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Read '
+              b'depth">\n'
+              b'##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype '
+              b'Quality">\n')
+
+
+class Population:
+    """Variant sites shared by the samples of a simulated cohort
+
+    Sites of a whole genome are spread over the contigs, sites of an exome
+    lie into targets of TARGET_LENGTH bp. Allele frequencies follow a
+    U-shaped spectrum, most sites are rare.
+
+    Args:
+        :param nb_sites: mean number of variants of a sample
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param seed: seed of the population
+    """
+
+    def __init__(self, nb_sites: int, experiment: str = "WG",
+                 seed: int = 0) -> None:
+        rng = np.random.RandomState([seed, 0])
+        self.experiment = experiment
+        # sites to draw for a sample to carry nb_sites variants on average
+        frequencies = rng.beta(0.4, 0.8, 100000)
+        carriers = np.mean(1 - (1 - frequencies) ** 2)
+        nb_pool = max(1, int(nb_sites / carriers))
+        lengths = np.array([length for _, length in CONTIGS], dtype=np.float64)
+        counts = rng.multinomial(nb_pool, lengths / lengths.sum())
+        chroms = []
+        positions = []
+        self.targets = []  # type: List[Tuple[bytes, int, int]]
+        for (chrom, length), count in zip(CONTIGS, counts):
+            if experiment == "EX":
+                nb_target = max(1, count // 4)
+                starts = np.unique(rng.randint(1, length - TARGET_LENGTH,
+                                               nb_target))
+                self.targets += [(chrom, int(start) - 1,
+                                  int(start) - 1 + TARGET_LENGTH)
+                                 for start in starts]
+                chrom_positions = np.unique(
+                    starts[rng.randint(0, len(starts), count)] +
+                    rng.randint(0, TARGET_LENGTH - 1, count))
+            else:
+                chrom_positions = np.unique(rng.randint(1, length, count))
+            chroms.append(np.full(len(chrom_positions), len(chroms)))
+            positions.append(chrom_positions)
+        self.chroms = np.concatenate(chroms)
+        self.positions = np.concatenate(positions)
+        nb_pool = len(self.positions)
+        self.frequencies = rng.beta(0.4, 0.8, nb_pool)
+        self.refs = rng.randint(0, 4, nb_pool)
+        self.alts = (self.refs + rng.randint(1, 4, nb_pool)) % 4
+        self.deletions = rng.random_sample(nb_pool) < INDEL_RATE
+        self.seed = seed
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def genotypes(self, sample: int) -> np.ndarray:
+        """Number of alternate alleles of a sample at each site
+
+        A sample has the same genotypes whatever the other samples drawn.
+        """
+        rng = np.random.RandomState([self.seed, 1, sample])
+        return rng.binomial(2, self.frequencies)
+
+
+def sample_reads(population: Population, sample: int, depth: float,
+                 contaminant: Optional[int] = None, fraction: float = 0.0) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Draw the reads of a sample, contaminated by another sample
+
+    The depth of a site is a gamma-Poisson draw around the mean depth, the
+    alternate reads a binomial draw of the alternate allele fraction of the
+    mix of both samples plus sequencing errors.
+
+    Args:
+        :param population: sites of the cohort
+        :param sample: index of the sample
+        :param depth: mean depth
+        :param contaminant: index of the contaminant sample, None if none
+        :param fraction: part of the reads coming from the contaminant
+
+    Returns:
+        Depth, alternate reads and genotype of the sample at each site
+    """
+    rng = np.random.RandomState([population.seed, 2, sample])
+    genotypes = population.genotypes(sample)
+    alt_fraction = genotypes / 2.0
+    if contaminant is not None and fraction > 0:
+        alt_fraction = ((1 - fraction) * alt_fraction +
+                        fraction * population.genotypes(contaminant) / 2.0)
+    alt_fraction = alt_fraction * (1 - ERROR_RATE) + \
+        (1 - alt_fraction) * ERROR_RATE / 3
+    shape = DEPTH_SHAPE.get(population.experiment, DEPTH_SHAPE["WG"])
+    depths = rng.poisson(depth * rng.gamma(shape, 1 / shape, len(population)))
+    alt_reads = rng.binomial(depths, alt_fraction)
+    return depths, alt_reads, genotypes
+
+
+def vcf_lines(population: Population, name: str, depths: np.ndarray,
+              alt_reads: np.ndarray) -> List[bytes]:
+    """Records of the variants called from the reads of a sample"""
+    called = np.nonzero(alt_reads >= MIN_ALT_READS)[0]
+    lines = [VCF_HEADER]
+    lines += [b"##contig=<ID=" + chrom + b",length=" +
+              str(length).encode() + b">\n" for chrom, length in CONTIGS]
+    lines.append(b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" +
+                 name.encode() + b"\n")
+    chroms = [chrom for chrom, _ in CONTIGS]
+    bases = BASES.tolist()
+    # python values, numpy scalars are slow to format one by one
+    for chrom, position, ref, alt_base, deletion, frequency, depth, alt in \
+            zip(population.chroms[called].tolist(),
+                population.positions[called].tolist(),
+                population.refs[called].tolist(),
+                population.alts[called].tolist(),
+                population.deletions[called].tolist(),
+                population.frequencies[called].tolist(),
+                depths[called].tolist(), alt_reads[called].tolist()):
+        if deletion:
+            ref_allele, alt_allele = bases[ref] + bases[alt_base], bases[ref]
+        else:
+            ref_allele, alt_allele = bases[ref], bases[alt_base]
+        genotype = b"1/1" if alt >= 0.85 * depth else b"0/1"
+        lines.append(b"%s\t%d\t.\t%s\t%s\t%d\tPASS\tAF=%.3f;DP=%d\t"
+                     b"GT:AD:DP:GQ\t%s:%d,%d:%d:%d\n"
+                     % (chroms[chrom], position, ref_allele, alt_allele,
+                        min(alt * 30, 5000), frequency, depth, genotype,
+                        depth - alt, alt, depth, min(99, 10 + alt * 3)))
+    return lines
+
+
+def write_vcf(vcf_file: str, lines: Sequence[bytes]) -> None:
+    """Write a bgzipped VCF and its tabix index"""
+    with BgzfWriter(vcf_file) as writer:
+        for line in lines:
+            writer.write(line)
+    write_index(build_index(vcf_file), index_path(vcf_file))
+
+
+def write_excluded_bed(bed_file: str, seed: int = 0) -> None:
+    """BED of regions to exclude, as the LCR and segmental duplications"""
+    rng = np.random.RandomState([seed, 3])
+    with open(bed_file, "w") as bed_f:
+        for chrom, length in CONTIGS:
+            nb_region = int(length * EXCLUDED_RATE / EXCLUDED_LENGTH)
+            starts = np.unique(rng.randint(0, length - EXCLUDED_LENGTH,
+                                           nb_region))
+            for start in starts.tolist():
+                bed_f.write("{}\t{}\t{}\n".format(chrom.decode(), start,
+                                                  start + EXCLUDED_LENGTH))
+
+
+def write_targets_bed(bed_file: str, population: Population) -> None:
+    with open(bed_file, "w") as bed_f:
+        for chrom, start, end in population.targets:
+            bed_f.write("{}\t{}\t{}\n".format(chrom.decode(), start, end))
+
+
+def parse_contamination(spec: str) -> Tuple[int, int, float]:
+    """Parse SAMPLE:SOURCE:FRACTION, as 3:5:0.1"""
+    try:
+        sample, source, fraction = spec.split(":")
+        result = int(sample), int(source), float(fraction)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "contamination must be SAMPLE:SOURCE:FRACTION, not " + spec)
+    if not 0 < result[2] < 1 or result[0] == result[1]:
+        raise argparse.ArgumentTypeError(
+            "invalid contamination: " + spec)
+    return result
+
+
+def sample_vcf(out_dir: str, sample: int) -> str:
+    return join(out_dir, "sample{:04d}.vcf.gz".format(sample))
+
+
+def simulate_cohort(out_dir: str, nb_sample: int, nb_sites: int,
+                    depth: float = 30, experiment: str = "WG",
+                    contaminations: Sequence[Tuple[int, int, float]] = (),
+                    seed: int = 0) -> List[str]:
+    """Write the VCF of a simulated cohort
+
+    Besides the VCF, the directory holds vcfs.txt, the list of the VCF,
+    truth.tsv, the contaminations injected, excluded.bed, regions to exclude
+    from the candidates, and targets.bed for an exome.
+
+    Args:
+        :param out_dir: output directory
+        :param nb_sample: number of samples
+        :param nb_sites: mean number of variants of a sample
+        :param depth: mean depth of the samples
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param contaminations: contaminated sample, source and fraction
+        :param seed: seed of the cohort, same seed same files
+
+    Returns:
+        The VCF files, in the order of the samples
+    """
+    makedirs(out_dir, exist_ok=True)
+    population = Population(nb_sites, experiment, seed)
+    sources = {}  # type: Dict[int, Tuple[int, float]]
+    for sample, source, fraction in contaminations:
+        if not (0 <= sample < nb_sample and 0 <= source < nb_sample):
+            raise ValueError("No sample {} or {} in a cohort of {}"
+                             .format(sample, source, nb_sample))
+        sources[sample] = (source, fraction)
+    vcfs = []
+    for sample in range(nb_sample):
+        source, fraction = sources.get(sample, (None, 0.0))
+        depths, alt_reads, _ = sample_reads(population, sample, depth,
+                                            source, fraction)
+        vcf = sample_vcf(out_dir, sample)
+        write_vcf(vcf, vcf_lines(population, "sample{:04d}".format(sample),
+                                 depths, alt_reads))
+        vcfs.append(vcf)
+    with open(join(out_dir, "vcfs.txt"), "w") as list_f:
+        list_f.write("".join(vcf + "\n" for vcf in vcfs))
+    with open(join(out_dir, "truth.tsv"), "w") as truth_f:
+        truth_f.write("vcf\tsource\tfraction\n")
+        for sample, (source, fraction) in sorted(sources.items()):
+            truth_f.write("{}\t{}\t{}\n".format(vcfs[sample], vcfs[source],
+                                                fraction))
+    write_excluded_bed(join(out_dir, "excluded.bed"), seed)
+    if experiment == "EX":
+        write_targets_bed(join(out_dir, "targets.bed"), population)
+    return vcfs
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester simulate",
+                                     description=("Write the bgzipped and "
+                                                  "indexed VCF of a "
+                                                  "simulated cohort"))
+    parser.add_argument("-o", "--outdir", required=True, type=str,
+                        help="output directory (Mandatory)")
+    parser.add_argument("-n", "--samples", default=1, type=int,
+                        help="number of samples [default: 1]")
+    parser.add_argument("--sites", default=None, type=int,
+                        help=("mean number of variants of a sample "
+                              "[default: 4000000 for WG, 40000 for EX]"))
+    parser.add_argument("-d", "--depth", default=30, type=float,
+                        help="mean depth of the samples [default: 30]")
+    parser.add_argument("-e", "--experiment", default="WG",
+                        choices=("WG", "EX"),
+                        help="WG for Whole Genome or EX for Exome "
+                             "[default: WG]")
+    parser.add_argument("-c", "--contaminate", default=[], action="append",
+                        type=parse_contamination,
+                        help=("contaminate sample SAMPLE by sample SOURCE, "
+                              "FRACTION of its reads come from SOURCE, as "
+                              "3:5:0.1, may be repeated"))
+    parser.add_argument("-s", "--seed", default=0, type=int,
+                        help="seed of the cohort [default: 0]")
+    args = parser.parse_args(parameters)
+    if args.sites is None:
+        args.sites = 40000 if args.experiment == "EX" else 4000000
+    return args
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    vcfs = simulate_cohort(args.outdir, args.samples, args.sites, args.depth,
+                           args.experiment, args.contaminate, args.seed)
+    print("{} VCF written into {}".format(len(vcfs), args.outdir))
+    return 0
@@ -0,0 +1,226 @@
+# Import necessary libraries:
+
+from os.path import isfile
+from typing import Dict, List, Optional, Tuple
+import gzip
+import struct
+
+from fr.cea.cnrgh.lbi.contatester.bgzf import BgzfReader, BgzfWriter
+
+TBI_MAGIC = b"TBI\x01"
+# Bin holding the start, end and number of records of a sequence
+META_BIN = 37450
+# Size of a linear index window
+LINEAR_SHIFT = 14
+# Largest position handled by the binning scheme
+MAX_POSITION = 1 << 29
+# VCF preset: format, sequence, begin and end columns, comment char, skip
+VCF_PRESET = (2, 1, 2, 0, ord("#"), 0)
+
+Chunk = Tuple[int, int]
+
+
+def reg2bin(beg: int, end: int) -> int:
+    """Smallest bin fully containing a 0-based [beg, end) region"""
+    end -= 1
+    if beg >> 14 == end >> 14:
+        return ((1 << 15) - 1) // 7 + (beg >> 14)
+    if beg >> 17 == end >> 17:
+        return ((1 << 12) - 1) // 7 + (beg >> 17)
+    if beg >> 20 == end >> 20:
+        return ((1 << 9) - 1) // 7 + (beg >> 20)
+    if beg >> 23 == end >> 23:
+        return ((1 << 6) - 1) // 7 + (beg >> 23)
+    if beg >> 26 == end >> 26:
+        return ((1 << 3) - 1) // 7 + (beg >> 26)
+    return 0
+
+
+class SequenceIndex:
+    """Bins and linear index of one sequence of a tabix index"""
+
+    def __init__(self) -> None:
+        self.bins = {}  # type: Dict[int, List[Chunk]]
+        self.linear = []  # type: List[int]
+        # computed once the bins are filled, offset_at is called by region
+        self._first_offset = None  # type: Optional[int]
+
+    def first_offset(self) -> int:
+        """Virtual offset of the first record of the sequence"""
+        if self._first_offset is None:
+            offsets = [chunk[0] for bin_id, chunks in self.bins.items()
+                       if bin_id != META_BIN for chunk in chunks]
+            self._first_offset = min(offsets) if offsets else 0
+        return self._first_offset
+
+    def length(self) -> int:
+        """Upper bound of record start positions covered by the index"""
+        return len(self.linear) << LINEAR_SHIFT
+
+    def offset_at(self, beg: int) -> int:
+        """Virtual offset from where records starting at beg can be read
+
+        Args:
+            :param beg: 0-based position
+        """
+        first = self.first_offset()
+        window = beg >> LINEAR_SHIFT
+        if 0 < window < len(self.linear):
+            return max(first, self.linear[window])
+        return first
+
+
+class TabixIndex:
+    """Content of a .tbi file"""
+
+    def __init__(self, names: List[bytes],
+                 sequences: List[SequenceIndex],
+                 preset: Tuple[int, ...] = VCF_PRESET) -> None:
+        self.names = names
+        self.sequences = sequences
+        self.preset = preset
+
+    def sequence(self, name: bytes) -> Optional[SequenceIndex]:
+        if name in self.names:
+            return self.sequences[self.names.index(name)]
+        return None
+
+
+def index_path(vcf_file: str) -> str:
+    return vcf_file + ".tbi"
+
+
+def has_index(vcf_file: str) -> bool:
+    return isfile(index_path(vcf_file))
+
+
+def read_index(tbi_file: str) -> TabixIndex:
+    """Parse a tabix index
+
+    Args:
+        :param tbi_file: path to the .tbi file
+
+    Returns:
+        The parsed index
+    """
+    with gzip.open(tbi_file, "rb") as tbi_f:
+        data = tbi_f.read()
+    if data[:4] != TBI_MAGIC:
+        raise ValueError("Not a tabix index: " + tbi_file)
+    fields = struct.unpack_from("<8i", data, 4)
+    nb_ref = fields[0]
+    preset = tuple(fields[1:7])
+    names_length = fields[7]
+    offset = 4 + 8 * 4
+    names = data[offset:offset + names_length].split(b"\x00")[:nb_ref]
+    offset += names_length
+    sequences = []
+    for _ in range(nb_ref):
+        sequence = SequenceIndex()
+        nb_bin = struct.unpack_from("<i", data, offset)[0]
+        offset += 4
+        for _ in range(nb_bin):
+            bin_id, nb_chunk = struct.unpack_from("<Ii", data, offset)
+            offset += 8
+            chunks = struct.unpack_from("<{}Q".format(2 * nb_chunk), data,
+                                        offset)
+            offset += 16 * nb_chunk
+            sequence.bins[bin_id] = list(zip(chunks[0::2], chunks[1::2]))
+        nb_intv = struct.unpack_from("<i", data, offset)[0]
+        offset += 4
+        sequence.linear = list(struct.unpack_from("<{}Q".format(nb_intv),
+                                                  data, offset))
+        offset += 8 * nb_intv
+        sequences.append(sequence)
+    return TabixIndex(names, sequences, preset)
+
+
+def build_index(vcf_file: str) -> TabixIndex:
+    """Index a bgzipped VCF sorted by position as tabix -p vcf does
+
+    Args:
+        :param vcf_file: path to a bgzipped VCF
+
+    Returns:
+        The index of the file
+    """
+    names = []  # type: List[bytes]
+    sequences = []  # type: List[SequenceIndex]
+    sequence = None
+    seq_start = 0
+    nb_records = 0
+    last_bin = -1
+    last_offset = 0
+    with BgzfReader(vcf_file) as reader:
+        for start, line, end in reader.iter_lines():
+            if line[:1] == b"#":
+                last_offset = end
+                continue
+            fields = line.split(b"\t", 5)
+            chrom = fields[0]
+            if sequence is None or chrom != names[-1]:
+                if chrom in names:
+                    raise ValueError("VCF file is not sorted: " + vcf_file)
+                if sequence is not None:
+                    sequence.bins[META_BIN] = [(seq_start, last_offset),
+                                               (nb_records, 0)]
+                names.append(chrom)
+                sequence = SequenceIndex()
+                sequences.append(sequence)
+                seq_start = start
+                nb_records = 0
+                last_bin = -1
+            beg = int(fields[1]) - 1
+            record_end = beg + max(len(fields[3]), 1)
+            bin_id = reg2bin(beg, record_end)
+            chunks = sequence.bins.setdefault(bin_id, [])
+            if bin_id == last_bin and chunks and chunks[-1][1] == start:
+                chunks[-1] = (chunks[-1][0], end)
+            else:
+                chunks.append((start, end))
+            last_bin = bin_id
+            for window in range(beg >> LINEAR_SHIFT,
+                                ((record_end - 1) >> LINEAR_SHIFT) + 1):
+                if window >= len(sequence.linear):
+                    sequence.linear.extend(
+                        [0] * (window + 1 - len(sequence.linear)))
+                if sequence.linear[window] == 0:
+                    sequence.linear[window] = start
+            nb_records += 1
+            last_offset = end
+    if sequence is not None:
+        sequence.bins[META_BIN] = [(seq_start, last_offset), (nb_records, 0)]
+    for sequence in sequences:
+        # windows without record point to the next record, as htslib does
+        for window in range(len(sequence.linear) - 2, -1, -1):
+            if sequence.linear[window] == 0:
+                sequence.linear[window] = sequence.linear[window + 1]
+    return TabixIndex(names, sequences)
+
+
+def write_index(index: TabixIndex, tbi_file: str) -> None:
+    """Write a tabix index, the file is BGZF compressed as tabix does
+
+    Args:
+        :param index: index to write
+        :param tbi_file: output path
+    """
+    names = b"".join(name + b"\x00" for name in index.names)
+    content = [TBI_MAGIC,
+               struct.pack("<8i", len(index.names), *index.preset,
+                           len(names)),
+               names]
+    for sequence in index.sequences:
+        content.append(struct.pack("<i", len(sequence.bins)))
+        for bin_id in sorted(sequence.bins):
+            chunks = sequence.bins[bin_id]
+            content.append(struct.pack("<Ii", bin_id, len(chunks)))
+            for chunk in chunks:
+                content.append(struct.pack("<QQ", *chunk))
+        content.append(struct.pack("<i", len(sequence.linear)))
+        content.append(struct.pack("<{}Q".format(len(sequence.linear)),
+                                   *sequence.linear))
+    # number of records without coordinate
+    content.append(struct.pack("<Q", 0))
+    with BgzfWriter(tbi_file) as tbi_f:
+        tbi_f.write(b"".join(content))
@@ -0,0 +1,343 @@
+# Import necessary libraries:
+
+from glob import glob
+from os import environ, getpid, sysconf
+from os.path import getmtime, isfile, join
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import socket
+import sys
+import time
+
+from fr.cea.cnrgh.lbi.contatester.executor import Task, read_dag
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# Environment variable naming the timeline of the run, set by the batch file
+TIMELINE_ENV = "CONTATESTER_TIMELINE"
+TIMELINE_SUFFIX = ".timeline.jsonl"
+# Stages which are not tasks of a DAG
+UNTRACED_STAGES = ("benchmark", "preflight", "profile", "run", "serve",
+                   "simulate")
+# A task is a straggler when it lasts this ratio of the median of its stage
+STRAGGLER_RATIO = 2.0
+# Start of the process when /proc is not available: once this module is
+# imported, the start-up before is missing from the wall time
+IMPORT_TIME = time.time()
+
+Event = Dict[str, Any]
+
+STAGE_HEADER = ["stage", "tasks", "wall_s", "median_s", "cpu_s",
+                "max_rss_mb", "read_mb", "written_mb", "failed"]
+
+
+def timeline_file(dag_file: str) -> str:
+    return dag_file + TIMELINE_SUFFIX
+
+
+def read_io() -> Tuple[Optional[int], Optional[int]]:
+    """Bytes read and written by the process and its waited children
+
+    Returns:
+        rchar and wchar of /proc/self/io, None when it is not available
+    """
+    counters = {}
+    try:
+        with open("/proc/self/io", "r") as io_f:
+            for line in io_f:
+                key, value = line.split(":")
+                counters[key] = int(value)
+    except (OSError, ValueError):
+        return None, None
+    return counters.get("rchar"), counters.get("wchar")
+
+
+def process_start() -> float:
+    """Epoch time the process started, as the CPU times of getrusage
+
+    The start is read from /proc/self/stat, with a 1/CLK_TCK precision,
+    the import time of this module is returned when /proc is not available.
+    """
+    try:
+        with open("/proc/self/stat", "r") as stat_f:
+            # the command name, 2nd field, may hold spaces
+            fields = stat_f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r") as uptime_f:
+            uptime = float(uptime_f.read().split()[0])
+        started = int(fields[19]) / sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return IMPORT_TIME
+    return time.time() - (uptime - started)
+
+
+def usage() -> Tuple[float, float, int]:
+    """CPU times and peak RSS (KiB) of the process and its waited children"""
+    if resource is None:
+        return 0.0, 0.0, 0
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (own.ru_utime + children.ru_utime,
+            own.ru_stime + children.ru_stime,
+            max(own.ru_maxrss, children.ru_maxrss))
+
+
+def append_event(path: str, event: Event) -> None:
+    """Append an event, a single write of a line is safe with concurrent
+    tasks, a run never fails because of its timeline"""
+    try:
+        with open(path, "a") as timeline_f:
+            timeline_f.write(json.dumps(event, sort_keys=True) + "\n")
+    except OSError as err:
+        print("Task not recorded into {}: {}".format(path, err),
+              file=sys.stderr)
+
+
+def run_stage(stage: str, stage_main: Callable[[Sequence[str]], int],
+              parameters: Sequence[str]) -> int:
+    """Run a stage and record its resources into the timeline of the run
+
+    The task is named by pegasus-mpi-cluster or contatester run in PMC_TASK.
+    Nothing is recorded when CONTATESTER_TIMELINE is not set. The CPU times,
+    peak RSS and I/O are those of the whole process, so the wall time is
+    measured from the start of the process as well: startup is the part of
+    it spent before the stage ran (interpreter start and imports).
+
+    Args:
+        :param stage: stage name, as abcalc
+        :param stage_main: main function of the stage
+        :param parameters: parameters of the stage
+
+    Returns:
+        The exit status of the stage
+    """
+    path = environ.get(TIMELINE_ENV)
+    if not path or stage in UNTRACED_STAGES:
+        return stage_main(parameters)
+    start = process_start()
+    stage_start = time.time()
+    status = 1
+    try:
+        status = stage_main(parameters)
+    except SystemExit as err:
+        status = err.code if isinstance(err.code, int) else 1
+        raise
+    finally:
+        end = time.time()
+        user, system, max_rss = usage()
+        read_bytes, written_bytes = read_io()
+        append_event(path, {"task": environ.get("PMC_TASK", stage),
+                            "stage": stage,
+                            "args": list(parameters),
+                            "host": socket.gethostname(),
+                            "pid": getpid(),
+                            "cores": int(environ.get("PMC_CPUS", 1)),
+                            "start": round(start, 3),
+                            "end": round(end, 3),
+                            "wall": round(end - start, 3),
+                            "startup": round(stage_start - start, 3),
+                            "user": round(user, 3),
+                            "sys": round(system, 3),
+                            "max_rss_kb": max_rss,
+                            "read_bytes": read_bytes,
+                            "written_bytes": written_bytes,
+                            "status": status})
+    return status
+
+
+def read_timeline(path: str) -> List[Event]:
+    """Events of a timeline, the last one of a task run several times"""
+    events = {}  # type: Dict[str, Event]
+    with open(path, "r") as timeline_f:
+        for line in timeline_f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            events[event["task"]] = event
+    return sorted(events.values(), key=lambda event: event["start"])
+
+
+def median(values: Sequence[float]) -> float:
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def stage_totals(events: Sequence[Event]) -> List[List[str]]:
+    rows = []
+    for stage in sorted(set(event["stage"] for event in events)):
+        stage_events = [event for event in events if event["stage"] == stage]
+        walls = [event["wall"] for event in stage_events]
+        rows.append([stage, str(len(stage_events)),
+                     "{:.1f}".format(sum(walls)),
+                     "{:.1f}".format(median(walls)),
+                     "{:.1f}".format(sum(event["user"] + event["sys"]
+                                         for event in stage_events)),
+                     "{:.0f}".format(max(event["max_rss_kb"]
+                                         for event in stage_events) / 1024),
+                     "{:.1f}".format(sum(event["read_bytes"] or 0
+                                         for event in stage_events) / 2 ** 20),
+                     "{:.1f}".format(sum(event["written_bytes"] or 0
+                                         for event in stage_events) / 2 ** 20),
+                     str(sum(event["status"] != 0 for event in stage_events))])
+    return rows
+
+
+def stragglers(events: Sequence[Event],
+               ratio: float = STRAGGLER_RATIO) -> List[Tuple[Event, float]]:
+    """Tasks lasting ratio times the median of their stage, longest first"""
+    medians = {}
+    for stage in set(event["stage"] for event in events):
+        medians[stage] = median([event["wall"] for event in events
+                                 if event["stage"] == stage])
+    found = [(event, event["wall"] / medians[event["stage"]])
+             for event in events
+             if medians[event["stage"]] > 0 and
+             event["wall"] >= ratio * medians[event["stage"]]]
+    return sorted(found, key=lambda item: -item[0]["wall"])
+
+
+def peak_cores(events: Sequence[Event]) -> int:
+    """Highest number of cores used by tasks running at the same time"""
+    changes = sorted([(event["start"], event["cores"]) for event in events] +
+                     [(event["end"], -event["cores"]) for event in events])
+    peak = used = 0
+    for _, change in changes:
+        used += change
+        peak = max(peak, used)
+    return peak
+
+
+def parallel_efficiency(events: Sequence[Event],
+                        cores: Optional[int] = None) -> float:
+    """CPU time of the tasks over the cores available during the run"""
+    span = max(event["end"] for event in events) - \
+        min(event["start"] for event in events)
+    cores = cores or peak_cores(events)
+    if span <= 0 or cores <= 0:
+        return 0.0
+    return sum(event["user"] + event["sys"] for event in events) / \
+        (span * cores)
+
+
+def critical_path(events: Sequence[Event],
+                  tasks: Optional[Dict[str, Task]] = None) \
+        -> List[Tuple[Event, float]]:
+    """Tasks the end of the run waited for, with their wait before start
+
+    From the last task, the path goes back to the parent which ended last.
+    The wait of a task is the time between the end of this parent, or the
+    start of the run, and its start: time spent by the scheduler.
+
+    Args:
+        :param events: events of the timeline
+        :param tasks: tasks of the DAG file, None when it is not available
+
+    Returns:
+        The tasks of the path from the first one, with their wait in second
+    """
+    by_task = {event["task"]: event for event in events}
+    run_start = min(event["start"] for event in events)
+    event = max(events, key=lambda item: item["end"])
+    path = []
+    while event is not None:
+        parents = []
+        if tasks is not None and event["task"] in tasks:
+            parents = [by_task[parent]
+                       for parent in tasks[event["task"]].parents
+                       if parent in by_task]
+        parent = max(parents, key=lambda item: item["end"]) \
+            if parents else None
+        ready = parent["end"] if parent is not None else run_start
+        path.append((event, max(0.0, event["start"] - ready)))
+        event = parent
+    return list(reversed(path))
+
+
+def format_table(rows: Sequence[Sequence[str]]) -> str:
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "".join("  ".join(cell.ljust(width)
+                             for cell, width in zip(row, widths)).rstrip() +
+                   "\n" for row in rows)
+
+
+def profile_report(events: Sequence[Event],
+                   tasks: Optional[Dict[str, Task]] = None,
+                   cores: Optional[int] = None) -> str:
+    """Summary of a timeline printed by contatester profile"""
+    span = max(event["end"] for event in events) - \
+        min(event["start"] for event in events)
+    lines = ["{} task(s) in {:.1f} s, parallel efficiency {:.0%} on {} "
+             "core(s)".format(len(events), span,
+                              parallel_efficiency(events, cores),
+                              cores or peak_cores(events)),
+             "", "Stages:",
+             format_table([STAGE_HEADER] + stage_totals(events)).rstrip()]
+    slow = stragglers(events)
+    lines += ["", "Stragglers (>= {:g} x stage median):"
+              .format(STRAGGLER_RATIO)]
+    lines += ["  {} {:.1f} s ({:.1f} x)".format(event["task"], event["wall"],
+                                                times)
+              for event, times in slow] or ["  none"]
+    path = critical_path(events, tasks)
+    waited = sum(wait for _, wait in path)
+    lines += ["", "Critical path: {:.1f} s running, {:.1f} s waiting"
+              .format(sum(event["wall"] for event, _ in path), waited)]
+    lines += ["  {} waited {:.1f} s, ran {:.1f} s (cpu {:.1f} s)"
+              .format(event["task"], wait, event["wall"],
+                      event["user"] + event["sys"])
+              for event, wait in path]
+    failed = [event for event in events if event["status"] != 0]
+    if failed:
+        lines += ["", "Failed tasks:"]
+        lines += ["  {} exit status {}".format(event["task"], event["status"])
+                  for event in failed]
+    return "\n".join(lines) + "\n"
+
+
+def latest_timeline(out_dir: str) -> Optional[str]:
+    timelines = glob(join(out_dir, "*" + TIMELINE_SUFFIX))
+    if not timelines:
+        return None
+    return max(timelines, key=getmtime)
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester profile",
+                                     description=("Summarize the resources "
+                                                  "used by the tasks of a "
+                                                  "run"))
+    parser.add_argument("outdir", type=str,
+                        help="output directory of the run")
+    parser.add_argument("--timeline", default=None, type=str,
+                        help=("timeline to read [default: latest "
+                              "<dagfile>" + TIMELINE_SUFFIX + " of outdir]"))
+    parser.add_argument("-n", "--cores", default=None, type=int,
+                        help=("cores of the job for the parallel efficiency "
+                              "[default: highest number of cores used at "
+                              "the same time]"))
+    return parser.parse_args(parameters)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    args = get_cli_args(parameters)
+    path = args.timeline or latest_timeline(args.outdir)
+    if path is None or not isfile(path):
+        print("No timeline found into {}".format(args.outdir),
+              file=sys.stderr)
+        return 1
+    events = read_timeline(path)
+    if not events:
+        print("No task recorded into {}".format(path), file=sys.stderr)
+        return 1
+    dag_file = path[:-len(TIMELINE_SUFFIX)]
+    tasks = read_dag(dag_file) if isfile(dag_file) else None
+    print(profile_report(events, tasks, args.cores), end="")
+    return 0
@@ -0,0 +1,269 @@
+# Import necessary libraries:
+
+from concurrent.futures import ProcessPoolExecutor
+from os import makedirs
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import AlleleBalance, \
+    cached_index, compute_allele_balance, plan_shards, \
+    shard_allele_balance, write_hist, write_mean_depth
+from fr.cea.cnrgh.lbi.contatester.estimation import dataset_depth, \
+    estimate_files, quadratic_root, read_depth
+from fr.cea.cnrgh.lbi.contatester.outputs import conta_file, depth_file, \
+    hist_file, sample_name, triage_file
+from fr.cea.cnrgh.lbi.contatester.panels import Panel, load_panel, \
+    ratio_hetero
+from fr.cea.cnrgh.lbi.contatester.runtime import files_size, \
+    record_runtime
+from fr.cea.cnrgh.lbi.contatester.tabix import has_index
+
+# Length of the regions drawn at random
+REGION_SIZE = 1000000
+# Regions read between two convergence tests
+ROUND_SIZE = 32
+# Half width of the confidence interval of the estimation, in percent
+TOLERANCE = 0.5
+# Regions read before the sample is scanned in full
+MAX_FRACTION = 0.5
+# Bootstrap replicates of the confidence interval
+NB_BOOTSTRAP = 200
+CONFIDENCE = 0.95
+
+
+def poly_estimates(panel: Panel, histograms: np.ndarray) -> np.ndarray:
+    """Polynomial estimation of contamination by column, as estimate does"""
+    coef_c, coef_b, coef_a = panel.poly_coefs
+    return quadratic_root(coef_c - ratio_hetero(histograms, panel.poly_rows),
+                          coef_b, coef_a)
+
+
+class Triage:
+    """Allele balance of a sample accumulated region by region
+
+    The histogram of each region read is kept, the confidence interval of
+    the estimation is computed by resampling the regions.
+
+    Args:
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param panel_dir: directory of compiled panels [default: data dir]
+        :param seed: seed of the resampling
+    """
+
+    def __init__(self, experiment: str = "WG",
+                 panel_dir: Optional[str] = None, seed: int = 0) -> None:
+        self.experiment = experiment
+        self.panel_dir = panel_dir
+        self.rng = np.random.RandomState(seed)
+        self.result = AlleleBalance()
+        self.histograms = []  # type: List[List[int]]
+
+    def add(self, partial: AlleleBalance) -> None:
+        self.result.merge(partial)
+        self.histograms.append(partial.histogram)
+
+    def panel(self) -> Panel:
+        depth = int(self.result.mean_depth())
+        return load_panel(self.experiment,
+                          dataset_depth(depth, self.experiment),
+                          self.panel_dir)
+
+    def interval(self, nb_bootstrap: int = NB_BOOTSTRAP,
+                 confidence: float = CONFIDENCE) -> Tuple[float, float, float]:
+        """Estimation and its confidence interval from the regions read
+
+        Returns:
+            The estimation, the lower and the upper bounds, in percent
+        """
+        panel = self.panel()
+        regions = np.array(self.histograms, dtype=np.float64)
+        estimation = float(poly_estimates(panel,
+                                          regions.sum(axis=0)[:, None])[0])
+        weights = self.rng.multinomial(len(regions),
+                                       [1.0 / len(regions)] * len(regions),
+                                       size=nb_bootstrap)
+        replicates = poly_estimates(panel, regions.T.dot(weights.T))
+        replicates = replicates[np.isfinite(replicates)]
+        if len(replicates) == 0:
+            return estimation, float("-inf"), float("inf")
+        low, high = np.percentile(replicates, [50 * (1 - confidence),
+                                               50 * (1 + confidence)])
+        return estimation, float(low), float(high)
+
+
+def sample_regions(vcf_file: str, region_size: int = REGION_SIZE,
+                   seed: int = 0) -> List[Tuple[bytes, int, int, int]]:
+    """Regions of an indexed VCF in a random order"""
+    shards = plan_shards(cached_index(vcf_file), region_size)
+    order = np.random.RandomState(seed).permutation(len(shards))
+    return [shards[i] for i in order.tolist()]
+
+
+def triage_vcf(vcf_file: str, experiment: str = "WG",
+               conta_threshold: int = 4, tolerance: float = TOLERANCE,
+               max_fraction: float = MAX_FRACTION, thread: int = 1,
+               region_size: int = REGION_SIZE, round_size: int = ROUND_SIZE,
+               panel_dir: Optional[str] = None, seed: int = 0) \
+        -> Tuple[AlleleBalance, Dict[str, Any]]:
+    """Estimate the contamination of a sample from random regions
+
+    Regions of the tabix indexed VCF are read in a random order, by rounds
+    processed in parallel. After each round the estimation is computed with
+    its confidence interval, sampling stops once the interval is narrower
+    than the tolerance. The sample is scanned in full when its interval
+    still contains the threshold, or when max_fraction of the regions did
+    not give a narrow enough interval.
+
+    Args:
+        :param vcf_file: path to a bgzipped and tabix indexed VCF
+        :param experiment: WG for Whole Genome or EX for Exome
+        :param conta_threshold: threshold for contaminated status
+        :param tolerance: half width of the confidence interval, in percent
+        :param max_fraction: part of the regions read before a full scan
+        :param thread: number of processes
+        :param region_size: length of the regions drawn
+        :param round_size: regions read between two convergence tests
+        :param panel_dir: directory of compiled panels [default: data dir]
+        :param seed: seed of the region order and of the resampling
+
+    Returns:
+        The allele balance used for the estimation and the triage record:
+        fraction of the regions read, estimation and confidence interval,
+        convergence and escalation to a full scan
+    """
+    regions = sample_regions(vcf_file, region_size, seed)
+    triage = Triage(experiment, panel_dir, seed)
+    max_regions = max(1, int(len(regions) * max_fraction))
+    record = {"regions": len(regions),
+              "converged": False}  # type: Dict[str, Any]
+    executor = ProcessPoolExecutor(max_workers=thread) if thread > 1 \
+        else None
+    try:
+        while len(triage.histograms) < min(max_regions, len(regions)):
+            first = len(triage.histograms)
+            # rounds grow with the regions read, the interval is computed
+            # a logarithmic number of times
+            last = min(first + max(round_size, first // 4), max_regions)
+            batch = regions[first:last]
+            if executor is not None:
+                partials = list(executor.map(shard_allele_balance,
+                                             [vcf_file] * len(batch), batch,
+                                             [None] * len(batch),
+                                             [False] * len(batch),
+                                             [None] * len(batch)))
+            else:
+                partials = [shard_allele_balance(vcf_file, shard, None,
+                                                 False, None)
+                            for shard in batch]
+            for partial, _ in partials:
+                triage.add(partial)
+            if triage.result.nb_snp == 0:
+                continue
+            estimation, low, high = triage.interval()
+            record.update(estimation=round(estimation, 2),
+                          ci_low=round(low, 3), ci_high=round(high, 3))
+            if (high - low) / 2 <= tolerance:
+                record["converged"] = True
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    record["sampled"] = len(triage.histograms)
+    record["fraction"] = len(triage.histograms) / max(1, len(regions))
+    record["escalated"] = not record["converged"] or \
+        record["ci_low"] < conta_threshold <= record["ci_high"]
+    if not record["escalated"]:
+        return triage.result, record
+    return compute_allele_balance(vcf_file, thread=thread), record
+
+
+def write_triage(triage: str, record: Dict[str, Any]) -> None:
+    with open(triage, "w") as triage_f:
+        json.dump(record, triage_f, sort_keys=True)
+        triage_f.write("\n")
+
+
+def get_cli_args(parameters: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="contatester triage",
+                                     description=("Estimate the "
+                                                  "contamination of a sample "
+                                                  "from random regions, scan "
+                                                  "it in full only near the "
+                                                  "threshold"))
+    parser.add_argument("-f", "--file", required=True, type=str,
+                        help=("bgzipped and tabix indexed VCF file to "
+                              "process (Mandatory)"))
+    parser.add_argument("-o", "--outdir", default=".", type=str,
+                        help=("folder of the sample results "
+                              "[default: current directory]"))
+    parser.add_argument("-s", "--threshold", default=4, type=int,
+                        help=("Threshold for contamination status "
+                              "[default: 4]"))
+    parser.add_argument("-e", "--experiment", default="WG", type=str,
+                        choices=("WG", "EX"),
+                        help=("Experiment type, could be WG for Whole "
+                              "Genome or EX for Exome [default: WG]"))
+    parser.add_argument("--tolerance", default=TOLERANCE, type=float,
+                        help=("half width of the {:.0%} confidence interval "
+                              "of the estimation, in percent, sampling "
+                              "stops below it [default: {}]"
+                              .format(CONFIDENCE, TOLERANCE)))
+    parser.add_argument("--max-fraction", default=MAX_FRACTION, type=float,
+                        help=("part of the regions read before the sample "
+                              "is scanned in full [default: {}]"
+                              .format(MAX_FRACTION)))
+    parser.add_argument("--region-size", default=REGION_SIZE, type=int,
+                        help=("length in bp of the regions drawn "
+                              "[default: {}]".format(REGION_SIZE)))
+    parser.add_argument("--seed", default=0, type=int,
+                        help="seed of the region order [default: 0]")
+    parser.add_argument("-t", "--thread", default=1, type=int,
+                        help=("number of processes reading regions "
+                              "[default: 1]"))
+    parser.add_argument("--panels", default=None, type=str,
+                        help=("folder of panels compiled by contatester "
+                              "panels [default: contatester data "
+                              "directory]"))
+    return parser.parse_args(parameters)
+
+
+def main(parameters: Sequence[str] = sys.argv[2:]) -> int:
+    start = time.monotonic()
+    args = get_cli_args(parameters)
+    if not has_index(args.file):
+        print("Error {} has no tabix index, regions cannot be drawn"
+              .format(args.file), file=sys.stderr)
+        return 1
+    result, record = triage_vcf(args.file, args.experiment, args.threshold,
+                                args.tolerance, args.max_fraction,
+                                args.thread, args.region_size,
+                                panel_dir=args.panels, seed=args.seed)
+    if result.nb_snp == 0:
+        print("Error no SNP found in VCF file {}".format(args.file),
+              file=sys.stderr)
+        return 1
+    name = sample_name(args.file)
+    makedirs(args.outdir, exist_ok=True)
+    write_hist(hist_file(args.outdir, name), result.histogram)
+    write_mean_depth(depth_file(args.outdir, name), result.mean_depth())
+    conta = conta_file(args.outdir, name)
+    estimation = estimate_files([hist_file(args.outdir, name)],
+                                [read_depth(depth_file(args.outdir, name))],
+                                [conta], args.experiment, args.threshold,
+                                args.panels)[0]
+    record["res_poly"] = estimation.res_poly
+    write_triage(triage_file(conta), record)
+    print("{}: {:g}% from {:.1%} of the regions, {:.0%} interval "
+          "[{:.2f}; {:.2f}]{}".format(name, estimation.res_poly,
+                                      record["fraction"], CONFIDENCE,
+                                      record.get("ci_low", float("nan")),
+                                      record.get("ci_high", float("nan")),
+                                      ", scanned in full"
+                                      if record["escalated"] else ""))
+    record_runtime("triage", files_size([args.file]), args.thread, start)
+    return 0
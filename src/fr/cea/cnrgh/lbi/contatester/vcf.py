@@ -0,0 +1,277 @@
+# Import necessary libraries:
+
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+import gzip
+import io
+
+from fr.cea.cnrgh.lbi.contatester.bgzf import BgzfReader
+from fr.cea.cnrgh.lbi.contatester.tabix import SequenceIndex
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Fields kept apart when splitting a record: CHROM .. FORMAT, first sample
+NB_SPLIT = 10
+
+
+def open_vcf(vcf_file: str) -> BinaryIO:
+    """Open a plain or (b)gzipped VCF as a binary stream
+
+    Args:
+        :param vcf_file: path to a VCF file, compressed or not
+
+    Returns:
+        A buffered binary file handler
+    """
+    with open(vcf_file, "rb") as filin:
+        magic = filin.read(2)
+    if magic == GZIP_MAGIC:
+        handler = io.BufferedReader(gzip.open(vcf_file, "rb"),
+                                    buffer_size=1024 * 1024)
+    else:
+        handler = open(vcf_file, "rb", buffering=1024 * 1024)
+    return handler
+
+
+def iter_records(handler: BinaryIO, header: Optional[List[bytes]] = None) \
+        -> Iterator[List[bytes]]:
+    """Iterate over VCF records, header lines are skipped
+
+    Only the first ten columns are split, others samples stay in the last
+    field, so joining the fields with tabs gives back the record line.
+
+    Args:
+        :param handler: a binary stream over a VCF content
+        :param header: if provided, header lines are appended to this list
+
+    Returns:
+        An iterator of record fields as raw bytes
+    """
+    for line in handler:
+        if line[:1] == b"#":
+            if header is not None:
+                header.append(line)
+            continue
+        yield line.rstrip(b"\n").split(b"\t", NB_SPLIT)
+
+
+def read_header(vcf_file: str) -> List[bytes]:
+    """Header lines of a VCF, the records are not read"""
+    header = []
+    with open_vcf(vcf_file) as handler:
+        for line in handler:
+            if line[:1] != b"#":
+                break
+            header.append(line)
+    return header
+
+
+def header_samples(header: List[bytes]) -> List[str]:
+    """Sample names of the #CHROM line of a VCF header"""
+    for line in reversed(header):
+        if line.startswith(b"#CHROM"):
+            return [name.decode() for name in
+                    line.rstrip(b"\r\n").split(b"\t")[9:]]
+    return []
+
+
+def iter_region(reader: BgzfReader, offset: int, chrom: bytes, beg: int,
+                end: int) -> Iterator[List[bytes]]:
+    """Iterate over the records of a bgzipped VCF starting in a region
+
+    Records are read from a virtual offset given by the tabix index, until
+    the end of the region or of the sequence.
+
+    Args:
+        :param reader: reader of the bgzipped VCF
+        :param offset: virtual offset before the first record of the region
+        :param chrom: sequence name of the region
+        :param beg: 0-based start of the region
+        :param end: 0-based end of the region (excluded)
+
+    Returns:
+        An iterator of record fields as raw bytes
+    """
+    reader.seek(offset)
+    in_sequence = False
+    for line in reader:
+        if line[:1] == b"#":
+            continue
+        fields = line.rstrip(b"\n").split(b"\t", NB_SPLIT)
+        if fields[0] != chrom:
+            if in_sequence:
+                break
+            continue
+        in_sequence = True
+        pos = int(fields[1]) - 1
+        if pos < beg:
+            continue
+        if pos >= end:
+            break
+        yield fields
+
+
+def iter_targets(reader: BgzfReader, sequence: SequenceIndex, chrom: bytes,
+                 targets: Sequence[Tuple[int, int]]) \
+        -> Iterator[List[bytes]]:
+    """Iterate over the records of a bgzipped VCF starting in target regions
+
+    Between two targets, the reader seeks to the offset of the next target
+    when it lies in a later block, so the blocks holding only off-target
+    records are not decompressed.
+
+    Args:
+        :param reader: reader of the bgzipped VCF
+        :param sequence: tabix index of the sequence
+        :param chrom: sequence name of the targets
+        :param targets: sorted, non overlapping 0-based [beg, end) regions
+
+    Returns:
+        An iterator of record fields as raw bytes
+    """
+    if not targets:
+        return
+    reader.seek(sequence.offset_at(targets[0][0]))
+    i = 0
+    in_sequence = False
+    while True:
+        line = reader.readline()
+        if not line:
+            break
+        if line[:1] == b"#":
+            continue
+        fields = line.rstrip(b"\n").split(b"\t", NB_SPLIT)
+        if fields[0] != chrom:
+            if in_sequence:
+                break
+            continue
+        in_sequence = True
+        pos = int(fields[1]) - 1
+        while pos >= targets[i][1]:
+            i += 1
+            if i == len(targets):
+                return
+        if pos < targets[i][0]:
+            offset = sequence.offset_at(targets[i][0])
+            if offset > reader.tell():
+                reader.seek(offset)
+            continue
+        yield fields
+
+
+def is_snp_allele(ref: bytes, alt: bytes) -> bool:
+    """Test if an alternate allele is a SNP as bcftools TYPE~"snp" does
+
+    Alleles of same length which differ by exactly one base are SNP, more
+    differences make a MNP.
+    """
+    if len(ref) != len(alt) or alt[:1] in (b"<", b"*", b"."):
+        return False
+    nb_diff = 0
+    for base_ref, base_alt in zip(ref.upper(), alt.upper()):
+        if base_ref != base_alt:
+            nb_diff += 1
+    return nb_diff == 1
+
+
+def is_snp(ref: bytes, alts: bytes) -> bool:
+    """Test if a record holds at least one SNP alternate allele
+
+    Args:
+        :param ref: REF column
+        :param alts: ALT column (comma separated alleles)
+    """
+    if len(ref) == 1 and len(alts) == 1:
+        # most frequent case: biallelic single base substitution
+        return alts != b"." and alts != b"*" and alts.upper() != ref.upper()
+    return any(is_snp_allele(ref, alt) for alt in alts.split(b","))
+
+
+def field_index(fmt: bytes, cache: Dict[bytes, int],
+                key: bytes = b"AD") -> int:
+    """Position of a key in the FORMAT column, -1 if absent
+
+    Args:
+        :param fmt: FORMAT column
+        :param cache: a dictionary used to memoize FORMAT layouts
+        :param key: the FORMAT key to look for
+    """
+    index = cache.get(fmt)
+    if index is None:
+        keys = fmt.split(b":")
+        index = keys.index(key) if key in keys else -1
+        cache[fmt] = index
+    return index
+
+
+def sample_ad_values(fields: List[bytes], cache: Dict[bytes, int]) \
+        -> List[Optional[int]]:
+    """Allelic depths of the first sample of a record as written in the VCF
+
+    Args:
+        :param fields: record split by iter_records
+        :param cache: a dictionary used to memoize FORMAT layouts
+
+    Returns:
+        A list of allelic depths, None for missing values and an empty list
+        if the record has no AD
+    """
+    if len(fields) <= 9:
+        return []
+    index = field_index(fields[8], cache)
+    if index < 0:
+        return []
+    return ad_values(fields[9].split(b":"), index)
+
+
+def ad_values(keys: List[bytes], index: int) -> List[Optional[int]]:
+    """Allelic depths of a sample, see sample_ad_values
+
+    Args:
+        :param keys: column of the sample split on ":"
+        :param index: position of AD in the FORMAT column, -1 if absent
+    """
+    if index < 0 or index >= len(keys):
+        return []
+    return [int(value) if value.isdigit() else None
+            for value in keys[index].split(b",")]
+
+
+def has_alt_allele(keys: List[bytes], index: int,
+                   values: List[Optional[int]]) -> bool:
+    """Test if a sample carries an alternate allele of a record
+
+    The genotype is read when the record has one, otherwise a read of an
+    alternate allele makes the sample a carrier.
+
+    Args:
+        :param keys: column of the sample split on ":"
+        :param index: position of GT in the FORMAT column, -1 if absent
+        :param values: allelic depths of the sample
+    """
+    if index < 0 or index >= len(keys):
+        return any(value for value in values[1:])
+    return any(allele not in (b"0", b".", b"")
+               for allele in keys[index].replace(b"|", b"/").split(b"/"))
+
+
+def sample_ad(fields: List[bytes], cache: Dict[bytes, int]) -> List[int]:
+    """Allelic depths of the first sample of a record
+
+    Missing values are counted as 0, as awk does with bcftools query output.
+
+    Args:
+        :param fields: record split by iter_records
+        :param cache: a dictionary used to memoize FORMAT layouts
+
+    Returns:
+        A list of the 4 first allelic depths
+    """
+    return padded_ad(sample_ad_values(fields, cache))
+
+
+def padded_ad(values: List[Optional[int]]) -> List[int]:
+    """The 4 first allelic depths, missing values are replaced by 0"""
+    ad = [0, 0, 0, 0]
+    for i, value in enumerate(values[:4]):
+        if value is not None:
+            ad[i] = value
+    return ad
@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def session_runtime_history(tmp_path_factory):
+    # module fixtures run stages before the function fixtures below are set
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        history = str(tmp_path_factory.mktemp('history') / 'runtimes.jsonl')
+        monkeypatch.setenv('CONTATESTER_HISTORY', history)
+        yield history
+
+
+@pytest.fixture(autouse=True)
+def runtime_history(tmpdir, monkeypatch):
+    # stages run by tests must not feed the runtime history of the user
+    history = str(tmpdir.join('runtimes.jsonl'))
+    monkeypatch.setenv('CONTATESTER_HISTORY', history)
+    return history
@@ -0,0 +1,121 @@
+from typing import List
+from pkg_resources import resource_filename
+import gzip
+import pytest
+from fr.cea.cnrgh.lbi.contatester.bgzf import BgzfReader
+from fr.cea.cnrgh.lbi.contatester.vcf import is_snp, sample_ad
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import ab_bin, compute_allele_balance, main
+from fr.cea.cnrgh.lbi.contatester.regions import Regions, read_bed
+from fr.cea.cnrgh.lbi.contatester.synthetic import simulate_cohort
+
+
+@pytest.mark.parametrize('alt_depth, total_depth',
+                         ((1, 8), (3, 8), (11, 41), (15, 37), (33, 33),
+                          (0, 12), (7, 20), (35, 100), (1, 200)))
+def test_ab_bin(alt_depth: int, total_depth: int) -> None:
+    # bins must match awk printf "%.2f"
+    expected = "{:.2f}".format(alt_depth / total_depth)
+    assert "{:.2f}".format(ab_bin(alt_depth, total_depth) / 100) == expected
+
+
+@pytest.mark.parametrize('ref, alts, expected',
+                         ((b'C', b'T', True),
+                          (b'C', b'C', False),
+                          (b'CCG', b'C', False),
+                          (b'AT', b'A,TT', True),
+                          (b'AT', b'GC', False),
+                          (b'A', b'*', False),
+                          (b'A', b'<NON_REF>', False)
+                          ))
+def test_is_snp(ref: bytes, alts: bytes, expected: bool) -> None:
+    assert is_snp(ref, alts) == expected
+
+
+@pytest.mark.parametrize('fields, expected',
+                         (([b'GT:AD:DP', b'0/1:30,11:41'],     [30, 11, 0, 0]),
+                          ([b'GT:AD:DP', b'1/2:0,15,22:37'],   [0, 15, 22, 0]),
+                          ([b'GT:AD', b'1/2:1,2,3,4,5'],       [1, 2, 3, 4]),
+                          ([b'GT:DP', b'0/1:12'],              [0, 0, 0, 0]),
+                          ([b'GT:AD:DP', b'0/1:.:9'],          [0, 0, 0, 0])
+                          ))
+def test_sample_ad(fields: List[bytes], expected: List[int]) -> None:
+    record = [b'chr1', b'1', b'.', b'A', b'G', b'.', b'.', b'.'] + fields
+    assert sample_ad(record, {}) == expected
+
+
+def test_main(tmpdir) -> None:
+    vcf_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    status = main(['-f', vcf_file, '-o', str(tmpdir.join('ab_sample.hist')),
+                   '-d', str(tmpdir.join('ab_sample.meandepth'))])
+    assert status == 0
+    for output in ('ab_sample.hist', 'ab_sample.meandepth'):
+        expected_filename = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', output)
+        assert tmpdir.join(output).readlines() == open(expected_filename).readlines()
+
+
+def test_main_with_candidates(tmpdir) -> None:
+    vcf_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    bed_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample_exclusion.bed')
+    candidates = str(tmpdir.join('ab_sample_candidates.vcf.gz'))
+    status = main(['-f', vcf_file, '-o', str(tmpdir.join('ab_sample.hist')),
+                   '-d', str(tmpdir.join('ab_sample.meandepth')), '-c', candidates, '-g', bed_file])
+    assert status == 0
+    expected_filename = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample_candidates.vcf')
+    with gzip.open(candidates, 'rt') as candidates_f:
+        assert candidates_f.readlines() == open(expected_filename).readlines()
+    # the histogram does not depend on the selection
+    expected_filename = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.hist')
+    assert tmpdir.join('ab_sample.hist').readlines() == open(expected_filename).readlines()
+
+
+@pytest.mark.parametrize('chrom, pos, expected',
+                         ((b'chr3', 49, False),
+                          (b'chr3', 50, True),
+                          (b'chr3', 160, True),
+                          (b'chr3', 161, False),
+                          (b'chr3', 210, True),
+                          (b'chr1', 100, False)
+                          ))
+def test_regions_contains(chrom: bytes, pos: int, expected: bool) -> None:
+    regions = Regions({b'chr3': [(200, 300), (49, 151), (100, 160)]})
+    assert regions.contains(chrom, pos) == expected
+
+
+
+def test_targets(tmpdir, monkeypatch) -> None:
+    vcf = simulate_cohort(str(tmpdir), 1, 100000, 90, 'EX', seed=2)[0]
+    # the capture kit of the test covers a few of the simulated targets
+    targets = str(tmpdir.join('kit.bed'))
+    simulated = tmpdir.join('targets.bed').readlines()
+    tmpdir.join('kit.bed').write(''.join(simulated[:200] + simulated[600:700:2] + simulated[3000:3100]))
+    regions = read_bed(targets)
+    with gzip.open(vcf, 'rb') as vcf_f:
+        lines = vcf_f.readlines()
+    on_target = str(tmpdir.join('on_target.vcf.gz'))
+    with gzip.open(on_target, 'wb') as vcf_f:
+        vcf_f.writelines(line for line in lines if line.startswith(b'#') or
+                         regions.contains(line.split(b'\t')[0], int(line.split(b'\t')[1])))
+    not_indexed = str(tmpdir.join('not_indexed.vcf.gz'))
+    with gzip.open(not_indexed, 'wb') as vcf_f:
+        vcf_f.writelines(lines)
+    expected = compute_allele_balance(on_target, candidates_file=str(tmpdir.join('expected.vcf.gz')))
+    assert expected.nb_snp < 0.1 * compute_allele_balance(vcf).nb_snp
+    blocks = []
+    load_block = BgzfReader._load_block
+    monkeypatch.setattr(BgzfReader, '_load_block',
+                        lambda reader, address: blocks.append(address) or load_block(reader, address))
+    for vcf_file, thread in ((vcf, 1), (vcf, 2), (not_indexed, 1)):
+        result = compute_allele_balance(vcf_file, candidates_file=str(tmpdir.join('targets.vcf.gz')),
+                                        thread=thread, shard_size=50000000, targets_file=targets)
+        assert (result.histogram, result.depth_sum) == (expected.histogram, expected.depth_sum)
+        with gzip.open(str(tmpdir.join('targets.vcf.gz'))) as result_f, \
+                gzip.open(str(tmpdir.join('expected.vcf.gz'))) as expected_f:
+            assert result_f.read() == expected_f.read()
+        if thread == 1 and vcf_file == vcf:
+            # the blocks holding only off-target records are not read
+            nb_blocks = len(set(blocks))
+    blocks.clear()
+    reader = BgzfReader(vcf)
+    while reader._next_block():
+        pass
+    assert nb_blocks < 0.2 * len(set(blocks))
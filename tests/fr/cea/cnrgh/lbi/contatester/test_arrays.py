@@ -0,0 +1,16 @@
+import os
+import numpy as np
+from fr.cea.cnrgh.lbi.contatester.arrays import save_arrays
+
+
+def test_save_arrays(tmpdir) -> None:
+    directory = str(tmpdir.join('index'))
+    save_arrays(directory, {'values': np.arange(3), 'names': np.array([b'a', b'b'])})
+    assert sorted(os.listdir(directory)) == ['names.npy', 'values.npy']
+    # a mapped array of the previous directory stays readable once it is replaced
+    previous = np.load(os.path.join(directory, 'values.npy'), mmap_mode='r')
+    save_arrays(directory, {'values': np.arange(5)})
+    assert os.listdir(str(tmpdir)) == ['index']
+    assert os.listdir(directory) == ['values.npy']
+    assert np.array_equal(np.load(os.path.join(directory, 'values.npy')), np.arange(5))
+    assert np.array_equal(previous, np.arange(3))
@@ -0,0 +1,24 @@
+import os
+import json
+from fr.cea.cnrgh.lbi.contatester.benchmark import regressions, main
+
+
+def test_regressions() -> None:
+    assert regressions({'abcalc': 2.0, 'compare': 1.0, 'dag': 0.01, 'estimate': 1.0},
+                       {'abcalc': 1.0, 'compare': 0.9, 'dag': 0.001}) == [('abcalc', 2.0)]
+
+
+def test_main(tmpdir, runtime_history) -> None:
+    parameters = ['-o', str(tmpdir.join('bench')), '--samples', '2', '--sites', '2000', '-r', '1']
+    assert main(parameters + ['--save-baseline']) == 0
+    # the stages run on the simulated cohort are not recorded into the history of the user
+    assert tmpdir.join('bench', 'runtimes.jsonl').check() and not tmpdir.join('runtimes.jsonl').check()
+    assert os.environ['CONTATESTER_HISTORY'] == runtime_history
+    tmpdir = tmpdir.join('bench')
+    baseline = json.loads(tmpdir.join('baseline.json').read())
+    assert sorted(baseline['2x2000_30x_WG']) == ['abcalc', 'candidates', 'compare', 'dag', 'estimate']
+    # the DAG was written much faster before
+    baseline['2x2000_30x_WG']['dag'] = 1e-3
+    tmpdir.join('baseline.json').write(json.dumps(baseline))
+    assert main(parameters + ['--only', 'dag']) == 1
+    assert len(tmpdir.join('benchmark_results.jsonl').readlines()) == 2
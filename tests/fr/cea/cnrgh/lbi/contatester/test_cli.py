@@ -47,6 +47,7 @@ def mock_os(mocker):
     mocker.patch('fr.cea.cnrgh.lbi.contatester.__main__.isdir', side_effect=isdir_mocking)
     mocker.patch('fr.cea.cnrgh.lbi.contatester.__main__.default_dagfile_name', side_effect=default_dagfile_name_mocking)
     mocker.patch('builtins.open', mock_open(read_data=abspath('foo.input')+"\n"))
+    mocker.patch('fr.cea.cnrgh.lbi.contatester.__main__.has_matplotlib', return_value=True)
 
 
 @pytest.mark.parametrize('parameters, fields_expected',
@@ -59,7 +60,10 @@ def mock_os(mocker):
                           (('-f', 'foo.input', '-o', 'my_out_dir', '-r', '-c', '-d', 'test.dagfile'),(([abspath('foo.input')], abspath('my_out_dir'), '--report', True,  '',            '',       'test.dagfile',                     4, 4, 'WG'))),
                           (('-l', 'foo.input', '-o', 'my_out_dir'),                                  (([abspath('foo.input')], abspath('my_out_dir'), '',         False, '',            '',       'contatest_19000101000000.dagfile', 1, 4, 'WG'))),
                           (('-l', 'foo.input', '-o', 'my_out_dir', '-r'),                            (([abspath('foo.input')], abspath('my_out_dir'), '--report', False, '',            '',       'contatest_19000101000000.dagfile', 1, 4, 'WG'))),
-                          (('-l', 'foo.input', '-o', 'my_out_dir', '-r', '-c', '-m', 'foo@foo.com'), (([abspath('foo.input')], abspath('my_out_dir'), '--report', True,  'foo@foo.com', '',       'contatest_19000101000000.dagfile', 4, 4, 'WG')))
+                          (('-l', 'foo.input', '-o', 'my_out_dir', '-r', '-c', '-m', 'foo@foo.com'), (([abspath('foo.input')], abspath('my_out_dir'), '--report', True,  'foo@foo.com', '',       'contatest_19000101000000.dagfile', 4, 4, 'WG'))),
+                          (('-f', 'foo.input', '-t', '8'),                                           (([abspath('foo.input')], os.getcwd(),           '',         False, '',            '',       'contatest_19000101000000.dagfile', 8, 4, 'WG'))),
+                          (('-f', 'foo.input', '-c', '-t', '2'),                                     (([abspath('foo.input')], os.getcwd(),           '',         True,  '',            '',       'contatest_19000101000000.dagfile', 2, 4, 'WG'))),
+                          (('-f', 'foo.input', '--cache-dir', 'my_cache'),                           (([abspath('foo.input')], os.getcwd(),           '',         False, '',            '',       'contatest_19000101000000.dagfile', 1, 4, 'WG', abspath('my_cache'))))
                           ])
 @pytest.mark.usefixtures('mock_os')
 def test_allowed_usage(parameters: Sequence[str], fields_expected: List[Union[str, int]]):
@@ -74,9 +78,28 @@ def test_allowed_usage(parameters: Sequence[str], fields_expected: List[Union[st
                           ('my_input_dir', 'foo.input2', 'foo.result'),
                           ('-f', 'foo.input', '-m'),
                           ('-f', 'foo.input', '-r', 'foo.result'),
-                          ('-f', 'my_input_dir')
+                          ('-f', 'my_input_dir'),
+                          ('-f', 'foo.input', '--targets', 'foo.input'),
+                          ('-f', 'foo.input', '--triage', '-c'),
+                          ('-f', 'foo.input', '--sketch-index', 'my_index'),
+                          ('-f', 'foo.input', '--thread', '0'),
+                          ('-f', 'foo.input', '--batches', '0')
                          ])
 @pytest.mark.usefixtures('mock_os')
 def test_not_allowed_usage(parameters: Sequence[str]):
     with pytest.raises(SystemExit):
-        args = get_cli_args(parameters)
\ No newline at end of file
+        args = get_cli_args(parameters)
+
+
+@pytest.mark.usefixtures('mock_os')
+def test_report_without_matplotlib(mocker):
+    mocker.patch('fr.cea.cnrgh.lbi.contatester.__main__.has_matplotlib', return_value=False)
+    get_cli_args(('-f', 'foo.input'))
+    with pytest.raises(SystemExit):
+        get_cli_args(('-f', 'foo.input', '-r'))
+
+
+@pytest.mark.usefixtures('mock_os')
+def test_list_blank_lines(mocker):
+    mocker.patch('builtins.open', mock_open(read_data='\n' + abspath('foo.input') + '\n\n'))
+    assert get_cli_args(('-l', 'foo.input'))[0] == [abspath('foo.input')]
@@ -0,0 +1,125 @@
+from typing import Sequence
+from pkg_resources import resource_filename
+import gzip
+import json
+import os
+import shutil
+import numpy as np
+import pytest
+from fr.cea.cnrgh.lbi.contatester.comparison import bc_ratio, CandidateSets, main
+
+
+@pytest.mark.parametrize('nb_match, nb_var, expected',
+                         ((1, 2, '.500'),
+                          (2, 2, '1.000'),
+                          (0, 7, '0'),
+                          (1, 1000, '.001'),
+                          (2, 3, '.666'),
+                          (5, 0, 'NaN')
+                          ))
+def test_bc_ratio(nb_match: int, nb_var: int, expected: str) -> None:
+    assert bc_ratio(nb_match, nb_var) == expected
+
+
+def test_candidate_sets_count_matches() -> None:
+    candidate_sets = CandidateSets([np.array([1, 5, 5, 9], dtype=np.uint64),
+                                    np.array([5, 7], dtype=np.uint64),
+                                    np.array([], dtype=np.uint64)])
+    sites = np.array([1, 2, 5, 5, 7, 10], dtype=np.uint64)
+    assert candidate_sets.count_matches(sites).tolist() == [3, 3, 0]
+
+
+@pytest.mark.parametrize('options', (('-t', '1'), ('-t', '2'), ('--cache-dir', 'cache'), ('-t', '2', '--cache-dir', 'cache')))
+def test_main(tmpdir, runtime_history, options: Sequence[str]) -> None:
+    out_dir = str(tmpdir)
+    contaminated = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    clean = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'compare_sample.vcf')
+    candidates = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample_candidates.vcf')
+    with open(candidates, 'rb') as candidates_f, \
+            gzip.open(out_dir + '/ab_sample_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz', 'wb') as conta_f:
+        shutil.copyfileobj(candidates_f, conta_f)
+    with open(out_dir + '/ab_sample.conta', 'w') as conta_f:
+        conta_f.write('0.809 0.986 14.71 16.98% TRUE\n')
+    with open(out_dir + '/compare_sample.conta', 'w') as conta_f:
+        conta_f.write('0.998 0.999 0 0% FALSE\n')
+    with open(out_dir + '/cohort.list', 'w') as list_f:
+        list_f.write(contaminated + '\n' + clean + '\n')
+    options = [out_dir + '/' + option if option == 'cache' else option for option in options]
+    for _ in range(2):
+        # the second run reads SNP sites from the cache if any
+        status = main(['-l', out_dir + '/cohort.list', '-o', out_dir] + options)
+        assert status == 0
+        tmpdir.join('comparison.manifest').remove()
+    with open(out_dir + '/ab_sample_comparisonSummary.txt') as summary_f:
+        assert summary_f.readlines() == [
+            'vcfContaName,vcfComparName,nbSNPConta,nbMatch,ratio\n',
+            'ab_sample_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz,compare_sample.vcf,2,1,.500\n']
+    assert not tmpdir.join('compare_sample_comparisonSummary.txt').exists()
+    # a run reading every site from the cache is not recorded
+    runs = [json.loads(line) for line in open(runtime_history)]
+    assert len(runs) == (1 if '--cache-dir' in options else 2)
+    assert runs[0]['size'] == os.path.getsize(contaminated) + os.path.getsize(clean)
+
+
+def test_main_update(tmpdir) -> None:
+    out_dir = str(tmpdir)
+    contaminated = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    clean = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'compare_sample.vcf')
+    candidates = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample_candidates.vcf')
+    with open(candidates, 'rb') as candidates_f, \
+            gzip.open(out_dir + '/ab_sample_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz', 'wb') as conta_f:
+        shutil.copyfileobj(candidates_f, conta_f)
+    with open(out_dir + '/ab_sample.conta', 'w') as conta_f:
+        conta_f.write('0.809 0.986 14.71 16.98% TRUE\n')
+    # previous run, the row of compare_sample.vcf is kept as it is
+    previous_row = 'ab_sample_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz,compare_sample.vcf,2,2,1.000\n'
+    with open(out_dir + '/ab_sample_comparisonSummary.txt', 'w') as summary_f:
+        summary_f.write('vcfContaName,vcfComparName,nbSNPConta,nbMatch,ratio\n' + previous_row)
+    new_vcf = out_dir + '/new_sample.vcf'
+    shutil.copyfile(contaminated, new_vcf)
+    with open(out_dir + '/cohort.list', 'w') as list_f:
+        list_f.write(contaminated + '\n' + clean + '\n' + new_vcf + '\n')
+    assert main(['-l', out_dir + '/cohort.list', '-o', out_dir, '--update']) == 0
+    with open(out_dir + '/ab_sample_comparisonSummary.txt') as summary_f:
+        assert summary_f.readlines() == [
+            'vcfContaName,vcfComparName,nbSNPConta,nbMatch,ratio\n',
+            previous_row,
+            'ab_sample_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz,new_sample.vcf,2,2,1.000\n']
+
+
+def test_main_clean_cohort(tmpdir, mocker, capsys) -> None:
+    out_dir = str(tmpdir)
+    vcfs = [out_dir + '/sample{}.vcf'.format(i) for i in range(3)]
+    for vcf in vcfs:
+        tmpdir.join(vcf.split('/')[-1].replace('.vcf', '.conta')).write('0.998 0.999 0 0% FALSE\n')
+    tmpdir.join('cohort.list').write(''.join(vcf + '\n' for vcf in vcfs))
+    # verdicts are read once, no VCF is read when no sample is contaminated
+    mocker.patch('fr.cea.cnrgh.lbi.contatester.comparison.iter_snp_sites', side_effect=AssertionError)
+    assert main(['-l', out_dir + '/cohort.list', '-o', out_dir, '-t', '4']) == 0
+    assert capsys.readouterr().out == '0 contaminated sample(s) among 3 VCF\n'
+    assert not tmpdir.listdir(lambda path: path.basename.endswith('_comparisonSummary.txt'))
+
+
+def test_main_samples(tmpdir, capsys) -> None:
+    out_dir = str(tmpdir)
+    contaminated = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    clean = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'compare_sample.vcf')
+    candidates = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample_candidates.vcf')
+    with open(candidates, 'rb') as candidates_f, \
+            gzip.open(out_dir + '/ab_sample_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz', 'wb') as conta_f:
+        shutil.copyfileobj(candidates_f, conta_f)
+    tmpdir.join('ab_sample.conta').write('0.809 0.986 14.71 16.98% TRUE\n')
+    tmpdir.join('compare_sample.conta').write('0.998 0.999 0 0% FALSE\n')
+    tmpdir.join('cohort.list').write(contaminated + '\n' + clean + '\n')
+    # a batch holding the clean sample only compares nothing
+    tmpdir.join('batch001.vcfs').write(clean + '\n')
+    assert main(['-l', out_dir + '/cohort.list', '-o', out_dir, '--samples', out_dir + '/batch001.vcfs']) == 0
+    assert capsys.readouterr().out == '0 contaminated sample(s) among 1 VCF\n'
+    # the batch of the contaminated sample compares it with the whole cohort
+    tmpdir.join('batch002.vcfs').write(contaminated + '\n')
+    assert main(['-l', out_dir + '/cohort.list', '-o', out_dir, '--samples', out_dir + '/batch002.vcfs']) == 0
+    assert tmpdir.join('batch002.vcfs.manifest').exists()
+    assert not tmpdir.join('comparison.manifest').exists()
+    with open(out_dir + '/ab_sample_comparisonSummary.txt') as summary_f:
+        assert summary_f.readlines()[1:] == [
+            'ab_sample_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz,compare_sample.vcf,2,1,.500\n']
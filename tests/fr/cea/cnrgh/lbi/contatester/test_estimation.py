@@ -0,0 +1,91 @@
+from pkg_resources import resource_filename
+import os
+import shutil
+import numpy as np
+import pytest
+from fr.cea.cnrgh.lbi.contatester.estimation import dataset_depth, quadratic_root, main
+from fr.cea.cnrgh.lbi.contatester.data import data_dir
+from fr.cea.cnrgh.lbi.contatester.panels import PANEL_ARRAYS, PANEL_SUFFIX, PANELS, is_compiled, load_panel, \
+    main as panels_main
+
+
+@pytest.mark.parametrize('depth, experiment, expected',
+                         ((29, 'WG', 30), (45, 'WG', 30), (46, 'WG', 60), (75, 'WG', 60), (76, 'WG', 90),
+                          (30, 'EX', 60), (75, 'EX', 60), (120, 'EX', 90)))
+def test_dataset_depth(depth: int, experiment: str, expected: int) -> None:
+    assert dataset_depth(depth, experiment) == expected
+
+
+@pytest.mark.parametrize('coef_c, coef_b, coef_a, expected',
+                         ((-6.0, 1.0, 1.0, 2.0),      # roots 2 and -3
+                          (6.0, -5.0, 1.0, 2.0),      # roots 2 and 3
+                          (5.0, 2.0, 1.0, -1.0),      # roots -1 +/- 2i
+                          (-4.0, 2.0, 0.0, 2.0)))
+def test_quadratic_root(coef_c: float, coef_b: float, coef_a: float, expected: float) -> None:
+    assert quadratic_root(np.array([coef_c]), coef_b, coef_a)[0] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('experiment, depthtest', (('WG', 30), ('WG', 60), ('WG', 90), ('EX', 60), ('EX', 90)))
+def test_load_panel(experiment: str, depthtest: int) -> None:
+    panel = load_panel(experiment, depthtest)
+    assert panel.dataset.shape[0] == 101
+    assert panel.references.sum() > 0
+    assert panel.xconta.min() == 0 and panel.xconta.max() < 50
+
+
+def test_main(tmpdir, capsys) -> None:
+    hist = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'estimation_sample.hist')
+    expected_filename = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'estimation_sample.conta')
+    conta = str(tmpdir.join('estimation_sample.conta'))
+    assert main(['-i', hist, '-o', conta, '-d', '30']) == 0
+    assert 'up to date' not in capsys.readouterr().out
+    assert open(conta).readlines() == open(expected_filename).readlines()
+
+
+def test_main_batch(tmpdir) -> None:
+    hist = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'estimation_sample.hist')
+    out_dir = str(tmpdir)
+    for name, depth in (('sample1', '29.6'), ('sample2', '62.1'), ('sample3', '30')):
+        shutil.copyfile(hist, out_dir + '/' + name + '.hist')
+        tmpdir.join(name + '.meandepth').write(depth + '\n')
+    tmpdir.join('vcfs.list').write('/data/sample1.vcf.gz\n/data/sample2.vcf.gz\n/data/sample3.vcf\n')
+    assert main(['-l', out_dir + '/vcfs.list', '--outdir', out_dir]) == 0
+    for name, depth in (('sample1', '29'), ('sample2', '62'), ('sample3', '30')):
+        assert main(['-i', out_dir + '/' + name + '.hist', '-o', out_dir + '/single.conta', '-d', depth]) == 0
+        assert tmpdir.join(name + '.conta').read() == tmpdir.join('single.conta').read()
+    expected_filename = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'estimation_sample.conta')
+    assert tmpdir.join('sample1.conta').read() == open(expected_filename).read()
+
+
+def test_compiled_panels(tmpdir) -> None:
+    panel_dir = str(tmpdir)
+    assert panels_main(['-o', panel_dir]) == 0
+    compiled = load_panel('WG', 30, panel_dir)
+    assert isinstance(compiled.dataset, np.memmap)
+    rda = load_panel('WG', 30)
+    for name in PANEL_ARRAYS:
+        assert np.array_equal(getattr(compiled, name), getattr(rda, name))
+    hist = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'estimation_sample.hist')
+    expected_filename = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'estimation_sample.conta')
+    assert main(['-i', hist, '-o', panel_dir + '/sample.conta', '-d', '30', '--panels', panel_dir]) == 0
+    assert tmpdir.join('sample.conta').read() == open(expected_filename).read()
+
+
+def test_compiled_panel_changed_rda(tmpdir) -> None:
+    name, lin_rows, poly_rows = PANELS[('WG', 30)]
+    rda_dir = tmpdir.mkdir('rda')
+    rda_file = str(rda_dir.join(name + '.rda'))
+    for other, _, _ in PANELS.values():
+        shutil.copy(os.path.join(data_dir(), other + '.rda'), str(rda_dir))
+    panel_dir = str(tmpdir.join('panels'))
+    # panels compiled from another directory than the data directory
+    assert panels_main(['-i', str(rda_dir), '-o', panel_dir]) == 0
+    compiled = os.path.join(panel_dir, name + PANEL_SUFFIX)
+    assert is_compiled(compiled, lin_rows, poly_rows)
+    assert isinstance(load_panel('WG', 30, panel_dir).dataset, np.memmap)
+    # a new version of the dataset is not hidden by the compiled panel
+    stat = os.stat(rda_file)
+    os.utime(rda_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not is_compiled(compiled, lin_rows, poly_rows)
+    os.remove(rda_file)
+    assert not is_compiled(compiled, lin_rows, poly_rows)
@@ -0,0 +1,62 @@
+from pkg_resources import resource_filename
+from typing import List
+import pytest
+from fr.cea.cnrgh.lbi.contatester.executor import split_task_line, read_dag, run_dag, main
+
+
+@pytest.mark.parametrize('line, expected',
+                         (('EDGE a b', ['EDGE', 'a', 'b']),
+                          ('TASK a -c 2 bash -c "echo  foo"', ['TASK', 'a', '-c', '2', 'bash', '-c', 'echo  foo']),
+                          ('TASK a bash -c "awk \\\'END{printf \\$NF}\\\' f"', ['TASK', 'a', 'bash', '-c', "awk 'END{printf $NF}' f"]),
+                          ('  ', [])))
+def test_split_task_line(line: str, expected: List[str]) -> None:
+    assert split_task_line(line) == expected
+
+
+def test_read_dag() -> None:
+    dag_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'test_5vcf_check.dagfile')
+    tasks = read_dag(dag_file)
+    assert len(tasks) == 12
+    assert tasks['ABCalc_file0'].cores == 7
+    assert tasks['ABCalc_file0'].args[:2] == ['bash', '-c']
+    assert tasks['ABCalc_file0'].children == ['Report_file0']
+    assert sorted(tasks['Compare_all'].parents) == ['Report_file{}'.format(i) for i in range(5)]
+    assert tasks['Collect_results'].parents == ['Compare_all']
+
+
+def write_dag(tmpdir, small: str, large: str, fail: bool = False) -> str:
+    log = tmpdir.join('log')
+    dag_file = tmpdir.join('test.dagfile')
+    dag_file.write('TASK small -c 1 bash -c "echo small >> {log} ; cat {small} > /dev/null"\n'
+                   'TASK large -c 1 bash -c "echo large >> {log} ; cat {large} > /dev/null"\n'
+                   'TASK join -c 2 bash -c "echo join >> {log} ; exit {code}"\n'
+                   'TASK after -c 1 bash -c "echo after >> {log}"\n'
+                   'EDGE small join\n'
+                   'EDGE large join\n'
+                   'EDGE join after\n'.format(log=log, small=small, large=large, code=int(fail)))
+    return str(dag_file)
+
+
+def test_run_dag(tmpdir) -> None:
+    small = tmpdir.join('small.vcf')
+    small.write('x')
+    large = tmpdir.join('large.vcf')
+    large.write('x' * 1000)
+    dag_file = write_dag(tmpdir, str(small), str(large))
+    # the task of the largest file is started first
+    assert run_dag(dag_file, cores=1) == []
+    assert tmpdir.join('log').read().split() == ['large', 'small', 'join', 'after']
+    assert tmpdir.join('test.dagfile.rescue').read().split() == ['DONE', 'large', 'DONE', 'small',
+                                                                 'DONE', 'join', 'DONE', 'after']
+
+
+def test_run_dag_failure(tmpdir, capsys) -> None:
+    dag_file = write_dag(tmpdir, '/dev/null', '/dev/null', fail=True)
+    assert main([dag_file, '-n', '4']) == 1
+    assert sorted(tmpdir.join('log').read().split()) == ['join', 'large', 'small']
+    assert 'Task join failed with exit code 1\n1 task(s) not run: after\n' in capsys.readouterr().err
+    # tasks done are not run again
+    tmpdir.join('log').remove()
+    write_dag(tmpdir, '/dev/null', '/dev/null')
+    assert main([dag_file]) == 0
+    assert tmpdir.join('log').read().split() == ['join', 'after']
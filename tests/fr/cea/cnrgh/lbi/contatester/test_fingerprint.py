@@ -0,0 +1,97 @@
+from pkg_resources import resource_filename
+import gzip
+import os
+import numpy as np
+import pytest
+from pytest_mock import mocker
+from fr.cea.cnrgh.lbi.contatester.fingerprint import FingerprintCache, arrays_to_sites, sites_to_arrays
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import main
+
+
+def test_sites_round_trip() -> None:
+    sites = {b'chr1': [100, 300], b'chr2': [], b'chrX': [5]}
+    restored = arrays_to_sites(sites_to_arrays(sites))
+    assert {chrom: positions.tolist() for chrom, positions in restored.items()} == sites
+
+
+def test_store_load(tmpdir) -> None:
+    cache = FingerprintCache(str(tmpdir))
+    key = cache.key('abcalc', 'foo', 0.11)
+    assert cache.load(key) is None
+    cache.store(key, {'histogram': np.arange(101)})
+    assert cache.load(key)['histogram'].tolist() == list(range(101))
+    assert cache.key('abcalc', 'foo', 0.12) != key
+
+
+def test_lru_eviction(tmpdir) -> None:
+    cache = FingerprintCache(str(tmpdir))
+    keys = [cache.key('sites', i) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.store(key, {'positions': np.random.randint(0, 1 << 30, 1000, dtype=np.uint32)})
+        os.utime(cache.entry_path(key), ns=(i * 10 ** 9, i * 10 ** 9))
+    # reading the oldest entry makes it the most recently used one
+    cache.load(keys[0])
+    cache.max_size = os.path.getsize(cache.entry_path(keys[0])) + os.path.getsize(cache.entry_path(keys[2])) + 1
+    cache.evict()
+    assert [cache.contains(key) for key in keys] == [True, False, True]
+
+
+def test_store_evicts_above_estimate(tmpdir, mocker) -> None:
+    cache = FingerprintCache(str(tmpdir))
+    evict = mocker.spy(cache, 'evict')
+    # the size of a new cache is unknown, the entries are listed once
+    cache.store(cache.key('sites', 0), {'positions': np.arange(1000)})
+    assert evict.call_count == 1
+    size = cache.estimated_size()
+    assert size == os.path.getsize(cache.entry_path(cache.key('sites', 0)))
+    cache.store(cache.key('sites', 1), {'positions': np.arange(1000)})
+    assert evict.call_count == 1 and cache.estimated_size() == 2 * size
+    cache.max_size = 2 * size
+    cache.store(cache.key('sites', 2), {'positions': np.arange(1000)})
+    assert evict.call_count == 2 and cache.estimated_size() == 2 * size
+    assert sum(cache.contains(cache.key('sites', i)) for i in range(3)) == 2
+
+
+def test_load_truncated_entry(tmpdir, mocker) -> None:
+    cache = FingerprintCache(str(tmpdir))
+    key = cache.key('sites', 0)
+    cache.store(key, {'positions': np.arange(1000)})
+    with open(cache.entry_path(key), 'r+b') as entry_f:
+        entry_f.truncate(10)
+    # another task removed the entry first
+    mocker.patch('fr.cea.cnrgh.lbi.contatester.fingerprint.remove', side_effect=FileNotFoundError)
+    assert cache.load(key) is None
+
+
+def test_checksum_follows_content(tmpdir) -> None:
+    cache = FingerprintCache(str(tmpdir.join('cache')))
+    input_file = tmpdir.join('input.txt')
+    input_file.write('foo')
+    checksum = cache.checksum(str(input_file))
+    assert cache.checksum(str(input_file)) == checksum
+    input_file.write('bar')
+    os.utime(str(input_file), ns=(0, 0))
+    assert cache.checksum(str(input_file)) != checksum
+
+
+def test_main_with_cache(tmpdir, mocker) -> None:
+    vcf_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    bed_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample_exclusion.bed')
+    out_dir = str(tmpdir)
+    parameters = ['-f', vcf_file, '-o', out_dir + '/ab_sample.hist', '-d', out_dir + '/ab_sample.meandepth',
+                  '-c', out_dir + '/ab_sample_candidates.vcf.gz', '-g', bed_file, '--cache-dir', out_dir + '/cache']
+    assert main(parameters) == 0
+    for output in ('ab_sample.hist', 'ab_sample.meandepth', 'ab_sample_candidates.vcf.gz'):
+        os.remove(out_dir + '/' + output)
+    # the second run must not read the VCF
+    mocker.patch('fr.cea.cnrgh.lbi.contatester.allelic_balance.scan_allele_balance', side_effect=AssertionError)
+    assert main(parameters) == 0
+    for output in ('ab_sample.hist', 'ab_sample.meandepth'):
+        expected_filename = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', output)
+        assert open(out_dir + '/' + output).readlines() == open(expected_filename).readlines()
+    expected_filename = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample_candidates.vcf')
+    with gzip.open(out_dir + '/ab_sample_candidates.vcf.gz', 'rt') as candidates_f:
+        assert candidates_f.readlines() == open(expected_filename).readlines()
+    # another selection range is computed again
+    with pytest.raises(AssertionError):
+        main(parameters + ['--ABend', '0.2'])
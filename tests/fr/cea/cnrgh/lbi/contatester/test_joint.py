@@ -0,0 +1,99 @@
+import gzip
+import re
+import pytest
+from fr.cea.cnrgh.lbi.contatester import allelic_balance, comparison, estimation
+from fr.cea.cnrgh.lbi.contatester.joint import compute_joint_balance, main
+from fr.cea.cnrgh.lbi.contatester.synthetic import CONTIGS, simulate_cohort, write_vcf
+from fr.cea.cnrgh.lbi.contatester.vcf import has_alt_allele, header_samples
+
+
+@pytest.mark.parametrize('sample, gt_index, values, expected', (
+    (b'0/1:10,2', 0, [10, 2], True),
+    (b'1|1:0,12', 0, [0, 12], True),
+    (b'0/0:10,1', 0, [10, 1], False),
+    (b'./.:.', 0, [None], False),
+    (b'.', 0, [], False),
+    (b'10,2', -1, [10, 2], True),
+    (b'10,0', -1, [10, 0], False)))
+def test_has_alt_allele(sample: bytes, gt_index: int, values, expected: bool) -> None:
+    assert has_alt_allele(sample.split(b':'), gt_index, values) is expected
+
+
+def test_header_samples() -> None:
+    assert header_samples([b'##fileformat=VCFv4.2\n',
+                           b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\n']) == ['S1', 'S2']
+    assert header_samples([b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n']) == []
+
+
+def write_joint_vcf(vcfs, joint_vcf: str) -> None:
+    """Merge single sample VCF, a sample missing from a record is not called"""
+    header = []
+    records = {}
+    for i, vcf in enumerate(vcfs):
+        with gzip.open(vcf, 'rb') as vcf_f:
+            for line in vcf_f:
+                if line.startswith(b'#CHROM'):
+                    if i == 0:
+                        chrom_line = line.rstrip(b'\n')
+                    else:
+                        chrom_line += b'\t' + line.rstrip(b'\n').split(b'\t')[9]
+                elif line.startswith(b'#'):
+                    if i == 0:
+                        header.append(line)
+                else:
+                    fields = line.rstrip(b'\n').split(b'\t')
+                    key = (fields[0], int(fields[1]), fields[3], fields[4])
+                    record = records.setdefault(key, fields[:9] + [b'./.:.:.:.'] * len(vcfs))
+                    record[9 + i] = fields[9]
+    order = {chrom: i for i, (chrom, _) in enumerate(CONTIGS)}
+    with gzip.open(joint_vcf, 'wb') as joint_f:
+        joint_f.write(b''.join(header) + chrom_line + b'\n')
+        for key in sorted(records, key=lambda key: (order[key[0]],) + key[1:]):
+            joint_f.write(b'\t'.join(records[key]) + b'\n')
+
+
+@pytest.fixture
+def cohort(tmpdir):
+    vcfs = simulate_cohort(str(tmpdir.join('cohort')), 3, 20000, 30, 'WG', [(1, 0, 0.3)], seed=3)
+    joint_vcf = str(tmpdir.join('cohort', 'joint.vcf.gz'))
+    write_joint_vcf(vcfs, joint_vcf)
+    return vcfs, joint_vcf, str(tmpdir.join('cohort', 'excluded.bed'))
+
+
+def test_joint_matches_split_vcfs(cohort, tmpdir) -> None:
+    vcfs, joint_vcf, bed = cohort
+    split_dir = tmpdir.mkdir('split')
+    for vcf in vcfs:
+        name = vcf.split('/')[-1].split('.vcf')[0]
+        assert allelic_balance.main(['-f', vcf, '-o', str(split_dir.join(name + '.hist')),
+                                     '-d', str(split_dir.join(name + '.meandepth')), '-g', bed,
+                                     '-c', str(split_dir.join(name + '_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz'))]) == 0
+    split_dir.join('vcfs.txt').write(''.join(vcf + '\n' for vcf in vcfs))
+    assert estimation.main(['-l', str(split_dir.join('vcfs.txt')), '--outdir', str(split_dir)]) == 0
+    assert comparison.main(['-l', str(split_dir.join('vcfs.txt')), '-o', str(split_dir)]) == 0
+    joint_dir = tmpdir.join('joint')
+    assert main(['-f', joint_vcf, '-o', str(joint_dir), '-g', bed]) == 0
+    assert joint_dir.join('joint.samples').read() == 'sample0000.vcf\nsample0001.vcf\nsample0002.vcf\n'
+    for name in ('sample0000', 'sample0001', 'sample0002'):
+        for suffix in ('.hist', '.meandepth', '.conta'):
+            assert joint_dir.join(name + suffix).read() == split_dir.join(name + suffix).read()
+    # sample0001 is contaminated by sample0000
+    assert not split_dir.join('sample0000_comparisonSummary.txt').exists()
+    split_summary = split_dir.join('sample0001_comparisonSummary.txt').read()
+    assert joint_dir.join('sample0001_comparisonSummary.txt').read() == re.sub(',(sample[0-9]+).vcf.gz,', ',\\1.vcf,', split_summary)
+    # up to date
+    assert main(['-f', joint_vcf, '-o', str(joint_dir), '-g', bed]) == 0
+
+
+def test_compute_joint_balance_threads(cohort, tmpdir) -> None:
+    _, joint_vcf, bed = cohort
+    joint_bgzf = str(tmpdir.join('joint.vcf.gz'))
+    with gzip.open(joint_vcf, 'rb') as joint_f:
+        write_vcf(joint_bgzf, joint_f.readlines())
+    single = compute_joint_balance(joint_vcf, 3, bed)
+    sharded = compute_joint_balance(joint_bgzf, 3, bed, thread=2, shard_size=50000000)
+    assert [result.histogram for result in sharded.samples] == [result.histogram for result in single.samples]
+    assert sharded.nb_candidates == single.nb_candidates
+    assert (sharded.matches == single.matches).all()
+    assert single.matches[1, 0] > single.matches[1, 2]
+
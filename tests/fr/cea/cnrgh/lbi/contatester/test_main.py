@@ -2,9 +2,13 @@ from typing import List, Union
 from pkg_resources import resource_filename
 from os.path import dirname
 from os.path import isdir
+import shutil
 import pytest
 from pytest_mock import mocker
-from fr.cea.cnrgh.lbi.contatester.__main__ import task_cmd_if, nb_vcf_by_tasks, write_batch_file, nb_runs, job_duration, write_dag_file, write_edge_task, create_report, write_intermediate_task, write_intermediate_task, write_binary
+from fr.cea.cnrgh.lbi.contatester import allelic_balance, estimation
+from fr.cea.cnrgh.lbi.contatester.runtime import BatchPlan
+from fr.cea.cnrgh.lbi.contatester.__main__ import task_cmd_if, nb_vcf_by_tasks, write_batch_file, nb_runs, job_duration, write_dag_file, write_edge_task, create_report, write_intermediate_task, write_intermediate_task, write_binary, \
+    split_cohort
 
 
 def is_default_env_dir(dir: str):
@@ -100,6 +104,7 @@ def test_write_batch_file(mocker, env: str, dag_file: str, msub_file: str, nb_vc
                           accounting: Union[str, None], expected_file: str):
     if env == 'default':
         mocker.patch('fr.cea.cnrgh.lbi.contatester.__main__.isdir', side_effect=is_default_env_dir )
+        mocker.patch('fr.cea.cnrgh.lbi.contatester.__main__.shutil.which', return_value=None)
     elif env == 'cnrgh':
         mocker.patch('fr.cea.cnrgh.lbi.contatester.__main__.isdir', side_effect=is_cnrgh_env_dir )
     elif env == 'ccrt':
@@ -115,6 +120,15 @@ def test_write_batch_file(mocker, env: str, dag_file: str, msub_file: str, nb_vc
     # assert dirname(msub_file) == dirname(out_dir)
 
 
+def test_write_batch_file_plan(mocker, tmpdir):
+    mocker.patch('fr.cea.cnrgh.lbi.contatester.__main__.isdir', side_effect=is_ccrt_env_dir)
+    msub_file = str(tmpdir.join('test.msub'))
+    write_batch_file('test1.dag', msub_file, 5, 4, '/tmp/', '', '', plan=BatchPlan(3, 2, 100, 450))
+    content = open(msub_file, 'r').read()
+    assert '#MSUB -n 3\n' in content and '#MSUB -c 2\n' in content and '#MSUB -T 450\n' in content
+    assert '-n 4 pegasus-mpi-cluster' in content
+
+
 # TODO create_report
 
 
@@ -138,3 +152,108 @@ def test_write_dag_file(check: bool, dag_file: str, out_dir: str, report: str,
     expected_content = open(expected_filename, 'r').readlines()
     assert content == expected_content
     # assert dirname(dag_file) == dirname(out_dir)
+
+
+def test_write_dag_file_update(tmpdir):
+    out_dir = str(tmpdir)
+    vcfs = ['file{}.vcf'.format(i) for i in range(0, 3)]
+    for extension in ('.hist', '.meandepth', '.conta', '_AB_0.00_to_0.11_noLCRnoDUP.vcf.gz'):
+        tmpdir.join('file0' + extension).write('')
+    dag_file = out_dir + '/update.dagfile'
+    write_dag_file(True, dag_file, out_dir, '', "TASK {id} -c {core} bash -c ", vcfs, 2, 4, 'WG', '', True)
+    content = open(dag_file, 'r').read()
+    assert 'ABCalc_file0' not in content and 'Report_file0' not in content
+    assert 'ABCalc_file2' in content and 'EDGE Report_file2 Compare_all' in content
+    assert '-t 2 --update"' in content
+
+
+def test_write_dag_file_manifests(tmpdir):
+    out_dir = str(tmpdir)
+    vcf_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    vcfs = [out_dir + '/file{}.vcf'.format(i) for i in range(0, 2)]
+    for vcf in vcfs:
+        shutil.copyfile(vcf_file, vcf)
+    # file0 was processed by a previous run, its tasks wrote manifests
+    assert allelic_balance.main(['-f', vcfs[0], '-o', out_dir + '/file0.hist', '-d', out_dir + '/file0.meandepth',
+                                 '-t', '1']) == 0
+    assert estimation.main(['--input', out_dir + '/file0.hist', '--output', out_dir + '/file0.conta', '-t', '4',
+                            '--experiment', 'WG', '--depth-file', out_dir + '/file0.meandepth']) == 0
+    dag_file = out_dir + '/resume.dagfile'
+    write_dag_file(False, dag_file, out_dir, '', "TASK {id} -c {core} bash -c ", vcfs, 1, 4, 'WG')
+    content = open(dag_file, 'r').read()
+    assert 'ABCalc_file0' not in content and 'Report_file0' not in content
+    assert 'ABCalc_file1' in content and 'Report_file1' in content
+    # another threshold invalidates the estimation only
+    write_dag_file(False, dag_file, out_dir, '', "TASK {id} -c {core} bash -c ", vcfs, 1, 5, 'WG')
+    content = open(dag_file, 'r').read()
+    assert 'ABCalc_file0' not in content and 'Report_file0' in content
+    # a modified VCF invalidates both
+    with open(vcfs[0], 'a') as vcf_f:
+        vcf_f.write('\n')
+    write_dag_file(False, dag_file, out_dir, '', "TASK {id} -c {core} bash -c ", vcfs, 1, 4, 'WG')
+    content = open(dag_file, 'r').read()
+    assert 'EDGE ABCalc_file0 Report_file0' in content
+
+
+def test_write_dag_file_batch(tmpdir):
+    out_dir = str(tmpdir)
+    vcfs = ['file{}.vcf'.format(i) for i in range(0, 3)]
+    dag_file = out_dir + '/run.dagfile.batch002'
+    write_dag_file(True, dag_file, out_dir, '--report', "TASK {id} -c {core} bash -c ", vcfs[1:], 2, 4, 'WG',
+                   cohort_list=out_dir + '/run.dagfile.vcfs')
+    content = open(dag_file, 'r').read()
+    assert 'ABCalc_file0' not in content and 'ABCalc_file2' in content
+    assert open(dag_file + '.vcfs').read() == 'file1.vcf\nfile2.vcf\n'
+    assert ('compare -l ' + out_dir + '/run.dagfile.vcfs --samples ' + dag_file + '.vcfs') in content
+    assert ('report -l ' + dag_file + '.vcfs -o ' + out_dir + ' -s 4 --experiment WG --output ' + dag_file +
+            '.pdf"') in content
+    # batches run at the same time, each one writes its own database
+    assert ('collect -l ' + dag_file + '.vcfs -o ' + out_dir + ' --database ' + dag_file + '.sqlite"') in content
+
+
+def test_write_dag_file_targets(tmpdir):
+    out_dir = str(tmpdir)
+    dag_file = out_dir + '/run.dagfile'
+    write_dag_file(False, dag_file, out_dir, '', "TASK {id} -c {core} bash -c ", ['file0.vcf.gz'], 2, 4, 'EX',
+                   targets='/data/kit.bed')
+    content = open(dag_file, 'r').read()
+    assert 'contatester abcalc -f file0.vcf.gz -o ' + out_dir + '/file0.hist -d ' + out_dir + \
+        '/file0.meandepth -t 2 --targets /data/kit.bed"' in content
+
+
+def test_write_dag_file_sketch_index(tmpdir):
+    out_dir = str(tmpdir)
+    dag_file = out_dir + '/run.dagfile'
+    write_dag_file(True, dag_file, out_dir, '', "TASK {id} -c {core} bash -c ", ['file0.vcf.gz', 'file1.vcf.gz'],
+                   4, 4, 'WG', sketch_index='/data/sketches')
+    assert 'contatester compare -l ' + dag_file + '.vcfs -o ' + out_dir + ' -t 4 --sketch-index /data/sketches"' in \
+        open(dag_file, 'r').read()
+
+
+def test_write_dag_file_triage(tmpdir):
+    out_dir = str(tmpdir)
+    dag_file = out_dir + '/run.dagfile'
+    write_dag_file(False, dag_file, out_dir, '--report', "TASK {id} -c {core} bash -c ", ['file0.vcf.gz', 'file1.vcf.gz'],
+                   2, 4, 'WG', triage=True)
+    content = open(dag_file, 'r').read()
+    assert 'ABCalc_' not in content and 'Report_file0' not in content
+    assert 'TASK Triage_file1 -c 2 bash -c "contatester triage -f file1.vcf.gz -o ' + out_dir + \
+        ' -s 4 -e WG -t 2"' in content
+    assert 'EDGE Triage_file0 Report_cohort' in content and 'EDGE Triage_file1 Collect_results' in content
+
+
+@pytest.mark.parametrize('durations, nb_batch, walltime, expected',
+                         (([5, 4, 3, 3, 3], 2, 86400, [['s0', 's3'], ['s1', 's2', 's4']]),
+                          ([5, 4, 3, 3, 3], 1, 86400, [['s0', 's1', 's2', 's3', 's4']]),
+                          ([5, 4, 3, 3, 3], None, 86400, [['s0', 's1', 's2', 's3', 's4']])))
+def test_split_cohort(durations, nb_batch, walltime, expected):
+    vcfs = ['s{}'.format(i) for i in range(len(durations))]
+    assert split_cohort(vcfs, durations, nb_batch, walltime) == expected
+
+
+def test_split_cohort_walltime():
+    vcfs = ['s{}'.format(i) for i in range(100)]
+    # 48 samples run at the same time within the walltime
+    batches = split_cohort(vcfs, [1000] * 100, None, 1800)
+    assert [len(batch) for batch in batches] == [34, 33, 33]
+    assert sorted(vcf for batch in batches for vcf in batch) == sorted(vcfs)
@@ -0,0 +1,41 @@
+from os import utime, stat
+from fr.cea.cnrgh.lbi.contatester.fingerprint import FingerprintCache
+from fr.cea.cnrgh.lbi.contatester.manifest import Manifest, manifest_file
+
+
+def make_manifest(tmpdir, parameters=None, cache=None) -> Manifest:
+    return Manifest(manifest_file(str(tmpdir.join('sample.hist'))), 'abcalc', parameters or {'threshold': 4},
+                    [str(tmpdir.join('sample.vcf'))], [str(tmpdir.join('sample.hist'))], cache)
+
+
+def test_manifest(tmpdir) -> None:
+    tmpdir.join('sample.vcf').write('vcf\n')
+    tmpdir.join('sample.hist').write('hist\n')
+    manifest = make_manifest(tmpdir, cache=FingerprintCache(str(tmpdir.join('cache'))))
+    assert not manifest.is_valid()
+    manifest.write()
+    assert manifest.is_valid()
+    assert not make_manifest(tmpdir, {'threshold': 5}).is_valid()
+    # touched but not modified
+    vcf_stat = stat(str(tmpdir.join('sample.vcf')))
+    utime(str(tmpdir.join('sample.vcf')), ns=(vcf_stat.st_atime_ns, vcf_stat.st_mtime_ns + 10 ** 9))
+    assert manifest.is_valid()
+    tmpdir.join('sample.vcf').write('VCF\n')
+    assert not manifest.is_valid()
+    manifest.write()
+    tmpdir.join('sample.hist').remove()
+    assert not manifest.is_valid()
+
+
+def test_manifest_without_cache(tmpdir, mocker) -> None:
+    tmpdir.join('sample.vcf').write('vcf\n')
+    tmpdir.join('sample.hist').write('hist\n')
+    checksum = mocker.patch('fr.cea.cnrgh.lbi.contatester.manifest.file_checksum')
+    manifest = make_manifest(tmpdir)
+    manifest.write()
+    manifest.write()
+    assert manifest.is_valid() and not checksum.called
+    # touched: without checksum, the outputs are computed again
+    vcf_stat = stat(str(tmpdir.join('sample.vcf')))
+    utime(str(tmpdir.join('sample.vcf')), ns=(vcf_stat.st_atime_ns, vcf_stat.st_mtime_ns + 10 ** 9))
+    assert not manifest.is_valid()
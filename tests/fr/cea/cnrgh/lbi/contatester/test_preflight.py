@@ -0,0 +1,108 @@
+import gzip
+import os
+import pytest
+from fr.cea.cnrgh.lbi.contatester.preflight import check_vcf, header_reference, is_bgzf, main, preflight
+from fr.cea.cnrgh.lbi.contatester.synthetic import simulate_cohort
+from fr.cea.cnrgh.lbi.contatester.tabix import has_index, index_path, read_index
+
+HEADER = ('##fileformat=VCFv4.2\n'
+          '##contig=<ID=1,length={}>\n'
+          '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT{}\n')
+
+
+def write_plain_vcf(path, samples=('S1',), fmt='GT:AD', value='0/1:10,5', chr1_length=249250621,
+                    compress=False) -> str:
+    content = HEADER.format(chr1_length, ''.join('\t' + sample for sample in samples))
+    content += ''.join('1\t{}\t.\tA\tG\t50\tPASS\t.\t{}{}\n'.format(100 + i, fmt, ''.join('\t' + value for _ in samples))
+                       for i in range(3))
+    opener = gzip.open if compress else open
+    with opener(str(path), 'wt') as vcf_f:
+        vcf_f.write(content)
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def vcfs(tmpdir_factory):
+    return simulate_cohort(str(tmpdir_factory.mktemp('preflight')), 3, 5000, 30, 'WG', seed=4)
+
+
+def test_check_vcf(vcfs) -> None:
+    check = check_vcf(vcfs[0], index=True)
+    assert check.errors == [] and check.reference == 'GRCh37' and check.chr_prefix
+    # the index is up to date
+    assert not check.indexed and is_bgzf(vcfs[0])
+
+
+@pytest.mark.parametrize('kwargs, require_index, expected', (
+    ({'samples': ('S1', 'S2')}, False, 'has 2 samples, a single sample is expected (see contatester joint)'),
+    ({'samples': ()}, False, 'has 0 samples, a single sample is expected (see contatester joint)'),
+    ({'fmt': 'GT:DP', 'value': '0/1:15'}, False, 'has no AD field in FORMAT of its first records'),
+    ({}, True, 'is not bgzipped, it cannot be indexed'),
+    ({'compress': True}, True, 'is not bgzipped, it cannot be indexed')))
+def test_check_vcf_errors(tmpdir, kwargs, require_index: bool, expected: str) -> None:
+    vcf = write_plain_vcf(tmpdir.join('sample.vcf'), **kwargs)
+    assert check_vcf(vcf, require_index=require_index).errors == [expected]
+
+
+def test_check_vcf_unreadable(tmpdir) -> None:
+    assert check_vcf(str(tmpdir.join('missing.vcf.gz'))).errors == ['is not a readable file']
+    tmpdir.join('empty.vcf').write('')
+    assert check_vcf(str(tmpdir.join('empty.vcf'))).errors == ['has no VCF header']
+    tmpdir.join('truncated.vcf.gz').write_binary(b'\x1f\x8b\x08\x04' + b'\x00' * 10)
+    assert check_vcf(str(tmpdir.join('truncated.vcf.gz'))).errors[0].startswith('cannot be read')
+
+
+@pytest.mark.parametrize('line, expected', (
+    (b'##contig=<ID=chr1,length=248956422>\n', 'GRCh38'),
+    (b'##contig=<ID=1,length=249250621,assembly=b37>\n', 'GRCh37'),
+    (b'##reference=file:///ref/hs37d5.fa\n', 'GRCh37'),
+    (b'##reference=file:///ref/Homo_sapiens_assembly38.fasta\n', None),
+    (b'##contig=<ID=chr10,length=248956422>\n', None)))
+def test_header_reference(line: bytes, expected) -> None:
+    assert header_reference([b'##fileformat=VCFv4.2\n', line]) == expected
+
+
+def test_preflight_builds_indexes(vcfs) -> None:
+    for vcf in vcfs:
+        expected = read_index(index_path(vcf))
+        os.remove(index_path(vcf))
+    assert preflight(vcfs, index=True, workers=2) == []
+    assert all(has_index(vcf) for vcf in vcfs)
+    assert read_index(index_path(vcfs[-1])).names == expected.names
+
+
+def test_preflight_dry_run(vcfs) -> None:
+    os.remove(index_path(vcfs[0]))
+    unindexed = []
+    assert preflight(vcfs, index=True, workers=2, dry_run=True, unindexed=unindexed) == []
+    assert unindexed == [vcfs[0]] and not has_index(vcfs[0])
+    assert preflight(vcfs, index=True) == [] and has_index(vcfs[0])
+
+
+def test_preflight_regions(vcfs, tmpdir) -> None:
+    bed = tmpdir.join('regions.bed')
+    bed.write('1\t10\t20\n')
+    missing = str(tmpdir.join('missing.bed'))
+    assert preflight(vcfs, regions=[str(bed), missing]) == ['{}: is not a readable file'.format(missing)]
+
+
+def test_preflight_cohort(vcfs, tmpdir) -> None:
+    grch38 = write_plain_vcf(tmpdir.join('grch38.vcf'), chr1_length=248956422)
+    duplicate = tmpdir.mkdir('other').join(os.path.basename(vcfs[0]))
+    duplicate.write_binary(open(vcfs[0], 'rb').read())
+    assert preflight(vcfs + [grch38, str(duplicate)], workers=2) == [
+        '{}: same sample name sample0000 as {}'.format(duplicate, vcfs[0]),
+        'VCF of references GRCh37, GRCh38 are mixed',
+        'chromosomes are named with and without chr prefix']
+    assert preflight([grch38], reference='GRCh37') == [
+        '{}: reference GRCh38 while exclusion regions are GRCh37'.format(grch38)]
+
+
+def test_main(vcfs, tmpdir, capsys) -> None:
+    vcf_list = tmpdir.join('vcfs.txt')
+    vcf_list.write(''.join(vcf + '\n' for vcf in vcfs))
+    assert main(['-l', str(vcf_list), '--require-index', '-t', '1']) == 0
+    assert capsys.readouterr().out == '3 VCF ready\n'
+    vcf_list.write(str(tmpdir.join('missing.vcf.gz')) + '\n', mode='a')
+    assert main(['-l', str(vcf_list)]) == 1
+    assert capsys.readouterr().err == '{}: is not a readable file\n'.format(tmpdir.join('missing.vcf.gz'))
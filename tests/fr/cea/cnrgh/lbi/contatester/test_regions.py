@@ -0,0 +1,53 @@
+import os
+import pytest
+from fr.cea.cnrgh.lbi.contatester.regions import Regions, compile_bed, is_compiled, load_bed, main
+
+BED = 'chr3\t200\t300\nchr3\t49\t151\nchr3\t100\t160\n#comment\nchr1\t10\t20\nchr1\t30\t40\n'
+QUERIES = ((b'chr3', 49, False), (b'chr3', 50, True), (b'chr3', 160, True), (b'chr3', 161, False),
+           (b'chr3', 210, True), (b'chr3', 300, True), (b'chr3', 301, False), (b'chr1', 10, False),
+           (b'chr1', 11, True), (b'chr1', 25, False), (b'chr1', 40, True), (b'chr2', 100, False))
+
+
+def test_contains_any_order() -> None:
+    regions = Regions({b'chr3': [(200, 300), (49, 151), (100, 160)], b'chr1': [(10, 20), (30, 40)]})
+    # lookups reuse the last region found, whatever the order of positions
+    for queries in (QUERIES, tuple(reversed(QUERIES)), QUERIES[::2] + QUERIES[1::2]):
+        assert [regions.contains(chrom, pos) for chrom, pos, _ in queries] == \
+            [expected for _, _, expected in queries]
+
+
+@pytest.mark.parametrize('chrom, beg, end, expected',
+                         ((b'chr3', 0, 1000, [(49, 160), (200, 300)]),
+                          (b'chr3', 100, 250, [(100, 160), (200, 250)]),
+                          (b'chr3', 160, 200, []),
+                          (b'chr1', 15, 35, [(15, 20), (30, 35)]),
+                          (b'chr2', 0, 1000, [])))
+def test_intervals(chrom: bytes, beg: int, end: int, expected) -> None:
+    regions = Regions({b'chr3': [(200, 300), (49, 151), (100, 160)], b'chr1': [(10, 20), (30, 40)]})
+    assert regions.intervals(chrom, beg, end) == expected
+
+
+def test_compile_bed(tmpdir) -> None:
+    bed_file = str(tmpdir.join('excluded.bed'))
+    tmpdir.join('excluded.bed').write(BED)
+    assert not is_compiled(bed_file + '.regions', bed_file)
+    assert compile_bed(bed_file) == bed_file + '.regions'
+    assert is_compiled(bed_file + '.regions', bed_file)
+    regions = load_bed(bed_file)
+    assert regions.starts.tolist() == [10, 30, 49, 200] and regions.ends.tolist() == [20, 40, 160, 300]
+    assert [regions.contains(chrom, pos) for chrom, pos, _ in QUERIES] == [expected for _, _, expected in QUERIES]
+    # a modified BED is read again until it is compiled again
+    tmpdir.join('excluded.bed').write(BED + 'chr2\t99\t100\n')
+    os.utime(bed_file, ns=(0, 0))
+    assert not is_compiled(bed_file + '.regions', bed_file)
+    assert load_bed(bed_file).contains(b'chr2', 100)
+    assert not Regions.load(bed_file + '.regions').contains(b'chr2', 100)
+
+
+def test_main(tmpdir, capsys) -> None:
+    tmpdir.join('excluded.bed').write(BED)
+    out_dir = str(tmpdir.join('indexes'))
+    assert main([str(tmpdir.join('excluded.bed')), '-o', out_dir]) == 0
+    assert capsys.readouterr().out == out_dir + '/excluded.bed.regions\n'
+    regions = load_bed(str(tmpdir.join('excluded.bed')), out_dir + '/excluded.bed.regions')
+    assert regions.contains(b'chr3', 250)
@@ -0,0 +1,51 @@
+from pkg_resources import resource_filename
+import shutil
+import numpy as np
+import pytest
+from fr.cea.cnrgh.lbi.contatester.panels import load_panel
+from fr.cea.cnrgh.lbi.contatester.report import estimates_rows, load_samples, source_matrix, main
+
+pytest.importorskip('matplotlib')
+
+
+def make_cohort(tmpdir, nb_sample: int):
+    hist = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'estimation_sample.hist')
+    vcfs = []
+    for i in range(nb_sample):
+        shutil.copy(hist, str(tmpdir.join('sample{}.hist'.format(i))))
+        tmpdir.join('sample{}.meandepth'.format(i)).write('30.4\n')
+        vcfs.append('/data/sample{}.vcf.gz'.format(i))
+    vcf_list = tmpdir.join('vcfs.txt')
+    vcf_list.write(''.join(vcf + '\n' for vcf in vcfs))
+    return vcfs, str(vcf_list)
+
+
+def test_estimates_rows(tmpdir) -> None:
+    vcfs, _ = make_cohort(tmpdir, 2)
+    samples = load_samples(vcfs, str(tmpdir))
+    # same values as the .conta file of the sample
+    assert estimates_rows(samples, 4)[1] == ['sample1', '30', 'WG30x', '0.809', '0.986', '14.71',
+                                             '15% < x < 50% (15.85%)', '16.98%', 'TRUE']
+    assert estimates_rows(samples, 20)[0][-1] == 'FALSE'
+    assert samples[0].estimation.correlations.shape == load_panel('WG', 30).xconta.shape
+
+
+def test_source_matrix(tmpdir) -> None:
+    vcfs, _ = make_cohort(tmpdir, 3)
+    tmpdir.join('sample1_comparisonSummary.txt').write('vcfContaName,vcfComparName,nbSNPConta,nbMatch,ratio\n'
+                                                       'conta.vcf.gz,sample0.vcf.gz,2,1,.500\n'
+                                                       'conta.vcf.gz,sample2.vcf.gz,2,0,0\n')
+    names, matrix = source_matrix(load_samples(vcfs, str(tmpdir)), str(tmpdir))
+    assert names == ['sample1']
+    assert np.array_equal(matrix, np.array([[0.5, np.nan, 0.0]]), equal_nan=True)
+
+
+@pytest.mark.parametrize('options, expected_files',
+                         (([], ['cohort_report.pdf']),
+                          (['--sample-pdf', '-t', '2'], ['cohort_report.pdf', 'sample0.pdf', 'sample1.pdf'])))
+def test_main(tmpdir, options, expected_files) -> None:
+    _, vcf_list = make_cohort(tmpdir, 2)
+    assert main(['-l', vcf_list, '-o', str(tmpdir)] + options) == 0
+    for expected_file in expected_files:
+        assert tmpdir.join(expected_file).read_binary().startswith(b'%PDF')
+    assert tmpdir.join('sample0.pdf').check() == ('--sample-pdf' in options)
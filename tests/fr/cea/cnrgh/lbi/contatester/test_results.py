@@ -0,0 +1,65 @@
+from pkg_resources import resource_filename
+import json
+import shutil
+import sqlite3
+from fr.cea.cnrgh.lbi.contatester import estimation
+from fr.cea.cnrgh.lbi.contatester.results import collect_results, main, open_results, top_sources
+
+SUMMARY_HEADER = 'vcfContaName,vcfComparName,nbSNPConta,nbMatch,ratio\n'
+
+
+def write_cohort(tmpdir) -> str:
+    hist = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'estimation_sample.hist')
+    out_dir = str(tmpdir)
+    for name in ('s1', 's2'):
+        shutil.copyfile(hist, out_dir + '/' + name + '.hist')
+        tmpdir.join(name + '.meandepth').write('29.6\n')
+    # s3 is not estimated yet
+    tmpdir.join('estimated.list').write('/data/s1.vcf.gz\n/data/s2.vcf.gz\n')
+    assert estimation.main(['-l', out_dir + '/estimated.list', '--outdir', out_dir]) == 0
+    tmpdir.join('cohort.list').write('/data/s1.vcf.gz\n/data/s2.vcf.gz\n/data/s3.vcf.gz\n')
+    tmpdir.join('s1_comparisonSummary.txt').write(SUMMARY_HEADER +
+                                                  's1_AB.vcf.gz,s2.vcf.gz,10,5,.500\n'
+                                                  's1_AB.vcf.gz,s3.vcf.gz,10,9,.900\n')
+    tmpdir.join('s2_comparisonSummary.txt').write(SUMMARY_HEADER +
+                                                  's2_AB.vcf.gz,s1.vcf.gz,10,1,.100\n'
+                                                  's2_AB.vcf.gz,s3.vcf.gz,0,0,NaN\n')
+    return out_dir
+
+
+def test_estimation_record(tmpdir) -> None:
+    out_dir = write_cohort(tmpdir)
+    with open(out_dir + '/s1.conta.json') as record_f:
+        record = json.load(record_f)
+    assert record['sample'] == 's1' and record['contaminated'] is True
+    assert (record['depth'], record['dataset_depth'], record['res_poly']) == (29, 30, 16.98)
+
+
+def test_collect_results(tmpdir) -> None:
+    out_dir = write_cohort(tmpdir)
+    vcfs = ['/data/s1.vcf.gz', '/data/s2.vcf.gz', '/data/s3.vcf.gz']
+    assert collect_results(vcfs, out_dir) == (3, 4)
+    connection = sqlite3.connect(out_dir + '/contatester.sqlite')
+    assert connection.execute('SELECT sample, mean_depth, res_poly, contaminated FROM samples ORDER BY sample')\
+        .fetchall() == [('s1', 29.6, 16.98, 1), ('s2', 29.6, 16.98, 1), ('s3', None, None, None)]
+    assert connection.execute("SELECT SUM(count) FROM histograms WHERE sample = 's1'").fetchone()[0] > 0
+    assert top_sources(connection) == [('s1', 16.98, 's3', 10, 9, .9), ('s2', 16.98, 's1', 10, 1, .1)]
+    assert [row[2] for row in top_sources(connection, 2)] == ['s3', 's2', 's1']
+    connection.close()
+    # collected again, the rows of a sample are replaced
+    tmpdir.join('s1_comparisonSummary.txt').write(SUMMARY_HEADER + 's1_AB.vcf.gz,s2.vcf.gz,10,2,.200\n')
+    assert collect_results(vcfs[:1], out_dir) == (1, 1)
+    connection = open_results(out_dir + '/contatester.sqlite')
+    assert connection.execute('SELECT COUNT(*) FROM samples').fetchone()[0] == 3
+    assert top_sources(connection) == [('s1', 16.98, 's2', 10, 2, .2), ('s2', 16.98, 's1', 10, 1, .1)]
+    connection.close()
+
+
+def test_main(tmpdir, capsys) -> None:
+    out_dir = write_cohort(tmpdir)
+    assert main(['-l', out_dir + '/cohort.list', '-o', out_dir, '--database', out_dir + '/project.sqlite',
+                 '--top', '1']) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        '3 sample(s) and 4 comparison(s) collected into ' + out_dir + '/project.sqlite',
+        's1\t16.98%\ts3\t10\t9\t0.900',
+        's2\t16.98%\ts1\t10\t1\t0.100']
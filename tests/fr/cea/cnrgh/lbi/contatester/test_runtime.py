@@ -0,0 +1,104 @@
+import json
+import pytest
+from fr.cea.cnrgh.lbi.contatester import allelic_balance
+from fr.cea.cnrgh.lbi.contatester.runtime import DEFAULT_SAMPLE_DURATION, MAX_DURATION, RuntimeModel, count_batches, \
+    load_models, makespan, partition, plan_batch, sample_durations
+from pkg_resources import resource_filename
+
+
+def write_history(history: str, runs) -> None:
+    with open(history, 'w') as history_f:
+        for stage, size, cores, seconds in runs:
+            history_f.write(json.dumps({'stage': stage, 'size': size, 'cores': cores, 'seconds': seconds}) + '\n')
+        history_f.write('not a record\n')
+
+
+def test_load_models(runtime_history) -> None:
+    write_history(runtime_history, [('abcalc', 1000, 2, 60), ('abcalc', 3000, 2, 160), ('abcalc', 2000, 4, 55),
+                                    ('estimate', 1, 1, 2), ('estimate', 1, 1, 4)])
+    models = load_models()
+    assert models['abcalc'].slope == pytest.approx(0.1)
+    assert models['abcalc'].intercept == pytest.approx(20)
+    assert models['abcalc'].predict(10000, 4) == pytest.approx(255)
+    # no spread of the input size: mean duration
+    assert (models['estimate'].intercept, models['estimate'].slope) == (3, 0)
+    assert 'compare' not in models
+
+
+def test_record_runtime(tmpdir, runtime_history) -> None:
+    vcf = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    assert allelic_balance.main(['-f', vcf, '-o', str(tmpdir.join('s.hist')), '-d', str(tmpdir.join('s.depth'))]) == 0
+    # outputs up to date: nothing run, nothing recorded
+    assert allelic_balance.main(['-f', vcf, '-o', str(tmpdir.join('s.hist')), '-d', str(tmpdir.join('s.depth'))]) == 0
+    model = load_models()['abcalc']
+    assert model.nb_run == 1
+
+
+def test_record_runtime_cache(tmpdir, runtime_history) -> None:
+    vcf = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    cache = ['--cache-dir', str(tmpdir.join('cache'))]
+    for name in ('a', 'b'):
+        assert allelic_balance.main(['-f', vcf, '-o', str(tmpdir.join(name + '.hist')),
+                                     '-d', str(tmpdir.join(name + '.depth')), '-t', '4'] + cache) == 0
+    runs = [json.loads(line) for line in open(runtime_history)]
+    # the second run reads the cache, the VCF without index is read serially
+    assert len(runs) == 1 and runs[0]['cores'] == 1
+
+
+@pytest.mark.parametrize('durations, nb_task, expected',
+                         (([5, 4, 3, 3, 3], 1, 18),
+                          ([5, 4, 3, 3, 3], 2, 10),
+                          ([5, 4, 3, 3, 3], 5, 5)))
+def test_makespan(durations, nb_task, expected) -> None:
+    assert makespan(durations, nb_task) == expected
+
+
+def test_plan_batch(tmpdir) -> None:
+    vcfs = []
+    for i, size in enumerate([4000, 1000, 1000, 1000, 1000]):
+        tmpdir.join('s{}.vcf'.format(i)).write('x' * size)
+        vcfs.append(str(tmpdir.join('s{}.vcf'.format(i))))
+    models = {'abcalc': RuntimeModel(0, 0.1, 10)}
+    assert plan_batch(vcfs, 2, False, False, {}) is None
+    plan = plan_batch(vcfs, 2, False, False, models)
+    # the largest VCF lasts as long as the four others on one task
+    assert (plan.nb_task, plan.nb_core, plan.predicted) == (2, 2, 200)
+    assert plan.duration == 600
+    assert plan.core_hours() == pytest.approx(4 * 200 / 3600)
+    # comparison predicted from abcalc, report from estimate
+    plan = plan_batch(vcfs, 2, True, True, dict(models, estimate=RuntimeModel(1, 0)))
+    assert plan.predicted == pytest.approx(4 * (50 + 1) + 400 + 1)
+    plan = plan_batch(vcfs, 1, False, False, {'abcalc': RuntimeModel(100000, 0)})
+    assert plan.duration == MAX_DURATION
+    assert 'exceeds' in plan.summary()
+
+
+@pytest.mark.parametrize('durations, nb_batch, expected',
+                         (([5, 4, 3, 3, 3], 1, [[0, 1, 2, 3, 4]]),
+                          ([5, 4, 3, 3, 3], 2, [[0, 3], [1, 2, 4]]),
+                          ([5, 4], 3, [[0], [1]])))
+def test_partition(durations, nb_batch, expected) -> None:
+    assert partition(durations, nb_batch) == expected
+
+
+@pytest.mark.parametrize('durations, walltime, max_tasks, expected',
+                         (([100] * 10, 1000, 2, 2),
+                          ([100] * 10, 500, 2, 5),
+                          ([100] * 10, 100000, 2, 1),
+                          ([1000, 10, 10], 600, 48, 1),
+                          ([1000, 900, 10], 600, 1, 2),
+                          ([], 1000, 48, 1)))
+def test_count_batches(durations, walltime, max_tasks, expected) -> None:
+    # a batch lasts (walltime - 300) / 1.5 at most
+    assert count_batches(durations, walltime, max_tasks) == expected
+
+
+def test_sample_durations(tmpdir) -> None:
+    vcfs = []
+    for i, size in enumerate([4000, 1000, 2000]):
+        tmpdir.join('s{}.vcf'.format(i)).write('x' * size)
+        vcfs.append(str(tmpdir.join('s{}.vcf'.format(i))))
+    # proportional to the size when abcalc never ran
+    assert sample_durations(vcfs, 2, {}) == [2 * DEFAULT_SAMPLE_DURATION, DEFAULT_SAMPLE_DURATION / 2,
+                                             DEFAULT_SAMPLE_DURATION]
+    assert sample_durations(vcfs, 2, {'abcalc': RuntimeModel(0, 0.1, 10)}) == [200, 50, 100]
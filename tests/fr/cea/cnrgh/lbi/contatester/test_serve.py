@@ -0,0 +1,144 @@
+from concurrent.futures.process import BrokenProcessPool
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+import pytest
+from fr.cea.cnrgh.lbi.contatester import allelic_balance, estimation
+from fr.cea.cnrgh.lbi.contatester.serve import Service, make_server
+from fr.cea.cnrgh.lbi.contatester.synthetic import simulate_cohort
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path: str) -> None:
+        super().__init__('localhost')
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def request(socket_path: str, method: str, path: str, body=None):
+    connection = UnixHTTPConnection(socket_path)
+    try:
+        connection.request(method, path, body=None if body is None else json.dumps(body))
+        response = connection.getresponse()
+        content = response.read().decode()
+        if response.getheader('Content-Type') == 'application/json':
+            content = json.loads(content)
+        return response.status, content
+    finally:
+        connection.close()
+
+
+def wait_job(socket_path: str, job_id: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while True:
+        code, job = request(socket_path, 'GET', '/samples/' + job_id)
+        if job['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+@pytest.fixture(scope='module')
+def vcfs(tmpdir_factory):
+    return simulate_cohort(str(tmpdir_factory.mktemp('serve')), 2, 20000, 30, 'WG', seed=2)
+
+
+@pytest.fixture
+def service(tmpdir):
+    service = Service(str(tmpdir.join('results')), workers=2)
+    yield service
+    service.shutdown()
+
+
+@pytest.fixture
+def server(service, tmpdir):
+    socket_path = str(tmpdir.join('contatester.sock'))
+    server = make_server(service, socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_serve_samples(server, vcfs, tmpdir) -> None:
+    assert request(server, 'GET', '/status')[1]['jobs'] == {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+    jobs = []
+    for vcf in vcfs:
+        code, job = request(server, 'POST', '/samples', {'vcf': vcf, 'threshold': 3})
+        assert code == 202 and job['status'] in ('queued', 'running', 'done')
+        jobs.append(job['id'])
+    for job_id, vcf in zip(jobs, vcfs):
+        job = wait_job(server, job_id)
+        assert job['status'] == 'done'
+        assert job['estimation']['threshold'] == 3
+        # same results as the stages of the workflow
+        name = vcf.split('/')[-1].split('.vcf')[0]
+        hist, depth = str(tmpdir.join(name + '.hist')), str(tmpdir.join(name + '.meandepth'))
+        conta = str(tmpdir.join(name + '.conta'))
+        assert allelic_balance.main(['-f', vcf, '-o', hist, '-d', depth]) == 0
+        assert estimation.main(['--input', hist, '--output', conta, '-t', '3', '--depth-file', depth]) == 0
+        code, content = request(server, 'GET', '/samples/{}/conta'.format(job_id))
+        assert code == 200 and content == tmpdir.join(name + '.conta').read()
+    assert request(server, 'GET', '/status')[1]['jobs']['done'] == 2
+    assert [job['id'] for job in request(server, 'GET', '/samples')[1]] == jobs
+
+
+@pytest.mark.parametrize('method, path, body, expected', (
+    ('POST', '/samples', {'vcf': 'missing.vcf.gz'}, 400),
+    ('POST', '/samples', {'vcf': None, 'experiment': 'XX'}, 400),
+    ('POST', '/samples', [], 400),
+    ('POST', '/samples', {'vcf': __file__, 'threshold': '4x'}, 400),
+    ('POST', '/samples', {'vcf': __file__, 'threshold': [4]}, 400),
+    ('POST', '/samples', {'vcf': __file__, 'outdir': 42}, 400),
+    ('POST', '/samples', {'vcf': __file__, 'check': 'yes'}, 400),
+    ('POST', '/samples', {'vcf': __file__, 'experiment': 'EX', 'targets': 1}, 400),
+    ('POST', '/jobs', {}, 404),
+    ('GET', '/samples/42', None, 404),
+    ('GET', '/unknown', None, 404)))
+def test_serve_errors(server, method: str, path: str, body, expected: int) -> None:
+    code, content = request(server, method, path, body)
+    assert code == expected and 'error' in content
+
+
+def test_serve_failed(server, tmpdir) -> None:
+    empty = tmpdir.join('empty.vcf')
+    empty.write('##fileformat=VCFv4.2\n')
+    code, job = request(server, 'POST', '/samples', {'vcf': str(empty)})
+    job = wait_job(server, job['id'])
+    assert job['status'] == 'failed' and job['error'] == 'stage exited with status 1'
+    assert request(server, 'GET', '/samples/{}/conta'.format(job['id']))[0] == 409
+
+
+def test_serve_broken_pool(server, service, tmpdir) -> None:
+    empty = tmpdir.join('empty.vcf')
+    empty.write('##fileformat=VCFv4.2\n')
+    # a worker killed as by the OOM killer breaks the pool
+    with pytest.raises(BrokenProcessPool):
+        service.pool.submit(os._exit, 1).result()
+    code, content = request(server, 'POST', '/samples', {'vcf': str(empty)})
+    assert code == 500 and 'error' in content
+    # the workers were started again
+    code, job = request(server, 'POST', '/samples', {'vcf': str(empty)})
+    assert code == 202 and wait_job(server, job['id'])['error'] == 'stage exited with status 1'
+
+
+def test_forget_finished(service, tmpdir) -> None:
+    service.max_finished = 2
+    jobs = []
+    for i in range(4):
+        empty = tmpdir.join('empty{}.vcf'.format(i))
+        empty.write('##fileformat=VCFv4.2\n')
+        jobs.append(service.submit({'vcf': str(empty)}))
+        jobs[-1].future.result()
+    assert [job.job_id for job in jobs] == ['1', '2', '3', '4']
+    # finished jobs beyond the cap are forgotten at the next submission,
+    # identifiers are not reused
+    assert sorted(service.jobs) == ['2', '3', '4']
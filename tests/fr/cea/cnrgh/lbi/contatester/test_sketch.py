@@ -0,0 +1,120 @@
+import shutil
+import numpy as np
+import pytest
+from fr.cea.cnrgh.lbi.contatester import allelic_balance, comparison, estimation
+from fr.cea.cnrgh.lbi.contatester.outputs import candidates_file, summary_file
+from fr.cea.cnrgh.lbi.contatester.sketch import SketchIndex, add_samples, main, search_sources, sketch_sites, \
+    source_vcfs
+from fr.cea.cnrgh.lbi.contatester.synthetic import simulate_cohort
+
+SCALE = 10
+
+
+def sites(*positions):
+    return {b'chr1': np.array(positions, dtype=np.uint32)}
+
+
+def test_sketch_sites() -> None:
+    all_sites = sites(*range(1, 20001))
+    sketch = sketch_sites(all_sites, SCALE)
+    assert 1500 < len(sketch) < 2500 and (np.diff(sketch.astype(np.float64)) > 0).all()
+    # a site is kept by all sketches or by none
+    subset = sketch_sites(sites(*range(1, 20001, 2)), SCALE)
+    assert np.isin(subset, sketch).all() and 750 < len(subset) < 1250
+    assert len(sketch_sites(all_sites, 1)) == 20000
+    assert not np.array_equal(sketch, sketch_sites(all_sites, SCALE, seed=1))
+    assert not np.array_equal(sketch, sketch_sites({b'chr2': all_sites[b'chr1']}, SCALE))
+
+
+def test_index_update(tmpdir) -> None:
+    index = SketchIndex(1)
+    index.update([('a.vcf', 1, -1, sketch_sites(sites(1, 2, 3), 1), sketch_sites(sites(), 1)),
+                  ('b.vcf', 1, 2, sketch_sites(sites(3, 4), 1), sketch_sites(sites(2, 3), 1))])
+    index.update([('a.vcf', 5, -1, sketch_sites(sites(2, 3, 4, 5), 1), sketch_sites(sites(), 1)),
+                  ('c.vcf', 1, -1, sketch_sites(sites(9), 1), sketch_sites(sites(), 1))])
+    index.save(str(tmpdir.join('index')))
+    loaded = SketchIndex.load(str(tmpdir.join('index')))
+    assert loaded.vcfs == ['b.vcf', 'a.vcf', 'c.vcf'] and loaded.scale == 1
+    assert loaded.arrays['mtimes'].tolist() == [1, 5, 1]
+    assert loaded.arrays['sizes'].tolist() == [2, 4, 1]
+    assert loaded.candidate_sketch('a.vcf') is None
+    assert np.array_equal(loaded.candidate_sketch('b.vcf'), sketch_sites(sites(2, 3), 1))
+    query = sketch_sites(sites(2, 3, 4, 7), 1)
+    assert loaded.query(query) == [('a.vcf', 3, 0.75), ('b.vcf', 2, 0.5)]
+    assert loaded.query(query, top=1) == [('a.vcf', 3, 0.75)]
+    assert loaded.query(query, exclude='a') == [('b.vcf', 2, 0.5)]
+    assert loaded.query(sketch_sites(sites(), 1)) == []
+
+
+@pytest.fixture(scope='module')
+def cohort(tmpdir_factory):
+    out_dir = tmpdir_factory.mktemp('sketch')
+    vcfs = simulate_cohort(str(out_dir.join('cohort')), 8, 20000, 30, 'WG', [(5, 2, 0.3)], seed=5)
+    for vcf in vcfs:
+        name = vcf.split('/')[-1].split('.vcf')[0]
+        assert allelic_balance.main(['-f', vcf, '-o', str(out_dir.join(name + '.hist')),
+                                     '-d', str(out_dir.join(name + '.meandepth')),
+                                     '-g', str(out_dir.join('cohort', 'excluded.bed')),
+                                     '-c', candidates_file(str(out_dir), name)]) == 0
+    out_dir.join('vcfs.txt').write(''.join(vcf + '\n' for vcf in vcfs))
+    assert estimation.main(['-l', str(out_dir.join('vcfs.txt')), '--outdir', str(out_dir)]) == 0
+    return vcfs, out_dir
+
+
+def test_search_sources(cohort, tmpdir) -> None:
+    vcfs, out_dir = cohort
+    index_dir = str(tmpdir.join('index'))
+    assert add_samples(index_dir, vcfs, str(out_dir), thread=2, scale=SCALE) == 8
+    # up to date
+    assert add_samples(index_dir, vcfs, str(out_dir)) == 0
+    index = SketchIndex.load(index_dir)
+    sources = search_sources(index, vcfs[5], str(out_dir), top=3)
+    assert [vcf for vcf, _, _ in sources][0] == vcfs[2] and len(sources) == 3
+    assert vcfs[5] not in [vcf for vcf, _, _ in sources]
+    assert sources[0][2] > sources[1][2] + 0.1
+    assert main(['-i', index_dir, '-q', vcfs[5], '--top', '2']) == 0
+
+
+def test_compare_sketch_index(cohort, tmpdir) -> None:
+    vcfs, out_dir = cohort
+    vcf_list = str(out_dir.join('vcfs.txt'))
+    assert comparison.main(['-l', vcf_list, '-o', str(out_dir)]) == 0
+    full = out_dir.join('sample0005_comparisonSummary.txt').readlines()
+    index_dir = str(tmpdir.join('index'))
+    # a previous cohort, sketched with a scale fitting the small simulation
+    assert add_samples(index_dir, vcfs[:4], str(out_dir), scale=SCALE) == 4
+    assert comparison.main(['-l', vcf_list, '-o', str(out_dir), '--sketch-index', index_dir,
+                            '--top', '2']) == 0
+    assert SketchIndex.load(index_dir).vcfs == vcfs
+    rows = out_dir.join('sample0005_comparisonSummary.txt').readlines()
+    # only the most likely sources are compared, as exactly as before
+    assert rows[0] == full[0] and len(rows) == 3
+    assert set(rows[1:]) < set(full[1:])
+    assert any(',sample0002.vcf.gz,' in row for row in rows[1:])
+    assert summary_file(str(out_dir), 'sample0005').endswith('sample0005_comparisonSummary.txt')
+
+
+def test_compare_moved_sources(cohort, tmpdir) -> None:
+    vcfs, out_dir = cohort
+    vcf_list = str(out_dir.join('vcfs.txt'))
+    assert comparison.main(['-l', vcf_list, '-o', str(out_dir)]) == 0
+    full = out_dir.join('sample0005_comparisonSummary.txt').readlines()
+    # samples of another project, indexed first, then moved away
+    moved = []
+    for vcf in vcfs[:4]:
+        moved.append(str(tmpdir.mkdir(str(len(moved))).join(vcf.split('/')[-1])))
+        shutil.copyfile(vcf, moved[-1])
+    index_dir = str(tmpdir.join('index'))
+    assert add_samples(index_dir, moved, str(out_dir), scale=SCALE) == 4
+    assert add_samples(str(tmpdir.join('moved')), moved[2:3], str(out_dir), scale=SCALE) == 1
+    for vcf in moved:
+        tmpdir.join(vcf.split('/')[-2]).remove()
+    index = SketchIndex.load(index_dir)
+    assert not index.has_current_vcf(moved[2]) and search_sources(index, vcfs[5], str(out_dir), top=1)[0][0] == moved[2]
+    assert comparison.main(['-l', vcf_list, '-o', str(out_dir), '--sketch-index', index_dir,
+                            '--top', '2']) == 0
+    rows = out_dir.join('sample0005_comparisonSummary.txt').readlines()
+    assert len(rows) == 3 and set(rows[1:]) < set(full[1:])
+    assert any(',sample0002.vcf.gz,' in row for row in rows[1:])
+    # no source left to read: compared with the whole cohort
+    assert source_vcfs(SketchIndex.load(str(tmpdir.join('moved'))), str(out_dir), 2, vcfs[5]) is None
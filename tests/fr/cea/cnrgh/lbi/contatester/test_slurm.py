@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import fr.cea.cnrgh.lbi.contatester as contatester
+from fr.cea.cnrgh.lbi.contatester import slurm
+from fr.cea.cnrgh.lbi.contatester.__main__ import write_batch_file, write_dag_file
+from fr.cea.cnrgh.lbi.contatester.outputs import conta_file
+from fr.cea.cnrgh.lbi.contatester.results import results_file
+from fr.cea.cnrgh.lbi.contatester.synthetic import simulate_cohort
+
+TASK_FMT = 'TASK {id} -c {core} bash -c '
+
+# Runs a job when it is submitted, as a SLURM cluster with a single node
+# would: array tasks one after the other, and only if the tasks they depend
+# on succeeded
+SBATCH = '''#!{python}
+import json, os, subprocess, sys
+state_file = os.path.join({state!r}, 'jobs.json')
+state = json.load(open(state_file)) if os.path.isfile(state_file) else {{}}
+args = sys.argv[1:]
+assert args[0] == '--parsable', args
+dependencies = [arg.split('=', 1)[1] for arg in args if arg.startswith('--dependency=')]
+script = args[-1]
+options = dict(line[len('#SBATCH --'):].strip().split('=', 1) for line in open(script)
+               if line.startswith('#SBATCH --'))
+indexes = [None]
+if 'array' in options:
+    last, throttle = options['array'][len('0-'):].split('%')
+    assert 0 < int(throttle) <= int(last) + 1
+    indexes = list(range(int(last) + 1))
+statuses = {{}}
+for index in indexes:
+    ready = True
+    for dependency in dependencies:
+        for condition in dependency.split(','):
+            kind, _, ids = condition.partition(':')
+            for job_id in ids.split(':'):
+                parent = state[job_id]['statuses']
+                if kind == 'aftercorr':
+                    ready = ready and parent[str(index)] == 0
+                else:
+                    ready = ready and all(status == 0 for status in parent.values())
+    env = dict(os.environ)
+    if index is not None:
+        env['SLURM_ARRAY_TASK_ID'] = str(index)
+    statuses[str(index)] = subprocess.call(['bash', script], env=env) if ready else -1
+job_id = str(len(state) + 100)
+state[job_id] = {{'script': script, 'options': options, 'dependencies': dependencies,
+                  'statuses': statuses}}
+json.dump(state, open(state_file, 'w'))
+print(job_id + ';cluster')
+'''
+
+CONTATESTER = '''#!/bin/sh
+PYTHONPATH={path} exec {python} -m fr.cea.cnrgh.lbi.contatester "$@"
+'''
+
+
+def write_executable(path, content: str) -> None:
+    path.write(content)
+    path.chmod(0o755)
+
+
+@pytest.fixture
+def cluster(tmpdir, monkeypatch):
+    """sbatch and contatester on PATH, sbatch runs the jobs locally"""
+    bin_dir = tmpdir.mkdir('bin')
+    package_root = os.path.abspath(os.path.join(os.path.dirname(contatester.__file__), *[os.pardir] * 5))
+    write_executable(bin_dir.join('sbatch'), SBATCH.format(python=sys.executable, state=str(tmpdir)))
+    write_executable(bin_dir.join('contatester'), CONTATESTER.format(python=sys.executable, path=package_root))
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
+    return lambda: json.load(open(str(tmpdir.join('jobs.json'))))
+
+
+def test_dag_jobs(tmpdir) -> None:
+    dag_file = str(tmpdir.join('run.dagfile'))
+    vcfs = ['file{}.vcf.gz'.format(i) for i in range(3)]
+    write_dag_file(True, dag_file, str(tmpdir), '--report', TASK_FMT, vcfs, 2, 4, 'WG')
+    jobs = slurm.dag_jobs(dag_file, ['file{}'.format(i) for i in range(3)])
+    assert [job.name for job in jobs] == ['ABCalc', 'Report', 'Compare_all', 'Collect_results', 'Report_cohort']
+    assert [len(job.tasks) for job in jobs] == [3, 3, 1, 1, 1]
+    assert [[(parent.name, corresponding) for parent, corresponding in job.dependencies] for job in jobs] == [
+        [], [('ABCalc', True)], [('Report', False)], [('Compare_all', False)], [('Compare_all', False)]]
+
+
+def test_dag_jobs_split(tmpdir, monkeypatch) -> None:
+    monkeypatch.setattr(slurm, 'ARRAY_LIMIT', 2)
+    dag_file = str(tmpdir.join('run.dagfile'))
+    write_dag_file(False, dag_file, str(tmpdir), '', TASK_FMT, ['file{}.vcf.gz'.format(i) for i in range(3)],
+                   1, 4, 'WG')
+    jobs = slurm.dag_jobs(dag_file, ['file{}'.format(i) for i in range(3)])
+    assert [(job.name, len(job.tasks)) for job in jobs] == [
+        ('ABCalc_0', 2), ('ABCalc_1', 1), ('Report_0', 2), ('Report_1', 1), ('Collect_results', 1)]
+    assert [parent.name for parent, corresponding in jobs[3].dependencies if corresponding] == ['ABCalc_1']
+    assert sorted(parent.name for parent, _ in jobs[4].dependencies) == ['Report_0', 'Report_1']
+
+
+def test_job_script(tmpdir) -> None:
+    dag_file = str(tmpdir.join('run.dagfile'))
+    vcfs = ['file{}.vcf.gz'.format(i) for i in range(5)]
+    write_dag_file(True, dag_file, str(tmpdir), '', TASK_FMT, vcfs, 2, 4, 'WG')
+    submit_file = str(tmpdir.join('run.sbatch'))
+    jobs = slurm.write_slurm_jobs(dag_file, submit_file, str(tmpdir), 3, 900, 'project', 'foo@compagny.com',
+                                  models={})
+    for path in [submit_file] + [job.script for job in jobs]:
+        assert subprocess.call(['bash', '-n', path]) == 0
+    abcalc = open(jobs[0].script).read()
+    assert '#SBATCH --array=0-4%3\n' in abcalc and '#SBATCH --cpus-per-task=2\n' in abcalc
+    assert '#SBATCH --time=15\n' in abcalc and '#SBATCH --account=project\n' in abcalc
+    assert "    4) PMC_TASK=ABCalc_file4 PMC_CPUS=2 bash -c 'contatester abcalc -f file4.vcf.gz " in abcalc
+    assert '--mail-user' not in abcalc and '#SBATCH --mail-user=foo@compagny.com\n' in open(jobs[-1].script).read()
+    submit = open(submit_file).read()
+    assert 'job1=$(sbatch --parsable --dependency=aftercorr:$job0 ' + jobs[1].script + ')\n' in submit
+    assert 'job2=$(sbatch --parsable --dependency=afterok:$job1 ' + jobs[2].script + ')\n' in submit
+
+
+def test_run_jobs(tmpdir, cluster) -> None:
+    vcfs = simulate_cohort(str(tmpdir.join('cohort')), 3, 5000, 30, 'WG', seed=1)
+    out_dir = str(tmpdir.mkdir('out'))
+    dag_file = os.path.join(out_dir, 'run.dagfile')
+    write_dag_file(False, dag_file, out_dir, '', TASK_FMT, vcfs, 2, 4, 'WG')
+    msub_file = dag_file + '.msub'
+    # sbatch is found on PATH, neither /ccc nor /env/cng exist here
+    write_batch_file(dag_file, msub_file, len(vcfs), 2, out_dir)
+    assert subprocess.call(['bash', msub_file]) == 0
+    jobs = cluster()
+    assert [job['options']['job-name'] for job in jobs.values()] == [
+        'contatester_ABCalc', 'contatester_Report', 'contatester_Collect_results']
+    assert [job['dependencies'] for job in jobs.values()] == [[], ['aftercorr:100'], ['afterok:101']]
+    assert all(status == 0 for job in jobs.values() for status in job['statuses'].values())
+    assert all(os.path.isfile(conta_file(out_dir, 'sample000{}'.format(i))) for i in range(3))
+    assert os.path.isfile(results_file(out_dir))
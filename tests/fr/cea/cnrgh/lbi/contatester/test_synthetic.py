@@ -0,0 +1,45 @@
+import gzip
+import numpy as np
+import pytest
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import compute_allele_balance
+from fr.cea.cnrgh.lbi.contatester.synthetic import Population, parse_contamination, sample_reads, simulate_cohort
+from fr.cea.cnrgh.lbi.contatester.tabix import index_path, read_index
+
+
+def records(vcf: str):
+    with gzip.open(vcf, 'rb') as vcf_f:
+        return [line for line in vcf_f if not line.startswith(b'#')]
+
+
+def test_simulate_cohort(tmpdir) -> None:
+    vcfs = simulate_cohort(str(tmpdir.join('a')), 3, 5000, 30, 'WG', [(1, 2, 0.3)], seed=7)
+    again = simulate_cohort(str(tmpdir.join('b')), 2, 5000, 30, 'WG', [], seed=7)
+    # same seed, same files, whatever the other samples
+    assert tmpdir.join('a', 'sample0000.vcf.gz').read_binary() == tmpdir.join('b', 'sample0000.vcf.gz').read_binary()
+    assert 4000 < len(records(vcfs[0])) < 6000
+    assert read_index(index_path(vcfs[0])).names[0] == b'chr1'
+    assert tmpdir.join('a', 'truth.tsv').readlines()[1] == '{}\t{}\t0.3\n'.format(vcfs[1], vcfs[2])
+    assert tmpdir.join('a', 'vcfs.txt').read() == ''.join(vcf + '\n' for vcf in vcfs)
+    # contamination adds variants of low allele balance
+    clean = compute_allele_balance(vcfs[0]).histogram
+    contaminated = compute_allele_balance(vcfs[1]).histogram
+    assert sum(contaminated[1:20]) > 3 * sum(clean[1:20])
+    assert len(again) == 2
+
+
+def test_sample_reads() -> None:
+    population = Population(20000, 'EX', seed=1)
+    depths, alt_reads, genotypes = sample_reads(population, 0, 90)
+    assert abs(depths.mean() - 90) < 3
+    heterozygous = (genotypes == 1) & (depths > 20)
+    assert abs((alt_reads[heterozygous] / depths[heterozygous]).mean() - 0.5) < 0.01
+    # exome sites lie into the targets
+    starts = np.array([start for chrom, start, _ in population.targets if chrom == b'chr1'])
+    positions = population.positions[population.chroms == 0]
+    assert np.all(positions - 1 - starts[np.searchsorted(starts, positions - 1, side='right') - 1] < 170)
+
+
+@pytest.mark.parametrize('spec', ('1:1:0.1', '1:2:1.5', '1:2', 'a:2:0.1'))
+def test_parse_contamination_errors(spec: str) -> None:
+    with pytest.raises(Exception):
+        parse_contamination(spec)
@@ -0,0 +1,68 @@
+from pkg_resources import resource_filename
+import gzip
+import pytest
+from fr.cea.cnrgh.lbi.contatester.bgzf import BgzfWriter, BgzfReader
+from fr.cea.cnrgh.lbi.contatester.tabix import reg2bin, build_index, write_index, read_index, index_path
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import compute_allele_balance, plan_shards
+
+
+def bgzip_resource(name: str, block_size: int = 64) -> str:
+    """Compress a resource VCF with small blocks to get many virtual offsets"""
+    vcf_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', name)
+    bgzip_file = '/tmp/' + name + '.gz'
+    content = open(vcf_file, 'rb').read()
+    with BgzfWriter(bgzip_file) as writer:
+        for i in range(0, len(content), block_size):
+            writer.write(content[i:i + block_size])
+            writer.flush()
+    return bgzip_file
+
+
+@pytest.mark.parametrize('beg, end, expected',
+                         ((0, 1, 4681),
+                          (16383, 16385, 585),
+                          (0, 1 << 29, 0),
+                          (1 << 17, (1 << 17) + 100, 4681 + 8)
+                          ))
+def test_reg2bin(beg: int, end: int, expected: int) -> None:
+    assert reg2bin(beg, end) == expected
+
+
+def test_bgzf_round_trip() -> None:
+    bgzip_file = bgzip_resource('ab_sample.vcf')
+    vcf_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample.vcf')
+    assert gzip.open(bgzip_file).read() == open(vcf_file, 'rb').read()
+    with BgzfReader(bgzip_file) as reader:
+        lines = list(reader.iter_lines())
+    assert [line for _, line, _ in lines] == open(vcf_file, 'rb').readlines()
+    # each line can be read back from its virtual offset
+    with BgzfReader(bgzip_file) as reader:
+        for start, line, _ in reversed(lines):
+            reader.seek(start)
+            assert reader.readline() == line
+
+
+def test_index_round_trip() -> None:
+    bgzip_file = bgzip_resource('ab_sample.vcf')
+    index = build_index(bgzip_file)
+    write_index(index, index_path(bgzip_file))
+    index_read = read_index(index_path(bgzip_file))
+    assert index_read.names == [b'chr1', b'chr2', b'chr3']
+    for sequence, sequence_read in zip(index.sequences, index_read.sequences):
+        assert sequence.bins == sequence_read.bins
+        assert sequence.linear == sequence_read.linear
+
+
+@pytest.mark.parametrize('shard_size, nb_shards', ((0, 3), (300, 5), (1 << 20, 3)))
+def test_sharded_allele_balance(shard_size: int, nb_shards: int) -> None:
+    bgzip_file = bgzip_resource('ab_sample.vcf')
+    write_index(build_index(bgzip_file), index_path(bgzip_file))
+    bed_file = resource_filename('tests.fr.cea.cnrgh.lbi.contatester.resources', 'ab_sample_exclusion.bed')
+    assert len(plan_shards(read_index(index_path(bgzip_file)), shard_size)) >= nb_shards
+    serial = compute_allele_balance(bgzip_file, bed_file, candidates_file='/tmp/serial.vcf.gz')
+    sharded = compute_allele_balance(bgzip_file, bed_file, candidates_file='/tmp/sharded.vcf.gz',
+                                     thread=2, shard_size=shard_size)
+    assert sharded.histogram == serial.histogram
+    assert sharded.depth_sum == serial.depth_sum
+    assert sharded.nb_snp == serial.nb_snp
+    assert gzip.open('/tmp/sharded.vcf.gz').read() == gzip.open('/tmp/serial.vcf.gz').read()
@@ -0,0 +1,56 @@
+import json
+import pytest
+from fr.cea.cnrgh.lbi.contatester.executor import read_dag
+from fr.cea.cnrgh.lbi.contatester.timeline import critical_path, parallel_efficiency, read_timeline, run_stage, \
+    stage_totals, stragglers, main
+
+
+def event(task: str, stage: str, start: float, end: float, cpu: float, cores: int = 1, status: int = 0):
+    return {'task': task, 'stage': stage, 'args': [], 'host': 'node', 'pid': 1, 'cores': cores, 'start': start,
+            'end': end, 'wall': end - start, 'user': cpu, 'sys': 0.0, 'max_rss_kb': 2048, 'read_bytes': 2 ** 20,
+            'written_bytes': None, 'status': status}
+
+
+def write_run(tmpdir):
+    dag_file = tmpdir.join('run.dagfile')
+    dag_file.write('TASK ABCalc_a -c 2 bash -c "true"\nTASK Report_a -c 1 bash -c "true"\n'
+                   'TASK ABCalc_b -c 2 bash -c "true"\nTASK Report_b -c 1 bash -c "true"\n'
+                   'EDGE ABCalc_a Report_a\nEDGE ABCalc_b Report_b\n')
+    events = [event('ABCalc_a', 'abcalc', 0, 10, 18, 2), event('ABCalc_b', 'abcalc', 0, 40, 70, 2),
+              event('Report_a', 'estimate', 11, 12, 1), event('Report_b', 'estimate', 45, 46, 1, status=1)]
+    tmpdir.join('run.dagfile.timeline.jsonl').write(''.join(json.dumps(item) + '\n' for item in events))
+    return str(dag_file), events
+
+
+def test_run_stage(tmpdir, monkeypatch) -> None:
+    timeline = str(tmpdir.join('run.timeline.jsonl'))
+    assert run_stage('abcalc', lambda parameters: 0, ['-f', 'a.vcf']) == 0
+    assert not tmpdir.join('run.timeline.jsonl').check()
+    monkeypatch.setenv('CONTATESTER_TIMELINE', timeline)
+    monkeypatch.setenv('PMC_TASK', 'ABCalc_a')
+    assert run_stage('abcalc', lambda parameters: 3, ['-f', 'a.vcf']) == 3
+    assert run_stage('run', lambda parameters: 0, []) == 0
+    events = read_timeline(timeline)
+    assert len(events) == 1
+    assert events[0]['task'] == 'ABCalc_a' and events[0]['status'] == 3 and events[0]['args'] == ['-f', 'a.vcf']
+    assert events[0]['max_rss_kb'] > 0 and events[0]['end'] >= events[0]['start']
+    # the wall time covers the start of the process, as its CPU times
+    assert 0 < events[0]['startup'] <= events[0]['wall']
+
+
+def test_profile(tmpdir) -> None:
+    dag_file, events = write_run(tmpdir)
+    rows = stage_totals(events)
+    assert rows[0] == ['abcalc', '2', '50.0', '25.0', '88.0', '2', '2.0', '0.0', '0']
+    assert rows[1][-1] == '1'
+    assert [item[0]['task'] for item in stragglers(events)] == []
+    assert [item[0]['task'] for item in stragglers(events, 1.5)] == ['ABCalc_b']
+    # 90 s of CPU on 4 cores during 46 s
+    assert parallel_efficiency(events) == pytest.approx(90 / (46 * 4))
+    path = critical_path(events, read_dag(dag_file))
+    assert [(item['task'], wait) for item, wait in path] == [('ABCalc_b', 0), ('Report_b', 5)]
+    assert main([str(tmpdir)]) == 0
+
+
+def test_profile_without_timeline(tmpdir) -> None:
+    assert main([str(tmpdir)]) == 1
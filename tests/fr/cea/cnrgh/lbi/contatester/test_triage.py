@@ -0,0 +1,46 @@
+import json
+import pytest
+from fr.cea.cnrgh.lbi.contatester.allelic_balance import compute_allele_balance
+from fr.cea.cnrgh.lbi.contatester.synthetic import simulate_cohort
+from fr.cea.cnrgh.lbi.contatester.triage import main, sample_regions, triage_vcf
+
+
+@pytest.fixture(scope='module')
+def vcf(tmpdir_factory):
+    return simulate_cohort(str(tmpdir_factory.mktemp('triage')), 1, 100000, 30, 'WG', seed=1)[0]
+
+
+def test_sample_regions(vcf) -> None:
+    regions = sample_regions(vcf, 1000000, seed=3)
+    assert regions == sample_regions(vcf, 1000000, seed=3)
+    assert regions != sample_regions(vcf, 1000000, seed=4)
+    assert len(set(regions)) == len(regions) > 3000
+
+
+def test_triage_converged(vcf, tmpdir) -> None:
+    assert main(['-f', vcf, '-o', str(tmpdir), '--tolerance', '2']) == 0
+    with open(str(tmpdir.join('sample0000.conta.triage.json'))) as triage_f:
+        record = json.load(triage_f)
+    assert record['converged'] and not record['escalated']
+    assert record['fraction'] < 0.2 and record['sampled'] < record['regions']
+    assert record['ci_low'] <= record['res_poly'] == record['estimation'] <= record['ci_high']
+    assert record['ci_high'] - record['ci_low'] <= 4
+    # the histogram of the regions read only
+    full = compute_allele_balance(vcf)
+    assert sum(int(line.split()[0]) for line in tmpdir.join('sample0000.hist').readlines()) < \
+        0.2 * sum(full.histogram)
+    assert 'Possible contamination greater than 4% : FALSE' in tmpdir.join('sample0000.conta').read()
+
+
+@pytest.mark.parametrize('tolerance, threshold', ((0.01, 4), (2, -2)))
+def test_triage_escalated(vcf, tolerance: float, threshold: int) -> None:
+    # not converged, or the threshold lies into the interval
+    result, record = triage_vcf(vcf, conta_threshold=threshold, tolerance=tolerance, max_fraction=0.2)
+    assert record['escalated'] and record['fraction'] <= 0.2
+    assert result.histogram == compute_allele_balance(vcf).histogram
+
+
+def test_triage_threads(vcf) -> None:
+    result, record = triage_vcf(vcf, tolerance=2)
+    threaded, threaded_record = triage_vcf(vcf, tolerance=2, thread=2)
+    assert (threaded.histogram, threaded_record) == (result.histogram, record)